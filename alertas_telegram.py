@@ -0,0 +1,408 @@
+"""
+Despacho de alertas de disponibilidad por Telegram.
+
+Recibe eventos de cambio (ver diff_snapshots) y los convierte en mensajes
+resumen: cada llamada a notificar() genera a lo sumo un mensaje por bloque de
+4096 caracteres, agrupado por tipo, en lugar de un mensaje por horario.
+
+- Tipos alertados: agotado, reabierto y capacidad_baja (bajada de capacidad
+  que cruza ALERTA_UMBRAL_CAPACIDAD).
+- Los eventos repetidos (mismo tipo, tour, fecha y hora) dentro de
+  ALERTA_VENTANA_DEDUP segundos se descartan. Un evento cuenta como avisado
+  cuando Telegram acepta su mensaje, no al encolarlo: si el envío falla, el
+  siguiente snapshot lo vuelve a alertar. La ventana se persiste para que
+  sobreviva entre ejecuciones del job de Railway.
+- Los mensajes se envían desde una cola en un hilo de fondo respetando un
+  intervalo mínimo entre envíos, un máximo por minuto y el retry_after que
+  devuelve Telegram en los 429. En Vercel (historico_store.SERVERLESS) se
+  envían dentro de la llamada, porque el hilo no sobrevive a la respuesta,
+  y como la petición tiene tiempo límite esos envíos (con sus esperas) se
+  cortan a los ALERTA_TIEMPO_MAXIMO_SINCRONO segundos: los mensajes que no
+  caben se aplazan liberando sus claves, y el siguiente snapshot los alerta.
+
+La URL base de la API (TELEGRAM_API_URL) se puede apuntar a un servidor HTTP
+local para pruebas.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+
+import requests
+
+import storage_client
+import historico_store
+
+
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+
+# Umbral de plazas para alertar capacidad baja
+UMBRAL_CAPACIDAD = int(os.environ.get('ALERTA_UMBRAL_CAPACIDAD', '10'))
+
+# Segundos durante los que no se repite una alerta idéntica
+VENTANA_DEDUP = int(os.environ.get('ALERTA_VENTANA_DEDUP', '3600'))
+
+# Límites de envío (Telegram: ~1 msg/s por chat, 20 msg/min en grupos)
+INTERVALO_MINIMO = float(os.environ.get('ALERTA_INTERVALO_MINIMO', '1.0'))
+MAX_POR_MINUTO = int(os.environ.get('ALERTA_MAX_POR_MINUTO', '20'))
+
+# Segundos máximos de envío por llamada en modo síncrono (incluidas esperas)
+TIEMPO_MAXIMO_SINCRONO = float(os.environ.get('ALERTA_TIEMPO_MAXIMO_SINCRONO', '10'))
+
+# Líneas por tipo en un resumen antes de abreviar con "y N más"
+MAX_LINEAS_POR_TIPO = 30
+MAX_CARACTERES = 4096
+
+DEDUP_PATH = f'{historico_store.CARPETA}/eventos/alertas_enviadas.json'
+
+CAPACIDAD_BAJA = 'capacidad_baja'
+
+TITULOS = {
+    'agotado': '🔴 Agotados',
+    'reabierto': '🟢 Reabiertos',
+    CAPACIDAD_BAJA: '🟡 Pocas plazas',
+}
+
+
+def eventos_alertables(eventos: list, umbral: int = None) -> list:
+    """
+    Filtra los eventos que merecen alerta. Las bajadas de capacidad solo
+    alertan al cruzar el umbral, no en cada venta.
+
+    Args:
+        eventos: Eventos de diff_snapshots
+        umbral: Plazas por debajo de las cuales se alerta (default: UMBRAL_CAPACIDAD)
+
+    Returns:
+        Eventos con tipo agotado, reabierto o capacidad_baja
+    """
+    umbral = UMBRAL_CAPACIDAD if umbral is None else umbral
+    alertables = []
+
+    for evento in eventos:
+        tipo = evento.get('tipo')
+        if tipo in ('agotado', 'reabierto', CAPACIDAD_BAJA):
+            alertables.append(evento)
+        elif tipo == 'bajada_capacidad':
+            if evento.get('capacidad', 0) <= umbral < evento.get('capacidad_anterior', 0):
+                alertables.append(dict(evento, tipo=CAPACIDAD_BAJA))
+
+    return alertables
+
+
+def _linea(evento: dict) -> str:
+    """Línea de un evento en el resumen"""
+    hora = f" {evento['hora']}" if evento.get('hora') else ''
+    detalle = ''
+    if evento['tipo'] in (CAPACIDAD_BAJA, 'reabierto'):
+        detalle = f": {evento.get('capacidad', 0)} plazas"
+    return f"• {evento.get('tour', '')} {evento.get('fecha', '')}{hora}{detalle}"
+
+
+def formatear_resumen(eventos: list) -> list:
+    """
+    Agrupa eventos en mensajes de resumen de hasta MAX_CARACTERES.
+
+    Returns:
+        Lista de textos (normalmente uno)
+    """
+    return [texto for texto, _ in _mensajes_resumen(eventos)]
+
+
+def _mensajes_resumen(eventos: list) -> list:
+    """Como formatear_resumen, con los eventos que cubre cada mensaje: [(texto, eventos)]"""
+    por_tipo = {}
+    for evento in eventos:
+        por_tipo.setdefault(evento['tipo'], []).append(evento)
+
+    bloques = []
+    for tipo in TITULOS:
+        lista = sorted(por_tipo.get(tipo, []), key=lambda e: (e.get('tour', ''), e.get('fecha', ''), e.get('hora') or ''))
+        if not lista:
+            continue
+        lineas = [f"{TITULOS[tipo]} ({len(lista)})"]
+        lineas += [_linea(e) for e in lista[:MAX_LINEAS_POR_TIPO]]
+        if len(lista) > MAX_LINEAS_POR_TIPO:
+            lineas.append(f"… y {len(lista) - MAX_LINEAS_POR_TIPO} más")
+        bloques.append(('\n'.join(lineas), lista))
+
+    mensajes = []
+    actual, cubiertos = '🏛️ Colosseo - cambios de disponibilidad', []
+    for bloque, lista in bloques:
+        if len(actual) + len(bloque) + 2 > MAX_CARACTERES:
+            mensajes.append((actual, cubiertos))
+            actual, cubiertos = bloque[:MAX_CARACTERES], list(lista)
+        else:
+            actual += '\n\n' + bloque
+            cubiertos += lista
+    mensajes.append((actual, cubiertos))
+    return mensajes
+
+
+class DespachadorAlertas:
+    """Cola de mensajes de Telegram con deduplicación y límite de envío"""
+
+    def __init__(self, token: str, chat_id: str, api_url: str = None,
+                 ventana_dedup: int = VENTANA_DEDUP, intervalo_minimo: float = INTERVALO_MINIMO,
+                 max_por_minuto: int = MAX_POR_MINUTO, persistir: bool = True,
+                 sincrono: bool = None, tiempo_maximo_sincrono: float = TIEMPO_MAXIMO_SINCRONO):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = (api_url or TELEGRAM_API_URL).rstrip('/')
+        self.ventana_dedup = ventana_dedup
+        self.intervalo_minimo = intervalo_minimo
+        self.max_por_minuto = max_por_minuto
+        self.persistir = persistir
+        self.sincrono = historico_store.SERVERLESS if sincrono is None else sincrono
+        self.tiempo_maximo_sincrono = tiempo_maximo_sincrono
+
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._enviados = deque()
+        self._enviadas = None  # clave de evento -> epoch del último aviso
+        self._pendientes = set()  # claves encoladas que aún no se han enviado
+        self.estadisticas = {'mensajes': 0, 'errores': 0, 'duplicados': 0, 'aplazados': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token and self.chat_id)
+
+    # ---------- Deduplicación ----------
+
+    def _cargar_enviadas(self) -> dict:
+        if self._enviadas is None:
+            self._enviadas = {}
+            if self.persistir:
+                result = storage_client.read_bytes(DEDUP_PATH)
+                if result['success']:
+                    try:
+                        self._enviadas = json.loads(result['data'].decode('utf-8'))
+                    except ValueError:
+                        pass
+        return self._enviadas
+
+    def _guardar_enviadas(self) -> None:
+        if self.persistir:
+            data = json.dumps(self._enviadas, separators=(',', ':')).encode('utf-8')
+            storage_client.write_bytes(DEDUP_PATH, data, 'application/json')
+
+    @staticmethod
+    def clave(evento: dict) -> str:
+        """Clave de deduplicación: tipo, tour, fecha y hora"""
+        return f"{evento['tipo']}|{evento.get('tour', '')}|{evento.get('fecha', '')}|{evento.get('hora') or ''}"
+
+    def deduplicar(self, eventos: list) -> list:
+        """
+        Descarta eventos ya alertados dentro de la ventana o pendientes de
+        envío, y marca los nuevos como pendientes (ver confirmar).
+        """
+        ahora = time.time()
+        with self._lock:
+            enviadas = self._cargar_enviadas()
+            limite = ahora - self.ventana_dedup
+            for clave in [k for k, t in enviadas.items() if t < limite]:
+                del enviadas[clave]
+
+            nuevos = []
+            for evento in eventos:
+                clave = self.clave(evento)
+                if clave in enviadas or clave in self._pendientes:
+                    self.estadisticas['duplicados'] += 1
+                    continue
+                self._pendientes.add(clave)
+                nuevos.append(evento)
+        return nuevos
+
+    def confirmar(self, claves: list, enviado: bool) -> None:
+        """
+        Cierra las claves pendientes de un mensaje: si se envió quedan
+        registradas (y persistidas) para la ventana de deduplicación; si no,
+        se liberan para que el próximo snapshot vuelva a alertarlas.
+        """
+        with self._lock:
+            self._pendientes.difference_update(claves)
+            if enviado and claves:
+                enviadas = self._cargar_enviadas()
+                ahora = time.time()
+                for clave in claves:
+                    enviadas[clave] = ahora
+                self._guardar_enviadas()
+
+    # ---------- Cola y envío ----------
+
+    def notificar(self, eventos: list, umbral: int = None) -> int:
+        """
+        Encola los resúmenes de un conjunto de eventos (un snapshot). En modo
+        síncrono los envía antes de volver, como mucho durante
+        tiempo_maximo_sincrono segundos; los que no se envían a tiempo quedan
+        sin confirmar y se vuelven a alertar con el siguiente snapshot.
+
+        Returns:
+            Número de mensajes encolados (o enviados en modo síncrono)
+        """
+        if not self.enabled:
+            return 0
+
+        alertables = self.deduplicar(eventos_alertables(eventos, umbral))
+        if not alertables:
+            return 0
+
+        mensajes = [(texto, [self.clave(e) for e in cubiertos])
+                    for texto, cubiertos in _mensajes_resumen(alertables)]
+        if self.sincrono:
+            return self._despachar_sincrono(mensajes)
+
+        for mensaje in mensajes:
+            self._cola.put(mensaje)
+        self._iniciar_hilo()
+        return len(mensajes)
+
+    def _iniciar_hilo(self) -> None:
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._procesar_cola, name='alertas-telegram', daemon=True)
+                self._hilo.start()
+
+    def _despachar_sincrono(self, mensajes: list) -> int:
+        """Envía los mensajes en la llamada sin pasar de tiempo_maximo_sincrono"""
+        limite = time.time() + self.tiempo_maximo_sincrono
+        enviados = 0
+        for i, (texto, claves) in enumerate(mensajes):
+            if time.time() >= limite:
+                aplazados = mensajes[i:]
+                for _, pendientes in aplazados:
+                    self.confirmar(pendientes, enviado=False)
+                self.estadisticas['aplazados'] += len(aplazados)
+                print(f"[Alertas] {len(aplazados)} mensajes aplazados al próximo snapshot "
+                      f"(límite de {self.tiempo_maximo_sincrono:g}s)")
+                break
+            enviados += self._despachar(texto, claves, limite)
+        return enviados
+
+    def _esperar_turno(self, limite: float = None) -> bool:
+        """
+        Bloquea hasta que se pueda enviar sin superar los límites.
+
+        Returns:
+            False (sin esperar) si el turno llegaría después de limite (epoch)
+        """
+        while True:
+            ahora = time.time()
+            while self._enviados and ahora - self._enviados[0] > 60:
+                self._enviados.popleft()
+
+            espera = 0.0
+            if self._enviados:
+                espera = self._enviados[-1] + self.intervalo_minimo - ahora
+            if len(self._enviados) >= self.max_por_minuto:
+                espera = max(espera, self._enviados[0] + 60 - ahora)
+
+            if espera <= 0:
+                return True
+            if limite is not None and ahora + espera > limite:
+                return False
+            time.sleep(espera)
+
+    def _procesar_cola(self) -> None:
+        while True:
+            try:
+                mensaje = self._cola.get(timeout=5)
+            except queue.Empty:
+                # Terminar solo si nadie encoló mientras tanto
+                with self._lock:
+                    if self._cola.empty():
+                        self._hilo = None
+                        return
+                continue
+            try:
+                self._despachar(*mensaje)
+            finally:
+                self._cola.task_done()
+
+    def _despachar(self, texto: str, claves: list, limite: float = None) -> bool:
+        enviado = False
+        try:
+            enviado = self._enviar(texto, limite=limite)
+        finally:
+            self.confirmar(claves, enviado)
+        return enviado
+
+    def _enviar(self, texto: str, intentos: int = 3, limite: float = None) -> bool:
+        """
+        Envía un mensaje con reintentos. Con limite (epoch) no espera más
+        allá: si el turno, un reintento o el retry_after de un 429 llegarían
+        después, el mensaje se aplaza sin contar como error.
+        """
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        for _ in range(intentos):
+            if not self._esperar_turno(limite):
+                return self._aplazar()
+            self._enviados.append(time.time())
+            timeout = 15 if limite is None else max(1.0, min(15, limite - time.time()))
+            try:
+                response = requests.post(url, json={'chat_id': self.chat_id, 'text': texto}, timeout=timeout)
+            except requests.RequestException as e:
+                print(f"[Alertas] Error enviando a Telegram: {e}")
+                if limite is not None and time.time() + self.intervalo_minimo > limite:
+                    return self._aplazar()
+                time.sleep(self.intervalo_minimo)
+                continue
+
+            if response.status_code == 429:
+                try:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', 5)
+                except ValueError:
+                    retry_after = 5
+                if limite is not None and time.time() + retry_after > limite:
+                    print(f"[Alertas] Límite de Telegram ({retry_after}s), se aplaza al próximo snapshot")
+                    return self._aplazar()
+                print(f"[Alertas] Límite de Telegram, reintentando en {retry_after}s")
+                time.sleep(retry_after)
+                continue
+
+            if response.ok:
+                self.estadisticas['mensajes'] += 1
+                return True
+
+            print(f"[Alertas] Telegram respondió {response.status_code}: {response.text[:200]}")
+            break
+
+        self.estadisticas['errores'] += 1
+        return False
+
+    def _aplazar(self) -> bool:
+        self.estadisticas['aplazados'] += 1
+        return False
+
+    def esperar(self, timeout: float = 60) -> bool:
+        """
+        Espera a que se envíen los mensajes encolados (para procesos batch
+        que terminan después de notificar).
+
+        Returns:
+            True si la cola quedó vacía
+        """
+        limite = time.time() + timeout
+        while self._cola.unfinished_tasks and time.time() < limite:
+            time.sleep(0.1)
+        return not self._cola.unfinished_tasks
+
+
+_DESPACHADOR = {}
+
+
+def despachador() -> DespachadorAlertas:
+    """Despachador global configurado desde TELEGRAM_BOT_TOKEN / TELEGRAM_CHAT_ID"""
+    if 'global' not in _DESPACHADOR:
+        from colosseo_config import config
+        _DESPACHADOR['global'] = DespachadorAlertas(config.TELEGRAM_BOT_TOKEN, config.TELEGRAM_CHAT_ID)
+    return _DESPACHADOR['global']
+
+
+def notificar(eventos: list, umbral: int = None) -> int:
+    """Encola alertas en el despachador global (no hace nada sin Telegram configurado)"""
+    return despachador().notificar(eventos, umbral)
@@ -7,6 +7,7 @@ Soporta rotación de proxies para evitar bloqueos.
 import json
 import os
 import time
+import heapq
 import requests
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
@@ -430,8 +431,12 @@ class AvailabilityChecker:
                             existing["capacity"] = existing.get("capacity", 0) + item.get("capacity", 0)
                         if "originalCapacity" in item and "originalCapacity" in existing:
                             existing["originalCapacity"] = existing.get("originalCapacity", 0) + item.get("originalCapacity", 0)
+                        # La fecha está disponible si lo está alguno de sus timeslots
+                        if item.get("status") == AvailabilityChecker.STATUS_AVAILABLE:
+                            existing["status"] = AvailabilityChecker.STATUS_AVAILABLE
                     else:
-                        result[date] = item
+                        # Copia: sumar capacidades no debe modificar los timeslots originales
+                        result[date] = dict(item)
             return result
 
         return {}
@@ -642,6 +647,109 @@ class AvailabilityChecker:
 
         return sorted(low_capacity, key=lambda x: (x["capacidad"], x["fecha"]))
 
+    @staticmethod
+    def slot_date_time(item: Dict) -> Tuple[str, Optional[str]]:
+        """
+        Fecha y hora (hora de Roma) de un timeslot.
+
+        Acepta timeslots crudos de la API (startDateTime, normalmente en UTC)
+        o ya formateados ('fecha' / 'hora').
+
+        Returns:
+            (fecha, hora) con hora None si el elemento es una fecha agregada
+        """
+        if "fecha" in item:
+            return item["fecha"], item.get("hora")
+
+        start = item.get("startDateTime") or ""
+        if "T" in start:
+            try:
+                dt = datetime.fromisoformat(start.replace("Z", "+00:00"))
+                if dt.tzinfo is not None:
+                    from zoneinfo import ZoneInfo
+                    dt = dt.astimezone(ZoneInfo("Europe/Rome"))
+                return dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M")
+            except ValueError:
+                return start[:10], start[11:16]
+
+        return item.get("date") or start[:10], item.get("startTime")
+
+    @staticmethod
+    def find_low_capacity_slots(data, threshold: int = None, top_k: Optional[int] = 50, tour: str = "") -> List[Dict]:
+        """
+        Encuentra los horarios con baja capacidad de un tour (ver find_most_urgent_slots).
+
+        Args:
+            data: Timeslots del calendario (list) o datos por fecha (dict)
+            threshold: Umbral de capacidad (default: umbral configurado del tour)
+            top_k: Máximo de horarios a devolver (None = todos)
+            tour: Nombre o clave del tour
+
+        Returns:
+            Horarios ordenados de más a menos urgente
+        """
+        thresholds = {tour: threshold} if threshold is not None else None
+        return AvailabilityChecker.find_most_urgent_slots({tour: data}, thresholds, top_k)
+
+    @staticmethod
+    def find_most_urgent_slots(tours: Dict, thresholds: Dict[str, int] = None, top_k: Optional[int] = 50) -> List[Dict]:
+        """
+        Encuentra los horarios más urgentes (menos plazas libres) de uno o
+        varios tours, a nivel de timeslot: un horario casi lleno no queda
+        oculto por otro con plazas el mismo día.
+
+        Los candidatos se recorren una vez y se mantienen en un heap acotado a
+        top_k elementos, O(n log k), sin ordenar la lista completa.
+
+        Args:
+            tours: {tour: timeslots del calendario (list) o datos por fecha (dict)}
+            thresholds: {tour: umbral}; los tours sin umbral usan el configurado
+                (config.get_low_capacity_threshold)
+            top_k: Máximo de horarios a devolver (None = todos)
+
+        Returns:
+            Lista de {'tour', 'fecha', 'hora', 'capacidad', 'capacidad_original',
+            'urgencia'} ordenada por capacidad, fecha y hora
+        """
+        thresholds = thresholds or {}
+
+        def candidates():
+            for tour, data in tours.items():
+                threshold = thresholds.get(tour)
+                if threshold is None:
+                    threshold = config.get_low_capacity_threshold(tour)
+
+                items = data.values() if isinstance(data, dict) else (data or [])
+                for item in items:
+                    if not isinstance(item, dict):
+                        continue
+                    capacity = item.get("capacity", item.get("capacidad"))
+                    # Los horarios agotados no son urgentes: ya no se pueden reservar
+                    if not isinstance(capacity, int) or capacity <= 0 or capacity > threshold:
+                        continue
+                    status = item.get("status")
+                    if status and status != AvailabilityChecker.STATUS_AVAILABLE:
+                        continue
+                    fecha, hora = AvailabilityChecker.slot_date_time(item)
+                    yield (capacity, fecha, hora or "", tour, item)
+
+        if top_k is None:
+            selected = sorted(candidates(), key=lambda c: c[:4])
+        else:
+            selected = heapq.nsmallest(top_k, candidates(), key=lambda c: c[:4])
+
+        return [
+            {
+                "tour": tour,
+                "fecha": fecha,
+                "hora": hora or None,
+                "capacidad": capacity,
+                "capacidad_original": item.get("originalCapacity", item.get("capacidad_original")),
+                "urgencia": "ALTA" if capacity <= 5 else "MEDIA",
+            }
+            for capacity, fecha, hora, tour, item in selected
+        ]
+
 
 # Funciones de conveniencia
 def quick_check(dates: List[str], guid: str = None) -> Dict:
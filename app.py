@@ -6,39 +6,30 @@ Version: 2.0 - Tourmageddon Design
 import sys
 import io
 import json
+import hashlib
 import os
+import time
 from datetime import datetime, timedelta, timezone
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
 
 
 def utc_to_rome(datetime_str):
     """
-    Convierte un datetime string UTC a hora de Roma (CET = UTC+1).
+    Convierte un datetime string UTC a fecha y hora de Roma (CET/CEST según
+    la fecha, ver historico_store.utc_a_roma).
     """
     if not datetime_str:
         return '', ''
 
     try:
-        # Quitar Z si existe
-        clean_str = datetime_str.replace('Z', '')
-
-        # Parse datetime
-        dt = datetime.fromisoformat(clean_str)
-
-        # Convertir UTC a CET (UTC+1)
-        dt_rome = dt + timedelta(hours=1)
-
-        fecha = dt_rome.strftime('%Y-%m-%d')
-        hora = dt_rome.strftime('%H:%M')
-
-        return fecha, hora
+        import historico_store
+        return historico_store.utc_a_roma(datetime_str)
     except Exception as e:
         # Fallback: extraer directamente
         try:
             return datetime_str[:10], datetime_str[11:16]
         except:
             return '', ''
-import pandas as pd
 from io import BytesIO
 
 # Configurar encoding UTF-8 para Windows
@@ -50,6 +41,18 @@ from api_client import ColosseoAPIClient, AvailabilityChecker
 from proxy_manager import ProxyManager
 from colosseo_config import config
 import storage_client
+import historico_store
+import series_index
+from result_cache import result_cache
+import export_streams
+import diff_snapshots
+import reglas_vigilancia
+import indice_disponibilidad
+import buscador_grupos
+import compresion
+import difusion_cambios
+import trabajos_consulta
+import codificacion_columnar
 
 app = Flask(__name__)
 
@@ -63,12 +66,25 @@ def add_header(response):
     return response
 
 
-# Instancia global del proxy manager para la app
-proxy_manager = ProxyManager(
-    proxy_file=config.PROXY_FILE,
-    rotation_mode=config.PROXY_ROTATION_MODE,
-    reactivate_after_minutes=config.PROXY_REACTIVATE_MINUTES
-)
+# Comprimir respuestas JSON grandes (gzip / brotli según Accept-Encoding)
+@app.after_request
+def comprimir_json(response):
+    return compresion.comprimir_respuesta(response, request.accept_encodings)
+
+
+# Instancia global del proxy manager para la app (se crea en el primer uso)
+_PROXY_MANAGER = {}
+
+
+def obtener_proxy_manager():
+    """Proxy manager de la app, configurado con colosseo_config"""
+    if 'global' not in _PROXY_MANAGER:
+        _PROXY_MANAGER['global'] = ProxyManager(
+            proxy_file=config.PROXY_FILE,
+            rotation_mode=config.PROXY_ROTATION_MODE,
+            reactivate_after_minutes=config.PROXY_REACTIVATE_MINUTES
+        )
+    return _PROXY_MANAGER['global']
 
 # Configuración de tours disponibles
 TOURS = {
@@ -83,22 +99,40 @@ TOURS = {
 }
 
 
-def consultar_tour_completo(client, tour_guid, meses_a_consultar):
+def descargar_meses(client, tour_guid, meses_a_consultar):
     """
-    Consulta un tour en múltiples meses
+    Descarga el calendario de un tour mes a mes (una llamada por mes).
 
     Returns:
-        tuple (dict con fechas y sus datos, lista de errores)
+        list de (month, data, status, msg)
     """
-    datos_totales = {}
-    debug_info = []
-
+    descargas = []
     for month in meses_a_consultar:
         data, status, msg = client.fetch_calendar_data(
             guid=tour_guid,
             month=month
         )
+        descargas.append((month, data, status, msg))
+    return descargas
+
 
+def consultar_tour_completo(client, tour_guid, meses_a_consultar, descargas=None):
+    """
+    Consulta un tour en múltiples meses
+
+    Args:
+        descargas: Resultado de descargar_meses (si no se pasa, se descarga)
+
+    Returns:
+        tuple (dict con fechas y sus datos, lista de errores)
+    """
+    datos_totales = {}
+    debug_info = []
+
+    if descargas is None:
+        descargas = descargar_meses(client, tour_guid, meses_a_consultar)
+
+    for month, data, status, msg in descargas:
         debug_info.append(f"{month}: status={status}, data={len(data) if data else 0}, msg={msg[:50] if msg else 'ok'}")
 
         if data:
@@ -109,21 +143,22 @@ def consultar_tour_completo(client, tour_guid, meses_a_consultar):
     return datos_totales, debug_info
 
 
-def obtener_timeslots_detallados(client, tour_guid, meses_a_consultar):
+def obtener_timeslots_detallados(client, tour_guid, meses_a_consultar, descargas=None):
     """
     Obtiene todos los timeslots sin agregar, con horarios individuales
 
+    Args:
+        descargas: Resultado de descargar_meses (si no se pasa, se descarga)
+
     Returns:
         list de timeslots con todos sus detalles
     """
     todos_timeslots = []
 
-    for month in meses_a_consultar:
-        data, status, msg = client.fetch_calendar_data(
-            guid=tour_guid,
-            month=month
-        )
+    if descargas is None:
+        descargas = descargar_meses(client, tour_guid, meses_a_consultar)
 
+    for month, data, status, msg in descargas:
         if data and isinstance(data, list):
             for timeslot in data:
                 if isinstance(timeslot, dict):
@@ -160,15 +195,30 @@ def obtener_timeslots_detallados(client, tour_guid, meses_a_consultar):
     return todos_timeslots
 
 
-def formatear_resultados_para_tabla(datos_totales):
+def formatear_resultados_para_tabla(datos_totales, tour_key=None, ahora=None):
     """
     Formatea los datos para mostrar en tabla HTML/Excel
 
+    Args:
+        datos_totales: {fecha: {'capacity', 'originalCapacity'}}
+        tour_key: Clave del tour para la previsión de ocupación (opcional)
+        ahora: Timestamp de los datos (default: ahora en Roma)
+
     Returns:
-        list de dicts con formato para tabla
+        list de dicts con formato para tabla. 'ocupacion_prevista' es la
+        ocupación (%) esperada al día de la visita según el histórico, o
+        None si no hay previsión
     """
     resultados = []
 
+    modelo_prevision = None
+    if tour_key:
+        try:
+            import prevision_ocupacion
+            modelo_prevision = prevision_ocupacion.obtener_modelo()
+        except Exception as e:
+            print(f"[Prevision] No se pudo cargar el modelo: {e}")
+
     fechas_ordenadas = sorted(datos_totales.items())
 
     for fecha, info in fechas_ordenadas:
@@ -200,6 +250,10 @@ def formatear_resultados_para_tabla(datos_totales):
             fecha_formateada = fecha
             dia_semana = ""
 
+        ocupacion_prevista = None
+        if modelo_prevision is not None and capacidad_orig > 0:
+            ocupacion_prevista = modelo_prevision.predecir(tour_key, fecha, porcentaje_ocupado, ahora)
+
         resultados.append({
             "fecha": fecha,
             "fecha_formateada": fecha_formateada,
@@ -208,6 +262,7 @@ def formatear_resultados_para_tabla(datos_totales):
             "plazas_totales": capacidad_orig,
             "plazas_ocupadas": ocupadas,
             "porcentaje_ocupado": round(porcentaje_ocupado, 1),
+            "ocupacion_prevista": ocupacion_prevista,
             "estado": estado,
             "nivel": nivel
         })
@@ -291,12 +346,309 @@ def calcular_estadisticas_horarios(timeslots):
     }
 
 
+def anotar_velocidades(resultados, ahora=None):
+    """
+    Agrega a cada timeslot su velocidad de venta (plazas/hora) y agotamiento
+    estimado según el histórico (ver velocidad_venta). Si el histórico no
+    está disponible los resultados se devuelven sin anotar.
+    """
+    try:
+        import velocidad_venta
+        velocidad_venta.anotar_resultados(resultados, ahora)
+    except Exception as e:
+        print(f"[Velocidad] No se pudo calcular la velocidad de venta: {e}")
+    return resultados
+
+
+def resumir_resultados(resultados):
+    """
+    Copia de los resultados sin el detalle por horario ('timeslots_por_fecha'
+    y 'timeslots' de cada fecha). Cada fecha indica cuántos horarios tiene en
+    'num_timeslots'; el detalle se pide por fecha a /api/timeslots.
+    """
+    resumen = {}
+    for tour_key, tour_data in resultados.items():
+        por_fecha = tour_data.get('timeslots_por_fecha', {})
+        tour_resumen = {k: v for k, v in tour_data.items() if k != 'timeslots_por_fecha'}
+        tour_resumen['fechas'] = [
+            dict({k: v for k, v in fecha.items() if k != 'timeslots'},
+                 num_timeslots=len(por_fecha.get(fecha['fecha'], [])))
+            for fecha in tour_data.get('fechas', [])
+        ]
+        resumen[tour_key] = tour_resumen
+    return resumen
+
+
+def obtener_resultados_solicitud(data):
+    """
+    Obtiene los resultados de una petición: por 'result_id' (caché del servidor)
+    o por el objeto 'resultados' completo enviado en el body.
+
+    Returns:
+        tuple (resultados, respuesta_error). respuesta_error es None si todo va bien
+    """
+    result_id = data.get('result_id') or request.args.get('result_id')
+
+    if result_id:
+        cached = result_cache.obtener(result_id)
+        if cached is None:
+            return None, (jsonify({
+                "error": "Resultado expirado o desconocido, reenvía los resultados",
+                "result_id": result_id
+            }), 410)
+        return cached['resultados'], None
+
+    return data.get('resultados', {}), None
+
+
+def respuesta_stream(filas, columnas, formato, nombre_base):
+    """
+    Crea una respuesta en streaming (transferencia chunked) para CSV, CSV gzip o NDJSON.
+
+    Args:
+        filas: Generador de filas
+        columnas: Nombres de columna
+        formato: 'csv', 'csv.gz' o 'ndjson'
+        nombre_base: Nombre del archivo sin extensión
+    """
+    mimetype, extension = export_streams.FORMATOS[formato]
+    return Response(
+        stream_with_context(export_streams.codificar(filas, columnas, formato)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{nombre_base}.{extension}"'}
+    )
+
+
 @app.route('/')
 def index():
     """Página principal"""
     return render_template('index.html', tours=TOURS)
 
 
+def preparar_consulta(data):
+    """
+    Valida los parámetros de una consulta (body de /api/consultar).
+
+    Returns:
+        tuple (parametros, respuesta_error). parametros tiene 'cookies',
+        'tours', 'meses' y 'use_proxy'; respuesta_error es None si todo va bien
+    """
+    # Validar cookies
+    cookies_data = data.get('cookies')
+    if not cookies_data:
+        return None, (jsonify({"error": "No se proporcionaron cookies"}), 400)
+
+    # Parsear cookies - acepta string JSON o lista directamente
+    try:
+        if isinstance(cookies_data, str):
+            cookies = json.loads(cookies_data)
+        elif isinstance(cookies_data, list):
+            cookies = cookies_data
+        else:
+            return None, (jsonify({"error": "Formato de cookies inválido"}), 400)
+    except json.JSONDecodeError:
+        return None, (jsonify({"error": "Formato de cookies inválido. Debe ser JSON válido"}), 400)
+
+    return {
+        'cookies': cookies,
+        'tours': data.get('tours', list(TOURS.keys())),
+        'meses': data.get('meses', 6),
+        'use_proxy': data.get('use_proxy', obtener_proxy_manager().enabled)
+    }, None
+
+
+def pasos_consulta(parametros):
+    """
+    Consulta la disponibilidad de los tours pedidos paso a paso (generador) y
+    guarda el resultado en result_cache.
+
+    Args:
+        parametros: Ver preparar_consulta
+
+    Yields:
+        ('inicio', meses_a_consultar, tours) antes de la primera descarga
+        ('mes', tour_key, (month, data, status, msg), meses_hechos, meses_total)
+            tras descargar cada mes de cada tour
+        ('respuesta', respuesta) al final, con la respuesta completa de
+            /api/consultar (incluye 'result_id')
+
+    Raises:
+        ValueError: Si no se obtuvieron datos de ningún tour
+    """
+    cookies = parametros['cookies']
+    tours_seleccionados = parametros['tours']
+    num_meses = parametros['meses']
+
+    # Calcular meses a consultar
+    hoy = datetime.now()
+    meses_a_consultar = []
+    for i in range(num_meses):
+        fecha = hoy + timedelta(days=30*i)
+        mes_str = f"{fecha.year}-{fecha.month:02d}"
+        if mes_str not in meses_a_consultar:
+            meses_a_consultar.append(mes_str)
+
+    # Crear cliente con cookies y soporte de proxy
+    use_proxy = parametros['use_proxy']
+    client = ColosseoAPIClient(use_proxy=use_proxy)
+    client.cookies = cookies
+    client.create_session_from_cookies(cookies)
+
+    # Si hay proxy activo, informar
+    if use_proxy and client.proxy_manager and client.proxy_manager.enabled:
+        print(f"[API] Usando sistema de proxies ({len(client.proxy_manager.proxies)} proxies)")
+
+    # Consultar cada tour
+    resultados = {}
+    errores = []
+
+    yield 'inicio', meses_a_consultar, [t for t in tours_seleccionados if t in TOURS]
+
+    for tour_key in tours_seleccionados:
+        if tour_key not in TOURS:
+            continue
+
+        tour_info = TOURS[tour_key]
+
+        try:
+            # Una descarga por mes, compartida por el agregado y el detalle
+            descargas = []
+            for month in meses_a_consultar:
+                data, status, msg = client.fetch_calendar_data(
+                    guid=tour_info['guid'],
+                    month=month
+                )
+                descargas.append((month, data, status, msg))
+                yield 'mes', tour_key, descargas[-1], len(descargas), len(meses_a_consultar)
+
+            # Consultar disponibilidad agregada por fecha
+            datos, debug_info = consultar_tour_completo(
+                client,
+                tour_info['guid'],
+                meses_a_consultar,
+                descargas
+            )
+
+            # Agregar debug info a errores para ver qué pasa
+            if not datos:
+                errores.append(f"{tour_key} sin datos: {'; '.join(debug_info[:3])}")
+
+            # Obtener timeslots detallados
+            timeslots = obtener_timeslots_detallados(
+                client,
+                tour_info['guid'],
+                meses_a_consultar,
+                descargas
+            )
+        except Exception as e:
+            errores.append(f"{tour_key}: {str(e)}")
+            continue
+
+        if datos:
+            # Formatear resultados agregados
+            fechas_formateadas = formatear_resultados_para_tabla(datos, tour_key)
+            total_plazas = sum(f['plazas_disponibles'] for f in fechas_formateadas)
+
+            # Agrupar timeslots por fecha
+            timeslots_por_fecha = {}
+            for ts in timeslots:
+                fecha = ts['fecha']
+                if fecha not in timeslots_por_fecha:
+                    timeslots_por_fecha[fecha] = []
+                timeslots_por_fecha[fecha].append(ts)
+
+            # Calcular estadísticas
+            estadisticas = calcular_estadisticas_horarios(timeslots)
+
+            resultados[tour_key] = {
+                "nombre": tour_info['nombre'],
+                "guid": tour_info['guid'],
+                "total_fechas": len(fechas_formateadas),
+                "total_plazas": total_plazas,
+                "fechas": fechas_formateadas,
+                "timeslots_por_fecha": timeslots_por_fecha,
+                "estadisticas": estadisticas
+            }
+
+    if not resultados:
+        error_msg = "No se pudieron obtener datos. Verifica las cookies"
+        if errores:
+            error_msg += f". Errores: {'; '.join(errores)}"
+        # Debug info
+        error_msg += f". Tours intentados: {tours_seleccionados}. Meses: {meses_a_consultar}. Cookies recibidas: {len(cookies)}"
+        raise ValueError(error_msg)
+
+    anotar_velocidades(resultados)
+
+    # Horarios más urgentes de todos los tours, a nivel de timeslot
+    urgentes = AvailabilityChecker.find_most_urgent_slots({
+        tour_key: [ts for tslots in tour_data['timeslots_por_fecha'].values() for ts in tslots]
+        for tour_key, tour_data in resultados.items()
+    })
+
+    respuesta = {
+        "success": True,
+        "meses_consultados": meses_a_consultar,
+        "resultados": resultados,
+        "urgentes": urgentes,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+    # Guardar en caché para que exportar/histórico/timeslots puedan referenciarlo por id
+    respuesta["result_id"] = result_cache.guardar(respuesta)
+    yield 'respuesta', respuesta
+
+
+def ejecutar_consulta(parametros, progreso=None):
+    """
+    Ejecuta pasos_consulta hasta el final.
+
+    Args:
+        parametros: Ver preparar_consulta
+        progreso: Callable progreso(tour_key, meses_hechos, meses_total) opcional
+
+    Returns:
+        dict con la respuesta completa de /api/consultar (incluye 'result_id')
+
+    Raises:
+        ValueError: Si no se obtuvieron datos de ningún tour
+    """
+    for paso in pasos_consulta(parametros):
+        if paso[0] == 'inicio' and progreso:
+            for tour_key in paso[2]:
+                progreso(tour_key, 0, len(paso[1]))
+        elif paso[0] == 'mes' and progreso:
+            _, tour_key, _, hechos, total = paso
+            progreso(tour_key, hechos, total)
+        elif paso[0] == 'respuesta':
+            return paso[1]
+
+
+def respuesta_consulta(respuesta, detalle=False, columnar=False):
+    """
+    Respuesta de una consulta: completa o solo el resumen por fecha, en JSON
+    normal o columnar (ver codificacion_columnar)
+    """
+    if not detalle:
+        respuesta = dict(respuesta, resultados=resumir_resultados(respuesta['resultados']), detalle_omitido=True)
+    if columnar:
+        respuesta = codificacion_columnar.codificar(respuesta)
+    return respuesta
+
+
+def encoding_solicitado(data=None):
+    """
+    Codificación pedida en el query param o el body ('encoding').
+
+    Returns:
+        tuple (columnar, respuesta_error)
+    """
+    encoding = (request.args.get('encoding') or (data or {}).get('encoding') or 'json').lower()
+    if encoding not in codificacion_columnar.ENCODINGS:
+        return False, (jsonify({"error": f"Encoding no soportado: {encoding}"}), 400)
+    return encoding == 'columnar', None
+
+
 @app.route('/api/consultar', methods=['POST'])
 def consultar_disponibilidad():
     """
@@ -306,147 +658,261 @@ def consultar_disponibilidad():
         - cookies: JSON con cookies
         - tours: Lista de IDs de tours a consultar
         - meses: Número de meses a consultar (default: 6)
+        - detalle: Si es true incluye los horarios de cada fecha
+          ('timeslots_por_fecha'); por defecto solo el resumen por fecha y el
+          detalle se pide a /api/timeslots con el result_id
+        - encoding: 'json' (default) o 'columnar' (ver codificacion_columnar;
+          también como query param)
 
     Returns:
         JSON con resultados
     """
     try:
         data = request.json
+        parametros, error = preparar_consulta(data)
+        if error:
+            return error
+        columnar, error = encoding_solicitado(data)
+        if error:
+            return error
 
-        # Validar cookies
-        cookies_data = data.get('cookies')
-        if not cookies_data:
-            return jsonify({"error": "No se proporcionaron cookies"}), 400
-
-        # Parsear cookies - acepta string JSON o lista directamente
         try:
-            if isinstance(cookies_data, str):
-                cookies = json.loads(cookies_data)
-            elif isinstance(cookies_data, list):
-                cookies = cookies_data
-            else:
-                return jsonify({"error": "Formato de cookies inválido"}), 400
-        except json.JSONDecodeError:
-            return jsonify({"error": "Formato de cookies inválido. Debe ser JSON válido"}), 400
-
-        # Obtener tours seleccionados
-        tours_seleccionados = data.get('tours', list(TOURS.keys()))
-        num_meses = data.get('meses', 6)
-
-        # Calcular meses a consultar
-        hoy = datetime.now()
-        meses_a_consultar = []
-        for i in range(num_meses):
-            fecha = hoy + timedelta(days=30*i)
-            mes_str = f"{fecha.year}-{fecha.month:02d}"
-            if mes_str not in meses_a_consultar:
-                meses_a_consultar.append(mes_str)
-
-        # Crear cliente con cookies y soporte de proxy
-        use_proxy = data.get('use_proxy', proxy_manager.enabled)
-        client = ColosseoAPIClient(use_proxy=use_proxy)
-        client.cookies = cookies
-        client.create_session_from_cookies(cookies)
+            respuesta = ejecutar_consulta(parametros)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Si hay proxy activo, informar
-        if use_proxy and client.proxy_manager and client.proxy_manager.enabled:
-            print(f"[API] Usando sistema de proxies ({len(client.proxy_manager.proxies)} proxies)")
+        return jsonify(respuesta_consulta(respuesta, data.get('detalle'), columnar))
 
-        # Consultar cada tour
-        resultados = {}
-        errores = []
+    except Exception as e:
+        return jsonify({"error": f"Error al procesar: {str(e)}"}), 500
 
-        for tour_key in tours_seleccionados:
-            if tour_key not in TOURS:
-                continue
 
-            tour_info = TOURS[tour_key]
+def trabajos_no_disponibles():
+    """501 de los endpoints de trabajos donde no se pueden ejecutar"""
+    return jsonify({
+        "error": "Las consultas en segundo plano no están disponibles en este despliegue",
+        "hint": "Usa /api/consultar/stream o /api/consultar"
+    }), 501
 
-            try:
-                # Consultar disponibilidad agregada por fecha
-                datos, debug_info = consultar_tour_completo(
-                    client,
-                    tour_info['guid'],
-                    meses_a_consultar
-                )
 
-                # Agregar debug info a errores para ver qué pasa
-                if not datos:
-                    errores.append(f"{tour_key} sin datos: {'; '.join(debug_info[:3])}")
+@app.route('/api/consultar/trabajos', methods=['POST'])
+def crear_trabajo_consulta():
+    """
+    Encola una consulta de disponibilidad y responde enseguida con el id del
+    trabajo (ver trabajos_consulta). Si ya hay un trabajo idéntico en curso se
+    devuelve ese.
+
+    Recibe:
+        El mismo body que /api/consultar
 
-                # Obtener timeslots detallados
-                timeslots = obtener_timeslots_detallados(
-                    client,
-                    tour_info['guid'],
-                    meses_a_consultar
-                )
-            except Exception as e:
-                errores.append(f"{tour_key}: {str(e)}")
-                continue
+    Returns:
+        202 con 'trabajo_id' y 'duplicado'; 501 donde no hay trabajos en
+        segundo plano (Vercel, ver trabajos_consulta.DISPONIBLE)
+    """
+    if not trabajos_consulta.DISPONIBLE:
+        return trabajos_no_disponibles()
 
-            if datos:
-                # Formatear resultados agregados
-                fechas_formateadas = formatear_resultados_para_tabla(datos)
-                total_plazas = sum(f['plazas_disponibles'] for f in fechas_formateadas)
-
-                # Agrupar timeslots por fecha
-                timeslots_por_fecha = {}
-                for ts in timeslots:
-                    fecha = ts['fecha']
-                    if fecha not in timeslots_por_fecha:
-                        timeslots_por_fecha[fecha] = []
-                    timeslots_por_fecha[fecha].append(ts)
-
-                # Calcular estadísticas
-                estadisticas = calcular_estadisticas_horarios(timeslots)
-
-                resultados[tour_key] = {
-                    "nombre": tour_info['nombre'],
-                    "guid": tour_info['guid'],
-                    "total_fechas": len(fechas_formateadas),
-                    "total_plazas": total_plazas,
-                    "fechas": fechas_formateadas,
-                    "timeslots_por_fecha": timeslots_por_fecha,
-                    "estadisticas": estadisticas
-                }
+    try:
+        data = request.json
+        parametros, error = preparar_consulta(data)
+        if error:
+            return error
 
-        if not resultados:
-            error_msg = "No se pudieron obtener datos. Verifica las cookies"
-            if errores:
-                error_msg += f". Errores: {'; '.join(errores)}"
-            # Debug info
-            error_msg += f". Tours intentados: {tours_seleccionados}. Meses: {meses_a_consultar}. Cookies recibidas: {len(cookies)}"
-            return jsonify({"error": error_msg}), 400
+        try:
+            trabajo_id, duplicado = trabajos_consulta.gestor_trabajos.enviar(
+                parametros, lambda progreso: ejecutar_consulta(parametros, progreso)
+            )
+        except trabajos_consulta.ColaLlena as e:
+            return jsonify({"error": str(e)}), 503
 
         return jsonify({
             "success": True,
-            "meses_consultados": meses_a_consultar,
-            "resultados": resultados,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+            "trabajo_id": trabajo_id,
+            "duplicado": duplicado
+        }), 202
 
     except Exception as e:
         return jsonify({"error": f"Error al procesar: {str(e)}"}), 500
 
 
+@app.route('/api/consultar/trabajos/<trabajo_id>', methods=['GET'])
+def estado_trabajo_consulta(trabajo_id):
+    """
+    Estado y progreso de un trabajo de consulta.
+
+    Returns:
+        JSON con 'estado' (pendiente, ejecutando, completado o error) y
+        'progreso' {tour: {'hechos', 'total'}} en meses consultados
+    """
+    if not trabajos_consulta.DISPONIBLE:
+        return trabajos_no_disponibles()
+
+    estado = trabajos_consulta.gestor_trabajos.estado(trabajo_id)
+    if estado is None:
+        return jsonify({"error": "Trabajo desconocido o expirado"}), 404
+    return jsonify(dict(estado, success=True))
+
+
+@app.route('/api/consultar/trabajos/<trabajo_id>/resultado', methods=['GET'])
+def resultado_trabajo_consulta(trabajo_id):
+    """
+    Resultado de un trabajo terminado (mismo formato que /api/consultar).
+
+    Query params:
+        - detalle: 1 para incluir los horarios de cada fecha
+        - encoding: 'json' (default) o 'columnar'
+
+    Returns:
+        200 con el resultado, 202 si aún no terminó, 400 si falló, 404 si no existe
+    """
+    if not trabajos_consulta.DISPONIBLE:
+        return trabajos_no_disponibles()
+
+    columnar, error = encoding_solicitado()
+    if error:
+        return error
+
+    trabajo = trabajos_consulta.gestor_trabajos.obtener(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo desconocido o expirado"}), 404
+    if trabajo['estado'] in trabajos_consulta.EN_CURSO:
+        return jsonify(dict(trabajos_consulta.gestor_trabajos.estado(trabajo_id), success=False)), 202
+    if trabajo['estado'] == trabajos_consulta.ERROR:
+        return jsonify({"error": trabajo['error']}), 400
+
+    detalle = request.args.get('detalle', '0').lower() in ('1', 'true')
+    return jsonify(respuesta_consulta(trabajo['resultado'], detalle, columnar))
+
+
+def fechas_mes(tour_key, descarga):
+    """
+    Filas de la tabla de fechas de un mes recién descargado (con
+    'num_timeslots', como en resumir_resultados).
+
+    Args:
+        descarga: (month, data, status, msg) de pasos_consulta
+    """
+    _, data, _, _ = descarga
+    if not data:
+        return []
+
+    normalizado = AvailabilityChecker().normalize_data(data)
+    num_timeslots = {}
+    for ts in obtener_timeslots_detallados(None, None, None, [descarga]):
+        num_timeslots[ts['fecha']] = num_timeslots.get(ts['fecha'], 0) + 1
+
+    return [
+        dict(fecha, num_timeslots=num_timeslots.get(fecha['fecha'], 0))
+        for fecha in formatear_resultados_para_tabla(normalizado, tour_key)
+    ]
+
+
+def lineas_consulta(parametros, detalle=False, columnar=False):
+    """
+    Ejecuta una consulta y la codifica como NDJSON, una línea por paso:
+
+        {"tipo": "inicio", "meses": [...], "tours": {tour: {"nombre", "guid"}}}
+        {"tipo": "mes", "tour", "mes", "hechos", "total", "fechas": [...], "error"}
+        {"tipo": "resumen", ...respuesta de /api/consultar}
+        {"tipo": "error", "error"} si la consulta falla
+    """
+    def linea(datos):
+        return json.dumps(datos, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    try:
+        for paso in pasos_consulta(parametros):
+            if paso[0] == 'inicio':
+                _, meses, tours = paso
+                yield linea({
+                    "tipo": "inicio",
+                    "meses": meses,
+                    "tours": {t: {"nombre": TOURS[t]['nombre'], "guid": TOURS[t]['guid']} for t in tours}
+                })
+            elif paso[0] == 'mes':
+                _, tour_key, descarga, hechos, total = paso
+                month, data, status, msg = descarga
+                yield linea({
+                    "tipo": "mes",
+                    "tour": tour_key,
+                    "mes": month,
+                    "hechos": hechos,
+                    "total": total,
+                    "fechas": fechas_mes(tour_key, descarga),
+                    "error": None if data else f"status={status}, msg={msg[:50] if msg else ''}"
+                })
+            else:
+                yield linea(dict(respuesta_consulta(paso[1], detalle, columnar), tipo="resumen"))
+    except ValueError as e:
+        yield linea({"tipo": "error", "error": str(e)})
+    except Exception as e:
+        yield linea({"tipo": "error", "error": f"Error al procesar: {str(e)}"})
+
+
+@app.route('/api/consultar/stream', methods=['POST'])
+def consultar_disponibilidad_stream():
+    """
+    Variante en streaming de /api/consultar: responde NDJSON (ver
+    lineas_consulta) con una línea por mes y tour en cuanto se descarga, y una
+    línea final 'resumen' con la misma respuesta que /api/consultar.
+
+    Recibe:
+        El mismo body que /api/consultar ('encoding' se aplica a la línea 'resumen')
+
+    Returns:
+        application/x-ndjson en streaming
+    """
+    data = request.get_json(silent=True) or {}
+    parametros, error = preparar_consulta(data)
+    if error:
+        return error
+    columnar, error = encoding_solicitado(data)
+    if error:
+        return error
+
+    return Response(
+        stream_with_context(lineas_consulta(parametros, data.get('detalle'), columnar)),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/exportar-excel', methods=['POST'])
 def exportar_excel():
     """
     Exporta los resultados a Excel
 
     Recibe:
-        - resultados: Datos de la consulta
+        - result_id: Id devuelto por /api/consultar (preferido)
+        - resultados: Datos de la consulta (si no se envía result_id)
+        - format: 'xlsx' (default), 'csv', 'csv.gz' o 'ndjson' (body o query param)
 
     Returns:
-        Archivo Excel
+        Archivo Excel, o CSV/NDJSON en streaming
     """
     try:
-        data = request.json
-        resultados = data.get('resultados', {})
+        data = request.get_json(silent=True) or {}
+        resultados, error = obtener_resultados_solicitud(data)
+        if error:
+            return error
 
         if not resultados:
             return jsonify({"error": "No hay datos para exportar"}), 400
 
+        formato = (request.args.get('format') or data.get('format') or 'xlsx').lower()
+        if export_streams.es_formato_stream(formato):
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            return respuesta_stream(
+                export_streams.filas_resultados(resultados),
+                export_streams.COLUMNAS_RESULTADOS,
+                formato,
+                f"colosseo_disponibilidad_{timestamp}"
+            )
+        if formato != 'xlsx':
+            return jsonify({"error": f"Formato no soportado: {formato}"}), 400
+
+        # pandas solo se importa al exportar a Excel (no en el arranque en frío)
+        import pandas as pd
+
         # Crear archivo Excel en memoria
         output = BytesIO()
 
@@ -475,6 +941,7 @@ def exportar_excel():
                         "Plazas Disponibles": fecha_info['plazas_disponibles'],
                         "Plazas Totales": fecha_info['plazas_totales'],
                         "% Ocupado": fecha_info['porcentaje_ocupado'],
+                        "% Previsto": fecha_info.get('ocupacion_prevista'),
                         "Estado": fecha_info['estado']
                     })
 
@@ -676,241 +1143,49 @@ def guardar_cookies():
 def guardar_historico():
     """
     Guarda datos históricos de disponibilidad en Excel formato matriz para análisis de tendencias
-    Formato: Cada fila = fecha+hora, cada columna = timestamp de consulta
+    Formato: Cada fila = fecha+hora, cada columna = timestamp de consulta.
+    Las columnas se reparten en workbooks por periodo (ver historico_store).
+
+    Recibe:
+        - result_id: Id devuelto por /api/consultar (preferido)
+        - resultados: Datos de la consulta (si no se envía result_id)
 
     Returns:
         JSON con resultado
     """
     try:
-        from openpyxl import load_workbook, Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-        import os
-
-        data = request.json
-        resultados = data.get('resultados', {})
+        data = request.get_json(silent=True) or {}
+        resultados, error = obtener_resultados_solicitud(data)
+        if error:
+            return error
 
         if not resultados:
             return jsonify({"error": "No hay datos para guardar"}), 400
 
-        # Archivo de histórico
-        filename = 'historico_disponibilidad.xlsx'
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+        snapshot = historico_store.snapshot_desde_resultados(resultados)
+        result = historico_store.registrar_snapshot(snapshot)
 
-        # Crear o cargar workbook
-        if os.path.exists(filename):
-            wb = load_workbook(filename)
+        total_timeslots = result['total_timeslots']
+        if not result['local']:
+            message = f"Historico guardado en la nube ({total_timeslots} horarios)"
+        elif storage_client.is_configured():
+            message = f"Historico guardado localmente ({total_timeslots} horarios)"
         else:
-            wb = Workbook()
-            # Eliminar hoja por defecto
-            if 'Sheet' in wb.sheetnames:
-                wb.remove(wb['Sheet'])
-
-        # Procesar cada tour
-        for tour_key, tour_data in resultados.items():
-            tour_nombre = tour_data['nombre']
-            timeslots_por_fecha = tour_data.get('timeslots_por_fecha', {})
-
-            # Nombre de hoja (máx 31 caracteres)
-            sheet_name = f"{tour_key[:25]}"
-
-            # Crear estructura de datos: {(fecha, hora): {timestamp: disponibilidad}}
-            matriz_datos = {}
-            for fecha, timeslots in sorted(timeslots_por_fecha.items()):
-                for ts in sorted(timeslots, key=lambda x: x.get('hora', '')):
-                    hora = ts.get('hora', 'N/A')
-                    key = (fecha, hora)
-
-                    if key not in matriz_datos:
-                        matriz_datos[key] = {
-                            'capacidad_total': ts.get('capacidad_original', 0)
-                        }
-
-                    matriz_datos[key][timestamp] = ts.get('capacidad', 0)
-
-            # === CREAR/ACTUALIZAR HOJA ===
-            if sheet_name not in wb.sheetnames:
-                ws = wb.create_sheet(sheet_name)
-
-                # Headers fijos
-                ws['A1'] = 'Fecha'
-                ws['B1'] = 'Hora'
-                ws['C1'] = 'Capacidad Total'
-
-                # Estilo headers
-                header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-                header_font = Font(color='FFFFFF', bold=True)
-
-                for col in ['A1', 'B1', 'C1']:
-                    ws[col].fill = header_fill
-                    ws[col].font = header_font
-                    ws[col].alignment = Alignment(horizontal='center', vertical='center')
-
-                # Escribir filas (fecha + hora)
-                row = 2
-                for (fecha, hora), datos in sorted(matriz_datos.items()):
-                    ws[f'A{row}'] = fecha
-                    ws[f'B{row}'] = hora
-                    ws[f'C{row}'] = datos['capacidad_total']
-                    row += 1
-
-                # Ajustar anchos
-                ws.column_dimensions['A'].width = 12
-                ws.column_dimensions['B'].width = 8
-                ws.column_dimensions['C'].width = 14
-
-                # Primera columna de datos (timestamp actual)
-                col_num = 4
-            else:
-                ws = wb[sheet_name]
-
-                # Leer filas existentes y crear mapeo (fecha, hora) -> número de fila
-                filas_existentes = {}
-                for row in range(2, ws.max_row + 1):
-                    fecha_cell = ws[f'A{row}'].value
-                    hora_cell = ws[f'B{row}'].value
-                    if fecha_cell and hora_cell:
-                        key = (str(fecha_cell), str(hora_cell))
-                        filas_existentes[key] = row
-
-                # Identificar horarios nuevos que no existen en el archivo
-                horarios_nuevos = []
-                for (fecha, hora) in sorted(matriz_datos.keys()):
-                    key = (fecha, hora)
-                    if key not in filas_existentes:
-                        horarios_nuevos.append(key)
-
-                # Agregar horarios nuevos al final
-                if horarios_nuevos:
-                    next_row = ws.max_row + 1
-                    for (fecha, hora) in horarios_nuevos:
-                        ws[f'A{next_row}'] = fecha
-                        ws[f'B{next_row}'] = hora
-                        ws[f'C{next_row}'] = matriz_datos[(fecha, hora)]['capacidad_total']
-                        filas_existentes[(fecha, hora)] = next_row
-                        next_row += 1
-
-                # Encontrar la siguiente columna disponible
-                col_num = ws.max_column + 1
-
-            # Agregar nueva columna con timestamp
-            col_letter = get_column_letter(col_num)
-
-            # Header de la nueva columna (timestamp)
-            ws[f'{col_letter}1'] = timestamp
-            ws[f'{col_letter}1'].fill = PatternFill(start_color='70AD47', end_color='70AD47', fill_type='solid')
-            ws[f'{col_letter}1'].font = Font(color='FFFFFF', bold=True)
-            ws[f'{col_letter}1'].alignment = Alignment(horizontal='center', vertical='center')
-            ws.column_dimensions[col_letter].width = 12
-
-            # Llenar datos de disponibilidad en las filas correspondientes
-            if sheet_name not in wb.sheetnames or col_num == 4:
-                # Primera vez: iterar en orden
-                row = 2
-                for (fecha, hora), datos in sorted(matriz_datos.items()):
-                    disponibilidad = datos.get(timestamp, 0)
-                    cell = ws[f'{col_letter}{row}']
-                    cell.value = disponibilidad
-                    cell.alignment = Alignment(horizontal='center')
-
-                    # Formato condicional por color
-                    capacidad_total = datos['capacidad_total']
-                    if capacidad_total > 0:
-                        porcentaje = (disponibilidad / capacidad_total) * 100
-                        if disponibilidad == 0:
-                            cell.fill = PatternFill(start_color='FF6B6B', end_color='FF6B6B', fill_type='solid')
-                            cell.font = Font(color='FFFFFF', bold=True)
-                        elif porcentaje < 30:
-                            cell.fill = PatternFill(start_color='FFE066', end_color='FFE066', fill_type='solid')
-                        elif porcentaje > 70:
-                            cell.fill = PatternFill(start_color='95E1D3', end_color='95E1D3', fill_type='solid')
-
-                    row += 1
-            else:
-                # Actualizaciones posteriores: usar mapeo de filas existentes
-                for (fecha, hora), datos in matriz_datos.items():
-                    key = (fecha, hora)
-                    if key in filas_existentes:
-                        row_num = filas_existentes[key]
-                        disponibilidad = datos.get(timestamp, 0)
-                        cell = ws[f'{col_letter}{row_num}']
-                        cell.value = disponibilidad
-                        cell.alignment = Alignment(horizontal='center')
-
-                        # Formato condicional por color
-                        capacidad_total = datos['capacidad_total']
-                        if capacidad_total > 0:
-                            porcentaje = (disponibilidad / capacidad_total) * 100
-                            if disponibilidad == 0:
-                                cell.fill = PatternFill(start_color='FF6B6B', end_color='FF6B6B', fill_type='solid')
-                                cell.font = Font(color='FFFFFF', bold=True)
-                            elif porcentaje < 30:
-                                cell.fill = PatternFill(start_color='FFE066', end_color='FFE066', fill_type='solid')
-                            elif porcentaje > 70:
-                                cell.fill = PatternFill(start_color='95E1D3', end_color='95E1D3', fill_type='solid')
-
-                # Para filas que ya no tienen datos (horarios pasados), dejar vacías con marca
-                for row in range(2, ws.max_row + 1):
-                    fecha_cell = ws[f'A{row}'].value
-                    hora_cell = ws[f'B{row}'].value
-                    if fecha_cell and hora_cell:
-                        key = (str(fecha_cell), str(hora_cell))
-                        if key not in matriz_datos:
-                            # Este horario ya no está en la consulta actual (pasó o se eliminó)
-                            cell = ws[f'{col_letter}{row}']
-                            cell.value = '-'  # Marca para indicar que no está disponible
-                            cell.alignment = Alignment(horizontal='center')
-                            cell.fill = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
-                            cell.font = Font(color='999999', italic=True)
-
-        # Contar timeslots
-        total_timeslots = sum(
-            len(tour_data.get('timeslots_por_fecha', {}).get(fecha, []))
-            for tour_data in resultados.values()
-            for fecha in tour_data.get('timeslots_por_fecha', {})
-        )
+            message = f"Historico actualizado ({total_timeslots} horarios)"
 
-        # Guardar archivo - local o Supabase
-        if storage_client.is_configured():
-            # Guardar en Supabase Storage
-            output = BytesIO()
-            wb.save(output)
-            output.seek(0)
-
-            upload_result = storage_client.upload_file(
-                output.getvalue(),
-                filename,
-                folder='historico'
-            )
-
-            if upload_result['success']:
-                return jsonify({
-                    "success": True,
-                    "message": f"Historico guardado en la nube ({total_timeslots} horarios)",
-                    "filename": filename,
-                    "timestamp": timestamp,
-                    "url": upload_result.get('url', '')
-                })
-            else:
-                # Fallback a local si falla Supabase
-                wb.save(filename)
-                return jsonify({
-                    "success": True,
-                    "message": f"Historico guardado localmente ({total_timeslots} horarios)",
-                    "filename": filename,
-                    "timestamp": timestamp,
-                    "warning": "No se pudo guardar en la nube"
-                })
-        else:
-            # Guardar localmente
-            wb.save(filename)
-            return jsonify({
-                "success": True,
-                "message": f"Historico actualizado ({total_timeslots} horarios)",
-                "filename": filename,
-                "timestamp": timestamp
-            })
+        response = {
+            "success": True,
+            "message": message,
+            "filename": os.path.basename(result['path']),
+            "particion": result['particion'],
+            "timestamp": result['timestamp']
+        }
+        if result.get('warning'):
+            response["warning"] = "No se pudo guardar en la nube"
+        return jsonify(response)
 
+    except historico_store.HistoricoOcupado as e:
+        return jsonify({"error": str(e)}), 423
     except PermissionError as e:
         return jsonify({"error": f"No se puede guardar: el archivo está abierto en otro programa. Ciérralo e intenta de nuevo."}), 423
     except OSError as e:
@@ -924,34 +1199,56 @@ def guardar_historico():
 @app.route('/api/descargar-historico', methods=['GET'])
 def descargar_historico():
     """
-    Descarga el archivo histórico desde Supabase o local.
+    Descarga el histórico desde Supabase o local, combinando las particiones pedidas.
 
     Query params:
         - include_past: 'true' o 'false' (default: 'true') - incluir fechas pasadas
         - fix_timezone: 'true' o 'false' (default: 'true') - corregir horarios UTC a CET
+        - desde: Periodo inicial inclusive (ej: '2025-11'). Opcional
+        - hasta: Periodo final inclusive (ej: '2025-12'). Opcional
+          Sin rango se combinan las particiones más recientes que caben en una hoja
+        - format: 'xlsx' (default), 'csv', 'csv.gz' o 'ndjson'. Los formatos de texto
+          se generan en streaming en formato largo (una fila por horario y snapshot)
+          y sin rango incluyen todas las particiones
 
     Returns:
-        Archivo Excel directamente
+        Archivo Excel directamente, o CSV/NDJSON en streaming
     """
-    from openpyxl import load_workbook, Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from copy import copy
-
     try:
         include_past = request.args.get('include_past', 'true').lower() == 'true'
         fix_timezone = request.args.get('fix_timezone', 'true').lower() == 'true'
+        desde = request.args.get('desde') or None
+        hasta = request.args.get('hasta') or None
+        formato = request.args.get('format', 'xlsx').lower()
 
-        # Obtener el archivo
-        if storage_client.is_configured():
-            result = storage_client.download_file('historico/historico_disponibilidad.xlsx')
-            if not result['success']:
-                return jsonify({"error": "Archivo no encontrado en la nube"}), 404
-            wb = load_workbook(BytesIO(result['data']))
-        else:
-            filename = 'historico_disponibilidad.xlsx'
-            if not os.path.exists(filename):
+        # Obtener las particiones
+        manifest = historico_store.cargar_manifest()
+
+        if export_streams.es_formato_stream(formato):
+            if desde or hasta:
+                particiones = historico_store.seleccionar_particiones(manifest, desde, hasta)
+            else:
+                particiones = historico_store.particiones_ordenadas(manifest)
+            if not particiones:
                 return jsonify({"error": "Archivo no encontrado"}), 404
-            wb = load_workbook(filename)
+
+            suffix = '' if include_past else '_future_only'
+            return respuesta_stream(
+                export_streams.filas_historico(particiones, include_past, fix_timezone),
+                export_streams.COLUMNAS_HISTORICO,
+                formato,
+                f"historico_disponibilidad{suffix}"
+            )
+        if formato != 'xlsx':
+            return jsonify({"error": f"Formato no soportado: {formato}"}), 400
+
+        particiones = historico_store.seleccionar_particiones(manifest, desde, hasta)
+        if not particiones:
+            return jsonify({"error": "Archivo no encontrado"}), 404
+
+        wb = historico_store.combinar_particiones(particiones)
+        if wb is None:
+            return jsonify({"error": "Archivo no encontrado"}), 404
 
         today = datetime.now().strftime('%Y-%m-%d')
 
@@ -997,6 +1294,8 @@ def descargar_historico():
 
         # Nombre del archivo según filtro
         suffix = '' if include_past else '_future_only'
+        if desde or hasta:
+            suffix += f"_{desde or 'inicio'}_{hasta or 'fin'}"
         download_name = f'historico_disponibilidad{suffix}.xlsx'
 
         return send_file(
@@ -1010,6 +1309,401 @@ def descargar_historico():
         return jsonify({"error": f"Error: {str(e)}"}), 500
 
 
+@app.route('/api/historico/particiones', methods=['GET'])
+def historico_particiones():
+    """
+    Lista las particiones del histórico registradas en el manifest.
+
+    Returns:
+        JSON con periodo y particiones (clave, path, columnas, filas, bytes, desde, hasta)
+    """
+    try:
+        manifest = historico_store.cargar_manifest()
+        return jsonify({
+            "success": True,
+            "periodo": manifest.get('periodo', historico_store.PERIODO),
+            "max_columnas": historico_store.MAX_COLUMNAS,
+            "particiones": historico_store.particiones_ordenadas(manifest)
+        })
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/historico/backfill', methods=['POST'])
+def historico_backfill():
+    """
+    Aplica varios snapshots recuperados al histórico en una sola pasada
+    (una carga, guardado y subida por partición afectada).
+
+    Recibe:
+        - snapshots: Lista de {'availability' | 'resultados', 'timestamp'}
+          (caché de Railway o respuestas de /api/consultar archivadas)
+
+    Returns:
+        JSON con snapshots aplicados, horarios y particiones modificadas; 423
+        si otro guardado del histórico no termina a tiempo
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        archivos = data.get('snapshots') or []
+        if not isinstance(archivos, list) or not archivos:
+            return jsonify({"error": "Se requiere una lista 'snapshots'"}), 400
+
+        snapshots = []
+        for i, archivo in enumerate(archivos):
+            try:
+                snapshots.append(historico_store.snapshot_desde_archivo(archivo))
+            except (ValueError, TypeError, AttributeError) as e:
+                return jsonify({"error": f"Snapshot {i} inválido: {str(e)}"}), 400
+
+        result = historico_store.registrar_snapshots(snapshots)
+        return jsonify(result)
+
+    except historico_store.HistoricoOcupado as e:
+        return jsonify({"error": str(e)}), 423
+    except Exception as e:
+        return jsonify({"error": f"Error en backfill: {str(e)}"}), 500
+
+
+@app.route('/api/heatmap', methods=['GET'])
+def heatmap_demanda():
+    """
+    Heatmap de demanda día de semana x hora x antelación, acumulado sobre
+    todos los snapshots del histórico (precalculado, ver demanda_heatmap).
+
+    Query params:
+        - tour: Clave del tour (opcional, default: todos)
+
+    Returns:
+        JSON con 'dias', 'horas', 'antelacion' y matrices [día][hora][antelación]
+        de 'ocupacion_promedio', 'porcentaje_agotado' y 'observaciones'; 503
+        si el agregado aún no se ha construido
+    """
+    try:
+        import demanda_heatmap
+        tour = request.args.get('tour') or None
+        heatmap = demanda_heatmap.obtener_heatmap()
+        if heatmap is None:
+            return jsonify({"error": "El heatmap aún no se ha construido (lo construye el siguiente snapshot de Railway)"}), 503
+        data = heatmap.respuesta(tour)
+        if data is None:
+            return jsonify({"error": f"Sin datos para el tour '{tour}'"}), 404
+        return Response(data, mimetype='application/json')
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/eventos', methods=['GET'])
+def eventos_cambio():
+    """
+    Eventos de cambio entre snapshots consecutivos (ver diff_snapshots).
+
+    Query params:
+        - fecha: Día del log YYYY-MM-DD (default: hoy en hora de Roma)
+        - tipo: agotado, reabierto, bajada_capacidad, nuevo_horario,
+          nueva_fecha o horario_eliminado (opcional)
+        - tour: Clave del tour (opcional)
+        - desde_id: Solo eventos con id mayor (opcional)
+
+    Returns:
+        JSON con la lista de eventos
+    """
+    try:
+        fecha = request.args.get('fecha') or historico_store.timestamp_actual()[:10]
+        tipo = request.args.get('tipo') or None
+        if tipo and tipo not in diff_snapshots.TIPOS:
+            return jsonify({"error": f"Tipo inválido. Usa uno de: {', '.join(diff_snapshots.TIPOS)}"}), 400
+        try:
+            desde_id = int(request.args['desde_id']) if request.args.get('desde_id') else None
+        except ValueError:
+            return jsonify({"error": "desde_id debe ser un entero"}), 400
+
+        eventos = diff_snapshots.leer_eventos(fecha, tipo, request.args.get('tour') or None, desde_id)
+        return jsonify({
+            "success": True,
+            "fecha": fecha,
+            "total": len(eventos),
+            "eventos": eventos
+        })
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/slots/search', methods=['GET'])
+def buscar_slots():
+    """
+    Busca horarios en el índice en memoria del último snapshot.
+
+    Query params:
+        - tour: Claves de tour separadas por coma (opcional)
+        - desde / hasta: Rango de fechas YYYY-MM-DD (opcional)
+        - dias: Días de semana separados por coma, 0 (lunes) a 6 (domingo)
+        - hora_desde / hora_hasta: Rango de horas HH:MM (opcional)
+        - min_plazas: Capacidad mínima (opcional)
+        - limite: Máximo de horarios devueltos (default: 1000)
+
+    Returns:
+        JSON con 'total' (coincidencias) y 'slots' ordenados por fecha, hora y tour
+    """
+    try:
+        try:
+            tours = [t for t in request.args.get('tour', '').split(',') if t]
+            dias = [int(d) for d in request.args.get('dias', '').split(',') if d.strip()]
+            min_plazas = int(request.args.get('min_plazas', 0))
+            limite = min(int(request.args.get('limite', indice_disponibilidad.LIMITE_RESULTADOS)),
+                         indice_disponibilidad.LIMITE_RESULTADOS)
+            desde = request.args.get('desde') or None
+            hasta = request.args.get('hasta') or None
+            for fecha in (desde, hasta):
+                if fecha:
+                    datetime.strptime(fecha, '%Y-%m-%d')
+            hora_desde = request.args.get('hora_desde') or None
+            hora_hasta = request.args.get('hora_hasta') or None
+            for hora in (hora_desde, hora_hasta):
+                if hora:
+                    datetime.strptime(hora, '%H:%M')
+        except ValueError:
+            return jsonify({"error": "Parámetros inválidos: fechas YYYY-MM-DD, horas HH:MM, dias/min_plazas/limite enteros"}), 400
+
+        indice = indice_disponibilidad.obtener_indice()
+        if indice is None:
+            return jsonify({"error": "No hay disponibilidad cacheada"}), 404
+
+        inicio = time.perf_counter()
+        resultado = indice.buscar(tours, desde, hasta, dias, hora_desde, hora_hasta, min_plazas, limite)
+
+        return jsonify({
+            "success": True,
+            "timestamp": indice.timestamp,
+            "total": resultado['total'],
+            "slots": resultado['slots'],
+            "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+        })
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/grupos/buscar', methods=['GET'])
+def buscar_grupos():
+    """
+    Busca horarios sueltos o combinaciones de horarios adyacentes del mismo
+    día con capacidad para un grupo, ordenados por cercanía a la fecha y hora
+    deseadas.
+
+    Query params:
+        - personas: Tamaño del grupo (requerido)
+        - fecha / hora: Fecha YYYY-MM-DD y hora HH:MM deseadas (opcional)
+        - tour: Claves de tour separadas por coma (opcional)
+        - entre_tours: 1 para combinar horarios de distintos tours (default: 0)
+        - max_horarios: Máximo de horarios combinados (default: 4)
+        - desde / hasta: Rango de fechas YYYY-MM-DD (opcional)
+        - limite: Máximo de opciones (default: 20)
+
+    Returns:
+        JSON con 'opciones'
+    """
+    try:
+        try:
+            personas = int(request.args['personas'])
+            tours = [t for t in request.args.get('tour', '').split(',') if t]
+            entre_tours = request.args.get('entre_tours', '0').lower() in ('1', 'true', 'si', 'sí')
+            max_horarios = int(request.args.get('max_horarios', buscador_grupos.MAX_HORARIOS))
+            limite = min(int(request.args.get('limite', buscador_grupos.LIMITE_OPCIONES)),
+                         indice_disponibilidad.LIMITE_RESULTADOS)
+            fecha = request.args.get('fecha') or None
+            desde = request.args.get('desde') or None
+            hasta = request.args.get('hasta') or None
+            for valor in (fecha, desde, hasta):
+                if valor:
+                    datetime.strptime(valor, '%Y-%m-%d')
+            hora = request.args.get('hora') or None
+            if hora:
+                datetime.strptime(hora, '%H:%M')
+        except (KeyError, ValueError):
+            return jsonify({"error": "Parámetros inválidos: personas requerido (entero), fechas YYYY-MM-DD, hora HH:MM"}), 400
+
+        if personas <= 0 or max_horarios <= 0:
+            return jsonify({"error": "personas y max_horarios deben ser mayores que 0"}), 400
+
+        indice = indice_disponibilidad.obtener_indice()
+        if indice is None:
+            return jsonify({"error": "No hay disponibilidad cacheada"}), 404
+
+        inicio = time.perf_counter()
+        opciones = buscador_grupos.buscar(
+            indice.horarios_por_dia(tours, desde, hasta), personas,
+            fecha=fecha, hora=hora, max_horarios=max_horarios,
+            entre_tours=entre_tours, limite=limite
+        )
+
+        return jsonify({
+            "success": True,
+            "timestamp": indice.timestamp,
+            "personas": personas,
+            "total": len(opciones),
+            "opciones": opciones,
+            "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+        })
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/vigilancia/reglas', methods=['GET'])
+def listar_reglas_vigilancia():
+    """Lista las reglas de vigilancia guardadas"""
+    try:
+        data = reglas_vigilancia.cargar_reglas()
+        return jsonify({"success": True, "total": len(data.get('reglas', [])), "reglas": data.get('reglas', [])})
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/vigilancia/reglas', methods=['POST'])
+def crear_regla_vigilancia():
+    """
+    Crea (o reemplaza, si trae 'id') una regla de vigilancia.
+
+    Recibe:
+        - tour: Clave del tour o '*' (default: '*')
+        - desde / hasta: Rango de fechas YYYY-MM-DD
+        - dias_semana: Lista 0 (lunes) a 6 (domingo) (opcional)
+        - hora_desde / hora_hasta: HH:MM (opcional)
+        - min_plazas: Plazas mínimas (default: 1)
+        - nombre: Descripción (opcional)
+
+    Returns:
+        JSON con la regla guardada
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            regla = reglas_vigilancia.agregar_regla(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"success": True, "regla": regla})
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/vigilancia/reglas/<regla_id>', methods=['DELETE'])
+def eliminar_regla_vigilancia(regla_id):
+    """Elimina una regla de vigilancia"""
+    try:
+        if not reglas_vigilancia.eliminar_regla(regla_id):
+            return jsonify({"error": "Regla no encontrada"}), 404
+        return jsonify({"success": True})
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/vigilancia/coincidencias', methods=['GET'])
+def coincidencias_vigilancia():
+    """
+    Horarios del último snapshot que cumplen cada regla de vigilancia.
+
+    Query params:
+        - regla: Id de una regla (opcional, default: todas)
+
+    Returns:
+        JSON con 'timestamp' del snapshot y 'coincidencias' {regla_id: [horarios]}
+    """
+    try:
+        data = reglas_vigilancia.coincidencias_actuales()
+        coincidencias = data.get('coincidencias', {})
+
+        regla_id = request.args.get('regla')
+        if regla_id:
+            coincidencias = {regla_id: coincidencias.get(regla_id, [])}
+
+        return jsonify({
+            "success": True,
+            "timestamp": data.get('timestamp'),
+            "total": sum(len(v) for v in coincidencias.values()),
+            "coincidencias": coincidencias
+        })
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/historico/series', methods=['GET'])
+def historico_series():
+    """
+    Serie temporal de capacidad de un horario, servida desde el índice del histórico.
+
+    Query params:
+        - tour: Clave del tour (ej: 'arena')
+        - fecha: Fecha del horario (YYYY-MM-DD)
+        - hora: Hora del horario (HH:MM)
+        - from: Timestamp inicial inclusive (prefijo, ej: '2025-12-01'). Opcional
+        - to: Timestamp final inclusive (prefijo, ej: '2025-12-01 18'). Opcional
+
+    Returns:
+        JSON con 'puntos' = [[timestamp, capacidad], ...] (solo cambios de capacidad)
+    """
+    try:
+        tour = request.args.get('tour', '')
+        fecha = request.args.get('fecha', '')
+        hora = request.args.get('hora', '')
+
+        if not tour or not fecha or not hora:
+            return jsonify({"error": "Parámetros requeridos: tour, fecha, hora"}), 400
+
+        serie = series_index.consultar_serie(
+            tour, fecha, hora,
+            request.args.get('from') or None,
+            request.args.get('to') or None
+        )
+
+        return jsonify({
+            "success": True,
+            "tour": tour,
+            "fecha": fecha,
+            "hora": hora,
+            "capacidad_original": serie['capacidad_original'],
+            "puntos": serie['puntos']
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/historico/series/fecha', methods=['GET'])
+def historico_series_fecha():
+    """
+    Series temporales de todos los horarios de una fecha.
+
+    Query params:
+        - tour: Clave del tour
+        - fecha: Fecha (YYYY-MM-DD)
+        - from / to: Rango de timestamps (opcional, igual que /api/historico/series)
+
+    Returns:
+        JSON con 'horas' = {hora: {'capacidad_original', 'puntos'}}
+    """
+    try:
+        tour = request.args.get('tour', '')
+        fecha = request.args.get('fecha', '')
+
+        if not tour or not fecha:
+            return jsonify({"error": "Parámetros requeridos: tour, fecha"}), 400
+
+        horas = series_index.consultar_fecha(
+            tour, fecha,
+            request.args.get('from') or None,
+            request.args.get('to') or None
+        )
+
+        return jsonify({
+            "success": True,
+            "tour": tour,
+            "fecha": fecha,
+            "horas": horas
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+
 @app.route('/api/storage-status', methods=['GET'])
 def storage_status():
     """Verifica el estado del almacenamiento"""
@@ -1029,7 +1723,7 @@ def proxy_status():
     Returns:
         JSON con estadísticas de proxies
     """
-    return jsonify(proxy_manager.get_stats())
+    return jsonify(obtener_proxy_manager().get_stats())
 
 
 @app.route('/api/proxy/add', methods=['POST'])
@@ -1044,6 +1738,7 @@ def proxy_add():
         JSON con resultado
     """
     try:
+        proxy_manager = obtener_proxy_manager()
         data = request.json
         proxies_text = data.get('proxies', '')
 
@@ -1088,6 +1783,7 @@ def proxy_test():
         JSON con resultados de prueba
     """
     try:
+        proxy_manager = obtener_proxy_manager()
         if not proxy_manager.proxies:
             return jsonify({"error": "No hay proxies configurados"}), 400
 
@@ -1118,6 +1814,7 @@ def proxy_clear():
         JSON con resultado
     """
     try:
+        proxy_manager = obtener_proxy_manager()
         proxy_manager.clear_stats()
         return jsonify({
             "success": True,
@@ -1140,6 +1837,7 @@ def proxy_remove():
         JSON con resultado
     """
     try:
+        proxy_manager = obtener_proxy_manager()
         data = request.json
 
         if data.get('all'):
@@ -1176,6 +1874,7 @@ def proxy_save():
         JSON con resultado
     """
     try:
+        proxy_manager = obtener_proxy_manager()
         if not proxy_manager.proxies:
             return jsonify({"error": "No hay proxies para guardar"}), 400
 
@@ -1194,83 +1893,403 @@ def proxy_save():
         return jsonify({"error": f"Error: {str(e)}"}), 500
 
 
+# Respuesta de /api/availability/cached precalculada por snapshot de Railway
+TTL_DISPONIBILIDAD_CACHEADA = int(os.environ.get('AVAILABILITY_CACHE_TTL', '30'))
+_respuesta_cacheada = {'clave': None, 'datos': None, 'cuerpos': {}, 'deltas': {}, 'consultado': 0.0}
+
+# Eventos máximos entre dos versiones para responder con un delta (con más se
+# envía el snapshot completo) y deltas precalculados que se guardan por snapshot
+MAX_EVENTOS_DELTA = int(os.environ.get('AVAILABILITY_DELTA_MAX_EVENTOS', '5000'))
+MAX_DELTAS_CACHEADOS = 64
+
+
+def formatear_disponibilidad_cacheada(result):
+    """
+    Convierte la disponibilidad cacheada por Railway al formato de
+    /api/consultar (timeslots en hora de Roma agrupados por fecha).
+
+    Args:
+        result: Resultado de storage_client.get_cached_availability
+
+    Returns:
+        dict con 'resultados', 'timestamp', 'source' y 'cached'
+    """
+    availability = result.get('availability', {})
+    timestamp = result.get('timestamp', '')
+
+    # Formatear respuesta similar a /api/consultar
+    formatted = {
+        "resultados": {},
+        "timestamp": timestamp,
+        "source": result.get('source', 'cache'),
+        "cached": True
+    }
+
+    for tour_key, tour_data in availability.items():
+        # Procesar timeslots para formato compatible con frontend
+        fechas = {}
+        for ts in tour_data.get('timeslots', []):
+            start_dt = ts.get('startDateTime', '')
+            if not start_dt:
+                continue
+
+            # Convertir UTC a hora de Roma
+            fecha, hora = utc_to_rome(start_dt)
+            if not fecha:
+                continue
+
+            if fecha not in fechas:
+                fechas[fecha] = {
+                    'fecha': fecha,
+                    'plazas_disponibles': 0,
+                    'plazas_totales': 0,
+                    'timeslots': []
+                }
+
+            capacity = ts.get('capacity', 0)
+            original_capacity = ts.get('originalCapacity', capacity)
+
+            fechas[fecha]['plazas_disponibles'] += capacity
+            fechas[fecha]['plazas_totales'] += original_capacity
+            fechas[fecha]['timeslots'].append({
+                'hora': hora,
+                'capacidad': capacity,
+                'capacidad_original': original_capacity
+            })
+
+        # Convertir a lista y calcular totales
+        fechas_list = sorted(fechas.values(), key=lambda x: x['fecha'])
+
+        formatted['resultados'][tour_key] = {
+            'nombre': tour_data.get('nombre', tour_key),
+            'guid': tour_data.get('guid', ''),
+            'total_fechas': len(fechas_list),
+            'total_plazas': sum(f['plazas_disponibles'] for f in fechas_list),
+            'fechas': fechas_list,
+            'timeslots_por_fecha': {f['fecha']: f['timeslots'] for f in fechas_list}
+        }
+
+    ahora = None
+    if timestamp:
+        try:
+            ahora = historico_store.normalizar_timestamp(timestamp)
+        except ValueError:
+            pass
+    anotar_velocidades(formatted['resultados'], ahora)
+
+    return formatted
+
+
+def datos_disponibilidad_cacheada():
+    """
+    Disponibilidad cacheada ya formateada (con detalle por horario). Se
+    formatea una vez por snapshot (timestamp y origen) y el origen se vuelve
+    a consultar como máximo cada TTL_DISPONIBILIDAD_CACHEADA segundos.
+
+    'version' es el id del último evento de diff_snapshots cuando Railway
+    comparó este mismo snapshot, guardado junto a la disponibilidad (None si
+    no lo tiene, y los clientes piden entonces el snapshot completo). No se
+    usa la secuencia global porque también avanza con los guardados de
+    /api/guardar-historico, que no cambian esta caché.
+
+    Returns:
+        (datos, None) o (None, result) si no hay datos cacheados
+    """
+    ahora = time.time()
+    cache = _respuesta_cacheada
+    if cache['datos'] is not None and ahora - cache['consultado'] < TTL_DISPONIBILIDAD_CACHEADA:
+        return cache['datos'], None
+
+    result = storage_client.get_cached_availability()
+    if not result['success']:
+        return None, result
+
+    clave = (result.get('timestamp', ''), result.get('source', ''))
+    if cache['clave'] != clave:
+        datos = formatear_disponibilidad_cacheada(result)
+        datos['version'] = result.get('version')
+        cache.update(clave=clave, datos=datos, cuerpos={}, deltas={})
+    cache['consultado'] = ahora
+    return cache['datos'], None
+
+
+def obtener_disponibilidad_cacheada(detalle=False, columnar=False):
+    """
+    Bytes JSON (con sus variantes comprimidas) y ETag de
+    /api/availability/cached, precalculados por snapshot.
+
+    Args:
+        detalle: Si True incluye los horarios de cada fecha
+        columnar: Si True usa la codificación columnar
+
+    Returns:
+        (VariantesComprimidas, etag, None) o (None, None, result) si no hay datos cacheados
+    """
+    datos, result = datos_disponibilidad_cacheada()
+    if datos is None:
+        return None, None, result
+
+    cuerpos = _respuesta_cacheada['cuerpos']
+    clave = (detalle, columnar)
+    if clave not in cuerpos:
+        if not detalle:
+            datos = dict(datos, resultados=resumir_resultados(datos['resultados']), detalle_omitido=True)
+        if columnar:
+            datos = codificacion_columnar.codificar(datos)
+        cuerpo = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        cuerpos[clave] = (compresion.VariantesComprimidas(cuerpo), hashlib.sha1(cuerpo).hexdigest())
+    variantes, etag = cuerpos[clave]
+    return variantes, etag, None
+
+
+def fechas_cambiadas(desde, hasta):
+    """
+    Fechas con algún evento de cambio entre dos versiones de la
+    disponibilidad cacheada (ids consecutivos del log de diff_snapshots).
+
+    Args:
+        desde: Versión del cliente (exclusive)
+        hasta: Versión actual (inclusive)
+
+    Returns:
+        set de (tour, fecha), o None si hay más de MAX_EVENTOS_DELTA eventos
+        o los logs de ayer y hoy no cubren el intervalo
+    """
+    if desde == hasta:
+        return set()
+    if hasta - desde > MAX_EVENTOS_DELTA:
+        return None
+
+    eventos = [e for e in difusion_cambios.leer_eventos_recientes(desde) if e['id'] <= hasta]
+    if not eventos or eventos[0]['id'] != desde + 1 or eventos[-1]['id'] != hasta:
+        return None
+    return {(e['tour'], e['fecha']) for e in eventos}
+
+
+def delta_disponibilidad(datos, desde, cambiadas, columnar=False):
+    """
+    Cuerpo de /api/availability/delta: cada tour con sus campos actuales,
+    solo las fechas cambiadas (resumen, como /api/availability/cached sin
+    detalle) y en 'eliminadas' las que ya no están publicadas.
+    """
+    resultados = {}
+    for tour_key, tour_data in datos['resultados'].items():
+        cambiadas_tour = {fecha for tour, fecha in cambiadas if tour == tour_key}
+        tour = dict(tour_data, fechas=[f for f in tour_data['fechas'] if f['fecha'] in cambiadas_tour])
+        tour['eliminadas'] = sorted(cambiadas_tour - {f['fecha'] for f in tour['fechas']})
+        resultados[tour_key] = tour
+
+    delta = dict(datos, resultados=resumir_resultados(resultados), detalle_omitido=True,
+                 delta=True, desde=desde)
+    if columnar:
+        delta = codificacion_columnar.codificar(delta)
+    return delta
+
+
+def obtener_delta_disponibilidad(desde, columnar=False):
+    """
+    Bytes JSON (con sus variantes comprimidas) y ETag de
+    /api/availability/delta, precalculados por snapshot y versión de origen.
+    Si no se puede responder con un delta se devuelve el snapshot completo
+    (el mismo cuerpo que /api/availability/cached sin detalle).
+
+    Returns:
+        (VariantesComprimidas, etag, None) o (None, None, result) si no hay datos cacheados
+    """
+    datos, result = datos_disponibilidad_cacheada()
+    if datos is None:
+        return None, None, result
+
+    deltas = _respuesta_cacheada['deltas']
+    clave = (desde, columnar)
+    if clave not in deltas:
+        version = datos.get('version')
+        cambiadas = None
+        if version is not None and desde <= version:
+            cambiadas = fechas_cambiadas(desde, version)
+
+        if len(deltas) >= MAX_DELTAS_CACHEADOS:
+            deltas.clear()
+        if cambiadas is None:
+            deltas[clave] = None
+        else:
+            cuerpo = json.dumps(delta_disponibilidad(datos, desde, cambiadas, columnar),
+                                ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            deltas[clave] = (compresion.VariantesComprimidas(cuerpo), hashlib.sha1(cuerpo).hexdigest())
+
+    if deltas[clave] is None:
+        return obtener_disponibilidad_cacheada(False, columnar)
+    variantes, etag = deltas[clave]
+    return variantes, etag, None
+
+
+def respuesta_disponibilidad(variantes, etag, result):
+    """
+    Respuesta de un cuerpo precalculado de disponibilidad: 404 sin datos
+    cacheados, 304 si el cliente ya tiene esa versión (If-None-Match) o el
+    cuerpo en la mejor codificación aceptada.
+    """
+    if variantes is None:
+        return jsonify({
+            "error": result.get('error', 'No hay datos cacheados'),
+            "cached": False,
+            "hint": "Railway debe ejecutarse para obtener y cachear la disponibilidad"
+        }), 404
+
+    # El navegador guarda la respuesta pero la revalida en cada carga
+    headers = {'Cache-Control': 'no-cache'}
+    codificacion = None
+    if len(variantes) >= compresion.UMBRAL_BYTES:
+        headers['Vary'] = 'Accept-Encoding'
+        codificacion = compresion.elegir_codificacion(request.accept_encodings)
+    if codificacion:
+        # Cada codificación es una representación distinta con su propio ETag
+        headers['Content-Encoding'] = codificacion
+        etag = f"{etag}-{codificacion}"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.headers.pop('Content-Encoding', None)
+    else:
+        response = Response(variantes.obtener(codificacion), mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    return response
+
+
 @app.route('/api/availability/cached', methods=['GET'])
 def get_cached_availability():
     """
     Obtiene la disponibilidad cacheada desde Supabase.
     Railway consulta la disponibilidad desde el navegador y la guarda en Supabase.
-    Este endpoint devuelve esos datos cacheados.
+    Este endpoint devuelve esos datos cacheados, precalculados por snapshot y
+    con ETag: si el cliente ya tiene la versión actual (If-None-Match) se
+    responde 304 sin cuerpo. Las variantes gzip / brotli se comprimen una vez
+    por snapshot.
+
+    Query params:
+        - detalle: 1 para incluir los horarios de cada fecha (por defecto solo
+          el resumen; el detalle se pide por fecha a /api/timeslots)
+        - encoding: 'json' (default) o 'columnar'
 
     Returns:
-        JSON con disponibilidad por tour
+        JSON con disponibilidad por tour y su 'version' (para pedir después
+        solo los cambios a /api/availability/delta)
     """
     try:
-        result = storage_client.get_cached_availability()
+        detalle = request.args.get('detalle', '0').lower() in ('1', 'true')
+        columnar, error = encoding_solicitado()
+        if error:
+            return error
+        return respuesta_disponibilidad(*obtener_disponibilidad_cacheada(detalle, columnar))
 
-        if result['success']:
-            availability = result.get('availability', {})
-            timestamp = result.get('timestamp', '')
-
-            # Formatear respuesta similar a /api/consultar
-            formatted = {
-                "resultados": {},
-                "timestamp": timestamp,
-                "source": result.get('source', 'cache'),
-                "cached": True
-            }
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
 
-            for tour_key, tour_data in availability.items():
-                # Procesar timeslots para formato compatible con frontend
-                fechas = {}
-                for ts in tour_data.get('timeslots', []):
-                    start_dt = ts.get('startDateTime', '')
-                    if not start_dt:
-                        continue
-
-                    # Convertir UTC a hora de Roma
-                    fecha, hora = utc_to_rome(start_dt)
-                    if not fecha:
-                        continue
-
-                    if fecha not in fechas:
-                        fechas[fecha] = {
-                            'fecha': fecha,
-                            'plazas_disponibles': 0,
-                            'plazas_totales': 0,
-                            'timeslots': []
-                        }
-
-                    capacity = ts.get('capacity', 0)
-                    original_capacity = ts.get('originalCapacity', capacity)
-
-                    fechas[fecha]['plazas_disponibles'] += capacity
-                    fechas[fecha]['plazas_totales'] += original_capacity
-                    fechas[fecha]['timeslots'].append({
-                        'hora': hora,
-                        'capacidad': capacity,
-                        'capacidad_original': original_capacity
-                    })
 
-                # Convertir a lista y calcular totales
-                fechas_list = sorted(fechas.values(), key=lambda x: x['fecha'])
+@app.route('/api/availability/delta', methods=['GET'])
+def get_availability_delta():
+    """
+    Cambios de la disponibilidad cacheada desde una versión ('version' de
+    /api/availability/cached o de un delta anterior). El dashboard guarda el
+    último snapshot en IndexedDB y en cada visita solo descarga las fechas
+    que cambiaron.
 
-                formatted['resultados'][tour_key] = {
-                    'nombre': tour_data.get('nombre', tour_key),
-                    'guid': tour_data.get('guid', ''),
-                    'total_fechas': len(fechas_list),
-                    'total_plazas': sum(f['plazas_disponibles'] for f in fechas_list),
-                    'fechas': fechas_list,
-                    'timeslots_por_fecha': {f['fecha']: f['timeslots'] for f in fechas_list}
-                }
+    Query params:
+        - since: Versión que tiene el cliente
+        - encoding: 'json' (default) o 'columnar'
 
-            return jsonify(formatted)
-        else:
-            return jsonify({
-                "error": result.get('error', 'No hay datos cacheados'),
-                "cached": False,
-                "hint": "Railway debe ejecutarse para obtener y cachear la disponibilidad"
-            }), 404
+    Returns:
+        JSON con 'delta': true, 'version', 'desde' y por tour sus campos, las
+        fechas cambiadas (resumen) y 'eliminadas'; o el snapshot completo de
+        /api/availability/cached (sin 'delta') si los eventos desde esa
+        versión ya no están en el log o son más de MAX_EVENTOS_DELTA
+    """
+    try:
+        desde = int(request.args.get('since', ''))
+        if desde < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "since debe ser un entero >= 0"}), 400
+
+    try:
+        columnar, error = encoding_solicitado()
+        if error:
+            return error
+        return respuesta_disponibilidad(*obtener_delta_disponibilidad(desde, columnar))
+
+    except Exception as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
 
+
+@app.route('/api/stream', methods=['GET'])
+def stream_cambios():
+    """
+    Server-Sent Events con los cambios de disponibilidad de cada snapshot
+    nuevo (ver difusion_cambios). Al reconectar, el navegador envía
+    Last-Event-ID y recibe los cambios que se perdió.
+
+    Query params:
+        - last_event_id: Alternativa a la cabecera Last-Event-ID (opcional)
+
+    Returns:
+        text/event-stream con eventos 'cambios' y 'recargar' y heartbeats
+    """
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID debe ser un entero"}), 400
+
+    return Response(
+        stream_with_context(difusion_cambios.stream(ultimo_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/timeslots', methods=['GET'])
+def timeslots_fecha():
+    """
+    Horarios de un tour en una fecha, servidos desde la caché del servidor
+    (el dashboard los pide al desplegar una fila).
+
+    Query params:
+        - tour: Clave del tour
+        - fecha: Fecha YYYY-MM-DD
+        - result_id: Resultado de /api/consultar (opcional, por defecto la
+          disponibilidad cacheada por Railway)
+        - encoding: 'json' (default) o 'columnar'
+
+    Returns:
+        JSON con 'timeslots' de la fecha
+    """
+    try:
+        tour = request.args.get('tour')
+        fecha = request.args.get('fecha')
+        if not tour or not fecha:
+            return jsonify({"error": "Parámetros 'tour' y 'fecha' requeridos"}), 400
+        columnar, error = encoding_solicitado()
+        if error:
+            return error
+
+        if request.args.get('result_id'):
+            resultados, error = obtener_resultados_solicitud({})
+            if error:
+                return error
+        else:
+            datos, result = datos_disponibilidad_cacheada()
+            if datos is None:
+                return jsonify({"error": result.get('error', 'No hay datos cacheados')}), 404
+            resultados = datos['resultados']
+
+        if tour not in resultados:
+            return jsonify({"error": f"Tour '{tour}' no encontrado"}), 404
+
+        timeslots = resultados[tour].get('timeslots_por_fecha', {}).get(fecha, [])
+        respuesta = {"success": True, "tour": tour, "fecha": fecha, "timeslots": timeslots}
+        if columnar:
+            respuesta.update(codificacion_columnar.codificar_timeslots(timeslots), encoding='columnar')
+        return jsonify(respuesta)
     except Exception as e:
         return jsonify({"error": f"Error: {str(e)}"}), 500
 
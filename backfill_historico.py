@@ -0,0 +1,99 @@
+"""
+Backfill del histórico: aplica snapshots recuperados en una sola pasada.
+
+Acepta archivos JSON con la caché de Railway ({'availability', 'timestamp'})
+o respuestas archivadas de /api/consultar ({'resultados', 'timestamp'}).
+Los snapshots se ordenan por timestamp y cada partición afectada se carga,
+guarda y sube una sola vez.
+
+Uso:
+    python backfill_historico.py availability_cache_*.json
+    python backfill_historico.py archivados/ --dry-run
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timezone
+
+
+def listar_archivos(rutas: list) -> list:
+    """Expande directorios a sus archivos .json"""
+    archivos = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            archivos.extend(
+                os.path.join(ruta, nombre)
+                for nombre in sorted(os.listdir(ruta))
+                if nombre.endswith('.json')
+            )
+        else:
+            archivos.append(ruta)
+    return archivos
+
+
+def cargar_snapshot(path: str) -> tuple:
+    """
+    Lee un archivo de snapshot.
+    Si no trae timestamp se usa la fecha de modificación del archivo.
+    """
+    import historico_store
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    mtime = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc).isoformat()
+    return historico_store.snapshot_desde_archivo(data, mtime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill del histórico de disponibilidad')
+    parser.add_argument('rutas', nargs='+', help='Archivos JSON o directorios con snapshots')
+    parser.add_argument('--dry-run', action='store_true', help='Solo validar y listar los snapshots')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    import historico_store
+
+    snapshots = []
+    for path in listar_archivos(args.rutas):
+        try:
+            timestamp, snapshot = cargar_snapshot(path)
+        except (OSError, ValueError) as e:
+            print(f"[Backfill] Ignorado {path}: {e}")
+            continue
+        horarios = sum(len(datos) for datos in snapshot.values())
+        if not horarios:
+            print(f"[Backfill] Ignorado {path}: snapshot sin horarios")
+            continue
+        print(f"[Backfill] {timestamp} ({historico_store.clave_periodo(timestamp)}): {horarios} horarios - {path}")
+        snapshots.append((timestamp, snapshot))
+
+    if not snapshots:
+        print("[Backfill] No hay snapshots para aplicar")
+        return 1
+
+    if args.dry_run:
+        print(f"[Backfill] {len(snapshots)} snapshots válidos (dry-run, no se escribe nada)")
+        return 0
+
+    result = historico_store.registrar_snapshots(snapshots)
+    for particion in result['particiones']:
+        print(f"[Backfill] {particion['path']}: {particion['snapshots']} snapshots, "
+              f"{particion['insertados']} insertados en su posición")
+    if result.get('warning'):
+        print(f"[Backfill] Aviso: {result['warning']}")
+    print(f"[Backfill] {result['snapshots']} snapshots aplicados ({result['total_timeslots']} horarios)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Benchmark de exportación del histórico: XLSX (openpyxl) vs CSV / CSV gzip / NDJSON en streaming.
+
+Uso:
+    python bench_export.py                 # histórico configurado (Supabase o local)
+    python bench_export.py --sintetico 360 # histórico sintético en un directorio temporal
+    python bench_export.py --memoria       # medir también la memoria pico (más lento)
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+
+def construir_sintetico(snapshots: int, horarios_por_dia: int = 10, dias: int = 180) -> None:
+    """Genera un histórico sintético particionado en el directorio actual (modo local)"""
+    import random
+    from datetime import datetime, timedelta
+    import historico_store
+
+    inicio = datetime(2025, 1, 1)
+    claves = [((inicio + timedelta(days=d)).strftime('%Y-%m-%d'), f'{8 + h}:00'.zfill(5))
+              for d in range(dias) for h in range(horarios_por_dia)]
+    capacidades = {k: 100 for k in claves}
+
+    manifest = historico_store.cargar_manifest()
+    wb, entrada = None, None
+
+    for i in range(snapshots):
+        timestamp = (inicio + timedelta(hours=6 * i)).strftime('%Y-%m-%d %H:%M')
+        siguiente = historico_store._particion_para(manifest, timestamp)
+        if siguiente is not entrada:
+            if wb is not None:
+                _guardar(wb, entrada)
+            wb, entrada = historico_store._nuevo_workbook(), siguiente
+
+        for k in claves:
+            if random.random() < 0.1:
+                capacidades[k] = max(0, capacidades[k] - random.randint(1, 5))
+        datos = {k: {'capacidad': c, 'capacidad_original': 100} for k, c in capacidades.items()}
+        for tour_key in ('24h-grupos', 'arena'):
+            historico_store.escribir_columna(wb, tour_key, datos, timestamp)
+        entrada['columnas'] = entrada.get('columnas', 0) + 1
+
+    if wb is not None:
+        _guardar(wb, entrada)
+    historico_store.guardar_manifest(manifest)
+
+
+def _guardar(wb, entrada: dict) -> None:
+    """Guarda un workbook sintético y actualiza su entrada de manifest"""
+    from io import BytesIO
+    import historico_store
+    import storage_client
+
+    output = BytesIO()
+    wb.save(output)
+    storage_client.write_bytes(entrada['path'], output.getvalue(), historico_store.XLSX_MIME)
+    entrada.update(historico_store._describir_workbook(wb))
+    entrada['bytes'] = len(output.getvalue())
+
+
+def medir(client, url: str, memoria: bool = False) -> dict:
+    """Descarga una URL consumiendo el stream y mide tiempo, bytes y memoria pico"""
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+
+    response = client.get(url, buffered=False)
+    total = 0
+    primer_byte = None
+    for chunk in response.response:
+        if primer_byte is None:
+            primer_byte = time.perf_counter() - inicio
+        total += len(chunk)
+    response.close()
+
+    duracion = time.perf_counter() - inicio
+    pico = 0
+    if memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'segundos': duracion,
+        'primer_byte': primer_byte or duracion,
+        'bytes': total,
+        'pico_mb': pico / 1024 / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de exportación del histórico')
+    parser.add_argument('--sintetico', type=int, default=0,
+                        help='Número de snapshots de un histórico sintético (0 = usar el configurado)')
+    parser.add_argument('--memoria', action='store_true',
+                        help='Medir memoria pico con tracemalloc (distorsiona los tiempos)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.sintetico:
+        os.environ['SUPABASE_URL'] = ''
+        os.chdir(tempfile.mkdtemp(prefix='bench_historico_'))
+        print(f"Generando histórico sintético ({args.sintetico} snapshots) en {os.getcwd()}...")
+        construir_sintetico(args.sintetico)
+
+    from app import app
+    client = app.test_client()
+
+    print(f"\n{'FORMATO':<10} | {'STATUS':>6} | {'TIEMPO':>8} | {'1er BYTE':>8} | {'TAMAÑO':>10} | {'MEM PICO':>8}")
+    print('-' * 66)
+    for formato in ('xlsx', 'csv', 'csv.gz', 'ndjson'):
+        r = medir(client, f'/api/descargar-historico?format={formato}', args.memoria)
+        memoria = f"{r['pico_mb']:>6.1f}MB" if args.memoria else f"{'-':>8}"
+        print(f"{formato:<10} | {r['status']:>6} | {r['segundos']:>7.2f}s | {r['primer_byte']:>7.2f}s | "
+              f"{r['bytes'] / 1024:>8.0f}KB | {memoria}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark del arranque en frío de la entrada de Vercel (api/index.py).
+
+Importa el módulo en procesos nuevos con `python -X importtime`, toma la
+mediana del tiempo acumulado y falla (código 1) si supera el presupuesto o si
+se cargó alguna dependencia pesada que solo deben importar los endpoints que
+la usan (pandas, numpy, openpyxl, supabase).
+
+Uso:
+    python bench_importtime.py                    # presupuesto IMPORT_BUDGET_MS (default 400 ms)
+    python bench_importtime.py --presupuesto 300  # otro presupuesto en ms
+    python bench_importtime.py --modulo app --top 15
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+
+# Presupuesto (ms) del import en frío
+PRESUPUESTO_MS = float(os.environ.get('IMPORT_BUDGET_MS', '400'))
+
+# Dependencias que no deben cargarse al arrancar
+PESADOS = ('pandas', 'numpy', 'openpyxl', 'supabase')
+
+LINEA = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def medir_import(modulo: str) -> list:
+    """
+    Importa un módulo en un proceso nuevo con -X importtime.
+
+    Returns:
+        Lista de (nombre, propio_us, acumulado_us, nivel) en el orden en que
+        Python los reporta (los hijos antes que el módulo que los importa)
+    """
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=directorio, capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{proceso.stderr[-2000:]}")
+
+    entradas = []
+    for linea in proceso.stderr.splitlines():
+        m = LINEA.match(linea)
+        if m:
+            propio, acumulado, sangria, nombre = m.groups()
+            entradas.append((nombre, int(propio), int(acumulado), (len(sangria) - 1) // 2))
+    return entradas
+
+
+def raiz(entradas: list, modulo: str) -> int:
+    """Posición de la entrada del módulo medido"""
+    for i in range(len(entradas) - 1, -1, -1):
+        if entradas[i][0] == modulo:
+            return i
+    raise ValueError(f"{modulo} no aparece en la salida de -X importtime")
+
+
+def hijos_directos(entradas: list, posicion: int) -> list:
+    """Módulos importados directamente por la entrada en posicion"""
+    nivel = entradas[posicion][3]
+    hijos = []
+    for i in range(posicion - 1, -1, -1):
+        if entradas[i][3] <= nivel:
+            break
+        if entradas[i][3] == nivel + 1:
+            hijos.append(entradas[i])
+    return hijos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del import en frío de la app')
+    parser.add_argument('--modulo', default='api.index', help='Módulo a importar (default: api.index)')
+    parser.add_argument('--presupuesto', type=float, default=PRESUPUESTO_MS,
+                        help=f'Presupuesto en ms (default: {PRESUPUESTO_MS:.0f})')
+    parser.add_argument('--repeticiones', type=int, default=5, help='Arranques a medir (se usa la mediana)')
+    parser.add_argument('--top', type=int, default=10, help='Imports directos a listar')
+    args = parser.parse_args()
+
+    # El primer arranque compila los .pyc y no cuenta
+    medir_import(args.modulo)
+
+    mediciones = [medir_import(args.modulo) for _ in range(args.repeticiones)]
+    totales = sorted((m[raiz(m, args.modulo)][2], i) for i, m in enumerate(mediciones))
+    total_us, mediana = totales[len(totales) // 2]
+    entradas = mediciones[mediana]
+    total_ms = total_us / 1000
+
+    print(f"\nImport de {args.modulo}: mediana {total_ms:.0f} ms "
+          f"(min {totales[0][0] / 1000:.0f}, max {totales[-1][0] / 1000:.0f}, "
+          f"{args.repeticiones} arranques) | presupuesto {args.presupuesto:.0f} ms\n")
+
+    # Los imports directos más caros, bajando por los envoltorios (api.index -> app)
+    posicion = raiz(entradas, args.modulo)
+    hijos = hijos_directos(entradas, posicion)
+    while hijos:
+        mayor = max(hijos, key=lambda e: e[2])
+        if mayor[2] < 0.9 * entradas[posicion][2]:
+            break
+        posicion = entradas.index(mayor)
+        hijos = hijos_directos(entradas, posicion)
+    print(f"Imports directos de {entradas[posicion][0]}:")
+
+    print(f"{'MÓDULO':<32} | {'ACUMULADO':>10} | {'PROPIO':>8}")
+    print('-' * 56)
+    for nombre, propio, acumulado, _ in sorted(hijos, key=lambda e: -e[2])[:args.top]:
+        print(f"{nombre:<32} | {acumulado / 1000:>8.1f}ms | {propio / 1000:>6.1f}ms")
+
+    pesados = sorted({e[0] for e in entradas if e[0].split('.')[0] in PESADOS})
+    errores = []
+    if total_ms > args.presupuesto:
+        errores.append(f"El import tarda {total_ms:.0f} ms (presupuesto {args.presupuesto:.0f} ms)")
+    if pesados:
+        raices = sorted({p.split('.')[0] for p in pesados})
+        errores.append(f"Dependencias pesadas importadas al arrancar: {', '.join(raices)}")
+
+    print()
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ Dentro del presupuesto")
+
+
+if __name__ == '__main__':
+    main()
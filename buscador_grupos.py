@@ -0,0 +1,180 @@
+"""
+Buscador de horarios para grupos ("¿dónde entran 42 personas?").
+
+Para cada día (y tour, o todos los tours juntos si se cruzan tours) los
+horarios se recorren en orden de hora con una ventana deslizante de dos
+punteros: para cada horario inicial se obtiene la ventana más corta de
+horarios consecutivos cuya capacidad suma al menos K, en O(horarios del día).
+De cada día se devuelven las ventanas de longitud mínima: un horario suelto
+si alguno tiene capacidad >= K, o la combinación más corta de horarios
+adyacentes si no.
+
+Las opciones se ordenan por cercanía a la fecha y hora deseadas (distancia en
+minutos) con un heap acotado al número de resultados pedidos.
+
+Los horarios por día se obtienen del índice en memoria
+(indice_disponibilidad) o de timeslots crudos de la API
+(dias_desde_timeslots), que es lo que usa report_generator.
+"""
+
+import heapq
+from datetime import date
+
+# Máximo de horarios adyacentes en una combinación
+MAX_HORARIOS = 4
+
+# Máximo de opciones devueltas
+LIMITE_OPCIONES = 20
+
+
+def _minutos(fecha: str, hora: str = None) -> int:
+    """Minutos desde 0001-01-01 de una fecha y hora (para medir distancias)"""
+    minutos = date.fromisoformat(fecha).toordinal() * 1440
+    if hora:
+        minutos += _minutos_hora(hora)
+    return minutos
+
+
+def _minutos_hora(hora: str) -> int:
+    """Minutos desde medianoche de una hora HH:MM"""
+    return int(hora[:2]) * 60 + int(hora[3:5])
+
+
+def dias_desde_timeslots(tours: dict) -> dict:
+    """
+    Agrupa timeslots crudos por tour y día.
+
+    Args:
+        tours: {tour: timeslots de la API (list) o ya formateados (fecha/hora/capacidad)}
+
+    Returns:
+        {(tour, fecha): [(hora, tour, capacidad)] ordenado por hora}
+    """
+    from api_client import AvailabilityChecker
+
+    dias = {}
+    for tour, data in tours.items():
+        items = data.values() if isinstance(data, dict) else (data or [])
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            capacidad = item.get("capacity", item.get("capacidad"))
+            if not isinstance(capacidad, int):
+                continue
+            fecha, hora = AvailabilityChecker.slot_date_time(item)
+            if fecha and hora:
+                dias.setdefault((tour, fecha), []).append((hora, tour, capacidad))
+
+    for horarios in dias.values():
+        horarios.sort()
+    return dias
+
+
+def unir_tours(dias: dict) -> dict:
+    """Combina los horarios de todos los tours de cada día: {(None, fecha): [...]}"""
+    unidos = {}
+    for (_, fecha), horarios in dias.items():
+        unidos.setdefault((None, fecha), []).extend(horarios)
+    for horarios in unidos.values():
+        horarios.sort()
+    return unidos
+
+
+def ventanas_minimas(capacidades: list, personas: int, max_horarios: int = MAX_HORARIOS) -> list:
+    """
+    Ventanas [inicio, fin) de horarios consecutivos de longitud mínima cuya
+    capacidad suma al menos personas (dos punteros, O(n)).
+
+    Returns:
+        Lista de (inicio, fin); vacía si ninguna ventana de hasta max_horarios alcanza
+    """
+    ventanas = []
+    suma = 0
+    fin = 0
+    n = len(capacidades)
+
+    for inicio in range(n):
+        while fin < n and suma < personas:
+            suma += capacidades[fin]
+            fin += 1
+        if suma < personas:
+            break
+        ventanas.append((inicio, fin))
+        suma -= capacidades[inicio]
+
+    if not ventanas:
+        return []
+    minima = min(f - i for i, f in ventanas)
+    if minima > max_horarios:
+        return []
+    return [(i, f) for i, f in ventanas if f - i == minima]
+
+
+def _opcion(fecha: str, horarios: list, personas: int, distancia) -> dict:
+    """Describe una opción y reparte las personas llenando los horarios en orden"""
+    restantes = personas
+    detalle = []
+    for hora, tour, capacidad in horarios:
+        asignadas = min(capacidad, restantes)
+        restantes -= asignadas
+        detalle.append({'tour': tour, 'hora': hora, 'capacidad': capacidad, 'personas': asignadas})
+
+    return {
+        'fecha': fecha,
+        'hora_inicio': horarios[0][0],
+        'hora_fin': horarios[-1][0],
+        'tours': sorted({tour for _, tour, _ in horarios}),
+        'num_horarios': len(horarios),
+        'plazas': sum(c for _, _, c in horarios),
+        'horarios': detalle,
+        'distancia_minutos': distancia
+    }
+
+
+def buscar(dias: dict, personas: int, fecha: str = None, hora: str = None,
+           max_horarios: int = MAX_HORARIOS, entre_tours: bool = False,
+           limite: int = LIMITE_OPCIONES) -> list:
+    """
+    Busca horarios sueltos o combinaciones mínimas de horarios adyacentes
+    del mismo día con capacidad para un grupo.
+
+    Args:
+        dias: {(tour, fecha): [(hora, tour, capacidad)] ordenado por hora}
+        personas: Tamaño del grupo
+        fecha / hora: Fecha (YYYY-MM-DD) y hora (HH:MM) deseadas para ordenar
+            por cercanía (default: por fecha y hora)
+        max_horarios: Máximo de horarios adyacentes combinados
+        entre_tours: Si True, combina horarios de distintos tours el mismo día
+        limite: Máximo de opciones
+
+    Returns:
+        Lista de opciones (ver _opcion) de la más cercana a la más lejana
+    """
+    if personas <= 0:
+        return []
+    if entre_tours:
+        dias = unir_tours(dias)
+
+    objetivo = _minutos(fecha, hora or '12:00') if fecha else None
+
+    def candidatas():
+        for (_, dia), horarios in dias.items():
+            capacidades = [c for _, _, c in horarios]
+            ventanas = ventanas_minimas(capacidades, personas, max_horarios)
+            if not ventanas:
+                continue
+            base = _minutos(dia) if objetivo is not None else 0
+            for inicio, fin in ventanas:
+                hora_inicio = horarios[inicio][0]
+                distancia = abs(base + _minutos_hora(hora_inicio) - objetivo) if objetivo is not None else 0
+                plazas = sum(capacidades[inicio:fin])
+                yield (distancia, fin - inicio, plazas, dia, hora_inicio, horarios[inicio:fin])
+
+    if objetivo is not None:
+        # Cercanía, menos horarios, menos plazas sobrantes
+        clave = lambda c: c[:5]
+    else:
+        clave = lambda c: (c[3], c[4], c[1], c[2])
+    mejores = heapq.nsmallest(limite, candidatas(), key=clave)
+    return [_opcion(dia, seleccion, personas, distancia if objetivo is not None else None)
+            for distancia, _, _, dia, _, seleccion in mejores]
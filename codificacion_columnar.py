@@ -0,0 +1,142 @@
+"""
+Codificación columnar compacta de los resultados (encoding=columnar).
+
+En el formato por defecto cada horario repite sus claves ('capacidad_original',
+'porcentaje_ocupado', 'start_datetime'...) y, en la disponibilidad cacheada
+con detalle, los horarios de cada fecha aparecen dos veces ('timeslots' de la
+fecha y 'timeslots_por_fecha'). En la codificación columnar cada tour lleva
+dos tablas de arrays paralelos:
+
+    {
+      "encoding": "columnar",
+      "diccionarios": {"fecha": ["2026-06-01", ...], "hora": ["08:00", ...]},
+      "resultados": {
+        tour: {
+          ...campos del tour ('nombre', 'guid', 'total_plazas', 'estadisticas'),
+          "fechas": {"fecha": [0, 1, ...], "plazas_disponibles": [...], ...},
+          "timeslots": {"fecha": [0, 0, ...], "hora": [...], "capacidad": [...], ...}
+        }
+      },
+      ...resto de campos de la respuesta ('timestamp', 'result_id'...)
+    }
+
+'fecha' y 'hora' son índices a diccionarios compartidos por todos los tours.
+Los campos derivados (ocupadas, porcentajes, estado, nivel, día de semana,
+fecha formateada, disponible) no se envían y el cliente los recalcula
+(decodificarColumnar en app.js); tampoco las fechas UTC de inicio y fin de
+cada horario, que el dashboard no usa.
+"""
+
+# Codificaciones aceptadas en el parámetro 'encoding'
+ENCODINGS = ('json', 'columnar')
+
+# Campos que no se envían (el cliente los recalcula o no los usa)
+DERIVADOS_FECHA = ('fecha_formateada', 'dia_semana', 'plazas_ocupadas', 'porcentaje_ocupado',
+                   'estado', 'nivel', 'timeslots')
+DERIVADOS_TIMESLOT = ('ocupadas', 'porcentaje_ocupado', 'disponible', 'start_datetime', 'end_datetime')
+
+# Columnas que se envían como índices a un diccionario compartido
+DICCIONARIOS = ('fecha', 'hora')
+
+
+class Diccionario:
+    """Valores únicos en orden de aparición y su índice"""
+
+    def __init__(self):
+        self.valores = []
+        self._indices = {}
+
+    def indice(self, valor) -> int:
+        i = self._indices.get(valor)
+        if i is None:
+            i = self._indices[valor] = len(self.valores)
+            self.valores.append(valor)
+        return i
+
+
+def columnas(filas: list, omitir: tuple, diccionarios: dict) -> dict:
+    """
+    Convierte filas (dicts) en arrays paralelos, uno por clave.
+
+    Args:
+        filas: Lista de dicts (las claves ausentes en una fila quedan en None)
+        omitir: Claves que no se incluyen
+        diccionarios: {columna: Diccionario} de columnas a codificar como índices
+    """
+    claves = []
+    vistas = set(omitir)
+    for fila in filas:
+        for clave in fila:
+            if clave not in vistas:
+                vistas.add(clave)
+                claves.append(clave)
+
+    tabla = {}
+    for clave in claves:
+        valores = [fila.get(clave) for fila in filas]
+        if clave in diccionarios:
+            indice = diccionarios[clave].indice
+            valores = [indice(v) for v in valores]
+        tabla[clave] = valores
+    return tabla
+
+
+def tabla_timeslots(timeslots_por_fecha: dict, diccionarios: dict) -> dict:
+    """Horarios de un tour ({fecha: [timeslot]}) como una tabla columnar"""
+    indices_fecha = []
+    filas = []
+    indice = diccionarios['fecha'].indice
+    for fecha, timeslots in timeslots_por_fecha.items():
+        indices_fecha.extend([indice(fecha)] * len(timeslots))
+        filas.extend(timeslots)
+
+    tabla = {'fecha': indices_fecha}
+    tabla.update(columnas(filas, DERIVADOS_TIMESLOT + ('fecha',), diccionarios))
+    return tabla
+
+
+def nuevos_diccionarios() -> dict:
+    return {nombre: Diccionario() for nombre in DICCIONARIOS}
+
+
+def exportar_diccionarios(diccionarios: dict) -> dict:
+    return {nombre: d.valores for nombre, d in diccionarios.items()}
+
+
+def codificar(respuesta: dict) -> dict:
+    """
+    Codifica una respuesta con 'resultados' (formato de /api/consultar o de
+    /api/availability/cached) en formato columnar.
+    """
+    diccionarios = nuevos_diccionarios()
+    resultados = {}
+
+    for tour_key, tour_data in respuesta.get('resultados', {}).items():
+        fechas = tour_data.get('fechas', [])
+        tour = {k: v for k, v in tour_data.items() if k not in ('fechas', 'timeslots_por_fecha')}
+        tour['fechas'] = columnas(fechas, DERIVADOS_FECHA, diccionarios)
+
+        if 'timeslots_por_fecha' in tour_data:
+            tour['timeslots'] = tabla_timeslots(tour_data['timeslots_por_fecha'], diccionarios)
+            # La disponibilidad cacheada repite los horarios dentro de cada fecha
+            if any('timeslots' in fecha for fecha in fechas):
+                tour['timeslots_en_fechas'] = True
+
+        resultados[tour_key] = tour
+
+    return dict(respuesta, encoding='columnar', resultados=resultados,
+                diccionarios=exportar_diccionarios(diccionarios))
+
+
+def codificar_timeslots(timeslots: list) -> dict:
+    """
+    Horarios de una fecha (respuesta de /api/timeslots) en formato columnar.
+
+    Returns:
+        dict con 'timeslots' (tabla) y 'diccionarios'
+    """
+    diccionarios = nuevos_diccionarios()
+    return {
+        'timeslots': columnas(timeslots, DERIVADOS_TIMESLOT, diccionarios),
+        'diccionarios': exportar_diccionarios(diccionarios)
+    }
@@ -8,7 +8,18 @@ from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from typing import List, Dict
 
-load_dotenv()
+
+_ENTORNO = {'cargado': False}
+
+
+def cargar_entorno() -> None:
+    """Carga las variables de .env una sola vez por proceso"""
+    if not _ENTORNO['cargado']:
+        load_dotenv()
+        _ENTORNO['cargado'] = True
+
+
+cargar_entorno()
 
 
 class ColosseoConfig:
@@ -50,6 +61,11 @@ class ColosseoConfig:
     TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "").strip()
     HEADLESS = os.getenv("HEADLESS", "false").lower() in ('1', 'true', 'yes')
 
+    # Umbral de plazas para alertas de capacidad baja, global y por tour
+    # (LOW_CAPACITY_THRESHOLDS="24h-grupos:40,arena:5")
+    LOW_CAPACITY_THRESHOLD = int(os.getenv("LOW_CAPACITY_THRESHOLD", "10"))
+    LOW_CAPACITY_THRESHOLDS = os.getenv("LOW_CAPACITY_THRESHOLDS", "")
+
     # Configuración de proxies
     PROXY_ENABLED = os.getenv("PROXY_ENABLED", "false").lower() in ('1', 'true', 'yes')
     PROXY_FILE = os.getenv("PROXY_FILE", "proxies.txt")
@@ -93,6 +109,23 @@ class ColosseoConfig:
             return [f.strip() for f in fechas_str.split(",") if f.strip()]
         return ColosseoConfig.get_default_dates()
 
+    @staticmethod
+    def get_low_capacity_threshold(tour: str = None) -> int:
+        """
+        Umbral de capacidad baja de un tour.
+
+        Args:
+            tour: Clave del tour (o prefijo de GUID en colosseo_monitor)
+
+        Returns:
+            Umbral configurado en LOW_CAPACITY_THRESHOLDS o LOW_CAPACITY_THRESHOLD
+        """
+        for item in ColosseoConfig.LOW_CAPACITY_THRESHOLDS.split(","):
+            key, _, value = item.partition(":")
+            if tour and key.strip() == tour and value.strip().isdigit():
+                return int(value)
+        return ColosseoConfig.LOW_CAPACITY_THRESHOLD
+
     @staticmethod
     def get_headers(referer: str = None) -> Dict[str, str]:
         """
@@ -14,23 +14,28 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 from colosseo_config import config
 from stealth_browser import StealthBrowser, check_for_stop, stop_event
-from api_client import ColosseoAPIClient, AvailabilityChecker
+from api_client import ColosseoAPIClient
 from report_generator import ReportGenerator
 
 
 class ColosseoMonitor:
     """Aplicación principal de monitoreo"""
 
-    def __init__(self, dates_of_interest: List[str] = None, guid: str = None):
+    def __init__(self, dates_of_interest: List[str] = None, guid: str = None, guids: List[str] = None,
+                 group_size: int = None):
         """
         Inicializa el monitor.
 
         Args:
             dates_of_interest: Fechas a monitorear
             guid: GUID del tour
+            guids: GUIDs de varios tours (tiene prioridad sobre guid)
+            group_size: Tamaño de grupo para buscar horarios con capacidad (opcional)
         """
         self.dates_of_interest = dates_of_interest or config.parse_dates_from_env()
         self.guid = guid or config.DEFAULT_GUID
+        self.guids = guids or [self.guid]
+        self.group_size = group_size
         self.browser = StealthBrowser()
         self.api_client = ColosseoAPIClient()
         self.report_gen = ReportGenerator()
@@ -106,13 +111,16 @@ class ColosseoMonitor:
 
         return cookies
 
-    def fetch_and_report(self, cookies: list = None, save_report: bool = False) -> bool:
+    def fetch_and_report(self, cookies: list = None, save_report: bool = False, save_json: bool = False) -> bool:
         """
-        Consulta la API y genera el informe.
+        Consulta la API y genera el informe de cada tour. Los datos de cada
+        tour se normalizan una sola vez y todas las salidas (alertas, consola,
+        txt, JSON) salen del mismo informe.
 
         Args:
             cookies: Cookies a usar (intenta cargar si no se proporciona)
             save_report: Si True, guarda el informe en archivo
+            save_json: Si True, guarda también el informe en JSON
 
         Returns:
             True si fue exitoso
@@ -122,58 +130,90 @@ class ColosseoMonitor:
         print("=" * 70 + "\n")
 
         # Obtener datos del calendario
-        data, status, msg = self.api_client.fetch_calendar_data(
-            guid=self.guid,
-            cookies=cookies
-        )
+        tours = {}
+        for guid in self.guids:
+            data, status, msg = self.api_client.fetch_calendar_data(
+                guid=guid,
+                cookies=cookies
+            )
 
-        if not data:
-            print(f"\n❌ No se pudieron obtener datos del calendario: {msg}")
-            return False
+            if not data:
+                print(f"\n❌ No se pudieron obtener datos del calendario ({guid[:8]}): {msg}")
+                continue
 
-        # Generar alertas urgentes
-        self.report_gen.print_urgent_alerts(data, threshold=10)
+            tours[guid[:8]] = data
 
-        # Generar informe principal
-        self.report_gen.generate_console_report(
-            data,
-            dates_of_interest=self.dates_of_interest
-        )
+        if not tours:
+            return False
 
-        # Guardar informe si se solicita
+        outputs = ["alerts", "console"]
         if save_report:
-            self.report_gen.save_report_to_file(
-                data,
-                dates_of_interest=self.dates_of_interest
-            )
+            outputs.append("txt")
+        if save_json:
+            outputs.append("json")
+
+        reports = self.report_gen.generate_reports(
+            tours,
+            outputs,
+            dates_of_interest=self.dates_of_interest,
+            group_size=self.group_size
+        )
 
-        # Mostrar fechas disponibles
-        checker = AvailabilityChecker()
-        available_dates = checker.find_available_dates(data)
-
-        if available_dates:
-            print("📌 TODAS LAS FECHAS DISPONIBLES:")
-            print("-" * 70)
-            for item in available_dates[:10]:  # Mostrar máximo 10
-                capacidad = item.get('capacidad', 'N/A')
-                precio = item.get('precio')
-                if precio:
-                    print(f"  ✅ {item['fecha']}: {capacidad} plazas | €{precio}")
-                else:
-                    print(f"  ✅ {item['fecha']}: {capacidad} plazas")
-            if len(available_dates) > 10:
-                print(f"  ... y {len(available_dates) - 10} fechas más")
-            print("=" * 70 + "\n")
+        for tour, report in reports.items():
+            self.send_urgent_alerts(report)
+
+            # Mostrar fechas disponibles
+            available_dates = report["available_dates"]
+
+            if available_dates:
+                titulo = f" ({tour})" if len(reports) > 1 else ""
+                print(f"📌 TODAS LAS FECHAS DISPONIBLES{titulo}:")
+                print("-" * 70)
+                for item in available_dates[:10]:  # Mostrar máximo 10
+                    capacidad = item.get('capacidad', 'N/A')
+                    precio = item.get('precio')
+                    if precio:
+                        print(f"  ✅ {item['fecha']}: {capacidad} plazas | €{precio}")
+                    else:
+                        print(f"  ✅ {item['fecha']}: {capacidad} plazas")
+                if len(available_dates) > 10:
+                    print(f"  ... y {len(available_dates) - 10} fechas más")
+                print("=" * 70 + "\n")
 
         return True
 
-    def run_full_check(self, use_existing_cookies: bool = False, save_report: bool = False) -> bool:
+    def send_urgent_alerts(self, data, threshold: int = None) -> None:
+        """
+        Envía las alertas urgentes por Telegram como un único resumen
+        (solo si TELEGRAM_BOT_TOKEN y TELEGRAM_CHAT_ID están configurados).
+
+        Args:
+            data: Datos del calendario o informe de ReportGenerator.build_report
+            threshold: Umbral de capacidad (default: umbral del tour)
+        """
+        try:
+            import alertas_telegram
+        except ImportError:
+            return
+
+        despachador = alertas_telegram.despachador()
+        if not despachador.enabled:
+            return
+
+        tour = data.get("tour") if isinstance(data, dict) and "alert_events" in data else None
+        events = self.report_gen.generate_urgent_alert_events(data, threshold, tour=tour or self.guid[:8])
+        if despachador.notificar(events, threshold):
+            despachador.esperar(timeout=60)
+
+    def run_full_check(self, use_existing_cookies: bool = False, save_report: bool = False,
+                       save_json: bool = False) -> bool:
         """
         Ejecuta el chequeo completo: obtiene cookies y genera informe.
 
         Args:
             use_existing_cookies: Si True, intenta usar cookies guardadas
             save_report: Si True, guarda el informe en archivo
+            save_json: Si True, guarda también el informe en JSON
 
         Returns:
             True si fue exitoso
@@ -195,7 +235,7 @@ class ColosseoMonitor:
             self.api_client.save_cookies(cookies)
 
         # Fase 2: Consultar y reportar
-        return self.fetch_and_report(cookies, save_report)
+        return self.fetch_and_report(cookies, save_report, save_json)
 
 
 def main():
@@ -209,6 +249,8 @@ Ejemplos de uso:
   python colosseo_monitor.py
   python colosseo_monitor.py --dates 2025-12-20 2025-12-21 2025-12-22
   python colosseo_monitor.py --use-cookies --save
+  python colosseo_monitor.py --guid GUID_1 GUID_2 --only-report --save --json
+  python colosseo_monitor.py --only-report --grupo 42
   python colosseo_monitor.py --only-report
         """
     )
@@ -221,7 +263,8 @@ Ejemplos de uso:
 
     parser.add_argument(
         "--guid",
-        help="GUID del tour/evento a monitorear"
+        nargs="+",
+        help="GUID del tour/evento a monitorear (uno o varios)"
     )
 
     parser.add_argument(
@@ -236,6 +279,19 @@ Ejemplos de uso:
         help="Guardar informe en archivo"
     )
 
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Guardar también el informe en JSON"
+    )
+
+    parser.add_argument(
+        "--grupo",
+        type=int,
+        metavar="PERSONAS",
+        help="Buscar horarios (o combinaciones de horarios) para un grupo de PERSONAS"
+    )
+
     parser.add_argument(
         "--only-report",
         action="store_true",
@@ -247,7 +303,8 @@ Ejemplos de uso:
     # Crear monitor
     monitor = ColosseoMonitor(
         dates_of_interest=args.dates,
-        guid=args.guid
+        guids=args.guid,
+        group_size=args.grupo
     )
 
     # Ejecutar según modo
@@ -258,12 +315,14 @@ Ejemplos de uso:
 
         success = monitor.fetch_and_report(
             cookies=monitor.api_client.cookies,
-            save_report=args.save
+            save_report=args.save,
+            save_json=args.json
         )
     else:
         success = monitor.run_full_check(
             use_existing_cookies=args.use_cookies,
-            save_report=args.save
+            save_report=args.save,
+            save_json=args.json
         )
 
     if success:
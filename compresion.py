@@ -0,0 +1,98 @@
+"""
+Compresión de respuestas JSON grandes.
+
+La codificación se negocia con Accept-Encoding: brotli si el paquete está
+instalado y el cliente lo acepta, si no gzip. Las respuestas por debajo de
+UMBRAL_BYTES se envían sin comprimir (no compensa el coste).
+
+Las respuestas precalculadas (p. ej. /api/availability/cached) guardan sus
+variantes comprimidas en VariantesComprimidas, así cada codificación se
+calcula una vez por snapshot y no en cada petición. El resto de respuestas
+JSON se comprimen al vuelo desde app.after_request con un nivel más bajo.
+"""
+
+import gzip
+import os
+
+try:
+    import brotli
+    BROTLI_DISPONIBLE = True
+except ImportError:
+    BROTLI_DISPONIBLE = False
+
+
+# Tamaño mínimo (bytes) para comprimir una respuesta
+UMBRAL_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '2048'))
+
+# Niveles al vuelo (rápidos) y para variantes precalculadas (mejor ratio)
+NIVELES = {
+    'gzip': {'vuelo': 6, 'precalculado': 9},
+    'br': {'vuelo': 4, 'precalculado': 9},
+}
+
+
+def elegir_codificacion(accept_encodings) -> str:
+    """
+    Mejor codificación aceptada por el cliente.
+
+    Args:
+        accept_encodings: request.accept_encodings de Flask
+
+    Returns:
+        'br', 'gzip' o None
+    """
+    candidatas = ['br', 'gzip'] if BROTLI_DISPONIBLE else ['gzip']
+    calidades = [(accept_encodings.quality(c), -i, c) for i, c in enumerate(candidatas)]
+    calidad, _, codificacion = max(calidades)
+    return codificacion if calidad > 0 else None
+
+
+def comprimir(datos: bytes, codificacion: str, precalculado: bool = False) -> bytes:
+    """Comprime con gzip o brotli"""
+    nivel = NIVELES[codificacion]['precalculado' if precalculado else 'vuelo']
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=nivel)
+    return gzip.compress(datos, compresslevel=nivel, mtime=0)
+
+
+class VariantesComprimidas:
+    """Cuerpo de una respuesta precalculada y sus variantes comprimidas"""
+
+    def __init__(self, datos: bytes):
+        self.datos = datos
+        self._variantes = {}
+
+    def __len__(self) -> int:
+        return len(self.datos)
+
+    def obtener(self, codificacion: str = None) -> bytes:
+        """Cuerpo en la codificación pedida (se comprime la primera vez)"""
+        if codificacion is None or len(self.datos) < UMBRAL_BYTES:
+            return self.datos
+        if codificacion not in self._variantes:
+            self._variantes[codificacion] = comprimir(self.datos, codificacion, precalculado=True)
+        return self._variantes[codificacion]
+
+
+def comprimir_respuesta(response, accept_encodings):
+    """
+    Comprime al vuelo una respuesta JSON de Flask si supera UMBRAL_BYTES.
+    Las respuestas en streaming, ya codificadas o sin éxito se dejan igual.
+    """
+    if (response.mimetype != 'application/json' or response.status_code != 200
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    datos = response.get_data()
+    if len(datos) < UMBRAL_BYTES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    codificacion = elegir_codificacion(accept_encodings)
+    if codificacion is None:
+        return response
+
+    response.set_data(comprimir(datos, codificacion))
+    response.headers['Content-Encoding'] = codificacion
+    return response
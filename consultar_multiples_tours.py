@@ -12,6 +12,7 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 from api_client import ColosseoAPIClient, AvailabilityChecker
+from report_generator import ReportGenerator
 
 # Configuración de tours
 TOURS = {
@@ -26,6 +27,39 @@ TOURS = {
 }
 
 
+def imprimir_fechas(report, limite):
+    """Imprime las primeras fechas de un informe (ReportGenerator.build_report) con su ocupación"""
+    print(f"\n{'─' * 70}")
+    print(f"{'FECHA':<22} | {'PLAZAS':>12} | {'OCUPACIÓN':>12}")
+    print(f"{'─' * 70}")
+
+    fechas_ordenadas = report['fechas']
+
+    for fecha in fechas_ordenadas[:limite]:
+        capacidad = report['data'][fecha].get('capacity', 0)
+        porcentaje_ocupado = report['ocupacion'].get(fecha, 0)
+
+        # Emoji
+        if capacidad == 0:
+            emoji = "❌"
+        elif porcentaje_ocupado < 30:
+            emoji = "🟢"
+        elif porcentaje_ocupado < 70:
+            emoji = "🟡"
+        else:
+            emoji = "🔴"
+
+        fecha_str = ReportGenerator.format_date(fecha)
+
+        print(f"{emoji} {fecha_str:<20} | {capacidad:>5,} plazas | {porcentaje_ocupado:>6.1f}%")
+
+    if len(fechas_ordenadas) > limite:
+        print(f"   ... y {len(fechas_ordenadas) - limite} fechas más")
+
+    # Resumen del tour
+    print(f"\n📈 RESUMEN: {len(fechas_ordenadas)} fechas | {report['capacidad_total']:,} plazas totales")
+
+
 def consultar_tour(client, tour_key, tour_info, month="2025-12"):
     """Consulta disponibilidad para un tour específico"""
 
@@ -50,57 +84,18 @@ def consultar_tour(client, tour_key, tour_info, month="2025-12"):
 
     print(f"✅ Timeslots recibidos: {len(data)}")
 
-    # Normalizar
-    checker = AvailabilityChecker()
-    normalized = checker.normalize_data(data)
+    # Normalizar y calcular el informe en una pasada
+    report = ReportGenerator.build_report(data, tour=tour_key)
 
-    print(f"📊 Fechas únicas: {len(normalized)}")
+    print(f"📊 Fechas únicas: {len(report['fechas'])}")
 
-    if len(normalized) == 0:
+    if len(report['fechas']) == 0:
         print("⚠️  No hay fechas disponibles")
         return None
 
-    # Mostrar primeras fechas
-    print(f"\n{'─' * 70}")
-    print(f"{'FECHA':<22} | {'PLAZAS':>12} | {'OCUPACIÓN':>12}")
-    print(f"{'─' * 70}")
-
-    fechas_ordenadas = sorted(normalized.items())
-
-    for fecha, info in fechas_ordenadas[:10]:
-        capacidad = info.get('capacity', 0)
-        capacidad_orig = info.get('originalCapacity', 0)
-        ocupadas = capacidad_orig - capacidad if capacidad_orig else 0
-        porcentaje_ocupado = (ocupadas / capacidad_orig * 100) if capacidad_orig > 0 else 0
+    imprimir_fechas(report, 10)
 
-        # Emoji
-        if capacidad == 0:
-            emoji = "❌"
-        elif porcentaje_ocupado < 30:
-            emoji = "🟢"
-        elif porcentaje_ocupado < 70:
-            emoji = "🟡"
-        else:
-            emoji = "🔴"
-
-        # Formatear fecha
-        try:
-            fecha_obj = datetime.strptime(fecha, "%Y-%m-%d")
-            dia_semana = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"][fecha_obj.weekday()]
-            fecha_str = f"{fecha} ({dia_semana})"
-        except:
-            fecha_str = fecha
-
-        print(f"{emoji} {fecha_str:<20} | {capacidad:>5,} plazas | {porcentaje_ocupado:>6.1f}%")
-
-    if len(fechas_ordenadas) > 10:
-        print(f"   ... y {len(fechas_ordenadas) - 10} fechas más")
-
-    # Resumen del tour
-    total_plazas = sum(info.get('capacity', 0) for info in normalized.values())
-    print(f"\n📈 RESUMEN: {len(normalized)} fechas | {total_plazas:,} plazas totales")
-
-    return normalized
+    return report['data']
 
 
 def main():
@@ -142,8 +137,8 @@ def main():
             print("⚠️  GUID no configurado - sigue las instrucciones para obtenerlo")
             continue
 
-        # Acumular datos de todos los meses
-        datos_totales = {}
+        # Acumular timeslots de todos los meses
+        timeslots = []
 
         for month in meses_a_consultar:
             print(f"\n  📅 Consultando {month}...", end=" ")
@@ -159,64 +154,23 @@ def main():
                 continue
 
             print(f"✅ {len(data)} timeslots")
+            timeslots.extend(data if isinstance(data, list) else data.values())
 
-            # Normalizar
-            checker = AvailabilityChecker()
-            normalized = checker.normalize_data(data)
+        # Normalizar y calcular el informe una sola vez por tour
+        report = ReportGenerator.build_report(timeslots, tour=tour_key)
 
-            # Agregar al total
-            datos_totales.update(normalized)
-
-        if len(datos_totales) == 0:
+        if len(report['fechas']) == 0:
             print(f"\n⚠️  No hay fechas disponibles")
             continue
 
-        print(f"\n📊 Total de fechas únicas: {len(datos_totales)}")
-
-        # Mostrar primeras fechas
-        print(f"\n{'─' * 70}")
-        print(f"{'FECHA':<22} | {'PLAZAS':>12} | {'OCUPACIÓN':>12}")
-        print(f"{'─' * 70}")
-
-        fechas_ordenadas = sorted(datos_totales.items())
-
-        for fecha, info in fechas_ordenadas[:15]:
-            capacidad = info.get('capacity', 0)
-            capacidad_orig = info.get('originalCapacity', 0)
-            ocupadas = capacidad_orig - capacidad if capacidad_orig else 0
-            porcentaje_ocupado = (ocupadas / capacidad_orig * 100) if capacidad_orig > 0 else 0
-
-            # Emoji
-            if capacidad == 0:
-                emoji = "❌"
-            elif porcentaje_ocupado < 30:
-                emoji = "🟢"
-            elif porcentaje_ocupado < 70:
-                emoji = "🟡"
-            else:
-                emoji = "🔴"
+        print(f"\n📊 Total de fechas únicas: {len(report['fechas'])}")
 
-            # Formatear fecha
-            try:
-                fecha_obj = datetime.strptime(fecha, "%Y-%m-%d")
-                dia_semana = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"][fecha_obj.weekday()]
-                fecha_str = f"{fecha} ({dia_semana})"
-            except:
-                fecha_str = fecha
-
-            print(f"{emoji} {fecha_str:<20} | {capacidad:>5,} plazas | {porcentaje_ocupado:>6.1f}%")
-
-        if len(fechas_ordenadas) > 15:
-            print(f"   ... y {len(fechas_ordenadas) - 15} fechas más")
-
-        # Resumen del tour
-        total_plazas = sum(info.get('capacity', 0) for info in datos_totales.values())
-        print(f"\n📈 RESUMEN: {len(datos_totales)} fechas | {total_plazas:,} plazas totales")
+        imprimir_fechas(report, 15)
 
         # Guardar en resultados
         resultados[tour_key] = {
             "info": tour_info,
-            "datos": datos_totales
+            "report": report
         }
 
     # Comparación final
@@ -227,12 +181,23 @@ def main():
 
         for tour_key, resultado in resultados.items():
             tour_info = resultado['info']
-            datos = resultado['datos']
-            total_plazas = sum(info.get('capacity', 0) for info in datos.values())
+            report = resultado['report']
 
             print(f"\n🎫 {tour_info['nombre']}")
-            print(f"   Fechas disponibles: {len(datos)}")
-            print(f"   Plazas totales: {total_plazas:,}")
+            print(f"   Fechas disponibles: {len(report['fechas'])}")
+            print(f"   Plazas totales: {report['capacidad_total']:,}")
+
+    # Horarios más urgentes de todos los tours (umbral configurable por tour)
+    urgentes = AvailabilityChecker.find_most_urgent_slots(
+        {tour_key: resultado['report']['timeslots'] for tour_key, resultado in resultados.items()},
+        top_k=15
+    )
+    if urgentes:
+        print(f"\n{'=' * 70}")
+        print("🚨 HORARIOS MÁS URGENTES")
+        print(f"{'=' * 70}")
+        for slot in urgentes:
+            print(f"  {slot['tour']:<12} {ReportGenerator.format_date(slot['fecha']):<18} {slot['hora'] or '':<6} | {slot['capacidad']:>3} plazas")
 
     print(f"\n{'=' * 70}")
     print("✅ Consulta completada")
@@ -0,0 +1,355 @@
+"""
+Heatmap de demanda: día de semana x hora x antelación.
+
+Agregado acumulado sobre todos los snapshots del histórico. Cada observación
+es un horario visto en un snapshot, clasificado por el día de semana y la hora
+del horario y por la antelación (días entre el snapshot y el horario). Por
+celda se acumulan observaciones, agotados y suma de % de ocupación en arrays
+NumPy de forma (7, 24, len(ANTELACION)).
+
+Cada snapshot se agrega una sola vez, en O(horarios), desde
+historico_store.registrar_snapshots. Las respuestas del endpoint se
+precalculan por tour, así que consultarlas es O(1).
+
+El agregado se guarda en historico/heatmap.json.gz. Como los modelos de
+velocidad_venta y prevision_ocupacion, solo se reconstruye al registrar
+snapshots fuera de Vercel; /api/heatmap sin agregado guardado responde 503.
+"""
+
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import storage_client
+import historico_store
+
+
+HEATMAP_PATH = f'{historico_store.CARPETA}/heatmap.json.gz'
+
+# Límites (días) de los tramos de antelación: [0,1), [1,3), ... [60, ∞)
+LIMITES_ANTELACION = [1, 3, 7, 14, 30, 60]
+ANTELACION = ['0-1d', '1-3d', '3-7d', '7-14d', '14-30d', '30-60d', '60d+']
+
+DIAS = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
+FORMA = (7, 24, len(ANTELACION))
+
+# Clave del agregado de todos los tours
+TODOS = '_todos'
+
+# Segundos que se reutiliza el agregado en memoria antes de volver a leerlo
+TTL_HEATMAP = int(os.environ.get('HEATMAP_TTL', '60'))
+
+
+def _horas(texto: str) -> float:
+    """Horas desde la época de un 'YYYY-MM-DD HH:MM' (hora de reloj, sin zona)"""
+    dt = datetime.strptime(texto[:16], "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+    return dt.timestamp() / 3600.0
+
+
+class AgregadoTour:
+    """Contadores por celda (día, hora, antelación) de un tour"""
+
+    def __init__(self):
+        self.observaciones = np.zeros(FORMA, dtype=np.int64)
+        self.agotados = np.zeros(FORMA, dtype=np.int64)
+        self.ocupacion = np.zeros(FORMA, dtype=float)
+
+    def acumular(self, dias, horas, antelacion, capacidades, originales) -> None:
+        """
+        Acumula observaciones vectorizadas (arrays de igual longitud).
+        Las observaciones con antelación negativa (horario ya empezado) se ignoran.
+        """
+        validos = (antelacion >= 0) & ~np.isnan(capacidades)
+        if not validos.any():
+            return
+
+        tramos = np.searchsorted(LIMITES_ANTELACION, antelacion[validos], side='right')
+        celdas = np.ravel_multi_index((dias[validos], horas[validos], tramos), FORMA)
+
+        cap = capacidades[validos]
+        orig = originales[validos]
+        ocupacion = np.where(orig > 0, (orig - cap) / np.where(orig > 0, orig, 1) * 100, 0.0)
+
+        np.add.at(self.observaciones.reshape(-1), celdas, 1)
+        np.add.at(self.agotados.reshape(-1), celdas, (cap == 0).astype(np.int64))
+        np.add.at(self.ocupacion.reshape(-1), celdas, ocupacion)
+
+    def sumar(self, otro: 'AgregadoTour') -> None:
+        """Suma los contadores de otro agregado"""
+        self.observaciones += otro.observaciones
+        self.agotados += otro.agotados
+        self.ocupacion += otro.ocupacion
+
+    def to_dict(self) -> dict:
+        return {
+            'observaciones': self.observaciones.tolist(),
+            'agotados': self.agotados.tolist(),
+            'ocupacion': np.round(self.ocupacion, 3).tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'AgregadoTour':
+        agregado = cls()
+        agregado.observaciones = np.array(data['observaciones'], dtype=np.int64).reshape(FORMA)
+        agregado.agotados = np.array(data['agotados'], dtype=np.int64).reshape(FORMA)
+        agregado.ocupacion = np.array(data['ocupacion'], dtype=float).reshape(FORMA)
+        return agregado
+
+
+class HeatmapDemanda:
+    """Agregados por tour y registro de snapshots ya aplicados"""
+
+    def __init__(self):
+        self.tours = {}
+        self.snapshots = set()
+        self._respuestas = {}
+
+    def _agregado(self, tour_key: str) -> AgregadoTour:
+        if tour_key not in self.tours:
+            self.tours[tour_key] = AgregadoTour()
+        return self.tours[tour_key]
+
+    def agregar_snapshot(self, snapshot: dict, timestamp: str) -> bool:
+        """
+        Agrega un snapshot en O(horarios). Un timestamp ya aplicado se ignora,
+        de modo que un backfill repetido no duplica observaciones.
+
+        Args:
+            snapshot: {tour_key: {(fecha, hora): {'capacidad', 'capacidad_original'}}}
+            timestamp: Timestamp del snapshot
+
+        Returns:
+            True si el snapshot se aplicó
+        """
+        if timestamp in self.snapshots:
+            return False
+
+        t = _horas(timestamp)
+        dias_fecha = {}
+
+        for tour_key, datos in snapshot.items():
+            n = len(datos)
+            if not n:
+                continue
+
+            dias = np.empty(n, dtype=np.intp)
+            horas = np.empty(n, dtype=np.intp)
+            antelacion = np.empty(n)
+            capacidades = np.empty(n)
+            originales = np.empty(n)
+
+            i = 0
+            for (fecha, hora), valores in datos.items():
+                try:
+                    if fecha not in dias_fecha:
+                        dias_fecha[fecha] = datetime.strptime(fecha, "%Y-%m-%d").weekday()
+                    dias[i] = dias_fecha[fecha]
+                    horas[i] = int(hora[:2]) % 24
+                    antelacion[i] = (_horas(f"{fecha} {hora}") - t) / 24.0
+                except ValueError:
+                    continue
+                capacidades[i] = valores.get('capacidad', 0)
+                originales[i] = valores.get('capacidad_original', 0) or 0
+                i += 1
+
+            self._agregado(tour_key).acumular(
+                dias[:i], horas[:i], antelacion[:i], capacidades[:i], originales[:i]
+            )
+
+        self.snapshots.add(timestamp)
+        self._respuestas.clear()
+        return True
+
+    def agregar_indice(self, indice) -> None:
+        """
+        Agrega todos los snapshots de una partición desde su índice de series,
+        vectorizado sobre la matriz horarios x snapshots.
+        """
+        if not indice.snapshots:
+            return
+
+        claves, originales, matriz = indice.matriz_capacidades()
+        nuevos = np.array([ts not in self.snapshots for ts in indice.snapshots], dtype=bool)
+        if not claves or not nuevos.any():
+            self.snapshots.update(indice.snapshots)
+            return
+
+        tiempos = np.array([_horas(ts) for ts in indice.snapshots])[nuevos]
+        matriz = matriz[:, nuevos]
+
+        por_tour = {}
+        for fila, (tour_key, fecha, hora) in enumerate(claves):
+            por_tour.setdefault(tour_key, []).append(fila)
+
+        for tour_key, filas in por_tour.items():
+            dias, horas, inicio, validas = [], [], [], []
+            for fila in filas:
+                _, fecha, hora = claves[fila]
+                try:
+                    dias.append(datetime.strptime(fecha, "%Y-%m-%d").weekday())
+                    horas.append(int(hora[:2]) % 24)
+                    inicio.append(_horas(f"{fecha} {hora}"))
+                    validas.append(fila)
+                except ValueError:
+                    continue
+            if not validas:
+                continue
+
+            m = len(tiempos)
+            antelacion = (np.array(inicio)[:, None] - tiempos[None, :]) / 24.0
+            self._agregado(tour_key).acumular(
+                np.repeat(np.array(dias, dtype=np.intp), m),
+                np.repeat(np.array(horas, dtype=np.intp), m),
+                antelacion.reshape(-1),
+                matriz[validas].reshape(-1),
+                np.repeat(originales[validas], m)
+            )
+
+        self.snapshots.update(indice.snapshots)
+        self._respuestas.clear()
+
+    def respuesta(self, tour_key: str = None) -> bytes:
+        """
+        JSON del heatmap de un tour (o de todos), precalculado tras cada
+        actualización.
+
+        Returns:
+            bytes JSON o None si el tour no tiene datos
+        """
+        clave = tour_key or TODOS
+        if clave not in self._respuestas:
+            self._respuestas[clave] = self._calcular_respuesta(tour_key)
+        return self._respuestas[clave]
+
+    def _calcular_respuesta(self, tour_key: str = None):
+        if tour_key:
+            if tour_key not in self.tours:
+                return None
+            agregado = self.tours[tour_key]
+        else:
+            agregado = AgregadoTour()
+            for parcial in self.tours.values():
+                agregado.sumar(parcial)
+
+        obs = agregado.observaciones
+        con_datos = obs > 0
+        divisor = np.where(con_datos, obs, 1)
+        ocupacion = np.where(con_datos, np.round(agregado.ocupacion / divisor, 1), np.nan)
+        agotado = np.where(con_datos, np.round(agregado.agotados / divisor * 100, 1), np.nan)
+
+        # Solo las horas con alguna observación
+        horas = [h for h in range(24) if obs[:, h, :].any()]
+
+        def celdas(arr):
+            return [[[None if np.isnan(v) else float(v) for v in arr[d, h]] for h in horas] for d in range(7)]
+
+        data = {
+            'success': True,
+            'tour': tour_key or 'todos',
+            'dias': DIAS,
+            'horas': [f"{h:02d}:00" for h in horas],
+            'antelacion': ANTELACION,
+            'ocupacion_promedio': celdas(ocupacion),
+            'porcentaje_agotado': celdas(agotado),
+            'observaciones': [[obs[d, h].tolist() for h in horas] for d in range(7)],
+            'snapshots': len(self.snapshots),
+            'ultimo_snapshot': max(self.snapshots) if self.snapshots else None
+        }
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def to_dict(self) -> dict:
+        return {
+            'version': 1,
+            'limites_antelacion': LIMITES_ANTELACION,
+            'snapshots': sorted(self.snapshots),
+            'tours': {tour_key: agregado.to_dict() for tour_key, agregado in self.tours.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HeatmapDemanda':
+        heatmap = cls()
+        if data.get('limites_antelacion') != LIMITES_ANTELACION:
+            raise ValueError("Tramos de antelación distintos")
+        heatmap.snapshots = set(data.get('snapshots', []))
+        heatmap.tours = {k: AgregadoTour.from_dict(v) for k, v in data.get('tours', {}).items()}
+        return heatmap
+
+
+# ============== PERSISTENCIA ==============
+
+_CACHE = {'heatmap': None, 'cargado': 0.0}
+
+
+def guardar_heatmap(heatmap: HeatmapDemanda) -> dict:
+    """Guarda el agregado comprimido"""
+    data = json.dumps(heatmap.to_dict(), separators=(',', ':')).encode('utf-8')
+    return storage_client.write_bytes(HEATMAP_PATH, gzip.compress(data), 'application/gzip')
+
+
+def _leer_heatmap():
+    """Lee el agregado guardado o None si no existe"""
+    result = storage_client.read_bytes(HEATMAP_PATH)
+    if not result['success']:
+        return None
+    try:
+        return HeatmapDemanda.from_dict(json.loads(gzip.decompress(result['data']).decode('utf-8')))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[Heatmap] Agregado inválido, se reconstruye: {e}")
+        return None
+
+
+def reconstruir() -> HeatmapDemanda:
+    """Construye el agregado desde todas las particiones del histórico"""
+    import series_index
+
+    heatmap = HeatmapDemanda()
+    manifest = historico_store.cargar_manifest()
+    for entrada in historico_store.particiones_ordenadas(manifest):
+        heatmap.agregar_indice(series_index.cargar_indice(entrada))
+    return heatmap
+
+
+def obtener_heatmap():
+    """
+    Retorna el agregado vigente (memoria o storage), o None si aún no se ha
+    construido: se construye al registrar snapshots, no en la lectura.
+    El storage se vuelve a leer como máximo cada TTL_HEATMAP segundos.
+    """
+    ahora = time.time()
+    if _CACHE['cargado'] and ahora - _CACHE['cargado'] < TTL_HEATMAP:
+        return _CACHE['heatmap']
+
+    heatmap = _leer_heatmap()
+    _CACHE.update(heatmap=heatmap, cargado=ahora)
+    return heatmap
+
+
+def registrar_snapshots(snapshots: list) -> HeatmapDemanda:
+    """
+    Agrega snapshots recién escritos en el histórico (una vez cada uno).
+    Se llama desde historico_store.registrar_snapshots. Sin agregado
+    guardado se reconstruye, salvo en Vercel (historico_store.SERVERLESS),
+    donde no se hace nada y lo construye el siguiente snapshot de Railway.
+
+    Args:
+        snapshots: Lista de (timestamp, snapshot)
+    """
+    heatmap = _leer_heatmap()
+    if heatmap is None:
+        if historico_store.SERVERLESS:
+            print("[Heatmap] Sin agregado: se construirá con el próximo snapshot de Railway")
+            return None
+        # El histórico ya incluye estos snapshots
+        print("[Heatmap] Construyendo agregado desde el histórico...")
+        heatmap = reconstruir()
+    else:
+        for timestamp, snapshot in snapshots:
+            heatmap.agregar_snapshot(snapshot, timestamp)
+
+    guardar_heatmap(heatmap)
+    _CACHE.update(heatmap=heatmap, cargado=time.time())
+    return heatmap
@@ -0,0 +1,377 @@
+"""
+Motor de diferencias entre snapshots de disponibilidad.
+
+Compara dos snapshots ({tour_key: {(fecha, hora): {'capacidad',
+'capacidad_original'}}}) y emite eventos tipados:
+
+    agotado            el horario pasó de tener plazas a 0
+    reabierto          el horario pasó de 0 a tener plazas
+    bajada_capacidad   la capacidad bajó (delta = plazas vendidas)
+    nuevo_horario      horario nuevo en una fecha ya publicada
+    nueva_fecha        fecha publicada por primera vez (un evento por fecha)
+    horario_eliminado  el horario desapareció antes de empezar
+
+Los horarios se agrupan por tour y mes con un hash de contenido por mes
+(suma de hashes por horario, independiente del orden). Los meses con el mismo
+hash que en el snapshot anterior se omiten sin comparar horarios; el resto se
+compara en O(n) con diccionarios por clave (fecha, hora).
+
+Un snapshot puede ser parcial (/api/guardar-historico guarda solo los tours y
+meses consultados, y a Railway le puede fallar un tour): solo se comparan los
+tours y meses que contiene. Los ausentes no se dan por eliminados y el estado
+persistido conserva sus horarios anteriores (ver combinar).
+
+Cada snapshot registrado en el histórico se compara con el anterior y los
+eventos se agregan al log diario historico/eventos/YYYY-MM-DD.ndjson.gz
+(miembros gzip concatenados, un evento JSON por línea).
+"""
+
+import gzip
+import json
+import hashlib
+
+import storage_client
+import historico_store
+
+
+CARPETA_EVENTOS = f'{historico_store.CARPETA}/eventos'
+ESTADO_PATH = f'{CARPETA_EVENTOS}/estado.json.gz'
+
+AGOTADO = 'agotado'
+REABIERTO = 'reabierto'
+BAJADA_CAPACIDAD = 'bajada_capacidad'
+NUEVO_HORARIO = 'nuevo_horario'
+NUEVA_FECHA = 'nueva_fecha'
+HORARIO_ELIMINADO = 'horario_eliminado'
+
+TIPOS = [AGOTADO, REABIERTO, BAJADA_CAPACIDAD, NUEVO_HORARIO, NUEVA_FECHA, HORARIO_ELIMINADO]
+
+_MODULO_HASH = 1 << 64
+
+
+def _hash_horario(fecha: str, hora: str, capacidad, original) -> int:
+    """Hash estable (entre procesos) de un horario y sus valores"""
+    digest = hashlib.blake2b(f"{fecha}|{hora}|{capacidad}|{original}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def agrupar(snapshot: dict) -> tuple:
+    """
+    Agrupa un snapshot por tour y mes y calcula el hash de cada mes en O(n).
+
+    Returns:
+        (meses, huellas) con meses = {tour: {mes: {(fecha, hora): (capacidad, original)}}}
+        y huellas = {tour: {mes: hash hex}}
+    """
+    meses = {}
+    sumas = {}
+
+    for tour_key, datos in snapshot.items():
+        por_mes = meses.setdefault(tour_key, {})
+        sumas_tour = sumas.setdefault(tour_key, {})
+        for (fecha, hora), valores in datos.items():
+            capacidad = valores.get('capacidad', 0)
+            original = valores.get('capacidad_original', capacidad)
+            mes = fecha[:7]
+            por_mes.setdefault(mes, {})[(fecha, hora)] = (capacidad, original)
+            sumas_tour[mes] = (sumas_tour.get(mes, 0) + _hash_horario(fecha, hora, capacidad, original)) % _MODULO_HASH
+
+    huellas = {
+        tour_key: {mes: f"{suma:016x}" for mes, suma in sumas_tour.items()}
+        for tour_key, sumas_tour in sumas.items()
+    }
+    return meses, huellas
+
+
+def _evento(tipo: str, tour_key: str, fecha: str, hora, timestamp: str, **extra) -> dict:
+    evento = {'tipo': tipo, 'tour': tour_key, 'fecha': fecha, 'hora': hora, 'timestamp': timestamp}
+    evento.update(extra)
+    return evento
+
+
+def diferenciar(anterior: tuple, actual: tuple, timestamp: str) -> tuple:
+    """
+    Compara dos snapshots agrupados (ver agrupar). Solo se comparan los
+    tours y meses presentes en el snapshot nuevo.
+
+    Args:
+        anterior: (meses, huellas) del snapshot anterior
+        actual: (meses, huellas) del snapshot nuevo
+        timestamp: Timestamp del snapshot nuevo ('YYYY-MM-DD HH:MM'); los
+            horarios que desaparecen después de empezar no se reportan
+
+    Returns:
+        (eventos, meses omitidos por hash igual)
+    """
+    meses_ant, huellas_ant = anterior
+    meses_act, huellas_act = actual
+
+    eventos = []
+    omitidos = 0
+
+    for tour_key in sorted(meses_act):
+        por_mes_ant = meses_ant.get(tour_key, {})
+        por_mes_act = meses_act[tour_key]
+        h_ant = huellas_ant.get(tour_key, {})
+        h_act = huellas_act.get(tour_key, {})
+
+        for mes in sorted(por_mes_act):
+            if mes in h_ant and h_ant.get(mes) == h_act.get(mes):
+                omitidos += 1
+                continue
+
+            horarios_ant = por_mes_ant.get(mes, {})
+            horarios_act = por_mes_act.get(mes, {})
+            fechas_ant = {fecha for fecha, _ in horarios_ant}
+            nuevas_fechas = {}
+
+            for key, (capacidad, original) in horarios_act.items():
+                fecha, hora = key
+                previo = horarios_ant.get(key)
+
+                if previo is None:
+                    if fecha in fechas_ant:
+                        eventos.append(_evento(NUEVO_HORARIO, tour_key, fecha, hora, timestamp,
+                                               capacidad=capacidad, capacidad_original=original))
+                    else:
+                        nuevas_fechas.setdefault(fecha, []).append((hora, capacidad))
+                    continue
+
+                cap_ant = previo[0]
+                if capacidad == cap_ant:
+                    continue
+                if cap_ant > 0 and capacidad == 0:
+                    eventos.append(_evento(AGOTADO, tour_key, fecha, hora, timestamp,
+                                           capacidad=0, capacidad_anterior=cap_ant))
+                elif cap_ant == 0 and capacidad > 0:
+                    eventos.append(_evento(REABIERTO, tour_key, fecha, hora, timestamp,
+                                           capacidad=capacidad, capacidad_anterior=0))
+                elif capacidad < cap_ant:
+                    eventos.append(_evento(BAJADA_CAPACIDAD, tour_key, fecha, hora, timestamp,
+                                           capacidad=capacidad, capacidad_anterior=cap_ant,
+                                           delta=cap_ant - capacidad))
+
+            for fecha, horas in sorted(nuevas_fechas.items()):
+                eventos.append(_evento(NUEVA_FECHA, tour_key, fecha, None, timestamp,
+                                       horarios=len(horas),
+                                       capacidad=sum(c for _, c in horas)))
+
+            for key, (cap_ant, _) in horarios_ant.items():
+                if key not in horarios_act and f"{key[0]} {key[1]}" > timestamp:
+                    eventos.append(_evento(HORARIO_ELIMINADO, tour_key, key[0], key[1], timestamp,
+                                           capacidad_anterior=cap_ant))
+
+    return eventos, omitidos
+
+
+def combinar(anterior: tuple, actual: tuple, timestamp: str) -> tuple:
+    """
+    Estado tras un snapshot posiblemente parcial: los meses del snapshot
+    nuevo y, de cada tour, los meses del anterior que no contiene (salvo los
+    ya pasados, que no volverán a aparecer).
+
+    Args:
+        anterior: (meses, huellas) del estado anterior, o None
+        actual: (meses, huellas) del snapshot nuevo
+        timestamp: Timestamp del snapshot nuevo ('YYYY-MM-DD HH:MM')
+
+    Returns:
+        (meses, huellas)
+    """
+    if anterior is None:
+        return actual
+
+    meses_ant, huellas_ant = anterior
+    meses = {tour_key: dict(por_mes) for tour_key, por_mes in actual[0].items()}
+    huellas = {tour_key: dict(h) for tour_key, h in actual[1].items()}
+    mes_actual = timestamp[:7]
+
+    for tour_key, por_mes_ant in meses_ant.items():
+        for mes, horarios in por_mes_ant.items():
+            if mes < mes_actual or mes in meses.get(tour_key, {}):
+                continue
+            meses.setdefault(tour_key, {})[mes] = horarios
+            if mes in huellas_ant.get(tour_key, {}):
+                huellas.setdefault(tour_key, {})[mes] = huellas_ant[tour_key][mes]
+
+    return meses, huellas
+
+
+def diferenciar_snapshots(anterior: dict, actual: dict, timestamp: str) -> list:
+    """Compara dos snapshots sin agrupar y retorna la lista de eventos"""
+    eventos, _ = diferenciar(agrupar(anterior), agrupar(actual), timestamp)
+    return eventos
+
+
+# ============== ESTADO Y LOG DE EVENTOS ==============
+
+def _serializar_estado(timestamp: str, agrupado: tuple, secuencia: int) -> bytes:
+    meses, huellas = agrupado
+    data = {
+        'version': 1,
+        'timestamp': timestamp,
+        'secuencia': secuencia,
+        'huellas': huellas,
+        'meses': {
+            tour_key: {
+                mes: [[fecha, hora, cap, orig] for (fecha, hora), (cap, orig) in horarios.items()]
+                for mes, horarios in por_mes.items()
+            }
+            for tour_key, por_mes in meses.items()
+        }
+    }
+    return gzip.compress(json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+def cargar_estado():
+    """
+    Carga el último snapshot comparado.
+
+    Returns:
+        dict con 'timestamp', 'secuencia' y 'agrupado' (meses, huellas), o None
+    """
+    result = storage_client.read_bytes(ESTADO_PATH)
+    if not result['success']:
+        return None
+    try:
+        data = json.loads(gzip.decompress(result['data']).decode('utf-8'))
+    except (OSError, ValueError) as e:
+        print(f"[Eventos] Estado corrupto, se reinicia: {e}")
+        return None
+
+    meses = {
+        tour_key: {
+            mes: {(fecha, hora): (cap, orig) for fecha, hora, cap, orig in horarios}
+            for mes, horarios in por_mes.items()
+        }
+        for tour_key, por_mes in data.get('meses', {}).items()
+    }
+    return {
+        'timestamp': data.get('timestamp', ''),
+        'secuencia': data.get('secuencia', 0),
+        'agrupado': (meses, data.get('huellas', {}))
+    }
+
+
+def secuencia_actual():
+    """
+    Id del último evento emitido (0 si aún no hay eventos), o None si no hay
+    estado o no se puede leer. Avanza con cualquier snapshot registrado, no
+    solo con los de la disponibilidad cacheada: la versión de esa caché es la
+    que devuelve registrar al comparar su snapshot.
+    """
+    result = storage_client.read_bytes(ESTADO_PATH)
+    if not result['success']:
+        return None
+    try:
+        data = json.loads(gzip.decompress(result['data']).decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    return data.get('secuencia', 0)
+
+
+def path_log(fecha: str) -> str:
+    """Ruta del log de eventos de un día (YYYY-MM-DD)"""
+    return f"{CARPETA_EVENTOS}/{fecha}.ndjson.gz"
+
+
+def _agregar_al_log(eventos: list) -> None:
+    """Agrega eventos a los logs diarios como un nuevo miembro gzip por día"""
+    por_dia = {}
+    for evento in eventos:
+        por_dia.setdefault(evento['timestamp'][:10], []).append(evento)
+
+    for dia, lista in por_dia.items():
+        path = path_log(dia)
+        existente = storage_client.read_bytes(path)
+        previo = existente['data'] if existente['success'] else b''
+        lineas = ''.join(json.dumps(e, ensure_ascii=False, separators=(',', ':')) + '\n' for e in lista)
+        storage_client.write_bytes(path, previo + gzip.compress(lineas.encode('utf-8')), 'application/gzip')
+
+
+def registrar_snapshots(snapshots: list) -> list:
+    """
+    Compara cada snapshot nuevo con el anterior y persiste los eventos.
+    Los snapshots no posteriores al último comparado (backfill) se ignoran.
+
+    Args:
+        snapshots: Lista de (timestamp, snapshot) en orden cronológico
+
+    Returns:
+        Lista de eventos emitidos (con 'id' secuencial)
+    """
+    return registrar(snapshots)[0]
+
+
+def registrar(snapshots: list) -> tuple:
+    """
+    Como registrar_snapshots, pero devuelve además la secuencia tras el lote:
+    el id del último evento una vez comparados estos snapshots, que es la
+    versión de unos datos iguales al último de ellos. Se llama desde
+    historico_store.registrar_snapshots.
+
+    Args:
+        snapshots: Lista de (timestamp, snapshot) en orden cronológico
+
+    Returns:
+        (eventos emitidos, secuencia)
+    """
+    estado = cargar_estado()
+    ultimo = estado['timestamp'] if estado else ''
+    secuencia = estado['secuencia'] if estado else 0
+    anterior = estado['agrupado'] if estado else None
+
+    emitidos = []
+    for timestamp, snapshot in snapshots:
+        if timestamp <= ultimo:
+            continue
+
+        actual = agrupar(snapshot)
+        if anterior is not None:
+            eventos, omitidos = diferenciar(anterior, actual, timestamp)
+            for evento in eventos:
+                secuencia += 1
+                evento['id'] = secuencia
+            emitidos.extend(eventos)
+            print(f"[Eventos] {timestamp}: {len(eventos)} eventos ({omitidos} meses sin cambios)")
+
+        anterior, ultimo = combinar(anterior, actual, timestamp), timestamp
+
+    if anterior is not None and ultimo != (estado['timestamp'] if estado else ''):
+        if emitidos:
+            _agregar_al_log(emitidos)
+        storage_client.write_bytes(ESTADO_PATH, _serializar_estado(ultimo, anterior, secuencia), 'application/gzip')
+
+    return emitidos, secuencia
+
+
+def leer_eventos(fecha: str, tipo: str = None, tour_key: str = None, desde_id: int = None) -> list:
+    """
+    Lee el log de eventos de un día con filtros opcionales.
+
+    Args:
+        fecha: Día del log (YYYY-MM-DD)
+        tipo: Tipo de evento (ver TIPOS)
+        tour_key: Clave del tour
+        desde_id: Solo eventos con id mayor
+
+    Returns:
+        Lista de eventos en orden de emisión
+    """
+    result = storage_client.read_bytes(path_log(fecha))
+    if not result['success']:
+        return []
+
+    eventos = []
+    for linea in gzip.decompress(result['data']).decode('utf-8').splitlines():
+        if not linea:
+            continue
+        evento = json.loads(linea)
+        if tipo and evento.get('tipo') != tipo:
+            continue
+        if tour_key and evento.get('tour') != tour_key:
+            continue
+        if desde_id is not None and evento.get('id', 0) <= desde_id:
+            continue
+        eventos.append(evento)
+    return eventos
@@ -0,0 +1,245 @@
+"""
+Difusión de cambios de disponibilidad a los dashboards por Server-Sent Events.
+
+Un único hilo por proceso sondea el log de eventos de diff_snapshots cada
+INTERVALO_SONDEO segundos mientras haya clientes conectados y reparte cada
+snapshot nuevo a las colas de los suscriptores. Cada mensaje SSE agrupa los
+cambios de un snapshot en formato compacto:
+
+    id: <id del último evento del snapshot>
+    event: cambios
+    data: {"timestamp": ..., "cambios": [[tour, fecha, hora, capacidad, anterior]],
+           "estructura": bool}
+
+'estructura' indica que hubo fechas u horarios nuevos o eliminados, que el
+cliente no puede aplicar en su sitio. Los ids de evento son consecutivos, así
+que un cliente que reconecta con Last-Event-ID recibe exactamente lo que se
+perdió: del historial en memoria o, si no alcanza, de los logs de hoy y ayer.
+Si tampoco alcanza, recibe un evento 'recargar'. Sin cambios se envía un
+comentario de heartbeat cada HEARTBEAT segundos.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+from datetime import date, timedelta
+
+import historico_store
+import diff_snapshots
+
+
+# Segundos entre sondeos del log de eventos
+INTERVALO_SONDEO = float(os.environ.get('SSE_INTERVALO_SONDEO', '15'))
+
+# Segundos entre heartbeats sin cambios
+HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '15'))
+
+# Duración máxima de una conexión (el navegador reconecta y reanuda). Es el
+# único límite específico del stream: en Vercel (50s) lo cierra limpiamente
+# antes de que la plataforma corte la función, sin alargar el límite del
+# resto de rutas
+DURACION_MAXIMA = float(os.environ.get('SSE_DURACION_MAXIMA', '50' if historico_store.SERVERLESS else '300'))
+
+# Espera sugerida al navegador antes de reconectar
+REINTENTO_MS = 5000
+
+# Snapshots que se guardan en memoria para reanudar conexiones
+HISTORIAL = 50
+
+# Mensajes pendientes por cliente antes de pedirle que recargue
+MAX_COLA = 100
+
+TIPOS_CAPACIDAD = (diff_snapshots.AGOTADO, diff_snapshots.REABIERTO, diff_snapshots.BAJADA_CAPACIDAD)
+
+
+def formatear_mensaje(evento: str, data: dict, id_evento: int = None) -> str:
+    """Mensaje en formato text/event-stream"""
+    lineas = []
+    if id_evento is not None:
+        lineas.append(f"id: {id_evento}")
+    lineas.append(f"event: {evento}")
+    lineas.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(lineas) + '\n\n'
+
+
+def agrupar_por_snapshot(eventos: list) -> list:
+    """
+    Convierte eventos de diff_snapshots (ordenados por id) en un lote por
+    snapshot.
+
+    Returns:
+        Lista de (primer_id, ultimo_id, mensaje SSE)
+    """
+    lotes = []
+    actual = None
+    for evento in eventos:
+        if actual is None or evento['timestamp'] != actual['timestamp']:
+            actual = {'timestamp': evento['timestamp'], 'ids': [], 'cambios': [], 'estructura': False}
+            lotes.append(actual)
+        actual['ids'].append(evento['id'])
+        if evento['tipo'] in TIPOS_CAPACIDAD:
+            actual['cambios'].append([evento['tour'], evento['fecha'], evento['hora'],
+                                      evento.get('capacidad', 0), evento.get('capacidad_anterior', 0)])
+        else:
+            actual['estructura'] = True
+
+    return [
+        (lote['ids'][0], lote['ids'][-1], formatear_mensaje(
+            'cambios',
+            {'timestamp': lote['timestamp'], 'cambios': lote['cambios'], 'estructura': lote['estructura']},
+            lote['ids'][-1]
+        ))
+        for lote in lotes
+    ]
+
+
+def leer_eventos_recientes(desde_id: int = None) -> list:
+    """Eventos de ayer y hoy (hora de Roma) con id mayor que desde_id, ordenados por id"""
+    hoy = date.fromisoformat(historico_store.timestamp_actual()[:10])
+    eventos = []
+    for dia in (hoy - timedelta(days=1), hoy):
+        eventos.extend(diff_snapshots.leer_eventos(dia.isoformat(), desde_id=desde_id))
+    eventos.sort(key=lambda e: e.get('id', 0))
+    return eventos
+
+
+class DifusorCambios:
+    """Sondeo compartido del log de eventos y reparto a los clientes SSE"""
+
+    def __init__(self, intervalo: float = INTERVALO_SONDEO, historial: int = HISTORIAL):
+        self.intervalo = intervalo
+        self.ultimo_id = None
+        self._historial = deque(maxlen=historial)
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def suscribir(self) -> queue.Queue:
+        """Registra un cliente y arranca el sondeo si no estaba activo"""
+        cola = queue.Queue(maxsize=MAX_COLA)
+        cola.desbordada = False
+        with self._lock:
+            self._suscriptores.add(cola)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._sondear, name='difusion-cambios', daemon=True)
+                self._hilo.start()
+        return cola
+
+    def desuscribir(self, cola: queue.Queue) -> None:
+        with self._lock:
+            self._suscriptores.discard(cola)
+
+    def pendientes(self, desde_id: int):
+        """
+        Mensajes posteriores a desde_id para reanudar una conexión.
+
+        Returns:
+            Lista de (ultimo_id, mensaje) o None si ya no se pueden reconstruir
+        """
+        with self._lock:
+            if self.ultimo_id is not None and desde_id >= self.ultimo_id:
+                return []
+            if self._historial and desde_id >= self._historial[0][0] - 1:
+                return [(ultimo, mensaje) for _, ultimo, mensaje in self._historial if ultimo > desde_id]
+
+        eventos = leer_eventos_recientes(desde_id)
+        if not eventos:
+            return [] if self.ultimo_id is None or desde_id >= self.ultimo_id else None
+        if eventos[0]['id'] != desde_id + 1:
+            return None
+        return [(ultimo, mensaje) for _, ultimo, mensaje in agrupar_por_snapshot(eventos)]
+
+    def _publicar(self, lotes: list) -> None:
+        with self._lock:
+            for lote in lotes:
+                self._historial.append(lote)
+                self.ultimo_id = lote[1]
+            suscriptores = list(self._suscriptores)
+
+        for cola in suscriptores:
+            for _, ultimo, mensaje in lotes:
+                try:
+                    cola.put_nowait((ultimo, mensaje))
+                except queue.Full:
+                    cola.desbordada = True
+                    break
+
+    def _sondear(self) -> None:
+        while True:
+            try:
+                if self.ultimo_id is None:
+                    eventos = leer_eventos_recientes()
+                    self.ultimo_id = eventos[-1]['id'] if eventos else 0
+                else:
+                    eventos = leer_eventos_recientes(self.ultimo_id)
+                    if eventos:
+                        self._publicar(agrupar_por_snapshot(eventos))
+            except Exception as e:
+                print(f"[Stream] Error leyendo eventos: {e}")
+
+            time.sleep(self.intervalo)
+            # Terminar solo si no quedan clientes
+            with self._lock:
+                if not self._suscriptores:
+                    self._hilo = None
+                    return
+
+
+_DIFUSOR = {}
+
+
+def difusor() -> DifusorCambios:
+    """Difusor global del proceso"""
+    if 'global' not in _DIFUSOR:
+        _DIFUSOR['global'] = DifusorCambios()
+    return _DIFUSOR['global']
+
+
+def stream(ultimo_id: int = None, duracion_maxima: float = DURACION_MAXIMA):
+    """
+    Generador de mensajes SSE para un cliente.
+
+    Args:
+        ultimo_id: Last-Event-ID del cliente al reconectar (None = solo cambios nuevos)
+        duracion_maxima: Segundos antes de cerrar (el navegador reconecta)
+    """
+    origen = difusor()
+    cola = origen.suscribir()
+    enviado = ultimo_id
+    try:
+        yield f"retry: {REINTENTO_MS}\n\n"
+
+        if ultimo_id is not None:
+            pendientes = origen.pendientes(ultimo_id)
+            if pendientes is None:
+                yield formatear_mensaje('recargar', {'motivo': 'historial insuficiente'}, origen.ultimo_id)
+                enviado = origen.ultimo_id
+            else:
+                for ultimo, mensaje in pendientes:
+                    yield mensaje
+                    enviado = ultimo
+
+        fin = time.time() + duracion_maxima
+        while True:
+            restante = fin - time.time()
+            if restante <= 0:
+                return
+            try:
+                ultimo, mensaje = cola.get(timeout=min(HEARTBEAT, restante))
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+
+            if cola.desbordada:
+                # El cliente no da abasto: mejor que recargue todo
+                yield formatear_mensaje('recargar', {'motivo': 'demasiados cambios'}, origen.ultimo_id)
+                return
+            if enviado is not None and ultimo <= enviado:
+                continue
+            yield mensaje
+            enviado = ultimo
+    finally:
+        origen.desuscribir(cola)
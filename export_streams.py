@@ -0,0 +1,184 @@
+"""
+Exportación en streaming (CSV, CSV gzip y NDJSON) sin pandas.
+
+Las filas se generan una a una desde los resultados de consulta o desde las
+particiones del histórico (openpyxl en modo read_only) y se codifican en
+bloques, de modo que la memoria no depende del tamaño de la exportación.
+"""
+
+import io
+import csv
+import json
+import zlib
+from io import BytesIO
+from datetime import datetime
+
+import storage_client
+import historico_store
+
+
+# formato -> (mimetype, extensión)
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Filas por bloque emitido
+FILAS_POR_BLOQUE = 1000
+
+COLUMNAS_RESULTADOS = ['Tour', 'Fecha', 'Día', 'Plazas Disponibles', 'Plazas Totales', '% Ocupado', 'Estado']
+COLUMNAS_HISTORICO = ['Tour', 'Fecha', 'Hora', 'Capacidad Total', 'Timestamp', 'Capacidad']
+
+
+def es_formato_stream(formato: str) -> bool:
+    """Indica si el formato se exporta en streaming"""
+    return formato in FORMATOS
+
+
+# ============== GENERADORES DE FILAS ==============
+
+def filas_resultados(resultados: dict):
+    """
+    Genera una fila por fecha y tour a partir de los resultados de /api/consultar.
+
+    Yields:
+        Listas con los valores de COLUMNAS_RESULTADOS
+    """
+    for tour_key, tour_data in resultados.items():
+        nombre = tour_data.get('nombre', tour_key)
+        for fecha_info in tour_data.get('fechas', []):
+            yield [
+                nombre,
+                fecha_info.get('fecha', ''),
+                fecha_info.get('dia_semana', ''),
+                fecha_info.get('plazas_disponibles', 0),
+                fecha_info.get('plazas_totales', 0),
+                fecha_info.get('porcentaje_ocupado', 0),
+                fecha_info.get('estado', '')
+            ]
+
+
+def _corregir_hora(hora: str) -> str:
+    """Convierte HH:MM sumando 1 hora (UTC -> CET), igual que la descarga XLSX"""
+    try:
+        parts = hora.split(':')
+        if len(parts) >= 2:
+            return f'{(int(parts[0]) + 1) % 24:02d}:{parts[1]}'
+    except ValueError:
+        pass
+    return hora
+
+
+def filas_historico(particiones: list, include_past: bool = True, fix_timezone: bool = True):
+    """
+    Genera el histórico en formato largo: una fila por (horario, snapshot).
+    Las celdas '-' (horario ausente en ese snapshot) se omiten.
+
+    Args:
+        particiones: Entradas de manifest en orden cronológico
+        include_past: Incluir fechas anteriores a hoy
+        fix_timezone: Corregir la hora sumando 1 hora
+
+    Yields:
+        Listas con los valores de COLUMNAS_HISTORICO
+    """
+    from openpyxl import load_workbook
+
+    fijas = historico_store.COLUMNAS_FIJAS
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    for particion in particiones:
+        result = storage_client.read_bytes(particion['path'])
+        if not result['success']:
+            continue
+
+        wb = load_workbook(BytesIO(result['data']), read_only=True)
+        try:
+            for ws in wb.worksheets:
+                rows = ws.iter_rows(values_only=True)
+                header = next(rows, None)
+                if not header:
+                    continue
+                timestamps = [str(h) if h else None for h in header[fijas:]]
+
+                for row in rows:
+                    if not row or not row[0] or not row[1]:
+                        continue
+                    fecha = str(row[0])[:10]
+                    if not include_past and fecha < today:
+                        continue
+                    hora = _corregir_hora(str(row[1])) if fix_timezone else str(row[1])
+                    capacidad_total = row[2] if len(row) > 2 else None
+
+                    for timestamp, valor in zip(timestamps, row[fijas:]):
+                        if timestamp and isinstance(valor, (int, float)):
+                            yield [ws.title, fecha, hora, capacidad_total, timestamp, valor]
+        finally:
+            wb.close()
+
+
+# ============== CODIFICADORES ==============
+
+def csv_chunks(filas, columnas: list):
+    """Codifica filas como CSV UTF-8 (con BOM para Excel) en bloques de bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write('\ufeff')
+    writer.writerow(columnas)
+
+    for i, fila in enumerate(filas, start=1):
+        writer.writerow(fila)
+        if i % FILAS_POR_BLOQUE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(filas, columnas: list):
+    """Codifica filas como un objeto JSON por línea en bloques de bytes"""
+    lineas = []
+
+    for fila in filas:
+        lineas.append(json.dumps(dict(zip(columnas, fila)), ensure_ascii=False))
+        if len(lineas) >= FILAS_POR_BLOQUE:
+            yield ('\n'.join(lineas) + '\n').encode('utf-8')
+            lineas = []
+
+    if lineas:
+        yield ('\n'.join(lineas) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """Comprime un flujo de bloques de bytes en formato gzip"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def codificar(filas, columnas: list, formato: str):
+    """
+    Codifica un generador de filas en el formato pedido.
+
+    Args:
+        filas: Generador de listas de valores
+        columnas: Nombres de columna
+        formato: 'csv', 'csv.gz' o 'ndjson'
+
+    Returns:
+        Generador de bloques de bytes
+    """
+    if formato == 'ndjson':
+        return ndjson_chunks(filas, columnas)
+    if formato == 'csv.gz':
+        return gzip_chunks(csv_chunks(filas, columnas))
+    return csv_chunks(filas, columnas)
@@ -0,0 +1,912 @@
+"""
+Almacenamiento particionado del histórico de disponibilidad.
+
+El histórico agrega una columna por snapshot (consulta). Para no llegar al
+límite de columnas de Excel (16.384) y mantener acotado el coste de cada
+escritura, las columnas se reparten en workbooks por periodo del snapshot
+(mes por defecto) y se registran en un manifest JSON:
+
+    historico/manifest.json
+    historico/historico_2025-11.xlsx
+    historico/historico_2025-12.xlsx
+    historico/historico_2025-12_p2.xlsx   (si el periodo supera MAX_COLUMNAS)
+
+El archivo único anterior (historico_disponibilidad.xlsx) se conserva como
+partición 'legacy' de solo lectura.
+
+Railway, /api/guardar-historico y el backfill escriben desde procesos e
+instancias distintos, y cada escritura lee y reescribe el manifest, el índice
+de series y los agregados derivados. registrar_snapshots las serializa con un
+cerrojo en storage (historico/escritura.lock, creado de forma exclusiva) que
+caduca a los BLOQUEO_TTL segundos por si el proceso que lo tenía murió.
+"""
+
+import os
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from io import BytesIO
+from datetime import datetime, timezone
+
+import storage_client
+
+
+CARPETA = 'historico'
+MANIFEST_PATH = f'{CARPETA}/manifest.json'
+LEGACY_PATH_CLOUD = f'{CARPETA}/historico_disponibilidad.xlsx'
+LEGACY_PATH_LOCAL = 'historico_disponibilidad.xlsx'
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Periodo de partición: 'month', 'week' o 'day'
+PERIODO = os.environ.get('HISTORICO_PERIODO', 'month').lower()
+
+# Máximo de snapshots (columnas) por workbook antes de abrir una nueva parte
+MAX_COLUMNAS = int(os.environ.get('HISTORICO_MAX_COLUMNAS', '1000'))
+
+MAX_COLUMNAS_EXCEL = 16384
+COLUMNAS_FIJAS = 3  # Fecha, Hora, Capacidad Total
+
+# En Vercel (funciones serverless) no hay trabajo después de la respuesta:
+# los hilos de fondo se congelan o se pierden y cada request tiene tiempo límite
+SERVERLESS = bool(os.environ.get('VERCEL'))
+
+# Cerrojo de escritura: segundos que se considera vigente (debe cubrir la
+# escritura más larga) y segundos que se espera a que otro escritor lo libere
+BLOQUEO_PATH = f'{CARPETA}/escritura.lock'
+BLOQUEO_TTL = int(os.environ.get('HISTORICO_BLOQUEO_TTL', '300'))
+BLOQUEO_ESPERA = float(os.environ.get('HISTORICO_BLOQUEO_ESPERA', '20' if SERVERLESS else '120'))
+
+
+def timestamp_actual() -> str:
+    """Retorna el timestamp actual en hora de Roma (formato 'YYYY-MM-DD HH:MM')"""
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo('Europe/Rome')).strftime("%Y-%m-%d %H:%M")
+    except Exception:
+        return datetime.now().strftime("%Y-%m-%d %H:%M")
+
+
+def normalizar_timestamp(valor: str) -> str:
+    """
+    Normaliza el timestamp de un snapshot archivado al formato de columna.
+
+    Args:
+        valor: ISO con zona (ej: '2025-12-04T07:30:00Z', se convierte a hora
+            de Roma) o 'YYYY-MM-DD HH:MM[:SS]' ya en hora de Roma
+
+    Returns:
+        Timestamp 'YYYY-MM-DD HH:MM'
+
+    Raises:
+        ValueError: Si el valor no es una fecha válida
+    """
+    valor = str(valor).strip()
+    dt = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+
+    if dt.tzinfo is not None:
+        from zoneinfo import ZoneInfo
+        dt = dt.astimezone(ZoneInfo('Europe/Rome'))
+
+    return dt.strftime("%Y-%m-%d %H:%M")
+
+
+def clave_periodo(timestamp: str, periodo: str = None) -> str:
+    """
+    Calcula la clave de partición de un timestamp de snapshot.
+
+    Args:
+        timestamp: Timestamp 'YYYY-MM-DD HH:MM'
+        periodo: 'month', 'week' o 'day' (default: PERIODO)
+
+    Returns:
+        Clave ordenable ('2025-12', '2025-W49' o '2025-12-04')
+    """
+    periodo = periodo or PERIODO
+
+    try:
+        dt = datetime.strptime(str(timestamp)[:10], "%Y-%m-%d")
+    except ValueError:
+        return str(timestamp)[:7]
+
+    if periodo == 'day':
+        return dt.strftime("%Y-%m-%d")
+    if periodo == 'week':
+        year, week, _ = dt.isocalendar()
+        return f"{year}-W{week:02d}"
+    return dt.strftime("%Y-%m")
+
+
+# ============== CONVERSIÓN DE SNAPSHOTS ==============
+
+def utc_a_roma(valor: str) -> tuple:
+    """
+    Fecha y hora en Roma (CET/CEST según la fecha) de un startDateTime UTC
+    (ej: '2025-12-04T07:30:00Z'). Es la clave (fecha, hora) de un horario en
+    todo el histórico, venga de Railway o de /api/consultar.
+
+    Raises:
+        ValueError: Si el valor no es un datetime ISO
+    """
+    from zoneinfo import ZoneInfo
+
+    dt = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    roma = dt.astimezone(ZoneInfo('Europe/Rome'))
+    return roma.strftime('%Y-%m-%d'), roma.strftime('%H:%M')
+
+
+def snapshot_desde_resultados(resultados: dict) -> dict:
+    """
+    Convierte los resultados de /api/consultar al formato de snapshot. La
+    clave de cada horario sale de su 'start_datetime' (UTC) cuando lo tiene,
+    igual que en snapshot_desde_availability.
+
+    Returns:
+        {tour_key: {(fecha, hora): {'capacidad', 'capacidad_original'}}}
+    """
+    snapshot = {}
+
+    for tour_key, tour_data in resultados.items():
+        datos = {}
+        for fecha, timeslots in tour_data.get('timeslots_por_fecha', {}).items():
+            for ts in timeslots:
+                clave = (fecha, ts.get('hora', 'N/A'))
+                if ts.get('start_datetime'):
+                    try:
+                        clave = utc_a_roma(ts['start_datetime'])
+                    except ValueError:
+                        pass
+                capacidad = ts.get('capacidad', 0)
+                datos[clave] = {
+                    'capacidad': capacidad,
+                    'capacidad_original': ts.get('capacidad_original', capacidad)
+                }
+        snapshot[tour_key] = datos
+
+    return snapshot
+
+
+def snapshot_desde_availability(availability_data: dict) -> dict:
+    """
+    Convierte la disponibilidad cruda de Railway (timeslots con startDateTime UTC)
+    al formato de snapshot, con fecha y hora en hora de Roma.
+
+    Returns:
+        {tour_key: {(fecha, hora): {'capacidad', 'capacidad_original'}}}
+    """
+    snapshot = {}
+
+    for tour_key, tour_data in availability_data.items():
+        datos = {}
+        for ts in tour_data.get('timeslots', []):
+            start = ts.get('startDateTime', '')
+            if not start:
+                continue
+
+            try:
+                clave = utc_a_roma(start)
+            except ValueError:
+                continue
+
+            capacidad = ts.get('capacity', 0)
+            datos[clave] = {
+                'capacidad': capacidad,
+                'capacidad_original': ts.get('originalCapacity', capacidad)
+            }
+        snapshot[tour_key] = datos
+
+    return snapshot
+
+
+def snapshot_desde_archivo(data: dict, timestamp: str = None) -> tuple:
+    """
+    Convierte un snapshot archivado a (timestamp, snapshot).
+
+    Acepta la caché de Railway ({'availability', 'timestamp'} con timestamp
+    ISO en UTC) y respuestas guardadas de /api/consultar ({'resultados',
+    'timestamp'}).
+
+    Args:
+        data: Contenido JSON del archivo
+        timestamp: Timestamp a usar si el archivo no trae uno
+
+    Returns:
+        (timestamp 'YYYY-MM-DD HH:MM', snapshot)
+
+    Raises:
+        ValueError: Si el formato no se reconoce o falta el timestamp
+    """
+    if 'availability' in data:
+        snapshot = snapshot_desde_availability(data['availability'])
+    elif 'resultados' in data:
+        snapshot = snapshot_desde_resultados(data['resultados'])
+    else:
+        raise ValueError("Formato no reconocido: se esperaba 'availability' o 'resultados'")
+
+    valor = data.get('timestamp') or timestamp
+    if not valor:
+        raise ValueError("El snapshot no tiene timestamp")
+
+    return normalizar_timestamp(valor), snapshot
+
+
+# ============== ESCRITURA EN WORKBOOK ==============
+
+def _nuevo_workbook():
+    """Crea un workbook vacío sin la hoja por defecto"""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    if 'Sheet' in wb.sheetnames:
+        wb.remove(wb['Sheet'])
+    return wb
+
+
+def _crear_hoja(wb, sheet_name: str):
+    """Crea una hoja de tour con los headers fijos"""
+    from openpyxl.styles import Font, PatternFill, Alignment
+
+    ws = wb.create_sheet(sheet_name)
+
+    ws['A1'] = 'Fecha'
+    ws['B1'] = 'Hora'
+    ws['C1'] = 'Capacidad Total'
+
+    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+    header_font = Font(color='FFFFFF', bold=True)
+
+    for col in ['A1', 'B1', 'C1']:
+        ws[col].fill = header_fill
+        ws[col].font = header_font
+        ws[col].alignment = Alignment(horizontal='center', vertical='center')
+
+    ws.column_dimensions['A'].width = 12
+    ws.column_dimensions['B'].width = 8
+    ws.column_dimensions['C'].width = 14
+
+    return ws
+
+
+def _mapa_filas(ws) -> dict:
+    """Retorna el mapeo (fecha, hora) -> número de fila de una hoja"""
+    filas = {}
+    for row, (fecha, hora) in enumerate(ws.iter_rows(min_row=2, max_col=2, values_only=True), start=2):
+        if fecha and hora:
+            filas[(str(fecha), str(hora))] = row
+    return filas
+
+
+_ESTILOS = {}
+
+
+def _estilos() -> dict:
+    """Estilos compartidos (se crean una sola vez por proceso)"""
+    if not _ESTILOS:
+        from openpyxl.styles import Font, PatternFill, Alignment
+
+        _ESTILOS.update({
+            'centro': Alignment(horizontal='center'),
+            'header_centro': Alignment(horizontal='center', vertical='center'),
+            'header_fill': PatternFill(start_color='70AD47', end_color='70AD47', fill_type='solid'),
+            'header_font': Font(color='FFFFFF', bold=True),
+            'vacio_fill': PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid'),
+            'vacio_font': Font(color='999999', italic=True),
+            'agotado_fill': PatternFill(start_color='FF6B6B', end_color='FF6B6B', fill_type='solid'),
+            'agotado_font': Font(color='FFFFFF', bold=True),
+            'baja_fill': PatternFill(start_color='FFE066', end_color='FFE066', fill_type='solid'),
+            'alta_fill': PatternFill(start_color='95E1D3', end_color='95E1D3', fill_type='solid'),
+            'sin_fill': PatternFill(fill_type=None),
+            'normal_font': Font(),
+        })
+    return _ESTILOS
+
+
+def _formatear_header(cell, timestamp: str):
+    """Aplica el estilo de header de snapshot"""
+    estilos = _estilos()
+    cell.value = timestamp
+    cell.fill = estilos['header_fill']
+    cell.font = estilos['header_font']
+    cell.alignment = estilos['header_centro']
+
+
+def _formatear_celda(cell, capacidad, capacidad_total, limpiar: bool = False):
+    """
+    Escribe una celda de disponibilidad con formato condicional por color.
+    Con limpiar=True se quita antes el formato previo (columna reemplazada).
+    """
+    estilos = _estilos()
+    cell.value = capacidad
+    cell.alignment = estilos['centro']
+    if limpiar:
+        cell.fill = estilos['sin_fill']
+        cell.font = estilos['normal_font']
+
+    if capacidad == '-' or capacidad is None:
+        # Horario que ya no aparece en la consulta (pasó o se eliminó)
+        cell.value = '-'
+        cell.fill = estilos['vacio_fill']
+        cell.font = estilos['vacio_font']
+    elif capacidad == 0:
+        cell.fill = estilos['agotado_fill']
+        cell.font = estilos['agotado_font']
+    elif isinstance(capacidad_total, (int, float)) and capacidad_total > 0:
+        porcentaje = (capacidad / capacidad_total) * 100
+        if porcentaje < 30:
+            cell.fill = estilos['baja_fill']
+        elif porcentaje > 70:
+            cell.fill = estilos['alta_fill']
+
+
+def _headers_snapshot(ws) -> list:
+    """Timestamps de las columnas de snapshot de una hoja, en orden de columna"""
+    return [
+        str(v) if v else ''
+        for v in next(ws.iter_rows(min_row=1, max_row=1, min_col=COLUMNAS_FIJAS + 1, values_only=True), ())
+    ]
+
+
+def escribir_columna(wb, tour_key: str, datos: dict, timestamp: str) -> int:
+    """
+    Agrega una columna de snapshot a la hoja del tour.
+    Los horarios nuevos se agregan como filas al final y los que ya no
+    aparecen en el snapshot se marcan con '-'.
+
+    Normalmente la columna va al final. Un snapshot anterior al último
+    (backfill) se inserta en su posición cronológica, y uno con un timestamp
+    ya existente reemplaza esa columna.
+
+    Args:
+        wb: Workbook de la partición
+        tour_key: Clave del tour (nombre de hoja, máx 31 caracteres)
+        datos: {(fecha, hora): {'capacidad', 'capacidad_original'}}
+        timestamp: Header de la columna
+
+    Returns:
+        Número de horarios escritos
+    """
+    from bisect import bisect_left
+    from openpyxl.utils import get_column_letter
+
+    sheet_name = tour_key[:31]
+
+    if sheet_name in wb.sheetnames:
+        ws = wb[sheet_name]
+        filas = _mapa_filas(ws)
+    else:
+        ws = _crear_hoja(wb, sheet_name)
+        filas = {}
+
+    # Agregar horarios nuevos al final
+    next_row = ws.max_row + 1
+    for key in sorted(datos.keys()):
+        if key not in filas:
+            ws.cell(row=next_row, column=1, value=key[0])
+            ws.cell(row=next_row, column=2, value=key[1])
+            ws.cell(row=next_row, column=3, value=datos[key]['capacidad_original'])
+            filas[key] = next_row
+            next_row += 1
+
+    headers = _headers_snapshot(ws) if ws.max_column > COLUMNAS_FIJAS else []
+    col_num = COLUMNAS_FIJAS + 1 + len(headers)
+    reemplazar = False
+
+    if headers and timestamp <= headers[-1]:
+        i = bisect_left(headers, timestamp)
+        col_num = COLUMNAS_FIJAS + 1 + i
+        reemplazar = headers[i] == timestamp
+        if not reemplazar:
+            ws.insert_cols(col_num)
+
+    _formatear_header(ws.cell(row=1, column=col_num), timestamp)
+    ws.column_dimensions[get_column_letter(col_num)].width = 14
+
+    for key, row in filas.items():
+        if key in datos:
+            _formatear_celda(
+                ws.cell(row=row, column=col_num),
+                datos[key]['capacidad'],
+                datos[key]['capacidad_original'],
+                reemplazar
+            )
+        else:
+            _formatear_celda(ws.cell(row=row, column=col_num), '-', 0, reemplazar)
+
+    return len(datos)
+
+
+# ============== BLOQUEO DE ESCRITURA ==============
+
+class HistoricoOcupado(Exception):
+    """Otro proceso está escribiendo el histórico y no terminó a tiempo"""
+
+
+def _leer_bloqueo():
+    """Contenido del cerrojo ({'token', 'expira'}), {} si es ilegible o None si no existe"""
+    result = storage_client.read_bytes(BLOQUEO_PATH)
+    if not result['success']:
+        return None
+    try:
+        return json.loads(result['data'].decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return {}
+
+
+@contextmanager
+def bloqueo_escritura(espera: float = None):
+    """
+    Serializa las escrituras del histórico entre procesos e instancias.
+
+    El cerrojo es un objeto de storage creado de forma exclusiva; si ya
+    existe se reintenta hasta 'espera' segundos. Uno caducado (su escritor
+    murió sin liberarlo) se elimina y se vuelve a intentar.
+
+    Args:
+        espera: Segundos máximos de espera (default: BLOQUEO_ESPERA)
+
+    Raises:
+        HistoricoOcupado: Si otro escritor lo mantiene más de 'espera' segundos
+    """
+    espera = BLOQUEO_ESPERA if espera is None else espera
+    token = uuid.uuid4().hex
+    limite = time.time() + espera
+
+    while True:
+        contenido = json.dumps({'token': token, 'expira': time.time() + BLOQUEO_TTL}).encode('utf-8')
+        if storage_client.create_bytes(BLOQUEO_PATH, contenido, 'application/json')['success']:
+            break
+
+        actual = _leer_bloqueo()
+        if actual is not None and actual.get('expira', 0) < time.time():
+            print("[Historico] Cerrojo de escritura caducado, se libera")
+            storage_client.delete_bytes(BLOQUEO_PATH)
+            continue
+        if time.time() >= limite:
+            raise HistoricoOcupado("Otro guardado del histórico está en curso, inténtalo en unos segundos")
+        time.sleep(0.5)
+
+    try:
+        yield
+    finally:
+        # Si caducó y lo tomó otro escritor, no es nuestro
+        actual = _leer_bloqueo()
+        if actual is not None and actual.get('token') == token:
+            storage_client.delete_bytes(BLOQUEO_PATH)
+
+
+# ============== MANIFEST Y PARTICIONES ==============
+
+def _legacy_path() -> str:
+    """Ruta del histórico único anterior según el modo de almacenamiento"""
+    return LEGACY_PATH_CLOUD if storage_client.is_configured() else LEGACY_PATH_LOCAL
+
+
+def _path_particion(clave: str, parte: int) -> str:
+    """Ruta del workbook de una partición"""
+    if parte > 1:
+        return f"{CARPETA}/historico_{clave}_p{parte}.xlsx"
+    return f"{CARPETA}/historico_{clave}.xlsx"
+
+
+def _describir_workbook(wb) -> dict:
+    """Calcula columnas, filas y rango de timestamps de un workbook"""
+    columnas = 0
+    filas = 0
+    timestamps = []
+
+    for ws in wb.worksheets:
+        columnas = max(columnas, ws.max_column - COLUMNAS_FIJAS)
+        filas = max(filas, ws.max_row - 1)
+        for cell in next(ws.iter_rows(min_row=1, max_row=1, min_col=COLUMNAS_FIJAS + 1), ()):
+            if cell.value:
+                timestamps.append(str(cell.value))
+
+    return {
+        'columnas': max(columnas, 0),
+        'filas': max(filas, 0),
+        'desde': min(timestamps) if timestamps else '',
+        'hasta': max(timestamps) if timestamps else ''
+    }
+
+
+def cargar_manifest() -> dict:
+    """
+    Carga el manifest de particiones. Si no existe, lo inicializa registrando
+    el histórico único anterior (si lo hay) como partición 'legacy'.
+
+    Returns:
+        dict con 'version', 'periodo' y lista 'particiones'
+    """
+    result = storage_client.read_bytes(MANIFEST_PATH)
+    if result['success']:
+        try:
+            return json.loads(result['data'].decode('utf-8'))
+        except (ValueError, UnicodeDecodeError) as e:
+            print(f"[Historico] Manifest corrupto, se regenera: {e}")
+
+    manifest = {'version': 1, 'periodo': PERIODO, 'particiones': []}
+
+    legacy_path = _legacy_path()
+    legacy = storage_client.read_bytes(legacy_path)
+    if legacy['success']:
+        from openpyxl import load_workbook
+
+        wb = load_workbook(BytesIO(legacy['data']), read_only=True)
+        entrada = {'clave': 'legacy', 'parte': 1, 'path': legacy_path, 'bytes': len(legacy['data'])}
+        entrada.update(_describir_workbook(wb))
+        wb.close()
+        manifest['particiones'].append(entrada)
+
+    return manifest
+
+
+def guardar_manifest(manifest: dict) -> dict:
+    """Guarda el manifest de particiones"""
+    manifest['actualizado'] = timestamp_actual()
+    data = json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8')
+    return storage_client.write_bytes(MANIFEST_PATH, data, 'application/json')
+
+
+def particiones_ordenadas(manifest: dict) -> list:
+    """Particiones en orden cronológico (legacy primero)"""
+    return sorted(
+        manifest.get('particiones', []),
+        key=lambda p: (p.get('clave') != 'legacy', p.get('desde', ''), p.get('parte', 1))
+    )
+
+
+def _particion_para(manifest: dict, timestamp: str) -> dict:
+    """
+    Obtiene (o crea) la entrada de manifest donde escribir un snapshot.
+    Abre una nueva parte si la actual alcanzó MAX_COLUMNAS. Un snapshot
+    anterior al final de una parte ya cerrada (backfill) va a esa parte.
+    """
+    clave = clave_periodo(timestamp)
+    partes = sorted(
+        (p for p in manifest['particiones'] if p.get('clave') == clave),
+        key=lambda p: p.get('parte', 1)
+    )
+
+    for p in partes[:-1]:
+        if timestamp <= p.get('hasta', ''):
+            return p
+
+    if partes:
+        ultima = partes[-1]
+        if ultima.get('columnas', 0) < MAX_COLUMNAS or timestamp <= ultima.get('hasta', ''):
+            return ultima
+        parte = ultima.get('parte', 1) + 1
+    else:
+        parte = 1
+
+    entrada = {
+        'clave': clave,
+        'parte': parte,
+        'path': _path_particion(clave, parte),
+        'columnas': 0,
+        'filas': 0,
+        'bytes': 0,
+        'desde': '',
+        'hasta': ''
+    }
+    manifest['particiones'].append(entrada)
+    return entrada
+
+
+def _cargar_workbook(path: str):
+    """Carga el workbook de una partición o crea uno nuevo si no existe"""
+    from openpyxl import load_workbook
+
+    result = storage_client.read_bytes(path)
+    if result['success']:
+        return load_workbook(BytesIO(result['data']))
+    return _nuevo_workbook()
+
+
+def registrar_snapshot(snapshot: dict, timestamp: str = None) -> dict:
+    """
+    Escribe un snapshot como nueva columna en la partición de su periodo.
+    Solo se carga y reescribe el workbook de esa partición.
+
+    Args:
+        snapshot: {tour_key: {(fecha, hora): {'capacidad', 'capacidad_original'}}}
+        timestamp: Header de la columna (default: ahora en hora de Roma)
+
+    Returns:
+        dict con 'success', 'path', 'particion', 'timestamp', 'total_timeslots',
+        'local', 'version' y opcionalmente 'warning'
+    """
+    timestamp = timestamp or timestamp_actual()
+    result = registrar_snapshots([(timestamp, snapshot)])
+
+    respuesta = {
+        'success': True,
+        'path': result['particiones'][0]['path'],
+        'particion': result['particiones'][0]['clave'],
+        'timestamp': timestamp,
+        'total_timeslots': result['total_timeslots'],
+        'local': result['local'],
+        'version': result['version']
+    }
+    if result.get('warning'):
+        respuesta['warning'] = result['warning']
+    return respuesta
+
+
+def registrar_snapshots(snapshots: list) -> dict:
+    """
+    Escribe varios snapshots (backfill) en una sola pasada: se aplican en orden
+    de timestamp y cada partición afectada se carga, guarda y sube una sola
+    vez, con una única escritura del manifest y del índice de series.
+    Los snapshots anteriores a la última columna se insertan en su posición.
+    Toda la escritura (manifest, particiones, índice y agregados derivados) se
+    hace con el cerrojo de escritura (ver bloqueo_escritura).
+
+    Args:
+        snapshots: Lista de (timestamp, snapshot)
+
+    Returns:
+        dict con 'success', 'snapshots', 'total_timeslots', 'particiones'
+        (path, clave, snapshots, insertados), 'local', 'version' (id del último
+        evento de cambio tras comparar estos snapshots, None si no se pudo
+        calcular) y opcionalmente 'warning'
+
+    Raises:
+        HistoricoOcupado: Si otro proceso está escribiendo y no termina a tiempo
+    """
+    with bloqueo_escritura():
+        return _registrar_snapshots(snapshots)
+
+
+def _registrar_snapshots(snapshots: list) -> dict:
+    import series_index
+
+    ordenados = sorted(snapshots, key=lambda item: item[0])
+    manifest = cargar_manifest()
+
+    # path -> {'entrada', 'wb', 'snapshots', 'insertados'}
+    abiertas = {}
+    total_timeslots = 0
+
+    for timestamp, snapshot in ordenados:
+        entrada = _particion_para(manifest, timestamp)
+        particion = abiertas.get(entrada['path'])
+        if particion is None:
+            particion = abiertas[entrada['path']] = {
+                'entrada': entrada,
+                'original': dict(entrada),
+                'wb': _cargar_workbook(entrada['path']),
+                'snapshots': [],
+                'insertados': 0
+            }
+
+        if entrada.get('hasta') and timestamp <= entrada['hasta']:
+            particion['insertados'] += 1
+
+        for tour_key, datos in snapshot.items():
+            if datos:
+                total_timeslots += escribir_columna(particion['wb'], tour_key, datos, timestamp)
+        particion['snapshots'].append((timestamp, snapshot))
+
+        # Mantener el conteo al día para abrir una nueva parte si se llena
+        entrada.update(_describir_workbook(particion['wb']))
+
+    resumen = []
+    local = False
+    warning = None
+    version = None
+
+    for path, particion in abiertas.items():
+        entrada, wb = particion['entrada'], particion['wb']
+
+        output = BytesIO()
+        wb.save(output)
+        file_bytes = output.getvalue()
+
+        result = storage_client.write_bytes(path, file_bytes, XLSX_MIME)
+        local = local or result.get('local', False)
+        warning = warning or result.get('warning')
+
+        # Actualizar el índice de series de la partición
+        indice = series_index.registrar_snapshots(particion['original'], particion['snapshots'], wb)
+
+        entrada['bytes'] = len(file_bytes)
+        particion['indice'] = indice
+
+        print(f"[Historico] {path}: {len(particion['snapshots'])} snapshots "
+              f"({particion['insertados']} insertados, {entrada['columnas']} columnas, {len(file_bytes)} bytes)")
+
+        resumen.append({
+            'path': path,
+            'clave': entrada['clave'],
+            'snapshots': len(particion['snapshots']),
+            'insertados': particion['insertados']
+        })
+
+    if abiertas:
+        guardar_manifest(manifest)
+        for particion in abiertas.values():
+            series_index.actualizar_cache(particion['entrada'], particion['indice'])
+
+        version = _actualizar_derivados(ordenados)
+
+    respuesta = {
+        'success': True,
+        'snapshots': len(ordenados),
+        'total_timeslots': total_timeslots,
+        'particiones': resumen,
+        'local': local,
+        'version': version
+    }
+    if warning:
+        respuesta['warning'] = warning
+    return respuesta
+
+
+def _actualizar_derivados(snapshots: list):
+    """
+    Actualiza los agregados derivados del histórico (O(horarios) por snapshot):
+    velocidad de venta por horario, heatmap de demanda, previsión de
+    ocupación, coincidencias de las reglas de vigilancia y log de eventos de
+    cambio, que alimenta las alertas de Telegram. Un fallo en un agregado no
+    afecta al histórico ya guardado.
+
+    Returns:
+        Secuencia de eventos tras el lote, o None si no se pudo calcular
+    """
+    import velocidad_venta
+    import demanda_heatmap
+    import diff_snapshots
+    import reglas_vigilancia
+    import prevision_ocupacion
+
+    derivados = (
+        ('velocidad de venta', velocidad_venta),
+        ('heatmap de demanda', demanda_heatmap),
+        ('previsión de ocupación', prevision_ocupacion),
+        ('reglas de vigilancia', reglas_vigilancia),
+    )
+    for nombre, modulo in derivados:
+        try:
+            modulo.registrar_snapshots(snapshots)
+        except Exception as e:
+            print(f"[Historico] No se pudo actualizar {nombre}: {e}")
+
+    # Eventos de cambio y alertas de Telegram (un resumen por lote)
+    try:
+        eventos, secuencia = diff_snapshots.registrar(snapshots)
+    except Exception as e:
+        print(f"[Historico] No se pudieron procesar los eventos de cambio: {e}")
+        return None
+
+    if eventos:
+        try:
+            import alertas_telegram
+            alertas_telegram.notificar(eventos)
+        except Exception as e:
+            print(f"[Historico] No se pudieron enviar las alertas: {e}")
+    return secuencia
+
+
+# ============== LECTURA Y COMBINACIÓN ==============
+
+def seleccionar_particiones(manifest: dict, desde: str = None, hasta: str = None) -> list:
+    """
+    Selecciona las particiones a descargar.
+
+    Args:
+        manifest: Manifest de particiones
+        desde: Clave de periodo inicial inclusive (ej: '2025-11')
+        hasta: Clave de periodo final inclusive (ej: '2025-12')
+
+    Returns:
+        Lista de entradas en orden cronológico. Sin rango, las particiones
+        más recientes cuyas columnas caben en una hoja de Excel.
+    """
+    particiones = particiones_ordenadas(manifest)
+
+    if desde or hasta:
+        seleccion = []
+        for p in particiones:
+            clave = p.get('clave', '')
+            if clave == 'legacy':
+                if not desde:
+                    seleccion.append(p)
+                continue
+            if desde and clave < desde:
+                continue
+            if hasta and clave[:len(hasta)] > hasta:
+                continue
+            seleccion.append(p)
+        return seleccion
+
+    limite = MAX_COLUMNAS_EXCEL - COLUMNAS_FIJAS
+    seleccion = []
+    total = 0
+    for p in reversed(particiones):
+        columnas = p.get('columnas', 0)
+        if seleccion and total + columnas > limite:
+            break
+        seleccion.insert(0, p)
+        total += columnas
+    return seleccion
+
+
+def combinar_particiones(particiones: list):
+    """
+    Combina varias particiones en un único workbook.
+    Las filas (fecha, hora) se unen y las columnas se concatenan en orden
+    cronológico, conservando solo las más recientes si superan el límite de Excel.
+
+    Args:
+        particiones: Entradas de manifest en orden cronológico
+
+    Returns:
+        Workbook de openpyxl o None si no hay datos
+    """
+    from openpyxl import load_workbook
+
+    if len(particiones) == 1:
+        result = storage_client.read_bytes(particiones[0]['path'])
+        return load_workbook(BytesIO(result['data'])) if result['success'] else None
+
+    # hoja -> {'filas': {(fecha, hora): capacidad_total}, 'columnas': [(timestamp, {key: valor})]}
+    hojas = {}
+    leidas = 0
+
+    for p in particiones:
+        result = storage_client.read_bytes(p['path'])
+        if not result['success']:
+            print(f"[Historico] Partición no disponible: {p['path']}")
+            continue
+        leidas += 1
+
+        wb = load_workbook(BytesIO(result['data']), read_only=True)
+        for ws in wb.worksheets:
+            hoja = hojas.setdefault(ws.title, {'filas': {}, 'columnas': []})
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header:
+                continue
+
+            columnas = [(str(h), {}) for h in header[COLUMNAS_FIJAS:] if h]
+            for row in rows:
+                if not row or not row[0] or not row[1]:
+                    continue
+                key = (str(row[0]), str(row[1]))
+                hoja['filas'].setdefault(key, row[2] if len(row) > 2 else 0)
+                for i, (_, valores) in enumerate(columnas):
+                    idx = COLUMNAS_FIJAS + i
+                    if idx < len(row) and row[idx] is not None:
+                        valores[key] = row[idx]
+            hoja['columnas'].extend(columnas)
+        wb.close()
+
+    if not leidas:
+        return None
+
+    from openpyxl.utils import get_column_letter
+
+    limite = MAX_COLUMNAS_EXCEL - COLUMNAS_FIJAS
+    wb = _nuevo_workbook()
+
+    for sheet_name, hoja in hojas.items():
+        ws = _crear_hoja(wb, sheet_name)
+        claves = sorted(hoja['filas'].keys())
+
+        for row, key in enumerate(claves, start=2):
+            ws.cell(row=row, column=1, value=key[0])
+            ws.cell(row=row, column=2, value=key[1])
+            ws.cell(row=row, column=3, value=hoja['filas'][key])
+
+        for offset, (timestamp, valores) in enumerate(hoja['columnas'][-limite:]):
+            col_num = COLUMNAS_FIJAS + 1 + offset
+            _formatear_header(ws.cell(row=1, column=col_num), timestamp)
+            ws.column_dimensions[get_column_letter(col_num)].width = 14
+            for row, key in enumerate(claves, start=2):
+                if key in valores:
+                    _formatear_celda(ws.cell(row=row, column=col_num), valores[key], hoja['filas'][key])
+
+    return wb
@@ -0,0 +1,239 @@
+"""
+Índice en memoria sobre el último snapshot de disponibilidad.
+
+Los horarios se guardan en arrays paralelos ordenados por (fecha, hora, tour),
+así que un rango de fechas es un tramo contiguo que se localiza con bisect.
+Además hay listas de posiciones (postings, ordenadas) por tour, por hora y
+por día de semana. Una búsqueda recorta cada posting al tramo de fechas con
+bisect, recorre la más corta y comprueba el resto de filtros directamente
+sobre los arrays.
+
+El snapshot sale de la disponibilidad cacheada por Railway o, si no está
+disponible, del último snapshot del histórico (diff_snapshots). El índice se
+reconstruye solo cuando cambia el timestamp del snapshot, y el origen se
+vuelve a consultar como máximo cada TTL_INDICE segundos.
+"""
+
+import os
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+import storage_client
+import historico_store
+
+
+# Segundos que se reutiliza el índice antes de volver a consultar el origen
+TTL_INDICE = int(os.environ.get('INDICE_DISPONIBILIDAD_TTL', '30'))
+
+# Máximo de horarios devueltos por búsqueda
+LIMITE_RESULTADOS = 1000
+
+
+class IndiceDisponibilidad:
+    """Horarios de un snapshot con búsqueda por rango de fechas y filtros"""
+
+    def __init__(self, snapshot: dict, timestamp: str = ''):
+        """
+        Args:
+            snapshot: {tour_key: {(fecha, hora): {'capacidad', 'capacidad_original'}}}
+            timestamp: Timestamp del snapshot
+        """
+        self.timestamp = timestamp
+
+        filas = sorted(
+            (fecha, hora, tour_key, valores.get('capacidad', 0) or 0,
+             valores.get('capacidad_original', 0) or 0)
+            for tour_key, datos in snapshot.items()
+            for (fecha, hora), valores in datos.items()
+        )
+
+        self.fechas = [f[0] for f in filas]
+        self.horas = [f[1] for f in filas]
+        self.tours = [f[2] for f in filas]
+        self.capacidades = [f[3] for f in filas]
+        self.originales = [f[4] for f in filas]
+
+        self.dias = []
+        self.por_tour = {}
+        self.por_hora = {}
+        self.por_dia = {}
+
+        dias_fecha = {}
+        for i, (fecha, hora, tour_key, _, _) in enumerate(filas):
+            dia = dias_fecha.get(fecha)
+            if dia is None:
+                try:
+                    dia = dias_fecha[fecha] = date.fromisoformat(fecha).weekday()
+                except ValueError:
+                    dia = dias_fecha[fecha] = -1
+            self.dias.append(dia)
+            self.por_tour.setdefault(tour_key, []).append(i)
+            self.por_hora.setdefault(hora[:2], []).append(i)
+            self.por_dia.setdefault(dia, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.fechas)
+
+    def rango_fechas(self, desde: str = None, hasta: str = None) -> tuple:
+        """Tramo [inicio, fin) de posiciones con fecha entre desde y hasta (inclusive)"""
+        inicio = bisect_left(self.fechas, desde) if desde else 0
+        fin = bisect_right(self.fechas, hasta) if hasta else len(self.fechas)
+        return inicio, max(inicio, fin)
+
+    @staticmethod
+    def _recortar(posiciones: list, inicio: int, fin: int) -> list:
+        """Posiciones de un posting dentro del tramo [inicio, fin)"""
+        return posiciones[bisect_left(posiciones, inicio):bisect_left(posiciones, fin)]
+
+    def horario(self, i: int) -> dict:
+        """Horario en la posición i"""
+        return {
+            'tour': self.tours[i],
+            'fecha': self.fechas[i],
+            'hora': self.horas[i],
+            'capacidad': self.capacidades[i],
+            'capacidad_original': self.originales[i]
+        }
+
+    def buscar(self, tours=None, desde: str = None, hasta: str = None, dias_semana=None,
+               hora_desde: str = None, hora_hasta: str = None, min_plazas: int = None,
+               limite: int = LIMITE_RESULTADOS) -> dict:
+        """
+        Busca horarios que cumplan todos los filtros.
+
+        Args:
+            tours: Claves de tour (default: todos)
+            desde / hasta: Rango de fechas YYYY-MM-DD (inclusive)
+            dias_semana: Días 0 (lunes) a 6 (domingo)
+            hora_desde / hora_hasta: Rango de horas HH:MM (inclusive)
+            min_plazas: Capacidad mínima
+            limite: Máximo de horarios devueltos (None = todos)
+
+        Returns:
+            dict con 'total' (coincidencias) y 'slots' (ordenados por fecha, hora y tour)
+        """
+        inicio, fin = self.rango_fechas(desde, hasta)
+
+        # Candidatas de cada filtro con posting, recortadas al rango de fechas
+        grupos = []
+        if tours:
+            grupos.append(self._unir(self.por_tour, tours, inicio, fin))
+        if dias_semana:
+            grupos.append(self._unir(self.por_dia, dias_semana, inicio, fin))
+        if hora_desde or hora_hasta:
+            hh_desde, hh_hasta = (hora_desde or '00')[:2], (hora_hasta or '99')[:2]
+            horas = [hh for hh in self.por_hora if hh_desde <= hh <= hh_hasta]
+            grupos.append(self._unir(self.por_hora, horas, inicio, fin))
+
+        candidatas = min(grupos, key=len) if grupos else range(inicio, fin)
+
+        tours = set(tours) if tours else None
+        dias_semana = set(dias_semana) if dias_semana else None
+        min_plazas = min_plazas or 0
+
+        resultado = []
+        total = 0
+        for i in candidatas:
+            if self.capacidades[i] < min_plazas:
+                continue
+            if tours is not None and self.tours[i] not in tours:
+                continue
+            if dias_semana is not None and self.dias[i] not in dias_semana:
+                continue
+            if hora_desde and self.horas[i] < hora_desde:
+                continue
+            if hora_hasta and self.horas[i] > hora_hasta:
+                continue
+            total += 1
+            if limite is None or len(resultado) < limite:
+                resultado.append(i)
+
+        return {'total': total, 'slots': [self.horario(i) for i in resultado]}
+
+    def horarios_por_dia(self, tours=None, desde: str = None, hasta: str = None) -> dict:
+        """
+        Horarios agrupados por tour y día dentro de un rango de fechas
+        (entrada de buscador_grupos).
+
+        Returns:
+            {(tour, fecha): [(hora, tour, capacidad)] ordenado por hora}
+        """
+        inicio, fin = self.rango_fechas(desde, hasta)
+        posiciones = self._unir(self.por_tour, tours, inicio, fin) if tours else range(inicio, fin)
+
+        dias = {}
+        for i in posiciones:
+            tour_key = self.tours[i]
+            dias.setdefault((tour_key, self.fechas[i]), []).append((self.horas[i], tour_key, self.capacidades[i]))
+        return dias
+
+    def _unir(self, postings: dict, claves, inicio: int, fin: int) -> list:
+        """Unión ordenada de los postings de varias claves dentro del tramo"""
+        partes = [self._recortar(postings[c], inicio, fin) for c in claves if c in postings]
+        if len(partes) == 1:
+            return partes[0]
+        return sorted(p for parte in partes for p in parte)
+
+
+# ============== ORIGEN DEL SNAPSHOT ==============
+
+_CACHE = {'indice': None, 'consultado': 0.0}
+
+
+def _snapshot_actual() -> tuple:
+    """
+    Último snapshot disponible: caché de Railway o, si no hay, el último
+    snapshot comparado del histórico.
+
+    Returns:
+        (timestamp, snapshot) o (None, None)
+    """
+    result = storage_client.get_cached_availability()
+    if result.get('success') and result.get('availability'):
+        timestamp = result.get('timestamp', '')
+        try:
+            timestamp = historico_store.normalizar_timestamp(timestamp)
+        except ValueError:
+            pass
+        return timestamp, historico_store.snapshot_desde_availability(result['availability'])
+
+    import diff_snapshots
+    estado = diff_snapshots.cargar_estado()
+    if not estado:
+        return None, None
+
+    meses, _ = estado['agrupado']
+    snapshot = {
+        tour_key: {
+            clave: {'capacidad': capacidad, 'capacidad_original': original}
+            for horarios in por_mes.values()
+            for clave, (capacidad, original) in horarios.items()
+        }
+        for tour_key, por_mes in meses.items()
+    }
+    return estado['timestamp'], snapshot
+
+
+def obtener_indice():
+    """
+    Índice del último snapshot (se reconstruye solo si cambió el timestamp).
+
+    Returns:
+        IndiceDisponibilidad o None si no hay snapshot
+    """
+    ahora = time.time()
+    indice = _CACHE['indice']
+    if indice is not None and ahora - _CACHE['consultado'] < TTL_INDICE:
+        return indice
+
+    timestamp, snapshot = _snapshot_actual()
+    if snapshot is None:
+        return indice
+
+    if indice is None or indice.timestamp != timestamp:
+        indice = IndiceDisponibilidad(snapshot, timestamp)
+        print(f"[Indice] {len(indice)} horarios indexados ({timestamp})")
+
+    _CACHE.update(indice=indice, consultado=ahora)
+    return indice
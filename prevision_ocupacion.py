@@ -0,0 +1,413 @@
+"""
+Previsión de ocupación al día de la visita según la antelación.
+
+Para cada horario ya celebrado se conoce la ocupación final (última
+observación con menos de ANTELACION_FINAL días) y la ocupación que tenía en
+cada tramo de antelación. Con esos pares (ocupación en el tramo, ocupación
+final) se ajusta por mínimos cuadrados una recta por tour x día de semana x
+mes x tramo:
+
+    ocupacion_final ≈ a + b * ocupacion_actual
+
+El ajuste solo necesita las sumas n, Σx, Σy, Σx², Σxy de cada celda, que se
+acumulan en arrays NumPy de forma (7, 12, len(TRAMOS), 5). Reajustar con
+snapshots nuevos es sumar los horarios que terminan en ellos; los
+coeficientes se recalculan vectorizados para todas las celdas a la vez.
+Las celdas con pocas observaciones usan el ajuste del tour agregado por mes
+y, si tampoco alcanza, el del tour por tramo.
+
+Mientras un horario no empieza se guarda su última ocupación en cada tramo
+(arrays por horario pendiente). Los snapshots se aplican como columnas de
+la matriz horarios x snapshots de series_index, tanto en la reconstrucción
+completa como en la actualización incremental.
+
+El modelo se guarda en historico/prevision.json.gz. Como el de
+velocidad_venta, solo se reconstruye al registrar snapshots fuera de Vercel;
+las peticiones web sin modelo guardado no muestran previsión.
+"""
+
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import storage_client
+import historico_store
+
+
+MODELO_PATH = f'{historico_store.CARPETA}/prevision.json.gz'
+
+# Límites (días) de los tramos de antelación: [0,1), [1,2), ... [90, ∞)
+LIMITES_ANTELACION = [1, 2, 3, 5, 7, 10, 14, 21, 30, 45, 60, 90]
+TRAMOS = len(LIMITES_ANTELACION) + 1
+
+# Días antes del horario en que la última observación cuenta como ocupación final
+ANTELACION_FINAL = 1.0
+
+# Observaciones mínimas para usar el ajuste de una celda
+MIN_OBSERVACIONES = int(os.environ.get('PREVISION_MIN_OBSERVACIONES', '5'))
+
+# Segundos que se reutiliza el modelo en memoria antes de volver a leerlo
+TTL_MODELO = int(os.environ.get('PREVISION_TTL', '60'))
+
+FORMA = (7, 12, TRAMOS)
+
+# Índices de las sumas en el último eje
+N, SX, SY, SXX, SXY = range(5)
+
+
+def _horas(texto: str) -> float:
+    """Horas desde la época de un 'YYYY-MM-DD HH:MM' (hora de reloj, sin zona)"""
+    dt = datetime.strptime(texto[:16], "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+    return dt.timestamp() / 3600.0
+
+
+def _tramo(antelacion):
+    """Tramo de antelación (días) de un valor o array"""
+    return np.searchsorted(LIMITES_ANTELACION, antelacion, side='right')
+
+
+def _coeficientes(sumas: np.ndarray) -> tuple:
+    """
+    Recta de mínimos cuadrados de cada celda a partir de sus sumas.
+    Si x no varía en la celda se usa pendiente 1 (desplazamiento medio).
+
+    Returns:
+        (a, b, n) arrays con la forma de sumas sin el último eje
+    """
+    n = sumas[..., N]
+    sx, sy, sxx, sxy = sumas[..., SX], sumas[..., SY], sumas[..., SXX], sumas[..., SXY]
+    divisor = np.where(n > 0, n, 1)
+
+    varianza = n * sxx - sx * sx
+    con_pendiente = varianza > 1e-6 * np.maximum(n * n, 1)
+    b = np.where(con_pendiente, (n * sxy - sx * sy) / np.where(con_pendiente, varianza, 1), 1.0)
+    a = (sy - b * sx) / divisor
+    return a, b, n
+
+
+class ModeloPrevision:
+    """Sumas de regresión por tour y horarios pendientes de terminar"""
+
+    def __init__(self):
+        self.sumas = {}  # tour -> array (7, 12, TRAMOS, 5)
+        self.ultimo_snapshot = ''
+
+        # Horarios pendientes (aún no empezados)
+        self.claves = []
+        self.posiciones = {}
+        self.inicio = np.empty(0)
+        self.observado = np.empty((0, TRAMOS))
+        self.ultima = np.empty(0)
+        self.ultima_antelacion = np.empty(0)
+
+        self._tablas = {}
+        self._predicciones = {}
+
+    def _asegurar_claves(self, claves: list) -> np.ndarray:
+        """Agrega horarios pendientes nuevos y retorna las filas de cada clave"""
+        nuevas = [k for k in claves if k not in self.posiciones]
+        if nuevas:
+            inicio = []
+            for tour_key, fecha, hora in nuevas:
+                self.posiciones[(tour_key, fecha, hora)] = len(self.claves)
+                self.claves.append((tour_key, fecha, hora))
+                try:
+                    inicio.append(_horas(f"{fecha} {hora}"))
+                except ValueError:
+                    inicio.append(np.nan)
+            m = len(nuevas)
+            self.inicio = np.concatenate([self.inicio, inicio])
+            self.observado = np.vstack([self.observado, np.full((m, TRAMOS), np.nan)])
+            self.ultima = np.concatenate([self.ultima, np.full(m, np.nan)])
+            self.ultima_antelacion = np.concatenate([self.ultima_antelacion, np.full(m, np.nan)])
+        return np.array([self.posiciones[k] for k in claves], dtype=np.intp)
+
+    def aplicar_matriz(self, claves: list, originales: np.ndarray, matriz: np.ndarray, timestamps: list) -> None:
+        """
+        Aplica una matriz horarios x snapshots (columnas en orden cronológico)
+        y cierra los horarios que empiezan antes del último snapshot.
+        """
+        if not timestamps:
+            return
+
+        if claves:
+            filas = self._asegurar_claves(claves)
+            tiempos = np.array([_horas(ts) for ts in timestamps])
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ocupacion = np.where(originales[:, None] > 0,
+                                     (originales[:, None] - matriz) / originales[:, None] * 100, np.nan)
+            antelacion = (self.inicio[filas][:, None] - tiempos[None, :]) / 24.0
+            validos = ~np.isnan(ocupacion) & (antelacion >= 0)
+            tramos = _tramo(np.where(validos, antelacion, 0))
+            columnas = np.arange(len(timestamps))
+
+            # Última observación de cada horario en cada tramo
+            for tramo in range(TRAMOS):
+                ultima_col = np.where(validos & (tramos == tramo), columnas, -1).max(axis=1)
+                con_dato = ultima_col >= 0
+                self.observado[filas[con_dato], tramo] = ocupacion[con_dato, ultima_col[con_dato]]
+
+            ultima_col = np.where(validos, columnas, -1).max(axis=1)
+            con_dato = ultima_col >= 0
+            self.ultima[filas[con_dato]] = ocupacion[con_dato, ultima_col[con_dato]]
+            self.ultima_antelacion[filas[con_dato]] = antelacion[con_dato, ultima_col[con_dato]]
+
+        self.ultimo_snapshot = max(self.ultimo_snapshot, timestamps[-1])
+        self._cerrar_terminados(_horas(timestamps[-1]))
+
+    def agregar_snapshot(self, snapshot: dict, timestamp: str) -> None:
+        """Aplica un snapshot {tour_key: {(fecha, hora): valores}} como una columna"""
+        claves, originales, capacidades = [], [], []
+        for tour_key, datos in snapshot.items():
+            for (fecha, hora), valores in datos.items():
+                claves.append((tour_key, fecha, hora))
+                originales.append(valores.get('capacidad_original', 0) or 0)
+                capacidades.append(valores.get('capacidad', 0))
+        self.aplicar_matriz(claves, np.array(originales, dtype=float),
+                            np.array(capacidades, dtype=float).reshape(-1, 1), [timestamp])
+
+    def _cerrar_terminados(self, t: float) -> None:
+        """Suma a la regresión los horarios ya empezados y los quita de pendientes"""
+        terminados = ~(self.inicio > t)
+        if not terminados.any():
+            return
+
+        # Solo cuentan si se observaron cerca del inicio
+        cerrados = np.flatnonzero(terminados & (self.ultima_antelacion < ANTELACION_FINAL))
+        por_tour = {}
+        for fila in cerrados:
+            por_tour.setdefault(self.claves[fila][0], []).append(fila)
+
+        for tour_key, filas in por_tour.items():
+            filas = np.array(filas, dtype=np.intp)
+            dias, meses = [], []
+            for fila in filas:
+                fecha = datetime.strptime(self.claves[fila][1], "%Y-%m-%d")
+                dias.append(fecha.weekday())
+                meses.append(fecha.month - 1)
+
+            x = self.observado[filas]
+            y = np.broadcast_to(self.ultima[filas][:, None], x.shape)
+            hay = ~np.isnan(x)
+            fila_idx, tramo_idx = np.nonzero(hay)
+            celdas = np.ravel_multi_index(
+                (np.array(dias)[fila_idx], np.array(meses)[fila_idx], tramo_idx), FORMA
+            )
+            xv, yv = x[hay], y[hay]
+
+            sumas = self.sumas.setdefault(tour_key, np.zeros(FORMA + (5,))).reshape(-1, 5)
+            for indice, valores in ((N, np.ones_like(xv)), (SX, xv), (SY, yv), (SXX, xv * xv), (SXY, xv * yv)):
+                np.add.at(sumas[:, indice], celdas, valores)
+
+        conservar = np.flatnonzero(~terminados)
+        self.claves = [self.claves[i] for i in conservar]
+        self.posiciones = {k: i for i, k in enumerate(self.claves)}
+        self.inicio = self.inicio[conservar]
+        self.observado = self.observado[conservar]
+        self.ultima = self.ultima[conservar]
+        self.ultima_antelacion = self.ultima_antelacion[conservar]
+        self._tablas.clear()
+        self._predicciones.clear()
+
+    def _tabla(self, tour_key: str):
+        """Coeficientes (a, b, n) por celda, por (día, tramo) y por tramo, calculados una vez"""
+        if tour_key not in self._tablas:
+            sumas = self.sumas.get(tour_key)
+            if sumas is None:
+                self._tablas[tour_key] = None
+            else:
+                self._tablas[tour_key] = (
+                    _coeficientes(sumas),
+                    _coeficientes(sumas.sum(axis=1)),
+                    _coeficientes(sumas.sum(axis=(0, 1)))
+                )
+        return self._tablas[tour_key]
+
+    def predecir(self, tour_key: str, fecha: str, ocupacion: float, ahora: str = None, hora: str = '12:00'):
+        """
+        Ocupación prevista (%) al llegar la fecha de la visita.
+
+        Args:
+            tour_key: Clave del tour
+            fecha: Fecha de la visita (YYYY-MM-DD)
+            ocupacion: Ocupación actual (%)
+            ahora: Timestamp de la observación (default: ahora en Roma)
+            hora: Hora de la visita para calcular la antelación
+
+        Returns:
+            float redondeado a 0.1 o None si no hay ajuste para el tour
+        """
+        ahora = ahora or historico_store.timestamp_actual()
+        try:
+            fecha_dt = datetime.strptime(fecha, "%Y-%m-%d")
+            antelacion = (_horas(f"{fecha} {hora}") - _horas(ahora)) / 24.0
+        except ValueError:
+            return None
+        if antelacion < 0:
+            return None
+
+        tramo = int(_tramo(antelacion))
+        clave = (tour_key, fecha_dt.weekday(), fecha_dt.month - 1, tramo, round(ocupacion, 1))
+        if clave in self._predicciones:
+            return self._predicciones[clave]
+
+        prevista = None
+        tablas = self._tabla(tour_key)
+        if tablas is not None:
+            _, dia, mes, _, x = clave
+            celda, por_dia, por_tramo = tablas
+            for (a, b, n), indice in ((celda, (dia, mes, tramo)), (por_dia, (dia, tramo)), (por_tramo, (tramo,))):
+                if n[indice] >= MIN_OBSERVACIONES:
+                    y = a[indice] + b[indice] * x
+                    prevista = round(float(min(max(y, x), 100.0)), 1)
+                    break
+
+        self._predicciones[clave] = prevista
+        return prevista
+
+    def to_dict(self) -> dict:
+        def lista(arr):
+            return [None if np.isnan(v) else round(float(v), 2) for v in arr]
+
+        return {
+            'version': 1,
+            'limites_antelacion': LIMITES_ANTELACION,
+            'ultimo_snapshot': self.ultimo_snapshot,
+            'sumas': {k: np.round(v, 4).tolist() for k, v in self.sumas.items()},
+            'pendientes': {
+                'claves': [list(k) for k in self.claves],
+                'observado': [lista(fila) for fila in self.observado],
+                'ultima': lista(self.ultima),
+                'ultima_antelacion': lista(self.ultima_antelacion)
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ModeloPrevision':
+        if data.get('limites_antelacion') != LIMITES_ANTELACION:
+            raise ValueError("Tramos de antelación distintos")
+
+        modelo = cls()
+        modelo.ultimo_snapshot = data.get('ultimo_snapshot', '')
+        modelo.sumas = {k: np.array(v, dtype=float).reshape(FORMA + (5,)) for k, v in data.get('sumas', {}).items()}
+
+        pendientes = data.get('pendientes', {})
+        claves = [tuple(k) for k in pendientes.get('claves', [])]
+        if claves:
+            def array(valores):
+                return np.array([np.nan if v is None else v for v in valores], dtype=float)
+
+            modelo._asegurar_claves(claves)
+            modelo.observado = np.array([array(fila) for fila in pendientes['observado']]).reshape(-1, TRAMOS)
+            modelo.ultima = array(pendientes['ultima'])
+            modelo.ultima_antelacion = array(pendientes['ultima_antelacion'])
+        return modelo
+
+
+def construir_desde_indices(indices: list) -> ModeloPrevision:
+    """
+    Construye el modelo sobre todo el histórico a partir de los índices de
+    series, una matriz horarios x snapshots por partición.
+
+    Args:
+        indices: SeriesIndex de cada partición en orden cronológico
+    """
+    modelo = ModeloPrevision()
+    for indice in indices:
+        if not indice.snapshots:
+            continue
+        claves, originales, matriz = indice.matriz_capacidades()
+        modelo.aplicar_matriz(claves, originales, matriz, indice.snapshots)
+    return modelo
+
+
+def reconstruir() -> ModeloPrevision:
+    """Reconstruye el modelo desde todas las particiones del histórico"""
+    import series_index
+
+    manifest = historico_store.cargar_manifest()
+    indices = [series_index.cargar_indice(entrada) for entrada in historico_store.particiones_ordenadas(manifest)]
+    return construir_desde_indices(indices)
+
+
+# ============== PERSISTENCIA ==============
+
+_CACHE = {'modelo': None, 'cargado': 0.0}
+
+
+def guardar_modelo(modelo: ModeloPrevision) -> dict:
+    """Guarda el modelo comprimido"""
+    data = json.dumps(modelo.to_dict(), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return storage_client.write_bytes(MODELO_PATH, gzip.compress(data), 'application/gzip')
+
+
+def _leer_modelo():
+    """Lee el modelo guardado o None si no existe"""
+    result = storage_client.read_bytes(MODELO_PATH)
+    if not result['success']:
+        return None
+    try:
+        return ModeloPrevision.from_dict(json.loads(gzip.decompress(result['data']).decode('utf-8')))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[Prevision] Modelo inválido, se reconstruye: {e}")
+        return None
+
+
+def obtener_modelo():
+    """
+    Retorna el modelo vigente (memoria o storage), o None si aún no se ha
+    construido: se construye al registrar snapshots, no en la lectura.
+    El storage se vuelve a leer como máximo cada TTL_MODELO segundos, así que
+    las predicciones memorizadas duran hasta el siguiente snapshot.
+    """
+    ahora = time.time()
+    if _CACHE['cargado'] and ahora - _CACHE['cargado'] < TTL_MODELO:
+        return _CACHE['modelo']
+
+    modelo = _leer_modelo()
+    anterior = _CACHE['modelo']
+    if modelo is not None and anterior is not None and anterior.ultimo_snapshot == modelo.ultimo_snapshot:
+        # Mismo snapshot: conservar las predicciones ya calculadas
+        modelo = _CACHE['modelo']
+
+    _CACHE.update(modelo=modelo, cargado=ahora)
+    return modelo
+
+
+def registrar_snapshots(snapshots: list) -> ModeloPrevision:
+    """
+    Actualiza el modelo con snapshots recién escritos en el histórico.
+    Se llama desde historico_store.registrar_snapshots.
+
+    Los snapshots posteriores al último aplicado se suman en O(horarios);
+    si alguno es anterior (backfill) o no hay modelo, se reconstruye, salvo
+    en Vercel (ver velocidad_venta.registrar_snapshots).
+
+    Args:
+        snapshots: Lista de (timestamp, snapshot) en orden cronológico
+    """
+    modelo = _leer_modelo()
+    reconstruir_modelo = modelo is None or (snapshots and snapshots[0][0] <= modelo.ultimo_snapshot)
+
+    if reconstruir_modelo and historico_store.SERVERLESS:
+        if modelo is None:
+            print("[Prevision] Sin modelo: se construirá con el próximo snapshot de Railway")
+            return None
+        snapshots = [(t, s) for t, s in snapshots if t > modelo.ultimo_snapshot]
+        reconstruir_modelo = False
+
+    if reconstruir_modelo:
+        print("[Prevision] Construyendo modelo desde el histórico...")
+        modelo = reconstruir()
+    else:
+        for timestamp, snapshot in snapshots:
+            modelo.agregar_snapshot(snapshot, timestamp)
+
+    guardar_modelo(modelo)
+    _CACHE.update(modelo=modelo, cargado=time.time())
+    return modelo
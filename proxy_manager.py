@@ -10,9 +10,10 @@ import requests
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
 
-load_dotenv()
+from colosseo_config import cargar_entorno
+
+cargar_entorno()
 
 
 @dataclass
@@ -338,15 +339,30 @@ class ProxyManager:
         self.request_count = 0
 
 
-# Instancia global del proxy manager
-proxy_manager = ProxyManager()
+# Instancia global del proxy manager (se crea en el primer uso: lee el
+# archivo de proxies y no debe pagarse al importar el módulo)
+_PROXY_MANAGER = {}
+
+
+def get_proxy_manager() -> ProxyManager:
+    """Proxy manager global del proceso"""
+    if 'global' not in _PROXY_MANAGER:
+        _PROXY_MANAGER['global'] = ProxyManager()
+    return _PROXY_MANAGER['global']
+
+
+def __getattr__(name: str):
+    # Compatibilidad con `from proxy_manager import proxy_manager`
+    if name == 'proxy_manager':
+        return get_proxy_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_proxy() -> Optional[Dict[str, str]]:
     """Función de conveniencia para obtener el siguiente proxy"""
-    return proxy_manager.get_next_proxy()
+    return get_proxy_manager().get_next_proxy()
 
 
 def mark_result(proxy_url: str, success: bool, response_time: float = 0.0):
     """Función de conveniencia para marcar resultado"""
-    proxy_manager.mark_proxy_result(proxy_url, success, response_time)
+    get_proxy_manager().mark_proxy_result(proxy_url, success, response_time)
@@ -0,0 +1,343 @@
+"""
+Reglas de vigilancia de disponibilidad ("arena, cualquier sábado de mayo, ≥ 25 plazas").
+
+Cada regla tiene:
+    id, nombre, tour ('*' = cualquiera), desde / hasta (YYYY-MM-DD),
+    dias_semana (0=lunes … 6=domingo, opcional), hora_desde / hora_hasta
+    (HH:MM, opcional) y min_plazas.
+
+Las reglas se indexan por tour -> (mes, día de semana) -> umbral: cada
+cubeta guarda las reglas cuyo intervalo de fechas toca ese mes y que aceptan
+ese día de semana, ordenadas por min_plazas. Para un horario con capacidad C
+se toma la cubeta de su mes y día y una búsqueda binaria da las reglas con
+min_plazas <= C; solo esas se comprueban contra el intervalo exacto y la hora.
+Así el coste depende de las coincidencias y no de reglas x horarios.
+
+Las reglas se guardan en vigilancia/reglas.json y las coincidencias del
+último snapshot en vigilancia/coincidencias.json (combinadas con las
+anteriores para los tours y meses que no traiga un snapshot parcial).
+"""
+
+import json
+import uuid
+from bisect import bisect_right
+from datetime import datetime, date
+
+import storage_client
+import historico_store
+
+
+CARPETA = 'vigilancia'
+REGLAS_PATH = f'{CARPETA}/reglas.json'
+COINCIDENCIAS_PATH = f'{CARPETA}/coincidencias.json'
+
+TODOS = '*'
+
+
+def _meses(desde: str, hasta: str) -> list:
+    """Meses 'YYYY-MM' entre dos fechas inclusive"""
+    anio, mes = int(desde[:4]), int(desde[5:7])
+    fin = (int(hasta[:4]), int(hasta[5:7]))
+    meses = []
+    while (anio, mes) <= fin:
+        meses.append(f"{anio}-{mes:02d}")
+        mes += 1
+        if mes > 12:
+            anio, mes = anio + 1, 1
+    return meses
+
+
+def validar_regla(data: dict) -> dict:
+    """
+    Valida y normaliza una regla.
+
+    Raises:
+        ValueError: Si falta un campo o tiene formato inválido
+    """
+    try:
+        desde = datetime.strptime(str(data['desde']), '%Y-%m-%d').strftime('%Y-%m-%d')
+        hasta = datetime.strptime(str(data.get('hasta') or data['desde']), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except KeyError:
+        raise ValueError("Falta 'desde' (YYYY-MM-DD)")
+    except ValueError:
+        raise ValueError("Las fechas deben tener formato YYYY-MM-DD")
+    if hasta < desde:
+        raise ValueError("'hasta' es anterior a 'desde'")
+
+    dias = data.get('dias_semana')
+    if dias:
+        dias = sorted({int(d) for d in dias})
+        if any(d < 0 or d > 6 for d in dias):
+            raise ValueError("dias_semana usa 0 (lunes) a 6 (domingo)")
+
+    horas = []
+    for campo in ('hora_desde', 'hora_hasta'):
+        valor = data.get(campo)
+        if valor:
+            try:
+                valor = datetime.strptime(str(valor), '%H:%M').strftime('%H:%M')
+            except ValueError:
+                raise ValueError(f"'{campo}' debe tener formato HH:MM")
+        horas.append(valor or None)
+
+    try:
+        min_plazas = int(data.get('min_plazas', 1))
+    except (TypeError, ValueError):
+        raise ValueError("'min_plazas' debe ser un entero")
+
+    return {
+        'id': data.get('id') or uuid.uuid4().hex[:12],
+        'nombre': str(data.get('nombre') or '').strip(),
+        'tour': str(data.get('tour') or TODOS),
+        'desde': desde,
+        'hasta': hasta,
+        'dias_semana': dias or None,
+        'hora_desde': horas[0],
+        'hora_hasta': horas[1],
+        'min_plazas': max(min_plazas, 0),
+        'creada': data.get('creada') or historico_store.timestamp_actual()
+    }
+
+
+class IndiceReglas:
+    """Índice tour -> (mes, día de semana) -> reglas ordenadas por min_plazas"""
+
+    def __init__(self, reglas: list):
+        self.reglas = reglas
+        # tour -> (mes, dia) -> ([min_plazas ordenados], [reglas])
+        self._cubetas = {}
+
+        temporal = {}
+        for regla in reglas:
+            dias = regla.get('dias_semana') or range(7)
+            por_tour = temporal.setdefault(regla['tour'], {})
+            for mes in _meses(regla['desde'], regla['hasta']):
+                for dia in dias:
+                    por_tour.setdefault((mes, dia), []).append(regla)
+
+        for tour_key, cubetas in temporal.items():
+            indexadas = {}
+            for clave, lista in cubetas.items():
+                lista.sort(key=lambda r: r['min_plazas'])
+                indexadas[clave] = ([r['min_plazas'] for r in lista], lista)
+            self._cubetas[tour_key] = indexadas
+
+    def __len__(self) -> int:
+        return len(self.reglas)
+
+    def candidatas(self, tour_key: str, fecha: str, dia: int, capacidad: int):
+        """Reglas del tour (y comodín) cuya cubeta y umbral admiten el horario"""
+        clave = (fecha[:7], dia)
+        for tour in (tour_key, TODOS):
+            cubeta = self._cubetas.get(tour, {}).get(clave)
+            if cubeta:
+                umbrales, lista = cubeta
+                yield from lista[:bisect_right(umbrales, capacidad)]
+
+    def evaluar(self, horarios) -> dict:
+        """
+        Evalúa las reglas contra un conjunto de horarios.
+
+        Args:
+            horarios: Iterable de (tour_key, fecha, hora, capacidad); hora puede
+                ser None (fecha completa) y entonces no se filtra por hora
+
+        Returns:
+            {regla_id: [{'tour', 'fecha', 'hora', 'capacidad'}]}
+        """
+        coincidencias = {}
+        dias = {}
+
+        for tour_key, fecha, hora, capacidad in horarios:
+            if capacidad is None or capacidad <= 0:
+                continue
+            dia = dias.get(fecha)
+            if dia is None:
+                try:
+                    dia = dias[fecha] = date.fromisoformat(fecha).weekday()
+                except ValueError:
+                    continue
+
+            # Un único dict por horario, compartido por todas las reglas que coinciden
+            horario = None
+            for regla in self.candidatas(tour_key, fecha, dia, capacidad):
+                if not (regla['desde'] <= fecha <= regla['hasta']):
+                    continue
+                if hora:
+                    if regla['hora_desde'] and hora < regla['hora_desde']:
+                        continue
+                    if regla['hora_hasta'] and hora > regla['hora_hasta']:
+                        continue
+                if horario is None:
+                    horario = {'tour': tour_key, 'fecha': fecha, 'hora': hora, 'capacidad': capacidad}
+                coincidencias.setdefault(regla['id'], []).append(horario)
+
+        return coincidencias
+
+
+# ============== HORARIOS DE ENTRADA ==============
+
+def horarios_de_snapshot(snapshot: dict):
+    """(tour, fecha, hora, capacidad) de un snapshot del histórico"""
+    for tour_key, datos in snapshot.items():
+        for (fecha, hora), valores in datos.items():
+            yield tour_key, fecha, hora, valores.get('capacidad', 0)
+
+
+# ============== PERSISTENCIA ==============
+
+_CACHE = {'version': None, 'indice': None}
+
+
+def cargar_reglas() -> dict:
+    """Carga las reglas guardadas ({'version', 'reglas'})"""
+    result = storage_client.read_bytes(REGLAS_PATH)
+    if result['success']:
+        try:
+            return json.loads(result['data'].decode('utf-8'))
+        except ValueError as e:
+            print(f"[Vigilancia] Reglas corruptas: {e}")
+    return {'version': '', 'reglas': []}
+
+
+def guardar_reglas(reglas: list) -> dict:
+    """Guarda las reglas con una nueva versión"""
+    data = {'version': uuid.uuid4().hex, 'reglas': reglas}
+    storage_client.write_bytes(REGLAS_PATH, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'),
+                               'application/json')
+    return data
+
+
+def obtener_indice() -> IndiceReglas:
+    """Índice de las reglas actuales (se reconstruye solo si cambió la versión)"""
+    data = cargar_reglas()
+    if _CACHE['indice'] is None or _CACHE['version'] != data.get('version'):
+        _CACHE.update(version=data.get('version'), indice=IndiceReglas(data.get('reglas', [])))
+    return _CACHE['indice']
+
+
+def agregar_regla(data: dict) -> dict:
+    """Valida, agrega y guarda una regla. Retorna la regla normalizada."""
+    regla = validar_regla(data)
+    actuales = cargar_reglas().get('reglas', [])
+    guardar_reglas([r for r in actuales if r['id'] != regla['id']] + [regla])
+    return regla
+
+
+def eliminar_regla(regla_id: str) -> bool:
+    """Elimina una regla. Retorna False si no existía."""
+    actuales = cargar_reglas().get('reglas', [])
+    restantes = [r for r in actuales if r['id'] != regla_id]
+    if len(restantes) == len(actuales):
+        return False
+    guardar_reglas(restantes)
+    return True
+
+
+def _horarios_por_cubrir(snapshots: list, cubiertos: set):
+    """
+    Horarios de los snapshots (del último al primero) cuyos (tour, mes) no
+    estén ya en 'cubiertos', que se va completando: de cada tour y mes solo
+    cuenta el snapshot más reciente que lo contiene.
+    """
+    for _, snapshot in reversed(snapshots):
+        nuevos = set()
+        for tour_key, fecha, hora, capacidad in horarios_de_snapshot(snapshot):
+            clave = (tour_key, fecha[:7])
+            if clave in cubiertos:
+                continue
+            nuevos.add(clave)
+            yield tour_key, fecha, hora, capacidad
+        cubiertos |= nuevos
+
+
+def _horarios_de_estado(estado: dict):
+    """(tour, fecha, hora, capacidad) del último snapshot comparado por diff_snapshots"""
+    meses, _ = estado['agrupado']
+    for tour_key, por_mes in meses.items():
+        for horarios_mes in por_mes.values():
+            for (fecha, hora), (capacidad, _) in horarios_mes.items():
+                yield tour_key, fecha, hora, capacidad
+
+
+def registrar_snapshots(snapshots: list) -> dict:
+    """
+    Evalúa las reglas contra el último snapshot y guarda las coincidencias.
+    Se llama desde historico_store.registrar_snapshots.
+
+    Un snapshot parcial (solo algunos tours o meses) solo reemplaza las
+    coincidencias de los tours y meses que contiene; las del resto se
+    conservan de la evaluación anterior, o se calculan con el último snapshot
+    comparado por diff_snapshots si las reglas cambiaron desde entonces. Los
+    meses ya pasados no se conservan.
+
+    Args:
+        snapshots: Lista de (timestamp, snapshot) en orden cronológico
+    """
+    reglas = cargar_reglas()
+    if not reglas.get('reglas') or not snapshots:
+        return {}
+
+    timestamp = snapshots[-1][0]
+    indice = obtener_indice()
+    cubiertos = set()
+    coincidencias = indice.evaluar(_horarios_por_cubrir(snapshots, cubiertos))
+
+    def conservar(tour_key, fecha):
+        return fecha[:7] >= timestamp[:7] and (tour_key, fecha[:7]) not in cubiertos
+
+    anteriores = _leer_coincidencias()
+    if anteriores is not None and anteriores.get('version') == reglas.get('version'):
+        for regla_id, horarios in anteriores.get('coincidencias', {}).items():
+            conservados = [h for h in horarios if conservar(h['tour'], h['fecha'])]
+            if conservados:
+                coincidencias.setdefault(regla_id, []).extend(conservados)
+    else:
+        import diff_snapshots
+        estado = diff_snapshots.cargar_estado()
+        if estado:
+            previas = indice.evaluar(h for h in _horarios_de_estado(estado) if conservar(h[0], h[1]))
+            for regla_id, horarios in previas.items():
+                coincidencias.setdefault(regla_id, []).extend(horarios)
+
+    for horarios in coincidencias.values():
+        horarios.sort(key=lambda h: (h['fecha'], h['hora'] or '', h['tour']))
+
+    data = {'timestamp': timestamp, 'version': reglas.get('version'), 'coincidencias': coincidencias}
+    storage_client.write_bytes(COINCIDENCIAS_PATH, json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                               'application/json')
+    return coincidencias
+
+
+def _leer_coincidencias():
+    """Última evaluación guardada ({'timestamp', 'version', 'coincidencias'}) o None"""
+    result = storage_client.read_bytes(COINCIDENCIAS_PATH)
+    if result['success']:
+        try:
+            return json.loads(result['data'].decode('utf-8'))
+        except ValueError:
+            pass
+    return None
+
+
+def coincidencias_actuales() -> dict:
+    """
+    Coincidencias de las reglas con el último snapshot. Si las reglas cambiaron
+    desde la última evaluación, se reevalúan contra el último snapshot
+    comparado por diff_snapshots.
+
+    Returns:
+        dict con 'timestamp' y 'coincidencias' {regla_id: [horarios]}
+    """
+    version = cargar_reglas().get('version')
+
+    data = _leer_coincidencias()
+    if data is not None and data.get('version') == version:
+        return data
+
+    import diff_snapshots
+    estado = diff_snapshots.cargar_estado()
+    if not estado:
+        return {'timestamp': None, 'coincidencias': {}}
+
+    return {'timestamp': estado['timestamp'], 'coincidencias': obtener_indice().evaluar(_horarios_de_estado(estado))}
@@ -1,11 +1,19 @@
 """
 Generador de informes de disponibilidad del calendario del Colosseo.
-Produce informes visuales en consola y archivos de texto.
+Produce informes visuales en consola, archivos de texto y JSON.
+
+Los datos de cada tour se normalizan y recorren una sola vez
+(ReportGenerator.build_report); todas las salidas (consola, txt, JSON,
+alertas, resumen) se generan desde ese resultado intermedio, para uno o
+varios tours (ReportGenerator.generate_reports).
 """
 
+import json
 from typing import Dict, List, Optional
 from datetime import datetime
 from colosseo_config import config
+from api_client import AvailabilityChecker
+import buscador_grupos
 
 
 class ReportGenerator:
@@ -21,7 +29,8 @@ class ReportGenerator:
     @staticmethod
     def normalize_data(data):
         """
-        Convierte datos de lista a diccionario si es necesario.
+        Convierte datos de lista a diccionario si es necesario
+        (misma normalización que AvailabilityChecker.normalize_data).
 
         Args:
             data: Datos en formato dict o list
@@ -29,21 +38,153 @@ class ReportGenerator:
         Returns:
             Diccionario con fechas como keys
         """
-        if isinstance(data, dict):
-            return data
-
-        if isinstance(data, list):
-            result = {}
-            for item in data:
-                if not isinstance(item, dict):
-                    continue
-                # Intentar extraer fecha
-                date = item.get("date") or item.get("startDateTime", "").split("T")[0]
-                if date:
-                    result[date] = item
-            return result
-
-        return {}
+        return AvailabilityChecker.normalize_data(data)
+
+    @staticmethod
+    def build_report(data, threshold: int = None, tour: str = '', top_k: Optional[int] = 50,
+                     group_size: int = None) -> Dict:
+        """
+        Normaliza los datos de un tour y calcula en una sola pasada todo lo
+        que usan las salidas del informe.
+
+        Args:
+            data: Datos del calendario (dict o list)
+            threshold: Umbral de capacidad para alertas (default: umbral
+                configurado del tour, ver config.get_low_capacity_threshold)
+            tour: Nombre o clave del tour
+            top_k: Máximo de horarios urgentes (None = todos)
+            group_size: Tamaño de grupo para buscar horarios con capacidad (opcional)
+
+        Returns:
+            Diccionario con:
+                - tour, threshold, generado
+                - timeslots: datos recibidos (sin normalizar)
+                - data: datos normalizados por fecha
+                - fechas: fechas ordenadas
+                - ocupacion: {fecha: % ocupado} (fechas con capacidad original)
+                - capacidad_total: plazas libres sumando todas las fechas
+                - summary: ver generate_availability_summary
+                - urgent_slots: horarios con capacidad <= threshold, de más a
+                  menos urgente (ver AvailabilityChecker.find_most_urgent_slots)
+                - alerts / alert_events: ver generate_urgent_alerts / generate_urgent_alert_events
+                - available_dates: ver AvailabilityChecker.find_available_dates
+                - group_size / group_options: opciones para el grupo (ver buscador_grupos.buscar)
+        """
+        if threshold is None:
+            threshold = config.get_low_capacity_threshold(tour)
+
+        # Urgencia por horario, antes de agregar por fecha
+        timeslots = data
+        urgent_slots = AvailabilityChecker.find_most_urgent_slots({tour: timeslots}, {tour: threshold}, top_k)
+        group_options = []
+        if group_size:
+            group_options = buscador_grupos.buscar(buscador_grupos.dias_desde_timeslots({tour: timeslots}), group_size)
+
+        data = ReportGenerator.normalize_data(data)
+
+        summary = {
+            "total_fechas": len(data),
+            "disponibles": 0,
+            "agotadas": 0,
+            "cerradas": 0,
+            "total_plazas": 0,
+            "fechas_urgentes": [],
+        }
+        ocupacion = {}
+        capacidad_total = 0
+        available_dates = []
+
+        fechas = sorted(data.keys())
+        for date in fechas:
+            info = data[date]
+            if not isinstance(info, dict):
+                continue
+
+            status = info.get("status")
+            capacity = info.get("capacity")
+            original = info.get("originalCapacity")
+
+            if isinstance(capacity, int):
+                capacidad_total += capacity
+                if isinstance(original, int) and original > 0:
+                    ocupacion[date] = (original - capacity) / original * 100
+
+            if status == "available":
+                summary["disponibles"] += 1
+                summary["total_plazas"] += capacity if isinstance(capacity, int) else 0
+
+                # Detectar urgencia
+                if isinstance(capacity, int) and capacity <= 5:
+                    summary["fechas_urgentes"].append({
+                        "fecha": date,
+                        "capacidad": capacity
+                    })
+
+            elif status == "soldout":
+                summary["agotadas"] += 1
+
+            elif status == "closed":
+                summary["cerradas"] += 1
+
+            # Considerar disponible si tiene capacity > 0 o status disponible
+            if status == AvailabilityChecker.STATUS_AVAILABLE or (capacity is not None and capacity > 0):
+                available_dates.append(AvailabilityChecker.extract_complete_info(info))
+
+        alerts = []
+        alert_events = []
+        for slot in urgent_slots:
+            urgency = "¡URGENTE!" if slot["capacidad"] <= 5 else "¡ATENCIÓN!"
+            hora = f" {slot['hora']}" if slot["hora"] else ""
+            alerts.append(f"{urgency} {slot['fecha']}{hora}: Solo {slot['capacidad']} plazas disponibles")
+            alert_events.append({
+                "tipo": "capacidad_baja",
+                "tour": tour,
+                "fecha": slot["fecha"],
+                "hora": slot["hora"],
+                "capacidad": slot["capacidad"]
+            })
+
+        return {
+            "tour": tour,
+            "threshold": threshold,
+            "generado": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "timeslots": timeslots,
+            "data": data,
+            "fechas": fechas,
+            "ocupacion": ocupacion,
+            "capacidad_total": capacidad_total,
+            "summary": summary,
+            "urgent_slots": urgent_slots,
+            "alerts": alerts,
+            "alert_events": alert_events,
+            "available_dates": available_dates,
+            "group_size": group_size,
+            "group_options": group_options,
+        }
+
+    @staticmethod
+    def _as_report(data, threshold: int = None, tour: str = '') -> Dict:
+        """
+        Acepta datos crudos o un informe ya construido por build_report.
+        Si se pide otro umbral, el informe se recalcula.
+        """
+        if isinstance(data, dict) and "summary" in data and "fechas" in data and "data" in data:
+            if threshold is None or threshold == data["threshold"]:
+                return data
+            return ReportGenerator.build_report(data["timeslots"], threshold, tour or data["tour"],
+                                                group_size=data.get("group_size"))
+        return ReportGenerator.build_report(data, threshold, tour)
+
+    @staticmethod
+    def _dates_to_show(report: Dict, dates_of_interest: List[str] = None, show_all: bool = False) -> List[str]:
+        """Fechas a mostrar (todas, las indicadas o las configuradas en el entorno)"""
+        # Si no hay fechas específicas y no se pide mostrar todo, usar fechas configuradas
+        if dates_of_interest is None and not show_all:
+            dates_of_interest = config.parse_dates_from_env()
+
+        if show_all or not dates_of_interest:
+            return report["fechas"]
+        return dates_of_interest
 
     @staticmethod
     def get_status_emoji(status: str) -> str:
@@ -92,7 +233,7 @@ class ReportGenerator:
         Genera un informe visual en consola.
 
         Args:
-            data: Datos del calendario
+            data: Datos del calendario o informe de build_report
             dates_of_interest: Fechas específicas a reportar
             show_all: Si True, muestra todas las fechas
         """
@@ -102,25 +243,20 @@ class ReportGenerator:
         print(f"🕐 Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 70)
 
-        if not data:
+        report = ReportGenerator._as_report(data) if data else None
+
+        if not report or not report["data"]:
             print("\n⚠️  No hay datos disponibles para mostrar")
             print("=" * 70 + "\n")
             return
 
-        # Normalizar datos (convertir lista a dict si es necesario)
-        data = ReportGenerator.normalize_data(data)
+        ReportGenerator._print_console_body(report, dates_of_interest, show_all)
 
-        # Si no hay fechas específicas y no se pide mostrar todo, usar fechas configuradas
-        if dates_of_interest is None and not show_all:
-            dates_of_interest = config.parse_dates_from_env()
-
-        # Determinar qué fechas mostrar
-        if show_all:
-            dates_to_show = sorted(data.keys())
-        elif dates_of_interest:
-            dates_to_show = dates_of_interest
-        else:
-            dates_to_show = sorted(data.keys())
+    @staticmethod
+    def _print_console_body(report: Dict, dates_of_interest: List[str] = None, show_all: bool = False) -> None:
+        """Fechas y resumen del informe de consola"""
+        data = report["data"]
+        dates_to_show = ReportGenerator._dates_to_show(report, dates_of_interest, show_all)
 
         # Contadores
         available_count = 0
@@ -220,6 +356,13 @@ class ReportGenerator:
         print(f"  {ReportGenerator.EMOJI_AVAILABLE} Disponibles: {available_count}")
         print(f"  {ReportGenerator.EMOJI_SOLDOUT} Agotadas: {soldout_count}")
         print(f"  {ReportGenerator.EMOJI_CLOSED} Cerradas: {closed_count}")
+
+        if report.get("group_size"):
+            print(f"\n👥 OPCIONES PARA GRUPO DE {report['group_size']}:")
+            if not report["group_options"]:
+                print("  Sin horarios con capacidad suficiente")
+            for opcion in report["group_options"]:
+                print(f"  - {ReportGenerator._describe_group_option(opcion)}")
         print("=" * 70 + "\n")
 
     @staticmethod
@@ -228,86 +371,55 @@ class ReportGenerator:
         Genera un resumen estadístico de disponibilidad.
 
         Args:
-            data: Datos del calendario
+            data: Datos del calendario o informe de build_report
 
         Returns:
             Diccionario con estadísticas
         """
-        summary = {
-            "total_fechas": len(data),
-            "disponibles": 0,
-            "agotadas": 0,
-            "cerradas": 0,
-            "total_plazas": 0,
-            "fechas_urgentes": [],
-        }
-
-        for date, info in data.items():
-            if not isinstance(info, dict):
-                continue
-
-            status = info.get("status")
-
-            if status == "available":
-                summary["disponibles"] += 1
-                capacity = info.get("capacity", 0)
-                summary["total_plazas"] += capacity if isinstance(capacity, int) else 0
-
-                # Detectar urgencia
-                if isinstance(capacity, int) and capacity <= 5:
-                    summary["fechas_urgentes"].append({
-                        "fecha": date,
-                        "capacidad": capacity
-                    })
-
-            elif status == "soldout":
-                summary["agotadas"] += 1
-
-            elif status == "closed":
-                summary["cerradas"] += 1
-
-        return summary
+        return ReportGenerator._as_report(data)["summary"]
 
     @staticmethod
-    def generate_urgent_alerts(data, threshold: int = 10) -> List[str]:
+    def generate_urgent_alerts(data, threshold: int = None) -> List[str]:
         """
-        Genera alertas para fechas con baja disponibilidad.
+        Genera alertas para horarios con baja disponibilidad, del más urgente
+        al menos urgente.
 
         Args:
-            data: Datos del calendario (dict o list)
-            threshold: Umbral de capacidad para alerta
+            data: Datos del calendario (dict o list) o informe de build_report
+            threshold: Umbral de capacidad para alerta (default: umbral del tour)
 
         Returns:
             Lista de mensajes de alerta
         """
-        alerts = []
+        return ReportGenerator._as_report(data, threshold)["alerts"]
 
-        # Normalizar datos
-        data = ReportGenerator.normalize_data(data)
-
-        for date, info in data.items():
-            if not isinstance(info, dict):
-                continue
-
-            status = info.get("status")
-            capacity = info.get("capacity")
+    @staticmethod
+    def generate_urgent_alert_events(data, threshold: int = None, tour: str = '') -> List[Dict]:
+        """
+        Genera eventos de capacidad baja para el despachador de alertas
+        (ver alertas_telegram), que los agrupa en un solo mensaje resumen.
 
-            if status == "available" and isinstance(capacity, int) and capacity <= threshold:
-                urgency = "¡URGENTE!" if capacity <= 5 else "¡ATENCIÓN!"
-                alerts.append(
-                    f"{urgency} {date}: Solo {capacity} plazas disponibles"
-                )
+        Args:
+            data: Datos del calendario (dict o list) o informe de build_report
+            threshold: Umbral de capacidad para alerta (default: umbral del tour)
+            tour: Nombre o clave del tour
 
-        return sorted(alerts)
+        Returns:
+            Lista de eventos {'tipo': 'capacidad_baja', 'tour', 'fecha', 'hora', 'capacidad'}
+        """
+        report = ReportGenerator._as_report(data, threshold, tour)
+        if tour and report["tour"] != tour:
+            return [dict(event, tour=tour) for event in report["alert_events"]]
+        return report["alert_events"]
 
     @staticmethod
-    def print_urgent_alerts(data: Dict, threshold: int = 10) -> None:
+    def print_urgent_alerts(data: Dict, threshold: int = None) -> None:
         """
         Imprime alertas urgentes en consola.
 
         Args:
-            data: Datos del calendario
-            threshold: Umbral de capacidad
+            data: Datos del calendario o informe de build_report
+            threshold: Umbral de capacidad (default: umbral del tour)
         """
         alerts = ReportGenerator.generate_urgent_alerts(data, threshold)
 
@@ -329,7 +441,26 @@ class ReportGenerator:
         Guarda el informe en un archivo de texto.
 
         Args:
-            data: Datos del calendario
+            data: Datos del calendario o informe de build_report
+            filename: Nombre del archivo (usa default si no se proporciona)
+            dates_of_interest: Fechas específicas a incluir
+
+        Returns:
+            True si se guardó exitosamente
+        """
+        return ReportGenerator.save_reports_to_file([ReportGenerator._as_report(data)], filename, dates_of_interest)
+
+    @staticmethod
+    def save_reports_to_file(
+        reports: List[Dict],
+        filename: str = None,
+        dates_of_interest: List[str] = None
+    ) -> bool:
+        """
+        Guarda los informes de uno o varios tours en un archivo de texto.
+
+        Args:
+            reports: Informes de build_report
             filename: Nombre del archivo (usa default si no se proporciona)
             dates_of_interest: Fechas específicas a incluir
 
@@ -340,6 +471,9 @@ class ReportGenerator:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"colosseo_report_{timestamp}.txt"
 
+        if dates_of_interest is None:
+            dates_of_interest = config.parse_dates_from_env()
+
         try:
             with open(filename, "w", encoding="utf-8") as f:
                 f.write("=" * 70 + "\n")
@@ -348,93 +482,223 @@ class ReportGenerator:
                 f.write(f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
                 f.write("=" * 70 + "\n\n")
 
-                if dates_of_interest is None:
-                    dates_of_interest = config.parse_dates_from_env()
-
-                for date in dates_of_interest:
-                    info = data.get(date)
-
-                    if not info:
-                        f.write(f"{date}: Sin datos\n")
-                        continue
-
-                    status = info.get("status", "unknown")
-                    formatted_date = ReportGenerator.format_date(date)
-
-                    if status == "available":
-                        capacity = info.get("capacity", "?")
-                        original = info.get("originalCapacity", "?")
-                        price = info.get("price", "?")
-                        f.write(f"{formatted_date}: DISPONIBLE\n")
-                        f.write(f"  Plazas: {capacity}/{original}\n")
-                        f.write(f"  Precio: €{price}\n")
-
-                        # Información adicional
-                        hora_inicio = info.get("hora_inicio") or info.get("startTime")
-                        hora_fin = info.get("hora_fin") or info.get("endTime")
-                        duracion = info.get("duracion") or info.get("duration")
-                        titulo = info.get("titulo") or info.get("title")
-                        tipo_evento = info.get("tipo_evento") or info.get("eventType")
-                        idioma = info.get("idioma") or info.get("language")
-
-                        if hora_inicio:
-                            f.write(f"  Horario: {hora_inicio}")
-                            if hora_fin:
-                                f.write(f" - {hora_fin}")
-                            f.write("\n")
-
-                        if duracion:
-                            f.write(f"  Duración: {duracion}\n")
-
-                        if titulo:
-                            f.write(f"  Tipo: {titulo}\n")
-                        elif tipo_evento:
-                            f.write(f"  Tipo: {tipo_evento}\n")
-
-                        if idioma:
-                            f.write(f"  Idioma: {idioma}\n")
-
-                        plazas_ocupadas = info.get("plazas_ocupadas")
-                        if plazas_ocupadas is not None and isinstance(original, int) and original > 0:
-                            try:
-                                ocupacion_pct = (int(plazas_ocupadas) / int(original)) * 100
-                                f.write(f"  Ocupación: {ocupacion_pct:.1f}% ({plazas_ocupadas} plazas vendidas)\n")
-                            except (ValueError, TypeError, ZeroDivisionError):
-                                pass
-
+                for report in reports:
+                    if len(reports) > 1 or report["tour"]:
+                        f.write(f"TOUR: {report['tour']}\n")
+                        f.write("-" * 70 + "\n")
+                    ReportGenerator._write_text_body(f, report, dates_of_interest)
+                    if len(reports) > 1:
                         f.write("\n")
 
-                    elif status == "soldout":
-                        f.write(f"{formatted_date}: AGOTADO\n\n")
+            print(f"💾 Informe guardado en: {filename}")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error guardando informe: {e}")
+            return False
+
+    @staticmethod
+    def _write_text_body(f, report: Dict, dates_of_interest: List[str]) -> None:
+        """Fechas y resumen de un tour en el informe de texto"""
+        data = report["data"]
 
-                    elif status == "closed":
-                        f.write(f"{formatted_date}: CERRADO\n\n")
+        for date in dates_of_interest:
+            info = data.get(date)
 
-                    else:
-                        f.write(f"{formatted_date}: {status}\n\n")
+            if not info:
+                f.write(f"{date}: Sin datos\n")
+                continue
 
-                # Agregar resumen
-                summary = ReportGenerator.generate_availability_summary(data)
-                f.write("=" * 70 + "\n")
-                f.write("RESUMEN\n")
-                f.write("=" * 70 + "\n")
-                f.write(f"Fechas disponibles: {summary['disponibles']}\n")
-                f.write(f"Fechas agotadas: {summary['agotadas']}\n")
-                f.write(f"Fechas cerradas: {summary['cerradas']}\n")
-                f.write(f"Total de plazas: {summary['total_plazas']}\n")
+            status = info.get("status", "unknown")
+            formatted_date = ReportGenerator.format_date(date)
 
-                if summary['fechas_urgentes']:
-                    f.write("\nFECHAS URGENTES (≤5 plazas):\n")
-                    for urgente in summary['fechas_urgentes']:
-                        f.write(f"  - {urgente['fecha']}: {urgente['capacidad']} plazas\n")
+            if status == "available":
+                capacity = info.get("capacity", "?")
+                original = info.get("originalCapacity", "?")
+                price = info.get("price", "?")
+                f.write(f"{formatted_date}: DISPONIBLE\n")
+                f.write(f"  Plazas: {capacity}/{original}\n")
+                f.write(f"  Precio: €{price}\n")
 
-            print(f"💾 Informe guardado en: {filename}")
-            return True
+                # Información adicional
+                hora_inicio = info.get("hora_inicio") or info.get("startTime")
+                hora_fin = info.get("hora_fin") or info.get("endTime")
+                duracion = info.get("duracion") or info.get("duration")
+                titulo = info.get("titulo") or info.get("title")
+                tipo_evento = info.get("tipo_evento") or info.get("eventType")
+                idioma = info.get("idioma") or info.get("language")
+
+                if hora_inicio:
+                    f.write(f"  Horario: {hora_inicio}")
+                    if hora_fin:
+                        f.write(f" - {hora_fin}")
+                    f.write("\n")
+
+                if duracion:
+                    f.write(f"  Duración: {duracion}\n")
+
+                if titulo:
+                    f.write(f"  Tipo: {titulo}\n")
+                elif tipo_evento:
+                    f.write(f"  Tipo: {tipo_evento}\n")
+
+                if idioma:
+                    f.write(f"  Idioma: {idioma}\n")
+
+                plazas_ocupadas = info.get("plazas_ocupadas")
+                if plazas_ocupadas is not None and isinstance(original, int) and original > 0:
+                    try:
+                        ocupacion_pct = (int(plazas_ocupadas) / int(original)) * 100
+                        f.write(f"  Ocupación: {ocupacion_pct:.1f}% ({plazas_ocupadas} plazas vendidas)\n")
+                    except (ValueError, TypeError, ZeroDivisionError):
+                        pass
+
+                f.write("\n")
+
+            elif status == "soldout":
+                f.write(f"{formatted_date}: AGOTADO\n\n")
+
+            elif status == "closed":
+                f.write(f"{formatted_date}: CERRADO\n\n")
+
+            else:
+                f.write(f"{formatted_date}: {status}\n\n")
+
+        # Agregar resumen
+        summary = report["summary"]
+        f.write("=" * 70 + "\n")
+        f.write("RESUMEN\n")
+        f.write("=" * 70 + "\n")
+        f.write(f"Fechas disponibles: {summary['disponibles']}\n")
+        f.write(f"Fechas agotadas: {summary['agotadas']}\n")
+        f.write(f"Fechas cerradas: {summary['cerradas']}\n")
+        f.write(f"Total de plazas: {summary['total_plazas']}\n")
+
+        if summary['fechas_urgentes']:
+            f.write("\nFECHAS URGENTES (≤5 plazas):\n")
+            for urgente in summary['fechas_urgentes']:
+                f.write(f"  - {urgente['fecha']}: {urgente['capacidad']} plazas\n")
+
+        if report['urgent_slots']:
+            f.write(f"\nHORARIOS URGENTES (≤{report['threshold']} plazas):\n")
+            for slot in report['urgent_slots']:
+                hora = f" {slot['hora']}" if slot['hora'] else ""
+                f.write(f"  - {slot['fecha']}{hora}: {slot['capacidad']} plazas\n")
+
+        if report.get("group_size"):
+            f.write(f"\nOPCIONES PARA GRUPO DE {report['group_size']}:\n")
+            if not report["group_options"]:
+                f.write("  Sin horarios con capacidad suficiente\n")
+            for opcion in report["group_options"]:
+                f.write(f"  - {ReportGenerator._describe_group_option(opcion)}\n")
+
+    @staticmethod
+    def _describe_group_option(opcion: Dict) -> str:
+        """Línea de una opción de grupo: fecha, horarios y reparto de personas"""
+        horarios = ", ".join(f"{h['hora']} ({h['personas']}/{h['capacidad']})" for h in opcion["horarios"])
+        return f"{opcion['fecha']}: {horarios}"
+
+    @staticmethod
+    def save_reports_to_json(reports: List[Dict], filename: str = None) -> bool:
+        """
+        Guarda los resúmenes, alertas y fechas disponibles de uno o varios
+        tours en un archivo JSON.
+
+        Args:
+            reports: Informes de build_report
+            filename: Nombre del archivo (usa default si no se proporciona)
+
+        Returns:
+            True si se guardó exitosamente
+        """
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"colosseo_report_{timestamp}.json"
+
+        contenido = {
+            "generado": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "tours": [
+                {
+                    "tour": report["tour"],
+                    "resumen": report["summary"],
+                    "ocupacion": {fecha: round(pct, 1) for fecha, pct in report["ocupacion"].items()},
+                    "umbral": report["threshold"],
+                    "horarios_urgentes": report["urgent_slots"],
+                    "opciones_grupo": report["group_options"],
+                    "alertas": report["alerts"],
+                    "fechas_disponibles": report["available_dates"],
+                }
+                for report in reports
+            ]
+        }
 
+        try:
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(contenido, f, indent=2, ensure_ascii=False, default=str)
+            print(f"💾 Informe JSON guardado en: {filename}")
+            return True
         except Exception as e:
-            print(f"❌ Error guardando informe: {e}")
+            print(f"❌ Error guardando informe JSON: {e}")
             return False
 
+    @staticmethod
+    def generate_reports(
+        tours: Dict,
+        outputs: List[str] = ("console",),
+        dates_of_interest: List[str] = None,
+        show_all: bool = False,
+        threshold: int = None,
+        filename: str = None,
+        top_k: Optional[int] = 50,
+        group_size: int = None
+    ) -> Dict[str, Dict]:
+        """
+        Genera las salidas pedidas para cualquier número de tours. Cada tour
+        se normaliza y recorre una sola vez (build_report).
+
+        Args:
+            tours: {nombre o clave del tour: datos del calendario}
+            outputs: Salidas a generar: "alerts", "console", "txt" y/o "json"
+            dates_of_interest: Fechas específicas a reportar
+            show_all: Si True, la consola muestra todas las fechas
+            threshold: Umbral de capacidad para alertas (default: umbral de cada tour)
+            filename: Nombre base de los archivos (sin extensión)
+            top_k: Máximo de horarios urgentes por tour (None = todos)
+            group_size: Tamaño de grupo para buscar horarios con capacidad (opcional)
+
+        Returns:
+            {tour: informe de build_report}
+        """
+        reports = {
+            tour: ReportGenerator.build_report(data, threshold, tour, top_k, group_size)
+            for tour, data in tours.items()
+        }
+
+        if "alerts" in outputs:
+            for report in reports.values():
+                ReportGenerator.print_urgent_alerts(report, threshold)
+
+        if "console" in outputs:
+            for tour, report in reports.items():
+                if len(reports) > 1:
+                    print(f"\n🎫 {tour}")
+                ReportGenerator.generate_console_report(report, dates_of_interest, show_all)
+
+        if "txt" in outputs:
+            ReportGenerator.save_reports_to_file(
+                list(reports.values()),
+                f"{filename}.txt" if filename else None,
+                dates_of_interest
+            )
+
+        if "json" in outputs:
+            ReportGenerator.save_reports_to_json(
+                list(reports.values()),
+                f"{filename}.json" if filename else None
+            )
+
+        return reports
+
 
 # Funciones de conveniencia
 def quick_report(data: Dict, dates: List[str] = None, save: bool = False) -> None:
@@ -446,14 +710,8 @@ def quick_report(data: Dict, dates: List[str] = None, save: bool = False) -> Non
         dates: Fechas específicas (opcional)
         save: Si True, también guarda en archivo
     """
-    report = ReportGenerator()
-
-    # Mostrar alertas urgentes primero
-    report.print_urgent_alerts(data)
-
-    # Mostrar informe principal
-    report.generate_console_report(data, dates)
-
-    # Guardar si se solicita
+    outputs = ["alerts", "console"]
     if save:
-        report.save_report_to_file(data, dates_of_interest=dates)
+        outputs.append("txt")
+
+    ReportGenerator.generate_reports({"": data}, outputs, dates_of_interest=dates)
@@ -0,0 +1,130 @@
+"""
+Caché acotada de resultados de /api/consultar.
+
+Cada consulta se guarda en memoria bajo un result_id para que los endpoints de
+exportación e histórico puedan referenciarla sin que el navegador vuelva a
+subir el objeto 'resultados' completo.
+
+La memoria es por proceso, así que cada resultado también se guarda
+comprimido en storage (resultados/<hueco>.json.gz): si el id ya no está en
+memoria (LRU, otra instancia de Vercel) se lee de ahí. Hay RESULT_CACHE_HUECOS
+huecos fijos elegidos por el id, de modo que el storage no crece; un hueco
+reutilizado o un resultado con más de TTL_SEGUNDOS cuenta como expirado (410).
+"""
+
+import os
+import gzip
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import storage_client
+
+
+# Número máximo de resultados en memoria y tiempo de vida en segundos
+MAX_RESULTADOS = int(os.environ.get('RESULT_CACHE_MAX', '32'))
+TTL_SEGUNDOS = int(os.environ.get('RESULT_CACHE_TTL', '1800'))
+
+# Huecos de resultados persistidos en storage
+HUECOS = int(os.environ.get('RESULT_CACHE_HUECOS', '64'))
+CARPETA = 'resultados'
+
+
+class ResultCache:
+    """Caché LRU con expiración por tiempo"""
+
+    def __init__(self, max_items: int = MAX_RESULTADOS, ttl: int = TTL_SEGUNDOS,
+                 huecos: int = HUECOS, persistir: bool = True):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.huecos = huecos
+        self.persistir = persistir
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, resultado: dict) -> str:
+        """
+        Guarda un resultado y retorna su id.
+
+        Args:
+            resultado: Respuesta de /api/consultar (con 'resultados')
+
+        Returns:
+            result_id
+        """
+        result_id = uuid.uuid4().hex
+        creado = time.time()
+        with self._lock:
+            self._items[result_id] = (creado, resultado)
+            self._purgar()
+        if self.persistir:
+            self._persistir(result_id, creado, resultado)
+        return result_id
+
+    def obtener(self, result_id: str) -> Optional[dict]:
+        """Retorna el resultado guardado o None si no existe o expiró"""
+        with self._lock:
+            item = self._items.get(result_id)
+            if item is not None:
+                if time.time() - item[0] > self.ttl:
+                    del self._items[result_id]
+                    return None
+                self._items.move_to_end(result_id)
+                return item[1]
+
+        if not self.persistir:
+            return None
+        item = self._leer_persistido(result_id)
+        if item is None or time.time() - item[0] > self.ttl:
+            return None
+        with self._lock:
+            self._items[result_id] = item
+            self._purgar()
+        return item[1]
+
+    def _path(self, result_id: str) -> str:
+        """Hueco de storage de un id"""
+        return f"{CARPETA}/{int(result_id[:8], 16) % self.huecos:02d}.json.gz"
+
+    def _persistir(self, result_id: str, creado: float, resultado: dict) -> None:
+        data = {'result_id': result_id, 'creado': creado, 'resultado': resultado}
+        try:
+            cuerpo = gzip.compress(json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'))
+            storage_client.write_bytes(self._path(result_id), cuerpo, 'application/gzip')
+        except (OSError, TypeError) as e:
+            print(f"[Resultados] No se pudo persistir {result_id}: {e}")
+
+    def _leer_persistido(self, result_id: str):
+        """(creado, resultado) guardado en storage, o None si el hueco es de otro id"""
+        try:
+            int(result_id[:8], 16)
+        except ValueError:
+            return None
+        result = storage_client.read_bytes(self._path(result_id))
+        if not result['success']:
+            return None
+        try:
+            data = json.loads(gzip.decompress(result['data']).decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+        if data.get('result_id') != result_id:
+            return None
+        return data['creado'], data['resultado']
+
+    def _purgar(self) -> None:
+        """Elimina entradas expiradas y las menos usadas por encima del máximo"""
+        limite = time.time() - self.ttl
+        for result_id in [k for k, (creado, _) in self._items.items() if creado < limite]:
+            del self._items[result_id]
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# Instancia global de la caché
+result_cache = ResultCache()
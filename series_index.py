@@ -0,0 +1,421 @@
+"""
+Índice de series temporales sobre el histórico de disponibilidad.
+
+Permite consultar la evolución de la capacidad de un horario sin abrir los
+workbooks. Cada partición del histórico tiene su índice comprimido en
+historico/index/<partición>.json.gz, que se actualiza al mismo tiempo que se
+escribe la columna del snapshot (coste O(horarios) por snapshot).
+
+Las series solo guardan los puntos donde la capacidad cambia: la capacidad de
+un punto se mantiene hasta el punto siguiente. None indica que el horario dejó
+de aparecer en las consultas.
+"""
+
+import os
+import gzip
+import json
+import time
+from io import BytesIO
+from bisect import bisect_left, bisect_right, insort
+
+import storage_client
+import historico_store
+
+
+CARPETA_INDICE = f'{historico_store.CARPETA}/index'
+
+# Segundos entre comprobaciones del manifest para recargar índices modificados
+TTL_MANIFEST = int(os.environ.get('SERIES_INDEX_TTL', '60'))
+
+# Sufijo para comparar 'hasta' como prefijo inclusive
+FIN_RANGO = '\uffff'
+
+
+class SeriesIndex:
+    """Series de capacidad por (tour, fecha, hora) de una partición del histórico"""
+
+    def __init__(self):
+        # Timestamps de snapshot ordenados ('YYYY-MM-DD HH:MM')
+        self.snapshots = []
+        # tour -> fecha -> hora -> [tiempos, capacidades, capacidad_original]
+        self.series = {}
+        # tour -> set((fecha, hora)) con última capacidad distinta de None
+        self.activos = {}
+
+    def agregar_snapshot(self, snapshot: dict, timestamp: str) -> None:
+        """
+        Agrega un snapshot al índice en O(horarios).
+
+        Args:
+            snapshot: {tour_key: {(fecha, hora): {'capacidad', 'capacidad_original'}}}
+            timestamp: Timestamp del snapshot
+        """
+        if not self.snapshots or timestamp > self.snapshots[-1]:
+            self.snapshots.append(timestamp)
+        elif timestamp not in self.snapshots:
+            insort(self.snapshots, timestamp)
+
+        for tour_key, datos in snapshot.items():
+            fechas = self.series.setdefault(tour_key, {})
+            activos = self.activos.setdefault(tour_key, set())
+
+            for (fecha, hora), valores in datos.items():
+                horas = fechas.setdefault(fecha, {})
+                serie = horas.get(hora)
+                if serie is None:
+                    serie = horas[hora] = [[], [], 0]
+                self._agregar_punto(serie, timestamp, valores.get('capacidad', 0))
+                serie[2] = valores.get('capacidad_original', serie[2])
+                activos.add((fecha, hora))
+
+            # Horarios que dejaron de aparecer (pasaron o se eliminaron)
+            for key in [k for k in activos if k not in datos]:
+                self._agregar_punto(fechas[key[0]][key[1]], timestamp, None)
+                activos.discard(key)
+
+    @staticmethod
+    def _agregar_punto(serie: list, timestamp: str, capacidad) -> None:
+        """Agrega un punto a la serie, omitiéndolo si la capacidad no cambió"""
+        tiempos, capacidades = serie[0], serie[1]
+
+        if not tiempos or timestamp > tiempos[-1]:
+            if tiempos and capacidades[-1] == capacidad:
+                return
+            tiempos.append(timestamp)
+            capacidades.append(capacidad)
+            return
+
+        # Snapshot fuera de orden (backfill): insertar en su posición
+        i = bisect_left(tiempos, timestamp)
+        if i < len(tiempos) and tiempos[i] == timestamp:
+            capacidades[i] = capacidad
+        else:
+            tiempos.insert(i, timestamp)
+            capacidades.insert(i, capacidad)
+
+    def consultar(self, tour_key: str, fecha: str, hora: str, desde: str = None, hasta: str = None) -> list:
+        """
+        Retorna los puntos [timestamp, capacidad] de un horario dentro del rango.
+        Si el rango empieza a mitad de un tramo sin cambios, se incluye un punto
+        inicial con la capacidad vigente en el primer snapshot del rango.
+
+        Args:
+            tour_key: Clave del tour
+            fecha: Fecha del horario (YYYY-MM-DD)
+            hora: Hora del horario (HH:MM)
+            desde: Timestamp inicial inclusive (prefijo, ej: '2025-12-01')
+            hasta: Timestamp final inclusive (prefijo, ej: '2025-12-01 18')
+
+        Returns:
+            Lista de [timestamp, capacidad]
+        """
+        serie = self.series.get(tour_key, {}).get(fecha, {}).get(hora)
+        if not serie:
+            return []
+
+        tiempos, capacidades = serie[0], serie[1]
+        inicio = bisect_left(tiempos, desde) if desde else 0
+        fin = bisect_right(tiempos, hasta + FIN_RANGO) if hasta else len(tiempos)
+
+        puntos = [[tiempos[i], capacidades[i]] for i in range(inicio, fin)]
+
+        if desde and inicio > 0:
+            s = bisect_left(self.snapshots, desde)
+            if s < len(self.snapshots):
+                primero = self.snapshots[s]
+                en_rango = not hasta or primero <= hasta + FIN_RANGO
+                if en_rango and (not puntos or puntos[0][0] > primero):
+                    puntos.insert(0, [primero, capacidades[inicio - 1]])
+
+        return puntos
+
+    def horas(self, tour_key: str, fecha: str) -> list:
+        """Horas con serie para una fecha de un tour"""
+        return sorted(self.series.get(tour_key, {}).get(fecha, {}).keys())
+
+    def capacidad_original(self, tour_key: str, fecha: str, hora: str):
+        """Capacidad original registrada para un horario (o None)"""
+        serie = self.series.get(tour_key, {}).get(fecha, {}).get(hora)
+        return serie[2] if serie else None
+
+    def matriz_capacidades(self, desde_fecha: str = None) -> tuple:
+        """
+        Expande las series (solo cambios) a una matriz horarios x snapshots.
+
+        Args:
+            desde_fecha: Ignorar horarios con fecha anterior (YYYY-MM-DD)
+
+        Returns:
+            (claves [(tour, fecha, hora)], capacidades originales (array),
+            matriz de capacidades con NaN donde el horario no aparece)
+        """
+        import numpy as np
+
+        posicion = {ts: j for j, ts in enumerate(self.snapshots)}
+        total = len(self.snapshots)
+
+        claves = []
+        originales = []
+        filas = []
+        for tour_key, fechas in self.series.items():
+            for fecha, horas in fechas.items():
+                if desde_fecha and fecha < desde_fecha:
+                    continue
+                for hora, serie in horas.items():
+                    claves.append((tour_key, fecha, hora))
+                    originales.append(serie[2] or 0)
+                    filas.append(serie)
+
+        matriz = np.full((len(claves), total), np.nan)
+        for fila, serie in zip(matriz, filas):
+            tiempos, capacidades = serie[0], serie[1]
+            for p, (ts, cap) in enumerate(zip(tiempos, capacidades)):
+                fin = posicion[tiempos[p + 1]] if p + 1 < len(tiempos) else total
+                if cap is not None:
+                    fila[posicion[ts]:fin] = cap
+
+        return claves, np.array(originales, dtype=float), matriz
+
+    def to_dict(self) -> dict:
+        """Serializa el índice a un dict JSON"""
+        return {'version': 1, 'snapshots': self.snapshots, 'series': self.series}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SeriesIndex':
+        """Reconstruye el índice desde su forma serializada"""
+        indice = cls()
+        indice.snapshots = data.get('snapshots', [])
+        indice.series = data.get('series', {})
+
+        for tour_key, fechas in indice.series.items():
+            activos = indice.activos.setdefault(tour_key, set())
+            for fecha, horas in fechas.items():
+                for hora, serie in horas.items():
+                    if serie[1] and serie[1][-1] is not None:
+                        activos.add((fecha, hora))
+
+        return indice
+
+
+# ============== PERSISTENCIA POR PARTICIÓN ==============
+
+# path de partición -> (firma, SeriesIndex)
+_PARTICIONES = {}
+_ESTADO = {'verificado': 0.0, 'orden': []}
+
+
+def path_indice(path_particion: str) -> str:
+    """Ruta del índice de una partición del histórico"""
+    nombre = os.path.splitext(os.path.basename(path_particion))[0]
+    return f"{CARPETA_INDICE}/{nombre}.json.gz"
+
+
+def _firma(entrada: dict) -> tuple:
+    """Firma de una entrada de manifest para detectar cambios"""
+    return (entrada.get('hasta', ''), entrada.get('columnas', 0), entrada.get('bytes', 0))
+
+
+def guardar_indice(path_particion: str, indice: SeriesIndex) -> dict:
+    """Guarda el índice comprimido de una partición"""
+    data = json.dumps(indice.to_dict(), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return storage_client.write_bytes(path_indice(path_particion), gzip.compress(data), 'application/gzip')
+
+
+def construir_desde_workbook(path_particion: str) -> SeriesIndex:
+    """
+    Construye el índice de una partición leyendo su workbook.
+    Se usa para particiones sin índice (ej: la partición legacy).
+    """
+    from openpyxl import load_workbook
+
+    result = storage_client.read_bytes(path_particion)
+    if not result['success']:
+        return SeriesIndex()
+
+    wb = load_workbook(BytesIO(result['data']), read_only=True)
+    try:
+        return construir_desde_wb(wb)
+    finally:
+        wb.close()
+
+
+def construir_desde_wb(wb) -> SeriesIndex:
+    """Construye el índice desde un workbook ya cargado (normal o read_only)"""
+    indice = SeriesIndex()
+    fijas = historico_store.COLUMNAS_FIJAS
+
+    # Leer las columnas de cada hoja: [(timestamp, {key: valor})]
+    columnas_por_tour = {}
+    for ws in wb.worksheets:
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            continue
+
+        columnas = [(str(h), {}) for h in header[fijas:] if h]
+        originales = {}
+        for row in rows:
+            if not row or not row[0] or not row[1]:
+                continue
+            key = (str(row[0]), str(row[1]))
+            originales[key] = row[2] if len(row) > 2 else 0
+            for i, (_, valores) in enumerate(columnas):
+                idx = fijas + i
+                valor = row[idx] if idx < len(row) else None
+                if isinstance(valor, (int, float)):
+                    valores[key] = {'capacidad': int(valor), 'capacidad_original': originales[key]}
+        columnas_por_tour[ws.title] = columnas
+
+    # Reproducir los snapshots en orden cronológico
+    timestamps = sorted({ts for columnas in columnas_por_tour.values() for ts, _ in columnas})
+    por_timestamp = {}
+    for tour_key, columnas in columnas_por_tour.items():
+        for ts, valores in columnas:
+            por_timestamp.setdefault(ts, {})[tour_key] = valores
+
+    for ts in timestamps:
+        indice.agregar_snapshot(por_timestamp[ts], ts)
+
+    return indice
+
+
+def cargar_indice(entrada: dict) -> SeriesIndex:
+    """
+    Carga el índice de una partición (memoria, storage o reconstrucción).
+
+    Args:
+        entrada: Entrada del manifest de historico_store
+    """
+    path = entrada['path']
+    firma = _firma(entrada)
+
+    cacheado = _PARTICIONES.get(path)
+    if cacheado and cacheado[0] == firma:
+        return cacheado[1]
+
+    result = storage_client.read_bytes(path_indice(path))
+    indice = None
+    if result['success']:
+        try:
+            indice = SeriesIndex.from_dict(json.loads(gzip.decompress(result['data']).decode('utf-8')))
+        except (OSError, ValueError) as e:
+            print(f"[Series] Índice corrupto para {path}: {e}")
+
+    if indice is None or (entrada.get('hasta') and (not indice.snapshots or indice.snapshots[-1] < entrada['hasta'])):
+        print(f"[Series] Reconstruyendo índice de {path}...")
+        indice = construir_desde_workbook(path)
+        guardar_indice(path, indice)
+
+    _PARTICIONES[path] = (firma, indice)
+    return indice
+
+
+def registrar_snapshots(entrada: dict, snapshots: list, wb=None) -> SeriesIndex:
+    """
+    Agrega snapshots al índice de su partición y lo persiste una sola vez.
+    Se llama desde historico_store.registrar_snapshots justo después de
+    escribir las columnas en el workbook.
+
+    Los snapshots posteriores al último indexado se agregan en O(horarios)
+    cada uno. Si alguno es anterior (backfill) o no había índice, se reconstruye
+    desde el workbook en memoria, porque los horarios ausentes ('-') solo
+    se pueden deducir en orden cronológico.
+
+    Args:
+        entrada: Entrada del manifest de la partición (antes de actualizar su firma)
+        snapshots: Lista de (timestamp, snapshot) en orden cronológico
+        wb: Workbook ya actualizado de la partición
+
+    Returns:
+        Índice actualizado de la partición
+    """
+    path = entrada['path']
+
+    cacheado = _PARTICIONES.get(path)
+    if cacheado and cacheado[0] == _firma(entrada):
+        indice = cacheado[1]
+    else:
+        result = storage_client.read_bytes(path_indice(path))
+        indice = SeriesIndex()
+        if result['success']:
+            try:
+                indice = SeriesIndex.from_dict(json.loads(gzip.decompress(result['data']).decode('utf-8')))
+            except (OSError, ValueError):
+                indice = SeriesIndex()
+
+    if indice.snapshots:
+        incremental = snapshots[0][0] > indice.snapshots[-1]
+    else:
+        # Sin índice previo: incremental solo si la partición estaba vacía
+        incremental = not entrada.get('columnas')
+
+    if incremental or wb is None:
+        for timestamp, snapshot in snapshots:
+            indice.agregar_snapshot(snapshot, timestamp)
+    else:
+        print(f"[Series] Reconstruyendo índice de {path} desde el workbook...")
+        indice = construir_desde_wb(wb)
+
+    guardar_indice(path, indice)
+    return indice
+
+
+def actualizar_cache(entrada: dict, indice: SeriesIndex) -> None:
+    """Registra en memoria el índice de una partición con su firma actual"""
+    _PARTICIONES[entrada['path']] = (_firma(entrada), indice)
+    if _ESTADO['orden'] and entrada['path'] not in _ESTADO['orden']:
+        _ESTADO['orden'].append(entrada['path'])
+
+
+def obtener_indices() -> list:
+    """
+    Retorna los índices de todas las particiones en orden cronológico.
+    El manifest se vuelve a leer como máximo cada TTL_MANIFEST segundos.
+    """
+    ahora = time.time()
+    if _ESTADO['orden'] and ahora - _ESTADO['verificado'] < TTL_MANIFEST:
+        return [_PARTICIONES[path][1] for path in _ESTADO['orden'] if path in _PARTICIONES]
+
+    manifest = historico_store.cargar_manifest()
+    entradas = historico_store.particiones_ordenadas(manifest)
+
+    indices = [cargar_indice(entrada) for entrada in entradas]
+    _ESTADO['orden'] = [entrada['path'] for entrada in entradas]
+    _ESTADO['verificado'] = ahora
+    return indices
+
+
+def consultar_serie(tour_key: str, fecha: str, hora: str, desde: str = None, hasta: str = None) -> dict:
+    """
+    Consulta la serie de capacidad de un horario sobre todas las particiones.
+
+    Returns:
+        dict con 'puntos' ([timestamp, capacidad]) y 'capacidad_original'
+    """
+    puntos = []
+    capacidad_original = None
+
+    for indice in obtener_indices():
+        for punto in indice.consultar(tour_key, fecha, hora, desde, hasta):
+            # Las particiones empiezan con un punto explícito; evitar repetidos
+            if not puntos or puntos[-1][1] != punto[1]:
+                puntos.append(punto)
+        original = indice.capacidad_original(tour_key, fecha, hora)
+        if original is not None:
+            capacidad_original = original
+
+    return {'puntos': puntos, 'capacidad_original': capacidad_original}
+
+
+def consultar_fecha(tour_key: str, fecha: str, desde: str = None, hasta: str = None) -> dict:
+    """
+    Consulta las series de todos los horarios de una fecha.
+
+    Returns:
+        dict {hora: {'puntos', 'capacidad_original'}}
+    """
+    horas = set()
+    for indice in obtener_indices():
+        horas.update(indice.horas(tour_key, fecha))
+
+    return {hora: consultar_serie(tour_key, fecha, hora, desde, hasta) for hora in sorted(horas)}
@@ -31,12 +31,8 @@ async function cargarDisponibilidadCacheada() {
     actualizarEstadoCookies('loading', 'Loading data...', 'Searching availability in cache');
 
     try {
-        // Add cache-busting parameter to force fresh data
-        const cacheBuster = Date.now();
-        const response = await fetch(`/api/availability/cached?_=${cacheBuster}`, {
-            cache: 'no-store'
-        });
-        const data = await response.json();
+        const loadStart = performance.now();
+        const { response, data } = await descargarDisponibilidad();
 
         if (response.ok && data.resultados && Object.keys(data.resultados).length > 0) {
             usingCachedData = true;
@@ -50,6 +46,10 @@ async function cargarDisponibilidadCacheada() {
             // Show cached results
             currentResults = data;
             mostrarResultadosCacheados(data);
+            registrarTiempoCarga(response.url, loadStart);
+            // Stored before live changes start updating the rows
+            await guardarSnapshotLocal(data);
+            suscribirCambios();
 
             return true;
         } else {
@@ -62,6 +62,181 @@ async function cargarDisponibilidadCacheada() {
     }
 }
 
+// Cached availability: a delta on top of the snapshot stored in IndexedDB
+// when there is one (only the dates changed since its version), otherwise
+// the full snapshot
+async function descargarDisponibilidad() {
+    const local = await leerSnapshotLocal();
+    if (local) {
+        try {
+            const response = await fetch(`/api/availability/delta?since=${local.version}&encoding=columnar`, {
+                cache: 'no-cache'
+            });
+            if (response.ok) {
+                const data = decodificarColumnar(await response.json());
+                // Without 'delta' the server sent the full snapshot (gap too large)
+                const completo = data.delta ? aplicarDelta(local, data) : data;
+                if (completo) {
+                    return { response, data: completo };
+                }
+            }
+        } catch (error) {
+            console.warn('[Cache] Delta failed, loading the full snapshot:', error);
+        }
+    }
+
+    // Revalidate with the server's ETag (304 when nothing changed)
+    const response = await fetch('/api/availability/cached?encoding=columnar', {
+        cache: 'no-cache'
+    });
+    return { response, data: decodificarColumnar(await response.json()) };
+}
+
+// Merge a delta (per tour: current fields, changed dates and 'eliminadas')
+// into a snapshot. Null if the delta has a tour the snapshot doesn't know.
+// Dates before today (Rome) are dropped: slots that stop being published once
+// they have started don't produce events, so no delta would remove them
+function aplicarDelta(snapshot, delta) {
+    const hoy = new Date().toLocaleDateString('en-CA', {timeZone: 'Europe/Rome'});
+    const resultados = {};
+    for (const [tourKey, tour] of Object.entries(delta.resultados)) {
+        const anterior = snapshot.resultados[tourKey];
+        if (!anterior) {
+            return null;
+        }
+
+        const { fechas, eliminadas, ...campos } = tour;
+        const porFecha = new Map(anterior.fechas.map(f => [f.fecha, f]));
+        for (const fecha of eliminadas) {
+            porFecha.delete(fecha);
+        }
+        for (const fecha of fechas) {
+            porFecha.set(fecha.fecha, fecha);
+        }
+        campos.fechas = [...porFecha.values()]
+            .filter(f => f.fecha >= hoy)
+            .sort((a, b) => a.fecha.localeCompare(b.fecha));
+        resultados[tourKey] = campos;
+    }
+
+    const { delta: _delta, desde: _desde, ...resto } = delta;
+    return { ...resto, resultados };
+}
+
+// Last cached snapshot, kept in IndexedDB between visits
+const BASE_LOCAL = 'coliseo-dashboard';
+const ALMACEN_SNAPSHOTS = 'snapshots';
+const CLAVE_DISPONIBILIDAD = 'disponibilidad';
+let baseLocal = null;
+
+function abrirBaseLocal() {
+    if (!baseLocal) {
+        baseLocal = new Promise((resolve, reject) => {
+            if (!window.indexedDB) {
+                resolve(null);
+                return;
+            }
+            const peticion = indexedDB.open(BASE_LOCAL, 1);
+            peticion.onupgradeneeded = () => peticion.result.createObjectStore(ALMACEN_SNAPSHOTS);
+            peticion.onsuccess = () => resolve(peticion.result);
+            peticion.onerror = () => reject(peticion.error);
+        });
+    }
+    return baseLocal;
+}
+
+// Stored snapshot, or null (first visit, private mode, no IndexedDB)
+async function leerSnapshotLocal() {
+    try {
+        const db = await abrirBaseLocal();
+        if (!db) {
+            return null;
+        }
+        const snapshot = await new Promise((resolve, reject) => {
+            const peticion = db.transaction(ALMACEN_SNAPSHOTS)
+                .objectStore(ALMACEN_SNAPSHOTS).get(CLAVE_DISPONIBILIDAD);
+            peticion.onsuccess = () => resolve(peticion.result);
+            peticion.onerror = () => reject(peticion.error);
+        });
+        return snapshot && typeof snapshot.version === 'number' ? snapshot : null;
+    } catch (error) {
+        console.warn('[Cache] IndexedDB unavailable:', error);
+        return null;
+    }
+}
+
+// Store a snapshot (put() copies it, so later live changes don't touch it)
+async function guardarSnapshotLocal(data) {
+    if (typeof data.version !== 'number') {
+        return;
+    }
+    try {
+        const db = await abrirBaseLocal();
+        if (db) {
+            db.transaction(ALMACEN_SNAPSHOTS, 'readwrite')
+                .objectStore(ALMACEN_SNAPSHOTS).put(data, CLAVE_DISPONIBILIDAD);
+        }
+    } catch (error) {
+        console.warn('[Cache] Could not store the snapshot:', error);
+    }
+}
+
+// Live availability changes pushed by the server (Server-Sent Events).
+// EventSource reconnects by itself and resumes with Last-Event-ID.
+let cambiosSource = null;
+
+function suscribirCambios() {
+    if (cambiosSource || !window.EventSource) {
+        return;
+    }
+    cambiosSource = new EventSource('/api/stream');
+    cambiosSource.addEventListener('cambios', (event) => aplicarCambios(JSON.parse(event.data)));
+    cambiosSource.addEventListener('recargar', () => cargarDisponibilidadCacheada());
+}
+
+// Apply one snapshot's changes to the cached view without re-rendering the tables
+function aplicarCambios(data) {
+    if (!usingCachedData || !currentResults || !currentResults.resultados) {
+        return;
+    }
+    if (data.estructura) {
+        // New or removed dates/timeslots: reload (revalidated with the ETag)
+        cargarDisponibilidadCacheada();
+        return;
+    }
+
+    for (const [tourKey, fecha, hora, capacidad, anterior] of data.cambios) {
+        const tourData = currentResults.resultados[tourKey];
+        const tabla = tablasFechas.get(tourKey);
+        const indice = tabla ? tabla.buscar(fecha) : -1;
+        if (!tourData || indice < 0) {
+            continue;
+        }
+
+        const item = tabla.items[indice];
+        item.fecha.plazas_disponibles += capacidad - anterior;
+        tourData.total_plazas += capacidad - anterior;
+
+        const ts = item.timeslots && item.timeslots.find(t => t.hora === hora);
+        if (ts) {
+            ts.capacidad = capacidad;
+        }
+        // Repainted in place on the next frame if the row is on screen
+        tabla.actualizar(indice);
+    }
+
+    // Snapshot timestamps are already in Rome time
+    document.getElementById('timestamp').textContent = `Cached data: ${data.timestamp} (live)`;
+}
+
+// Log transfer size (compressed, 0 on a 304 reuse) and time until rendered
+function registrarTiempoCarga(url, loadStart) {
+    const entry = performance.getEntriesByName(url).pop();
+    const transfer = entry ? `${(entry.transferSize / 1024).toFixed(1)} KB transferred, ` +
+        `${(entry.decodedBodySize / 1024).toFixed(1)} KB decoded` : 'transfer size unknown';
+    console.log(`[Cache] ${transfer}, rendered in ${(performance.now() - loadStart).toFixed(0)} ms`);
+}
+
 // Show results from cache
 function mostrarResultadosCacheados(data) {
     // No summary cards - removed Tours Disponibles and Fuente
@@ -88,82 +263,59 @@ function mostrarResultadosCacheados(data) {
                     </button>
                 </div>
 
-                <div class="tab-content active" id="${tourId}_fechas">
-                    ${generarTablaFechasCacheadas(tourData)}
-                </div>
+                <div class="tab-content active" id="${tourId}_fechas"></div>
             </div>
         `;
     }
 
     document.getElementById('tourResults').innerHTML = toursHtml;
+    montarTablasFechas(data.resultados, 'cached');
     const cachedTimestamp = data.timestamp ? new Date(data.timestamp).toLocaleString('en-GB', {timeZone: 'Europe/Rome'}) : 'unknown';
     document.getElementById('timestamp').textContent = `Cached data: ${cachedTimestamp}`;
     document.getElementById('results').classList.add('active');
     document.getElementById('loading').classList.remove('active');
 }
 
-// Generate date table from cached data
-function generarTablaFechasCacheadas(tourData) {
-    const tourId = (tourData.guid || 'tour').substring(0, 8);
-    let html = '';
-
-    for (const fecha of tourData.fechas) {
-        const timeslots = fecha.timeslots || [];
-        const fechaId = tourId + '_' + fecha.fecha.replace(/[^a-z0-9]/gi, '_');
-
-        // Calculate status
-        const porcentajeOcupado = fecha.plazas_totales > 0
-            ? ((fecha.plazas_totales - fecha.plazas_disponibles) / fecha.plazas_totales * 100).toFixed(1)
-            : 0;
-
-        let estado = 'AVAILABLE';
-        let nivel = 'alta';
-        if (fecha.plazas_disponibles === 0) {
-            estado = 'SOLD OUT';
-            nivel = 'agotado';
-        } else if (porcentajeOcupado > 70) {
-            estado = 'LOW AVAILABILITY';
-            nivel = 'baja';
-        } else if (porcentajeOcupado > 30) {
-            estado = 'MODERATE';
-            nivel = 'media';
-        }
-
-        // Get day of week
-        let diaSemana = '';
-        try {
-            const fechaObj = new Date(fecha.fecha + 'T00:00:00');
-            diaSemana = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'][fechaObj.getDay()];
-        } catch (e) {}
-
-        html += `
-            <div class="fecha-row" onclick="toggleTimeslots('${fechaId}')">
-                <div class="fecha-cell fecha-fecha">${fecha.fecha}</div>
-                <div class="fecha-cell fecha-dia">${diaSemana}</div>
-                <div class="fecha-cell fecha-plazas"><strong>${fecha.plazas_disponibles.toLocaleString()}</strong> / ${fecha.plazas_totales.toLocaleString()}</div>
-                <div class="fecha-cell fecha-ocupado">${porcentajeOcupado}%</div>
-                <div class="fecha-cell fecha-estado"><span class="badge badge-${nivel}">${estado}</span></div>
-                <div class="fecha-cell fecha-horarios expand-hint">${ICONS.chevronDown} ${timeslots.length} timeslots</div>
-            </div>
-            <div class="timeslots-panel" id="timeslots_${fechaId}">
-                ${generarTimeslotsGridCacheados(timeslots)}
-            </div>
-        `;
+// Cells of a cached date row
+function vistaFechaCacheada(fecha, timeslots) {
+    const numTimeslots = timeslots ? timeslots.length : (fecha.num_timeslots || 0);
+
+    // Calculate status
+    const porcentajeOcupado = fecha.plazas_totales > 0
+        ? ((fecha.plazas_totales - fecha.plazas_disponibles) / fecha.plazas_totales * 100).toFixed(1)
+        : 0;
+
+    let estado = 'AVAILABLE';
+    let nivel = 'alta';
+    if (fecha.plazas_disponibles === 0) {
+        estado = 'SOLD OUT';
+        nivel = 'agotado';
+    } else if (porcentajeOcupado > 70) {
+        estado = 'LOW AVAILABILITY';
+        nivel = 'baja';
+    } else if (porcentajeOcupado > 30) {
+        estado = 'MODERATE';
+        nivel = 'media';
     }
 
-    return `
-        <div class="fechas-container">
-            <div class="fechas-header">
-                <div class="fecha-cell fecha-fecha">Date</div>
-                <div class="fecha-cell fecha-dia">Day</div>
-                <div class="fecha-cell fecha-plazas">Available Spots</div>
-                <div class="fecha-cell fecha-ocupado">% Occupied</div>
-                <div class="fecha-cell fecha-estado">Status</div>
-                <div class="fecha-cell fecha-horarios">Timeslots</div>
-            </div>
-            ${html}
-        </div>
-    `;
+    // Get day of week
+    let diaSemana = '';
+    try {
+        const fechaObj = new Date(fecha.fecha + 'T00:00:00');
+        diaSemana = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'][fechaObj.getDay()];
+    } catch (e) {}
+
+    return {
+        fecha: fecha.fecha,
+        dia: diaSemana,
+        disponibles: fecha.plazas_disponibles,
+        totales: fecha.plazas_totales,
+        ocupado: porcentajeOcupado,
+        prevision: null,
+        nivel: nivel,
+        estado: estado,
+        numTimeslots: numTimeslots
+    };
 }
 
 // Generate timeslots grid from cache
@@ -181,32 +333,54 @@ function generarTimeslotsGridCacheados(timeslots) {
     });
 
     for (const ts of timeslotsSorted) {
-        const capacidad = ts.capacidad || 0;
-        const capacidadOriginal = ts.capacidad_original || capacidad;
-        const porcentajeOcupado = capacidadOriginal > 0
-            ? ((capacidadOriginal - capacidad) / capacidadOriginal * 100)
-            : 0;
-
-        let clase = 'disponible';
-        if (capacidad === 0) {
-            clase = 'agotado';
-        } else if (porcentajeOcupado > 70) {
-            clase = 'parcial';
-        }
-
-        html += `
-            <div class="timeslot-card ${clase}">
-                <div class="timeslot-hora">${ts.hora || 'N/A'}</div>
-                <div class="timeslot-plazas">${capacidad} / ${capacidadOriginal}</div>
-                <div class="timeslot-plazas">${porcentajeOcupado.toFixed(0)}%</div>
-            </div>
-        `;
+        html += generarTimeslotCacheado(ts);
     }
 
     html += '</div>';
     return html;
 }
 
+// One cached timeslot card
+function generarTimeslotCacheado(ts) {
+    const capacidad = ts.capacidad || 0;
+    const capacidadOriginal = ts.capacidad_original || capacidad;
+    const porcentajeOcupado = capacidadOriginal > 0
+        ? ((capacidadOriginal - capacidad) / capacidadOriginal * 100)
+        : 0;
+
+    let clase = 'disponible';
+    if (capacidad === 0) {
+        clase = 'agotado';
+    } else if (porcentajeOcupado > 70) {
+        clase = 'parcial';
+    }
+
+    return `
+        <div class="timeslot-card ${clase}">
+            <div class="timeslot-hora">${ts.hora || 'N/A'}</div>
+            <div class="timeslot-plazas">${capacidad} / ${capacidadOriginal}</div>
+            <div class="timeslot-plazas">${porcentajeOcupado.toFixed(0)}%</div>
+            ${generarAgotamientoEstimado(ts)}
+        </div>
+    `;
+}
+
+// Projected sell-out time from the historico sales velocity
+function generarAgotamientoEstimado(ts) {
+    if (!ts.agotamiento_estimado) {
+        return '';
+    }
+    return `<div class="timeslot-plazas" title="${ts.velocidad} seats/hour">Sells out ~${ts.agotamiento_estimado.slice(5)}</div>`;
+}
+
+// Forecast occupancy on the visit date from the historico lead-time curves
+function textoOcupacionPrevista(prevision) {
+    if (prevision === null || prevision === undefined) {
+        return '';
+    }
+    return `\u00a0→ ${prevision}%`;
+}
+
 // Update visual status of cookies
 function actualizarEstadoCookies(estado, titulo, detalle) {
     const statusBox = document.getElementById('cookieStatus');
@@ -357,25 +531,17 @@ async function consultarDisponibilidad() {
     document.getElementById('loading').classList.add('active');
     document.getElementById('results').classList.remove('active');
 
-    try {
-        const response = await fetch('/api/consultar', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                cookies: currentCookies,
-                tours: toursSeleccionados,
-                meses: 6
-            })
-        });
-
-        const data = await response.json();
-
-        if (!response.ok) {
-            throw new Error(data.error || 'Error al consultar');
-        }
+    const loadingText = document.querySelector('#loading .loading-text');
 
+    try {
+        const data = decodificarColumnar(await consultarStream({
+            cookies: currentCookies,
+            tours: toursSeleccionados,
+            meses: 6,
+            encoding: 'columnar'
+        }, (texto) => { loadingText.textContent = texto; }));
+
+        usingCachedData = false;
         currentResults = data;
         mostrarResultados(data);
 
@@ -386,29 +552,248 @@ async function consultarDisponibilidad() {
         showAlert('error', error.message);
     } finally {
         document.getElementById('loading').classList.remove('active');
+        loadingText.textContent = 'Checking availability...';
     }
 }
 
+// Run a query through the NDJSON stream, rendering each (tour, month) as soon
+// as it arrives. Browsers without streaming bodies use a background job
+async function consultarStream(body, onProgreso) {
+    const response = await fetch('/api/consultar/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    });
+    if (!response.ok) {
+        const error = await response.json();
+        throw new Error(error.error || 'Error al consultar');
+    }
+    if (!response.body || typeof TextDecoder === 'undefined') {
+        return ejecutarTrabajoConsulta(body, onProgreso);
+    }
+
+    const progreso = {};
+    let resultado = null;
+
+    await leerNdjson(response, (linea) => {
+        if (linea.tipo === 'inicio') {
+            for (const tourKey of Object.keys(linea.tours)) {
+                progreso[tourKey] = { hechos: 0, total: linea.meses.length };
+            }
+            iniciarResultadosParciales(linea.tours);
+        } else if (linea.tipo === 'mes') {
+            progreso[linea.tour] = { hechos: linea.hechos, total: linea.total };
+            agregarFechasParciales(linea.tour, linea.fechas);
+        } else if (linea.tipo === 'resumen') {
+            delete linea.tipo;
+            resultado = linea;
+            return;
+        } else if (linea.tipo === 'error') {
+            throw new Error(linea.error);
+        }
+        onProgreso(describirProgreso({ estado: 'ejecutando', progreso }));
+    });
+
+    if (!resultado) {
+        throw new Error('The connection closed before the query finished');
+    }
+    return resultado;
+}
+
+// Read a newline-delimited JSON body, calling onLinea for each object as
+// soon as its line is complete
+async function leerNdjson(response, onLinea) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let pendiente = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        pendiente += decoder.decode(value, { stream: true });
+        const lineas = pendiente.split('\n');
+        pendiente = lineas.pop();
+        for (const linea of lineas) {
+            if (linea.trim()) onLinea(JSON.parse(linea));
+        }
+    }
+
+    pendiente += decoder.decode();
+    if (pendiente.trim()) onLinea(JSON.parse(pendiente));
+}
+
+// Empty tour sections that fill up month by month while the query streams
+// (replaced by mostrarResultados when the summary arrives)
+function iniciarResultadosParciales(tours) {
+    document.getElementById('summaryCards').innerHTML = '';
+
+    let toursHtml = '';
+    for (const [tourKey, tour] of Object.entries(tours)) {
+        const tourId = tourKey.replace(/[^a-z0-9]/gi, '_');
+        toursHtml += `
+            <div class="tour-section" id="parcial_${tourId}" data-fechas="0" data-plazas="0">
+                <div class="tour-section-header">
+                    <h3 class="tour-section-title">${tour.nombre}</h3>
+                    <div class="tour-section-stats">
+                        <span><strong class="parcial-fechas">0</strong> available dates</span>
+                        <span><strong class="parcial-plazas">0</strong> total spots</span>
+                    </div>
+                </div>
+                <div class="parcial-tabla"></div>
+            </div>
+        `;
+    }
+
+    document.getElementById('tourResults').innerHTML = toursHtml;
+    reiniciarTablasFechas();
+    for (const tourKey of Object.keys(tours)) {
+        const section = document.getElementById('parcial_' + tourKey.replace(/[^a-z0-9]/gi, '_'));
+        montarTablaFechas(tourKey, section.querySelector('.parcial-tabla'), [], opcionesTablaFechas('live', null, null));
+    }
+    document.getElementById('timestamp').textContent = '';
+    document.getElementById('results').classList.add('active');
+}
+
+// Append one streamed month's dates to its tour section
+function agregarFechasParciales(tourKey, fechas) {
+    const section = document.getElementById('parcial_' + tourKey.replace(/[^a-z0-9]/gi, '_'));
+    const tabla = tablasFechas.get(tourKey);
+    if (!section || !tabla || !fechas.length) return;
+
+    tabla.agregar(fechas);
+
+    section.dataset.fechas = Number(section.dataset.fechas) + fechas.length;
+    section.dataset.plazas = Number(section.dataset.plazas) + fechas.reduce((t, f) => t + f.plazas_disponibles, 0);
+    section.querySelector('.parcial-fechas').textContent = section.dataset.fechas;
+    section.querySelector('.parcial-plazas').textContent = Number(section.dataset.plazas).toLocaleString();
+}
+
+// How often to poll a query job's progress
+const INTERVALO_SONDEO_TRABAJO_MS = 1500;
+
+// Run a query as a background job: enqueue it, poll its progress and fetch
+// the result when it finishes. Where jobs aren't available (501, serverless
+// deployments) or the job is lost, the query runs synchronously instead
+async function ejecutarTrabajoConsulta(body, onProgreso) {
+    const response = await fetch('/api/consultar/trabajos', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    });
+    if (response.status === 501) {
+        return consultarSincrono(body);
+    }
+    const trabajo = await response.json();
+    if (!response.ok) {
+        throw new Error(trabajo.error || 'Error al consultar');
+    }
+
+    const url = `/api/consultar/trabajos/${trabajo.trabajo_id}`;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, INTERVALO_SONDEO_TRABAJO_MS));
+
+        const estadoResponse = await fetch(url, { cache: 'no-store' });
+        if (estadoResponse.status === 404) {
+            return consultarSincrono(body);
+        }
+        const estado = await estadoResponse.json();
+        if (!estadoResponse.ok) {
+            throw new Error(estado.error || 'Error al consultar');
+        }
+        if (estado.estado === 'error') {
+            throw new Error(estado.error || 'Error al consultar');
+        }
+        if (estado.estado === 'completado') {
+            break;
+        }
+        onProgreso(describirProgreso(estado));
+    }
+
+    const resultado = body.encoding ? `${url}/resultado?encoding=${body.encoding}` : `${url}/resultado`;
+    const resultadoResponse = await fetch(resultado, { cache: 'no-store' });
+    if (resultadoResponse.status === 404) {
+        return consultarSincrono(body);
+    }
+    const data = await resultadoResponse.json();
+    if (resultadoResponse.status !== 200) {
+        throw new Error(data.error || 'Error al consultar');
+    }
+    return data;
+}
+
+async function consultarSincrono(body) {
+    const response = await fetch('/api/consultar', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || 'Error al consultar');
+    }
+    return data;
+}
+
+// "Checking availability... 24h-grupos 3/6 months · arena 1/6 months"
+function describirProgreso(estado) {
+    if (estado.estado === 'pendiente') {
+        return 'Waiting in queue...';
+    }
+    const partes = Object.entries(estado.progreso || {})
+        .map(([tour, p]) => `${tour} ${p.hechos}/${p.total} months`);
+    return partes.length
+        ? `Checking availability... ${partes.join(' · ')}`
+        : 'Checking availability...';
+}
+
+// POST a result reference (result_id) to the server, re-sending the full
+// results only if the server no longer has them (410). Summary-only results
+// can't be re-sent, so the 410 is returned for the caller to report; the
+// server also keeps each result in storage, so this only happens after
+// RESULT_CACHE_TTL
+async function enviarResultados(url, data) {
+    const post = (body) => fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    });
+
+    if (data.result_id) {
+        const response = await post({ result_id: data.result_id });
+        if (response.status !== 410 || data.detalle_omitido) {
+            return response;
+        }
+    }
+
+    return post({ resultados: data.resultados });
+}
+
 // Save to history automatically
 async function guardarHistoricoAutomatico(data) {
     try {
-        const response = await fetch('/api/guardar-historico', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                resultados: data.resultados
-            })
-        });
+        const response = await enviarResultados('/api/guardar-historico', data);
 
         const result = await response.json();
 
-        if (result.success) {
+        if (response.ok && result.success) {
             console.log('History saved:', result.message);
+            return;
         }
+        throw new Error(response.status === 410
+            ? 'results expired, run the query again'
+            : (result.error || `HTTP ${response.status}`));
     } catch (error) {
         console.error('Error saving history:', error);
+        showAlert('error', 'History not saved: ' + error.message);
     }
 }
 
@@ -450,9 +835,7 @@ function mostrarResultados(data) {
                     </button>
                 </div>
 
-                <div class="tab-content active" id="${tourId}_fechas">
-                    ${generarTablaFechas(tourData)}
-                </div>
+                <div class="tab-content active" id="${tourId}_fechas"></div>
 
                 <div class="tab-content" id="${tourId}_estadisticas">
                     ${generarEstadisticas(tourData.estadisticas)}
@@ -462,67 +845,387 @@ function mostrarResultados(data) {
     }
 
     document.getElementById('tourResults').innerHTML = toursHtml;
+    montarTablasFechas(data.resultados, 'live');
     document.getElementById('timestamp').textContent = `Last query: ${data.timestamp}`;
     document.getElementById('results').classList.add('active');
 }
 
-// Generate date table with expandable timeslots
-function generarTablaFechas(tourData) {
-    const tourId = tourData.guid.substring(0, 8);
-    let html = '';
+// Translate status to English
+function translateStatus(estado) {
+    const translations = {
+        'DISPONIBLE': 'AVAILABLE',
+        'AGOTADO': 'SOLD OUT',
+        'POCA DISPONIBILIDAD': 'LOW AVAILABILITY',
+        'DISPONIBILIDAD MODERADA': 'MODERATE'
+    };
+    return translations[estado] || estado;
+}
 
-    // Translate status to English
-    const translateStatus = (estado) => {
-        const translations = {
-            'DISPONIBLE': 'AVAILABLE',
-            'AGOTADO': 'SOLD OUT',
-            'POCA DISPONIBILIDAD': 'LOW AVAILABILITY',
-            'DISPONIBILIDAD MODERADA': 'MODERATE'
-        };
-        return translations[estado] || estado;
+// Translate day names
+function translateDay(dia) {
+    const translations = {
+        'Dom': 'Sun', 'Lun': 'Mon', 'Mar': 'Tue', 'Mie': 'Wed', 'Mié': 'Wed',
+        'Jue': 'Thu', 'Vie': 'Fri', 'Sab': 'Sat', 'Sáb': 'Sat'
     };
+    return translations[dia] || dia;
+}
 
-    // Translate day names
-    const translateDay = (dia) => {
-        const translations = {
-            'Dom': 'Sun', 'Lun': 'Mon', 'Mar': 'Tue', 'Mie': 'Wed',
-            'Jue': 'Thu', 'Vie': 'Fri', 'Sab': 'Sat'
-        };
-        return translations[dia] || dia;
+// Cells of a live query date row
+function vistaFechaLive(fecha, timeslots) {
+    return {
+        fecha: fecha.fecha,
+        dia: translateDay(fecha.dia_semana),
+        disponibles: fecha.plazas_disponibles,
+        totales: fecha.plazas_totales,
+        ocupado: fecha.porcentaje_ocupado,
+        prevision: fecha.ocupacion_prevista,
+        nivel: fecha.nivel,
+        estado: translateStatus(fecha.estado),
+        numTimeslots: timeslots ? timeslots.length : (fecha.num_timeslots || 0)
     };
+}
 
-    for (const fecha of tourData.fechas) {
-        const timeslots = tourData.timeslots_por_fecha[fecha.fecha] || [];
-        const fechaId = tourId + '_' + fecha.fecha.replace(/[^a-z0-9]/gi, '_');
+// Date tables are virtualized: only the rows inside the scroll viewport (plus
+// SOBRANTE_FILAS above and below) are in the DOM, absolutely positioned over
+// a canvas as tall as the whole table. Row elements are pooled and their
+// cells repainted in place, so a 12-month multi-tour view renders one screen
+// of rows and a live change touches a single row
+const SOBRANTE_FILAS = 8;
+const ALTO_FILA_ESTIMADO = 45;
+
+// Date tables on screen by tour key (aplicarCambios and the streamed months
+// update them)
+const tablasFechas = new Map();
+
+const CABECERA_FECHAS = `
+    <div class="fechas-header">
+        <div class="fecha-cell fecha-fecha">Date</div>
+        <div class="fecha-cell fecha-dia">Day</div>
+        <div class="fecha-cell fecha-plazas">Available Spots</div>
+        <div class="fecha-cell fecha-ocupado">% Occupied</div>
+        <div class="fecha-cell fecha-estado">Status</div>
+        <div class="fecha-cell fecha-horarios">Timeslots</div>
+    </div>
+`;
+
+const FILA_FECHA = `
+    <div class="fecha-row">
+        <div class="fecha-cell fecha-fecha"></div>
+        <div class="fecha-cell fecha-dia"></div>
+        <div class="fecha-cell fecha-plazas"><strong></strong><span></span></div>
+        <div class="fecha-cell fecha-ocupado"><span></span><small title="Forecast occupancy on the visit date"></small></div>
+        <div class="fecha-cell fecha-estado"><span class="badge"></span></div>
+        <div class="fecha-cell fecha-horarios expand-hint">${ICONS.chevronDown}<span></span></div>
+    </div>
+    <div class="timeslots-panel"></div>
+`;
+
+// Write a row view (vistaFechaLive / vistaFechaCacheada) into the row's cells
+function pintarFilaFecha(fila, vista) {
+    const celdas = fila.children;
+    celdas[0].textContent = vista.fecha;
+    celdas[1].textContent = vista.dia;
+    celdas[2].firstElementChild.textContent = vista.disponibles.toLocaleString();
+    celdas[2].lastElementChild.textContent = ` / ${vista.totales.toLocaleString()}`;
+    celdas[3].firstElementChild.textContent = `${vista.ocupado}%`;
+    celdas[3].lastElementChild.textContent = textoOcupacionPrevista(vista.prevision);
+    celdas[4].firstElementChild.className = `badge badge-${vista.nivel}`;
+    celdas[4].firstElementChild.textContent = vista.estado;
+    celdas[5].lastElementChild.textContent = `${vista.numTimeslots} timeslots`;
+}
 
-        html += `
-            <div class="fecha-row" onclick="toggleTimeslots('${fechaId}')">
-                <div class="fecha-cell fecha-fecha">${fecha.fecha}</div>
-                <div class="fecha-cell fecha-dia">${translateDay(fecha.dia_semana)}</div>
-                <div class="fecha-cell fecha-plazas"><strong>${fecha.plazas_disponibles.toLocaleString()}</strong> / ${fecha.plazas_totales.toLocaleString()}</div>
-                <div class="fecha-cell fecha-ocupado">${fecha.porcentaje_ocupado}%</div>
-                <div class="fecha-cell fecha-estado"><span class="badge badge-${fecha.nivel}">${translateStatus(fecha.estado)}</span></div>
-                <div class="fecha-cell fecha-horarios expand-hint">${ICONS.chevronDown} ${timeslots.length} timeslots</div>
-            </div>
-            <div class="timeslots-panel" id="timeslots_${fechaId}">
-                ${generarTimeslotsGrid(timeslots)}
+// Virtualized date table of one tour. opciones:
+//   tourKey: tour whose timeslots are fetched on expand (null = not expandable)
+//   origen: 'live' or 'cached' (see cargarTimeslots)
+//   vista(fecha, timeslots): cells of a row
+//   panel(timeslots): HTML of an expanded date's timeslots
+//   timeslots(fecha): timeslots already in the response, or null
+class TablaFechas {
+    constructor(contenedor, opciones) {
+        this.opciones = opciones;
+        this.items = [];
+        this.indices = new Map();
+        this.alturas = new Float64Array(0);
+        this.inicios = new Float64Array(1);
+        this.altoFila = ALTO_FILA_ESTIMADO;
+        this.calibrada = false;
+        this.sucio = true;
+        this.visibles = new Map();
+        this.libres = [];
+        this.frame = 0;
+        this.destruida = false;
+
+        contenedor.innerHTML = `
+            <div class="fechas-container">
+                ${CABECERA_FECHAS}
+                <div class="fechas-viewport"><div class="fechas-lienzo"></div></div>
             </div>
         `;
+        this.viewport = contenedor.querySelector('.fechas-viewport');
+        this.lienzo = contenedor.querySelector('.fechas-lienzo');
+
+        this.viewport.addEventListener('scroll', () => this.programar(), { passive: true });
+        this.lienzo.addEventListener('click', (event) => {
+            const fila = event.target.closest('.fecha-row');
+            if (fila) {
+                this.alternar(fila.parentNode.indice);
+            }
+        });
+
+        // Resizes and hidden tabs becoming visible change what fits on screen
+        if (window.ResizeObserver) {
+            this.observador = new ResizeObserver(() => this.programar());
+            this.observador.observe(this.viewport);
+        } else {
+            window.addEventListener('resize', () => this.programar());
+        }
     }
 
-    return `
-        <div class="fechas-container">
-            <div class="fechas-header">
-                <div class="fecha-cell fecha-fecha">Date</div>
-                <div class="fecha-cell fecha-dia">Day</div>
-                <div class="fecha-cell fecha-plazas">Available Spots</div>
-                <div class="fecha-cell fecha-ocupado">% Occupied</div>
-                <div class="fecha-cell fecha-estado">Status</div>
-                <div class="fecha-cell fecha-horarios">Timeslots</div>
-            </div>
-            ${html}
-        </div>
-    `;
+    // Append dates at the end (streamed months arrive in order)
+    agregar(fechas) {
+        const inicio = this.items.length;
+        for (const fecha of fechas) {
+            this.indices.set(fecha.fecha, this.items.length);
+            this.items.push({
+                fecha: fecha,
+                timeslots: this.opciones.timeslots(fecha),
+                abierto: false,
+                cargando: false,
+                mensaje: null,
+                version: 0
+            });
+        }
+
+        const alturas = new Float64Array(this.items.length);
+        alturas.set(this.alturas);
+        alturas.fill(this.altoFila, inicio);
+        this.alturas = alturas;
+        this.sucio = true;
+        this.programar();
+    }
+
+    // Index of a date ('YYYY-MM-DD'), or -1
+    buscar(fecha) {
+        const indice = this.indices.get(fecha);
+        return indice === undefined ? -1 : indice;
+    }
+
+    // Repaint a date (row and open panel) whose data changed
+    actualizar(indice) {
+        this.items[indice].version++;
+        this.programar();
+    }
+
+    // Expand or collapse a date, loading its timeslots the first time
+    alternar(indice) {
+        const item = this.items[indice];
+        if (!item || (!item.timeslots && !this.opciones.tourKey)) {
+            return;
+        }
+        item.abierto = !item.abierto;
+        if (item.abierto && !item.timeslots && !item.cargando) {
+            this.cargar(item);
+        }
+        this.actualizar(indice);
+    }
+
+    async cargar(item) {
+        item.cargando = true;
+        item.mensaje = 'Loading timeslots...';
+        try {
+            item.timeslots = await cargarTimeslots(this.opciones.tourKey, item.fecha.fecha, this.opciones.origen);
+            item.mensaje = null;
+        } catch (error) {
+            // Retried the next time the date is expanded
+            item.mensaje = error.message;
+        }
+        item.cargando = false;
+        this.actualizar(this.buscar(item.fecha.fecha));
+    }
+
+    programar() {
+        if (!this.frame && !this.destruida) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = 0;
+                this.pintar();
+            });
+        }
+    }
+
+    // Last index whose top is at or above y
+    posicion(y) {
+        let bajo = 0;
+        let alto = this.items.length - 1;
+        while (bajo < alto) {
+            const medio = (bajo + alto + 1) >> 1;
+            if (this.inicios[medio] <= y) {
+                bajo = medio;
+            } else {
+                alto = medio - 1;
+            }
+        }
+        return bajo;
+    }
+
+    // Lay out the rows in the viewport, reusing the pooled elements and
+    // repainting only the ones that show a different date or changed
+    pintar() {
+        if (this.destruida) {
+            return;
+        }
+
+        const total = this.items.length;
+        if (this.sucio) {
+            const inicios = new Float64Array(total + 1);
+            for (let i = 0; i < total; i++) {
+                inicios[i + 1] = inicios[i] + this.alturas[i];
+            }
+            this.inicios = inicios;
+            this.lienzo.style.height = `${inicios[total]}px`;
+            this.sucio = false;
+        }
+
+        const arriba = this.viewport.scrollTop;
+        const visible = this.viewport.clientHeight || window.innerHeight;
+        const desde = Math.max(0, this.posicion(arriba) - SOBRANTE_FILAS);
+        const hasta = Math.min(total, this.posicion(arriba + visible) + 1 + SOBRANTE_FILAS);
+
+        for (const [indice, elemento] of this.visibles) {
+            if (indice < desde || indice >= hasta) {
+                elemento.hidden = true;
+                this.visibles.delete(indice);
+                this.libres.push(elemento);
+            }
+        }
+
+        for (let i = desde; i < hasta; i++) {
+            const item = this.items[i];
+            let elemento = this.visibles.get(i);
+            if (!elemento) {
+                elemento = this.libres.pop() || this.crearElemento();
+                elemento.hidden = false;
+                elemento.indice = -1;
+                this.visibles.set(i, elemento);
+            }
+            if (elemento.indice !== i || elemento.version !== item.version) {
+                this.pintarElemento(elemento, item);
+                elemento.indice = i;
+                elemento.version = item.version;
+            }
+            elemento.style.transform = `translateY(${this.inicios[i]}px)`;
+        }
+
+        this.medir();
+    }
+
+    // Real heights of the rows on screen (open panels, wrapped cells). If any
+    // differs from the estimate, the next frame moves the rows below it
+    medir() {
+        if (!this.calibrada) {
+            for (const [indice, elemento] of this.visibles) {
+                if (!this.items[indice].abierto && elemento.offsetHeight) {
+                    this.altoFila = elemento.offsetHeight;
+                    this.alturas.fill(this.altoFila);
+                    this.calibrada = true;
+                    this.sucio = true;
+                    break;
+                }
+            }
+        }
+
+        for (const [indice, elemento] of this.visibles) {
+            const alto = elemento.offsetHeight;
+            if (alto && alto !== this.alturas[indice]) {
+                this.alturas[indice] = alto;
+                this.sucio = true;
+            }
+        }
+        if (this.sucio) {
+            this.programar();
+        }
+    }
+
+    crearElemento() {
+        const elemento = document.createElement('div');
+        elemento.className = 'fecha-item';
+        elemento.innerHTML = FILA_FECHA;
+        this.lienzo.appendChild(elemento);
+        return elemento;
+    }
+
+    pintarElemento(elemento, item) {
+        pintarFilaFecha(elemento.firstElementChild, this.opciones.vista(item.fecha, item.timeslots));
+
+        const panel = elemento.lastElementChild;
+        panel.classList.toggle('active', item.abierto);
+        if (!item.abierto) {
+            panel.innerHTML = '';
+        } else if (item.timeslots) {
+            panel.innerHTML = this.opciones.panel(item.timeslots);
+        } else {
+            panel.innerHTML = `<p style="padding: 15px; color: #666;">${item.mensaje || ''}</p>`;
+        }
+    }
+
+    destruir() {
+        this.destruida = true;
+        cancelAnimationFrame(this.frame);
+        if (this.observador) {
+            this.observador.disconnect();
+        }
+    }
+}
+
+// Table options for live query results ('live', also the streamed partial
+// tables without tourKey) or cached availability ('cached')
+function opcionesTablaFechas(origen, tourKey, tourData) {
+    if (origen === 'cached') {
+        return {
+            tourKey: tourKey,
+            origen: origen,
+            vista: vistaFechaCacheada,
+            panel: generarTimeslotsGridCacheados,
+            timeslots: (fecha) => fecha.timeslots || null
+        };
+    }
+
+    const porFecha = tourData && tourData.timeslots_por_fecha;
+    return {
+        tourKey: tourKey,
+        origen: origen,
+        vista: vistaFechaLive,
+        panel: generarTimeslotsGrid,
+        timeslots: (fecha) => porFecha ? (porFecha[fecha.fecha] || []) : null
+    };
+}
+
+// Drop the tables of the previous results (their DOM is being replaced)
+function reiniciarTablasFechas() {
+    for (const tabla of tablasFechas.values()) {
+        tabla.destruir();
+    }
+    tablasFechas.clear();
+}
+
+// Mount a tour's date table into contenedor
+function montarTablaFechas(tourKey, contenedor, fechas, opciones) {
+    const tabla = new TablaFechas(contenedor, opciones);
+    tabla.agregar(fechas);
+    // First screen synchronously, so the rows are there with the section
+    tabla.pintar();
+    tablasFechas.set(tourKey, tabla);
+    return tabla;
+}
+
+// Mount the date table of every tour in its '<tourId>_fechas' tab
+function montarTablasFechas(resultados, origen) {
+    reiniciarTablasFechas();
+
+    for (const [tourKey, tourData] of Object.entries(resultados)) {
+        const tourId = tourKey.replace(/[^a-z0-9]/gi, '_');
+        montarTablaFechas(tourKey, document.getElementById(`${tourId}_fechas`), tourData.fechas,
+            opcionesTablaFechas(origen, tourKey, tourData));
+    }
 }
 
 // Generate timeslots grid
@@ -552,6 +1255,7 @@ function generarTimeslotsGrid(timeslots) {
                 <div class="timeslot-hora">${ts.hora || 'N/A'}</div>
                 <div class="timeslot-plazas">${ts.capacidad || 0} / ${ts.capacidad_original || 0}</div>
                 <div class="timeslot-plazas">${ts.porcentaje_ocupado || 0}%</div>
+                ${generarAgotamientoEstimado(ts)}
             </div>
         `;
     }
@@ -598,10 +1302,120 @@ function generarEstadisticas(stats) {
     `;
 }
 
-// Toggle timeslots visibility
-function toggleTimeslots(fechaId) {
-    const panel = document.getElementById('timeslots_' + fechaId);
-    panel.classList.toggle('active');
+// Fetch one date's timeslots from the server cache
+async function cargarTimeslots(tourKey, fecha, source) {
+    const params = new URLSearchParams({ tour: tourKey, fecha: fecha, encoding: 'columnar' });
+    if (source === 'live' && currentResults && currentResults.result_id) {
+        params.set('result_id', currentResults.result_id);
+    }
+
+    const response = await fetch(`/api/timeslots?${params}`);
+    const data = await response.json();
+
+    if (!response.ok) {
+        throw new Error(response.status === 410
+            ? 'Results expired, run the query again'
+            : (data.error || 'Error loading timeslots'));
+    }
+
+    return data.encoding === 'columnar'
+        ? decodificarTabla(data.timeslots, data.diccionarios).map(completarTimeslot)
+        : data.timeslots;
+}
+
+// Decode an encoding=columnar response (see codificacion_columnar.py) into
+// the regular shape: parallel arrays back into rows, dictionary indexes back
+// into dates and hours, and the derived fields the server leaves out
+function decodificarColumnar(data) {
+    if (!data || data.encoding !== 'columnar') {
+        return data;
+    }
+
+    const resultados = {};
+    for (const [tourKey, tour] of Object.entries(data.resultados)) {
+        const { timeslots, timeslots_en_fechas, ...tourData } = tour;
+        tourData.fechas = decodificarTabla(tour.fechas, data.diccionarios).map(completarFecha);
+
+        if (timeslots) {
+            const porFecha = {};
+            for (const ts of decodificarTabla(timeslots, data.diccionarios)) {
+                (porFecha[ts.fecha] = porFecha[ts.fecha] || []).push(completarTimeslot(ts));
+            }
+            tourData.timeslots_por_fecha = porFecha;
+            if (timeslots_en_fechas) {
+                for (const fecha of tourData.fechas) {
+                    fecha.timeslots = porFecha[fecha.fecha] || [];
+                }
+            }
+        }
+        resultados[tourKey] = tourData;
+    }
+
+    const { encoding, diccionarios, ...resto } = data;
+    return { ...resto, resultados };
+}
+
+// Parallel arrays ({column: [values]}) to a list of row objects
+function decodificarTabla(tabla, diccionarios) {
+    const claves = Object.keys(tabla);
+    const columnas = claves.map(clave => diccionarios[clave]
+        ? tabla[clave].map(i => diccionarios[clave][i])
+        : tabla[clave]);
+    const total = claves.length ? columnas[0].length : 0;
+
+    const filas = new Array(total);
+    for (let i = 0; i < total; i++) {
+        const fila = {};
+        for (let j = 0; j < claves.length; j++) {
+            fila[claves[j]] = columnas[j][i];
+        }
+        filas[i] = fila;
+    }
+    return filas;
+}
+
+const DIAS_SEMANA = ['Dom', 'Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb'];
+
+// Derived date fields, computed like formatear_resultados_para_tabla
+function completarFecha(fecha) {
+    const totales = fecha.plazas_totales || 0;
+    const ocupadas = totales ? totales - fecha.plazas_disponibles : 0;
+    const porcentaje = totales > 0 ? ocupadas / totales * 100 : 0;
+
+    let estado = 'POCA DISPONIBILIDAD';
+    let nivel = 'baja';
+    if (fecha.plazas_disponibles === 0) {
+        estado = 'AGOTADO';
+        nivel = 'agotado';
+    } else if (porcentaje < 30) {
+        estado = 'MUCHA DISPONIBILIDAD';
+        nivel = 'alta';
+    } else if (porcentaje < 70) {
+        estado = 'DISPONIBILIDAD MODERADA';
+        nivel = 'media';
+    }
+
+    const dia = DIAS_SEMANA[new Date(fecha.fecha + 'T00:00:00').getDay()] || '';
+    return Object.assign(fecha, {
+        fecha_formateada: dia ? `${fecha.fecha} (${dia})` : fecha.fecha,
+        dia_semana: dia,
+        plazas_ocupadas: ocupadas,
+        porcentaje_ocupado: Math.round(porcentaje * 10) / 10,
+        estado,
+        nivel
+    });
+}
+
+// Derived timeslot fields, computed like obtener_timeslots_detallados
+function completarTimeslot(ts) {
+    const capacidad = ts.capacidad || 0;
+    const original = ts.capacidad_original || 0;
+    const ocupadas = original ? original - capacidad : 0;
+    return Object.assign(ts, {
+        ocupadas,
+        porcentaje_ocupado: original > 0 ? Math.round(ocupadas / original * 1000) / 10 : 0,
+        disponible: capacidad > 0
+    });
 }
 
 // Cambiar tab
@@ -647,6 +1461,5 @@ async function descargarHistorico(includePast = true) {
 
 // Expose functions globally
 window.refrescarCookies = refrescarCookies;
-window.toggleTimeslots = toggleTimeslots;
 window.cambiarTab = cambiarTab;
 window.descargarHistorico = descargarHistorico;
@@ -6,11 +6,15 @@ Maneja la subida y descarga de archivos Excel e históricos.
 import os
 from io import BytesIO
 from datetime import datetime
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from typing import TYPE_CHECKING
+
+from colosseo_config import cargar_entorno
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Cargar variables de entorno desde .env
-load_dotenv()
+cargar_entorno()
 
 # Configuración de Supabase desde variables de entorno
 SUPABASE_URL = os.environ.get('SUPABASE_URL', '')
@@ -18,14 +22,15 @@ SUPABASE_KEY = os.environ.get('SUPABASE_KEY', '')
 BUCKET_NAME = 'colosseo-files'
 
 
-def get_supabase_client() -> Client:
-    """Obtiene el cliente de Supabase"""
+def get_supabase_client() -> 'Client':
+    """Obtiene el cliente de Supabase (el paquete se importa en el primer uso)"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("SUPABASE_URL y SUPABASE_KEY deben estar configurados")
+    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
-def ensure_bucket_exists(supabase: Client):
+def ensure_bucket_exists(supabase: 'Client'):
     """Crea el bucket si no existe"""
     try:
         supabase.storage.get_bucket(BUCKET_NAME)
@@ -156,6 +161,143 @@ def is_configured() -> bool:
     return bool(SUPABASE_URL and SUPABASE_KEY)
 
 
+def read_bytes(path: str) -> dict:
+    """
+    Lee un objeto desde Supabase Storage o, si no está configurado, desde disco local.
+
+    Args:
+        path: Ruta del objeto (ej: 'historico/manifest.json')
+
+    Returns:
+        dict con 'success', 'data' (bytes) o 'error'
+    """
+    if is_configured():
+        return download_file(path)
+
+    try:
+        with open(path, 'rb') as f:
+            return {'success': True, 'data': f.read()}
+    except FileNotFoundError:
+        return {'success': False, 'error': f'Archivo no encontrado: {path}'}
+    except Exception as e:
+        return {'success': False, 'error': f'Error leyendo archivo: {str(e)}'}
+
+
+def write_bytes(path: str, data: bytes, content_type: str = 'application/octet-stream') -> dict:
+    """
+    Escribe (reemplaza) un objeto en Supabase Storage o en disco local.
+    Si la subida a Supabase falla, se guarda localmente como respaldo.
+
+    Args:
+        path: Ruta del objeto
+        data: Contenido en bytes
+        content_type: Tipo MIME del contenido
+
+    Returns:
+        dict con 'success', 'path', 'local' y opcionalmente 'warning'
+
+    Raises:
+        OSError: Si falla la escritura local (ej: archivo abierto en Excel)
+    """
+    warning = None
+
+    if is_configured():
+        try:
+            supabase = get_supabase_client()
+            ensure_bucket_exists(supabase)
+
+            # Eliminar archivo anterior
+            try:
+                supabase.storage.from_(BUCKET_NAME).remove([path])
+            except:
+                pass
+
+            supabase.storage.from_(BUCKET_NAME).upload(
+                path,
+                data,
+                file_options={"content-type": content_type, "upsert": "true"}
+            )
+            return {'success': True, 'path': path, 'local': False}
+        except Exception as e:
+            warning = f"No se pudo guardar en la nube: {str(e)}"
+
+    # Guardar localmente (los errores de disco se propagan al llamador)
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    result = {'success': True, 'path': path, 'local': True}
+    if warning:
+        result['warning'] = warning
+    return result
+
+
+def create_bytes(path: str, data: bytes, content_type: str = 'application/octet-stream') -> dict:
+    """
+    Crea un objeto solo si no existe (creación exclusiva), en Supabase
+    Storage o en disco local. Sirve de cerrojo entre procesos e instancias.
+
+    Args:
+        path: Ruta del objeto
+        data: Contenido en bytes
+        content_type: Tipo MIME del contenido
+
+    Returns:
+        dict con 'success', 'path' y 'local', o 'success' False con 'exists'
+        True si el objeto ya existía
+    """
+    if is_configured():
+        try:
+            supabase = get_supabase_client()
+            ensure_bucket_exists(supabase)
+            supabase.storage.from_(BUCKET_NAME).upload(
+                path,
+                data,
+                file_options={"content-type": content_type, "upsert": "false"}
+            )
+            return {'success': True, 'path': path, 'local': False}
+        except Exception as e:
+            mensaje = str(e)
+            if '409' in mensaje or 'Duplicate' in mensaje or 'already exists' in mensaje.lower():
+                return {'success': False, 'exists': True, 'path': path}
+            print(f"[Storage] No se pudo crear {path} en la nube, se usa disco local: {mensaje}")
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+    except FileExistsError:
+        return {'success': False, 'exists': True, 'path': path}
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return {'success': True, 'path': path, 'local': True}
+
+
+def delete_bytes(path: str) -> dict:
+    """
+    Elimina un objeto de Supabase Storage o de disco local (no falla si no existe).
+
+    Returns:
+        dict con 'success' o 'error'
+    """
+    if is_configured():
+        try:
+            get_supabase_client().storage.from_(BUCKET_NAME).remove([path])
+        except Exception as e:
+            return {'success': False, 'error': f"Error eliminando archivo: {str(e)}"}
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        return {'success': False, 'error': f"Error eliminando archivo: {str(e)}"}
+    return {'success': True}
+
+
 def get_auto_cookies() -> dict:
     """
     Obtiene las cookies automáticas guardadas por GitHub Actions.
@@ -201,7 +343,8 @@ def get_cached_availability() -> dict:
     Obtiene la disponibilidad cacheada desde Supabase (consultada por Railway).
 
     Returns:
-        dict con 'success', 'availability', 'timestamp' o 'error'
+        dict con 'success', 'availability', 'timestamp', 'source', 'version'
+        (id del último evento de cambio al guardarla, o None) o 'error'
     """
     try:
         if not is_configured():
@@ -221,7 +364,8 @@ def get_cached_availability() -> dict:
                 'success': True,
                 'availability': data.get('availability', {}),
                 'timestamp': data.get('timestamp', ''),
-                'source': data.get('source', 'unknown')
+                'source': data.get('source', 'unknown'),
+                'version': data.get('version')
             }
 
         except Exception as e:
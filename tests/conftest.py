@@ -0,0 +1,23 @@
+"""
+Configuración común de los tests: módulos de la raíz importables y
+almacenamiento en disco local (sin Supabase) dentro de un directorio
+temporal por test.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage_client  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def almacenamiento_local(tmp_path, monkeypatch):
+    """storage_client lee y escribe en tmp_path"""
+    monkeypatch.setattr(storage_client, 'SUPABASE_URL', '')
+    monkeypatch.setattr(storage_client, 'SUPABASE_KEY', '')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,101 @@
+import time
+
+import alertas_telegram
+
+
+AGOTADO = {'tipo': 'agotado', 'tour': 'arena', 'fecha': '2030-06-01', 'hora': '09:00'}
+REABIERTO = {'tipo': 'reabierto', 'tour': 'arena', 'fecha': '2030-06-02', 'hora': '10:00', 'capacidad': 5}
+
+
+class Despachador(alertas_telegram.DespachadorAlertas):
+    """Despachador síncrono que registra los textos en lugar de llamar a Telegram"""
+
+    def __init__(self, respuestas, **kwargs):
+        super().__init__('token', 'chat', sincrono=True, **kwargs)
+        self.respuestas = list(respuestas)
+        self.textos = []
+
+    def _enviar(self, texto, intentos=3, limite=None):
+        self.textos.append(texto)
+        return self.respuestas.pop(0)
+
+
+def test_la_clave_se_registra_solo_tras_un_envio_correcto():
+    despachador = Despachador([False, True])
+
+    assert despachador.notificar([AGOTADO]) == 0
+    assert despachador.notificar([AGOTADO]) == 1
+    assert len(despachador.textos) == 2
+    assert despachador.notificar([AGOTADO]) == 0
+    assert len(despachador.textos) == 2
+    assert despachador.estadisticas['duplicados'] == 1
+
+
+def test_la_ventana_se_persiste_al_enviar():
+    Despachador([True]).notificar([AGOTADO, REABIERTO])
+
+    otro = Despachador([True])
+    assert otro.notificar([AGOTADO, REABIERTO]) == 0
+    assert otro.textos == []
+
+
+def test_los_pendientes_no_se_encolan_dos_veces():
+    despachador = alertas_telegram.DespachadorAlertas('token', 'chat', sincrono=False, persistir=False)
+    despachador._iniciar_hilo = lambda: None
+
+    assert despachador.notificar([AGOTADO]) == 1
+    assert despachador.notificar([AGOTADO]) == 0
+    _, claves = despachador._cola.get_nowait()
+
+    despachador.confirmar(claves, enviado=False)
+    assert despachador.notificar([AGOTADO]) == 1
+
+
+class Respuesta:
+    def __init__(self, status_code, datos=None):
+        self.status_code = status_code
+        self.ok = status_code == 200
+        self.text = ''
+        self._datos = datos or {}
+
+    def json(self):
+        return self._datos
+
+
+def test_un_429_no_duerme_mas_alla_del_limite_sincrono(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(alertas_telegram.requests, 'post', lambda *a, **kw: llamadas.append(kw) or
+                        Respuesta(429, {'parameters': {'retry_after': 30}}))
+    despachador = alertas_telegram.DespachadorAlertas('token', 'chat', sincrono=True, persistir=False,
+                                                      tiempo_maximo_sincrono=2)
+
+    inicio = time.time()
+    assert despachador.notificar([AGOTADO]) == 0
+    assert time.time() - inicio < 2
+    assert len(llamadas) == 1
+    assert despachador.estadisticas['aplazados'] == 1 and despachador.estadisticas['errores'] == 0
+
+    # La clave quedó sin confirmar: el siguiente snapshot lo vuelve a alertar
+    monkeypatch.setattr(alertas_telegram.requests, 'post', lambda *a, **kw: Respuesta(200))
+    assert despachador.notificar([AGOTADO]) == 1
+
+
+def test_mensajes_que_no_caben_en_el_tiempo_se_aplazan(monkeypatch):
+    # Un mensaje por tipo, y 30s entre envíos: el segundo no cabe en 2s
+    monkeypatch.setattr(alertas_telegram, 'MAX_CARACTERES', 100)
+    textos = []
+    monkeypatch.setattr(alertas_telegram.requests, 'post',
+                        lambda *a, **kw: textos.append(kw['json']['text']) or Respuesta(200))
+    despachador = alertas_telegram.DespachadorAlertas('token', 'chat', sincrono=True, persistir=False,
+                                                      intervalo_minimo=30, tiempo_maximo_sincrono=2)
+
+    inicio = time.time()
+    assert despachador.notificar([AGOTADO, REABIERTO]) == 1
+    assert time.time() - inicio < 2
+    assert len(textos) == 1 and 'Agotados' in textos[0]
+    assert despachador.estadisticas['aplazados'] == 1
+
+    # Solo el aplazado se vuelve a alertar
+    despachador._enviados.clear()
+    assert despachador.notificar([AGOTADO, REABIERTO]) == 1
+    assert 'Reabiertos' in textos[1]
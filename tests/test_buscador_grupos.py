@@ -0,0 +1,63 @@
+import buscador_grupos
+
+
+def dias(*horarios):
+    """{(tour, fecha): [(hora, tour, capacidad)]} a partir de (tour, fecha, hora, capacidad)"""
+    resultado = {}
+    for tour, fecha, hora, capacidad in horarios:
+        resultado.setdefault((tour, fecha), []).append((hora, tour, capacidad))
+    for lista in resultado.values():
+        lista.sort()
+    return resultado
+
+
+def test_ventanas_minimas():
+    assert buscador_grupos.ventanas_minimas([10, 30, 5, 20, 25], 40) == [(0, 2), (3, 5)]
+    assert buscador_grupos.ventanas_minimas([50, 10], 40) == [(0, 1)]
+    assert buscador_grupos.ventanas_minimas([10, 10, 10], 40) == []
+    assert buscador_grupos.ventanas_minimas([10] * 6, 50, max_horarios=4) == []
+
+
+def test_horario_suelto_antes_que_combinacion():
+    opciones = buscador_grupos.buscar(dias(('arena', '2030-06-01', '09:00', 45),
+                                           ('arena', '2030-06-01', '10:00', 20),
+                                           ('arena', '2030-06-02', '09:00', 25),
+                                           ('arena', '2030-06-02', '09:15', 25)), 42)
+
+    assert [(o['fecha'], o['hora_inicio'], o['num_horarios']) for o in opciones] == \
+        [('2030-06-01', '09:00', 1), ('2030-06-02', '09:00', 2)]
+    assert [h['personas'] for h in opciones[1]['horarios']] == [25, 17]
+
+
+def test_ordena_por_cercania_a_la_fecha_deseada():
+    opciones = buscador_grupos.buscar(dias(('arena', '2030-06-01', '09:00', 50),
+                                           ('arena', '2030-06-05', '11:00', 50),
+                                           ('arena', '2030-06-06', '09:00', 50)), 40,
+                                      fecha='2030-06-05', hora='10:00', limite=2)
+
+    assert [(o['fecha'], o['distancia_minutos']) for o in opciones] == [('2030-06-05', 60), ('2030-06-06', 1380)]
+
+
+def test_entre_tours_combina_horarios_del_mismo_dia():
+    datos = dias(('arena', '2030-06-01', '09:00', 20), ('underground', '2030-06-01', '09:15', 25))
+
+    assert buscador_grupos.buscar(datos, 42) == []
+    opciones = buscador_grupos.buscar(datos, 42, entre_tours=True)
+    assert [o['tours'] for o in opciones] == [['arena', 'underground']]
+
+
+def test_sin_coincidencias():
+    datos = dias(('arena', '2030-06-01', '09:00', 5), ('arena', '2030-06-01', '10:00', 5))
+
+    assert buscador_grupos.buscar(datos, 42) == []
+    assert buscador_grupos.buscar({}, 10) == []
+    assert buscador_grupos.buscar(datos, 0) == []
+
+
+def test_dias_desde_timeslots():
+    timeslots = [{'startDateTime': '2030-06-01T08:00:00Z', 'capacity': 10},
+                 {'startDateTime': '2030-06-01T07:00:00Z', 'capacity': 5},
+                 {'startDateTime': '2030-06-01T09:00:00Z', 'capacity': None}]
+
+    assert buscador_grupos.dias_desde_timeslots({'arena': timeslots}) == \
+        {('arena', '2030-06-01'): [('09:00', 'arena', 5), ('10:00', 'arena', 10)]}
@@ -0,0 +1,64 @@
+import json
+
+import app as app_module
+import codificacion_columnar
+from codificacion_columnar import DERIVADOS_FECHA, DERIVADOS_TIMESLOT
+
+
+def disponibilidad():
+    timeslots = [{'startDateTime': f'2030-06-0{d}T0{h}:00:00Z', 'capacity': d * h, 'originalCapacity': 50}
+                 for d in (1, 2) for h in (7, 8)]
+    availability = {
+        'arena': {'nombre': 'Arena', 'guid': 'g1', 'timeslots': timeslots},
+        'underground': {'nombre': 'Underground', 'guid': 'g2', 'timeslots': timeslots[:1]},
+    }
+    return app_module.formatear_disponibilidad_cacheada(
+        {'availability': availability, 'timestamp': '2030-05-01 10:00', 'source': 'railway-browser'})
+
+
+def filas(tabla, diccionarios):
+    """Tabla columnar -> lista de dicts con 'fecha' y 'hora' resueltas"""
+    n = len(next(iter(tabla.values()), []))
+    return [{clave: diccionarios[clave][valores[i]] if clave in diccionarios else valores[i]
+             for clave, valores in tabla.items()}
+            for i in range(n)]
+
+
+def sin(fila, derivados):
+    return {k: v for k, v in fila.items() if k not in derivados}
+
+
+def test_ida_y_vuelta_conserva_los_campos_no_derivados():
+    original = disponibilidad()
+    codificado = json.loads(json.dumps(codificacion_columnar.codificar(original)))
+    diccionarios = codificado['diccionarios']
+
+    assert codificado['encoding'] == 'columnar'
+    assert codificado['timestamp'] == original['timestamp']
+    assert len(diccionarios['fecha']) == len(set(diccionarios['fecha']))
+
+    for tour_key, tour in original['resultados'].items():
+        columnar = codificado['resultados'][tour_key]
+        assert columnar['nombre'] == tour['nombre'] and columnar['total_plazas'] == tour['total_plazas']
+        assert filas(columnar['fechas'], diccionarios) == [sin(f, DERIVADOS_FECHA) for f in tour['fechas']]
+        assert columnar['timeslots_en_fechas'] is True
+
+        horarios = [dict(sin(t, DERIVADOS_TIMESLOT), fecha=fecha)
+                    for fecha, lista in tour['timeslots_por_fecha'].items() for t in lista]
+        assert filas(columnar['timeslots'], diccionarios) == horarios
+
+
+def test_columnar_es_mas_pequeno():
+    original = disponibilidad()
+    assert len(json.dumps(codificacion_columnar.codificar(original))) < len(json.dumps(original))
+
+
+def test_timeslots_de_una_fecha():
+    timeslots = [{'hora': '09:00', 'capacidad': 5, 'capacidad_original': 50, 'disponible': True},
+                 {'hora': '10:00', 'capacidad': 0, 'capacidad_original': 50, 'disponible': False}]
+
+    codificado = codificacion_columnar.codificar_timeslots(timeslots)
+
+    assert codificado['diccionarios'] == {'fecha': [], 'hora': ['09:00', '10:00']}
+    assert filas(codificado['timeslots'], codificado['diccionarios']) == \
+        [sin(t, DERIVADOS_TIMESLOT) for t in timeslots]
@@ -0,0 +1,70 @@
+import gzip
+import json
+
+import pytest
+from flask import Response
+
+import app as app_module
+import compresion
+
+
+GRANDE = json.dumps({'fechas': [{'fecha': f'2030-06-{d:02d}', 'plazas': d} for d in range(1, 29)] * 10})
+
+
+@pytest.fixture(autouse=True)
+def sin_brotli(monkeypatch):
+    monkeypatch.setattr(compresion, 'BROTLI_DISPONIBLE', False)
+
+
+def responder(cuerpo, accept_encoding=None, **kwargs):
+    """Pasa una respuesta JSON por el after_request de la app"""
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding is not None else {}
+    with app_module.app.test_request_context(headers=headers):
+        return app_module.comprimir_json(Response(cuerpo, mimetype='application/json', **kwargs))
+
+
+def test_gzip_si_el_cliente_lo_acepta():
+    response = responder(GRANDE, 'gzip, deflate')
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert gzip.decompress(response.get_data()).decode('utf-8') == GRANDE
+
+
+def test_sin_accept_encoding_no_comprime_pero_varia():
+    for accept_encoding in (None, 'identity', 'gzip;q=0'):
+        response = responder(GRANDE, accept_encoding)
+
+        assert 'Content-Encoding' not in response.headers
+        assert 'Accept-Encoding' in response.vary
+        assert response.get_data(as_text=True) == GRANDE
+
+
+def test_respuestas_pequenas_o_no_json_sin_tocar():
+    pequena = responder('{"ok": true}', 'gzip')
+    assert 'Content-Encoding' not in pequena.headers
+    assert 'Accept-Encoding' not in pequena.vary
+
+    with app_module.app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+        html = app_module.comprimir_json(Response(GRANDE, mimetype='text/html'))
+    assert 'Content-Encoding' not in html.headers
+
+    error = responder(GRANDE, 'gzip', status=500)
+    assert 'Content-Encoding' not in error.headers
+
+
+def test_elegir_codificacion_prefiere_brotli(monkeypatch):
+    monkeypatch.setattr(compresion, 'BROTLI_DISPONIBLE', True)
+    with app_module.app.test_request_context(headers={'Accept-Encoding': 'gzip, br'}):
+        assert compresion.elegir_codificacion(app_module.request.accept_encodings) == 'br'
+    with app_module.app.test_request_context(headers={'Accept-Encoding': 'gzip, br;q=0.5'}):
+        assert compresion.elegir_codificacion(app_module.request.accept_encodings) == 'gzip'
+
+
+def test_variantes_precalculadas_se_comprimen_una_vez():
+    variantes = compresion.VariantesComprimidas(GRANDE.encode('utf-8'))
+
+    primera = variantes.obtener('gzip')
+    assert variantes.obtener('gzip') is primera
+    assert gzip.decompress(primera) == GRANDE.encode('utf-8')
+    assert variantes.obtener(None) == GRANDE.encode('utf-8')
@@ -0,0 +1,93 @@
+import pytest
+
+import app as app_module
+import diff_snapshots
+import historico_store
+import storage_client
+
+
+def timeslot(inicio, capacidad, original=50):
+    return {'startDateTime': inicio, 'capacity': capacidad, 'originalCapacity': original}
+
+
+def availability(capacidad_1_junio=40, con_2_junio=True):
+    timeslots = [timeslot('2030-06-01T07:00:00Z', capacidad_1_junio)]
+    if con_2_junio:
+        timeslots.append(timeslot('2030-06-02T07:00:00Z', 30))
+    return {
+        'arena': {'nombre': 'Arena', 'guid': 'g1', 'timeslots': timeslots},
+        '24h-grupos': {'nombre': 'Grupos', 'guid': 'g2', 'timeslots': [timeslot('2030-06-01T08:00:00Z', 10)]},
+    }
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(app_module, '_respuesta_cacheada',
+                        {'clave': None, 'datos': None, 'cuerpos': {}, 'deltas': {}, 'consultado': 0.0})
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
+
+
+def publicar(monkeypatch, datos, timestamp):
+    """Registra el snapshot como Railway y lo deja como disponibilidad cacheada"""
+    _, version = diff_snapshots.registrar([(timestamp, historico_store.snapshot_desde_availability(datos))])
+    monkeypatch.setattr(storage_client, 'get_cached_availability', lambda: {
+        'success': True, 'availability': datos, 'timestamp': timestamp, 'source': 'railway-browser',
+        'version': version})
+    app_module._respuesta_cacheada['consultado'] = 0.0
+    return version
+
+
+def test_delta_solo_con_las_fechas_cambiadas():
+    datos = app_module.formatear_disponibilidad_cacheada(
+        {'availability': availability(), 'timestamp': '2030-05-01T10:00:00Z', 'source': 'railway-browser'})
+    datos['version'] = 7
+
+    delta = app_module.delta_disponibilidad(datos, 5, {('arena', '2030-06-02'), ('arena', '2030-06-03')})
+
+    assert delta['delta'] is True and delta['desde'] == 5 and delta['version'] == 7
+    arena = delta['resultados']['arena']
+    assert [f['fecha'] for f in arena['fechas']] == ['2030-06-02']
+    assert arena['fechas'][0]['num_timeslots'] == 1 and 'timeslots' not in arena['fechas'][0]
+    assert arena['eliminadas'] == ['2030-06-03']
+    assert arena['total_fechas'] == 2
+    assert delta['resultados']['24h-grupos']['fechas'] == []
+    assert delta['resultados']['24h-grupos']['eliminadas'] == []
+
+
+def test_endpoint_delta(monkeypatch, cliente):
+    hoy = historico_store.timestamp_actual()[:10]
+    inicial = publicar(monkeypatch, availability(), f'{hoy} 00:00')
+    actual = publicar(monkeypatch, availability(capacidad_1_junio=0, con_2_junio=False), f'{hoy} 00:01')
+    assert (inicial, actual) == (0, 2)
+
+    delta = cliente.get(f'/api/availability/delta?since={inicial}').get_json()
+    assert delta['delta'] is True and delta['version'] == actual
+    arena = delta['resultados']['arena']
+    assert [(f['fecha'], f['plazas_disponibles']) for f in arena['fechas']] == [('2030-06-01', 0)]
+    assert arena['eliminadas'] == ['2030-06-02']
+
+    sin_cambios = cliente.get(f'/api/availability/delta?since={actual}').get_json()
+    assert sin_cambios['delta'] is True
+    assert all(not t['fechas'] and not t['eliminadas'] for t in sin_cambios['resultados'].values())
+
+
+def test_endpoint_delta_sin_version_conocida_devuelve_el_snapshot(monkeypatch, cliente):
+    hoy = historico_store.timestamp_actual()[:10]
+    publicar(monkeypatch, availability(), f'{hoy} 00:00')
+
+    completo = cliente.get('/api/availability/delta?since=5').get_json()
+    assert 'delta' not in completo
+    assert [f['fecha'] for f in completo['resultados']['arena']['fechas']] == ['2030-06-01', '2030-06-02']
+
+    assert cliente.get('/api/availability/delta?since=-1').status_code == 400
+
+
+def test_la_version_no_avanza_con_guardados_que_no_son_la_cache(monkeypatch, cliente):
+    hoy = historico_store.timestamp_actual()[:10]
+    version = publicar(monkeypatch, availability(), f'{hoy} 00:00')
+    # Un guardado desde la web registra eventos pero no cambia la caché
+    diff_snapshots.registrar([(f'{hoy} 00:05', historico_store.snapshot_desde_availability(
+        availability(capacidad_1_junio=0)))])
+
+    assert cliente.get('/api/availability/cached').get_json()['version'] == version
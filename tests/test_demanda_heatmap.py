@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import app as app_module
+import demanda_heatmap
+import historico_store
+
+
+T0, T1 = '2030-05-01 10:00', '2030-05-02 10:00'
+
+
+def horarios(capacidad):
+    return {('2030-06-01', '09:00'): {'capacidad': capacidad, 'capacidad_original': 50}}
+
+
+@pytest.fixture(autouse=True)
+def sin_cache(monkeypatch):
+    monkeypatch.setattr(demanda_heatmap, '_CACHE', {'heatmap': None, 'cargado': 0.0})
+
+
+def test_sin_agregado_no_se_reconstruye_en_la_lectura(monkeypatch):
+    monkeypatch.setattr(demanda_heatmap, 'reconstruir', lambda: pytest.fail('reconstruido en la lectura'))
+
+    assert demanda_heatmap.obtener_heatmap() is None
+    respuesta = app_module.app.test_client().get('/api/heatmap')
+    assert respuesta.status_code == 503
+
+
+def test_se_construye_al_registrar_y_se_sirve(monkeypatch):
+    def reconstruir():
+        # El histórico ya contiene el snapshot que se registra
+        heatmap = demanda_heatmap.HeatmapDemanda()
+        heatmap.agregar_snapshot({'arena': horarios(50)}, T0)
+        return heatmap
+
+    monkeypatch.setattr(demanda_heatmap, 'reconstruir', reconstruir)
+    demanda_heatmap.registrar_snapshots([(T0, {'arena': horarios(50)})])
+    demanda_heatmap.registrar_snapshots([(T1, {'arena': horarios(0)})])
+    monkeypatch.setattr(demanda_heatmap, '_CACHE', {'heatmap': None, 'cargado': 0.0})
+
+    respuesta = app_module.app.test_client().get('/api/heatmap?tour=arena')
+    assert respuesta.status_code == 200
+    data = json.loads(respuesta.data)
+    assert sum(n for dia in data['observaciones'] for hora in dia for n in hora) == 2
+
+
+def test_en_serverless_no_se_reconstruye(monkeypatch):
+    monkeypatch.setattr(historico_store, 'SERVERLESS', True)
+    monkeypatch.setattr(demanda_heatmap, 'reconstruir', lambda: pytest.fail('reconstruido en serverless'))
+
+    assert demanda_heatmap.registrar_snapshots([(T0, {'arena': horarios(50)})]) is None
+    assert demanda_heatmap.obtener_heatmap() is None
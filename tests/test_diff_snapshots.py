@@ -0,0 +1,119 @@
+import diff_snapshots
+from diff_snapshots import agrupar, diferenciar, combinar
+
+
+def horarios(fechas, horas=('09:00', '10:00'), capacidad=50):
+    return {(fecha, hora): {'capacidad': capacidad, 'capacidad_original': 50}
+            for fecha in fechas for hora in horas}
+
+
+JUNIO = ['2030-06-01', '2030-06-02']
+JULIO = ['2030-07-01', '2030-07-02']
+T0, T1, T2 = '2030-05-01 10:00', '2030-05-01 11:00', '2030-05-01 12:00'
+
+
+def tipos(eventos):
+    return sorted(e['tipo'] for e in eventos)
+
+
+def test_cambios_de_capacidad():
+    anterior = {'arena': horarios(JUNIO)}
+    actual = {'arena': horarios(JUNIO)}
+    actual['arena'][('2030-06-01', '09:00')]['capacidad'] = 0
+    actual['arena'][('2030-06-01', '10:00')]['capacidad'] = 30
+
+    eventos, omitidos = diferenciar(agrupar(anterior), agrupar(actual), T1)
+
+    assert tipos(eventos) == [diff_snapshots.AGOTADO, diff_snapshots.BAJADA_CAPACIDAD]
+    bajada = next(e for e in eventos if e['tipo'] == diff_snapshots.BAJADA_CAPACIDAD)
+    assert bajada['delta'] == 20
+    assert omitidos == 0
+
+
+def test_meses_con_el_mismo_hash_se_omiten():
+    anterior = {'arena': horarios(JUNIO + JULIO)}
+    actual = {'arena': horarios(JUNIO + JULIO)}
+    actual['arena'][('2030-07-01', '09:00')]['capacidad'] = 0
+
+    eventos, omitidos = diferenciar(agrupar(anterior), agrupar(actual), T1)
+
+    assert [e['fecha'] for e in eventos] == ['2030-07-01']
+    assert omitidos == 1
+
+
+def test_estructura_nuevos_y_eliminados():
+    anterior = {'arena': horarios(JUNIO)}
+    actual = {'arena': horarios(JUNIO + ['2030-06-03'])}
+    actual['arena'][('2030-06-01', '11:00')] = {'capacidad': 5, 'capacidad_original': 5}
+    del actual['arena'][('2030-06-02', '10:00')]
+
+    eventos, _ = diferenciar(agrupar(anterior), agrupar(actual), T1)
+
+    assert tipos(eventos) == [diff_snapshots.HORARIO_ELIMINADO, diff_snapshots.NUEVA_FECHA,
+                              diff_snapshots.NUEVO_HORARIO]
+    nueva = next(e for e in eventos if e['tipo'] == diff_snapshots.NUEVA_FECHA)
+    assert nueva['horarios'] == 2 and nueva['capacidad'] == 100
+
+
+def test_horarios_pasados_no_se_dan_por_eliminados():
+    anterior = {'arena': horarios(JUNIO)}
+    actual = {'arena': horarios(['2030-06-02'])}
+
+    eventos, _ = diferenciar(agrupar(anterior), agrupar(actual), '2030-06-01 18:00')
+
+    assert eventos == []
+
+
+def test_snapshot_parcial_no_elimina_tours_ni_meses_ausentes():
+    completo = {'arena': horarios(JUNIO + JULIO), '24h-grupos': horarios(JUNIO)}
+    parcial = {'arena': horarios(JUNIO)}
+
+    eventos, _ = diferenciar(agrupar(completo), agrupar(parcial), T1)
+
+    assert eventos == []
+
+
+def test_combinar_conserva_lo_ausente_y_descarta_meses_pasados():
+    anterior = agrupar({'arena': horarios(['2030-04-30'] + JUNIO + JULIO), '24h-grupos': horarios(JUNIO)})
+    parcial = {'arena': horarios(JUNIO, capacidad=40)}
+
+    meses, huellas = combinar(anterior, agrupar(parcial), T1)
+
+    assert sorted(meses['arena']) == ['2030-06', '2030-07']
+    assert meses['arena']['2030-06'][('2030-06-01', '09:00')] == (40, 50)
+    assert meses['24h-grupos'] == anterior[0]['24h-grupos']
+    assert huellas['arena']['2030-07'] == anterior[1]['arena']['2030-07']
+
+
+def test_guardado_parcial_seguido_de_completo():
+    completo = {'arena': horarios(JUNIO + JULIO), '24h-grupos': horarios(JUNIO)}
+    parcial = {'arena': horarios(JUNIO)}
+    parcial['arena'][('2030-06-01', '09:00')]['capacidad'] = 0
+    siguiente = {'arena': horarios(JUNIO + JULIO), '24h-grupos': horarios(JUNIO)}
+    siguiente['arena'][('2030-06-01', '09:00')]['capacidad'] = 0
+    siguiente['arena'][('2030-07-02', '10:00')]['capacidad'] = 10
+
+    assert diff_snapshots.registrar_snapshots([(T0, completo)]) == []
+    eventos_parcial = diff_snapshots.registrar_snapshots([(T1, parcial)])
+    eventos_completo = diff_snapshots.registrar_snapshots([(T2, siguiente)])
+
+    assert [(e['tipo'], e['fecha'], e['hora']) for e in eventos_parcial] == [
+        (diff_snapshots.AGOTADO, '2030-06-01', '09:00')]
+    assert [(e['tipo'], e['fecha'], e['hora']) for e in eventos_completo] == [
+        (diff_snapshots.BAJADA_CAPACIDAD, '2030-07-02', '10:00')]
+    assert [e['id'] for e in eventos_parcial + eventos_completo] == [1, 2]
+    assert diff_snapshots.secuencia_actual() == 2
+    assert [e['id'] for e in diff_snapshots.leer_eventos('2030-05-01')] == [1, 2]
+
+
+def test_registrar_devuelve_la_version_de_cada_snapshot():
+    completo = {'arena': horarios(JUNIO)}
+    siguiente = {'arena': horarios(JUNIO)}
+    siguiente['arena'][('2030-06-01', '09:00')]['capacidad'] = 0
+
+    assert diff_snapshots.registrar([(T0, completo)]) == ([], 0)
+    eventos, version = diff_snapshots.registrar([(T1, siguiente)])
+    assert [e['id'] for e in eventos] == [1]
+    assert version == 1
+    # Sin cambios la versión no avanza
+    assert diff_snapshots.registrar([(T2, siguiente)]) == ([], 1)
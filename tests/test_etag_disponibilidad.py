@@ -0,0 +1,77 @@
+import gzip
+
+import pytest
+
+import app as app_module
+import compresion
+import storage_client
+
+
+def availability(capacidad):
+    return {'arena': {'nombre': 'Arena', 'guid': 'g1', 'timeslots': [
+        {'startDateTime': '2030-06-01T07:00:00Z', 'capacity': capacidad, 'originalCapacity': 50}]}}
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(app_module, '_respuesta_cacheada',
+                        {'clave': None, 'datos': None, 'cuerpos': {}, 'deltas': {}, 'consultado': 0.0})
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
+
+
+def publicar(monkeypatch, capacidad, timestamp):
+    monkeypatch.setattr(storage_client, 'get_cached_availability', lambda: {
+        'success': True, 'availability': availability(capacidad), 'timestamp': timestamp,
+        'source': 'railway-browser', 'version': None})
+    app_module._respuesta_cacheada['consultado'] = 0.0
+
+
+def test_if_none_match_responde_304_hasta_el_siguiente_snapshot(monkeypatch, cliente):
+    publicar(monkeypatch, 40, '2030-05-01 10:00')
+    primera = cliente.get('/api/availability/cached')
+    etag = primera.headers['ETag']
+
+    assert primera.status_code == 200 and primera.get_json()['resultados']['arena']['total_plazas'] == 40
+    assert primera.headers['Cache-Control'] == 'no-cache'
+
+    revalidada = cliente.get('/api/availability/cached', headers={'If-None-Match': etag})
+    assert revalidada.status_code == 304
+    assert revalidada.data == b''
+    assert revalidada.headers['ETag'] == etag
+
+    # Otra vista (con detalle) es otra representación con otro ETag
+    detalle = cliente.get('/api/availability/cached?detalle=1', headers={'If-None-Match': etag})
+    assert detalle.status_code == 200 and detalle.headers['ETag'] != etag
+
+    publicar(monkeypatch, 35, '2030-05-01 10:05')
+    nueva = cliente.get('/api/availability/cached', headers={'If-None-Match': etag})
+    assert nueva.status_code == 200 and nueva.headers['ETag'] != etag
+    assert nueva.get_json()['resultados']['arena']['total_plazas'] == 35
+
+
+def test_etag_por_codificacion(monkeypatch, cliente):
+    monkeypatch.setattr(compresion, 'UMBRAL_BYTES', 0)
+    monkeypatch.setattr(compresion, 'BROTLI_DISPONIBLE', False)
+    publicar(monkeypatch, 40, '2030-05-01 10:00')
+
+    plano = cliente.get('/api/availability/cached', headers={'Accept-Encoding': 'identity'})
+    comprimido = cliente.get('/api/availability/cached', headers={'Accept-Encoding': 'gzip'})
+
+    assert comprimido.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(comprimido.data) == plano.data
+    assert comprimido.headers['ETag'] != plano.headers['ETag']
+
+    revalidada = cliente.get('/api/availability/cached', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': comprimido.headers['ETag']})
+    assert revalidada.status_code == 304
+    assert 'Content-Encoding' not in revalidada.headers
+
+
+def test_sin_datos_cacheados_404(monkeypatch, cliente):
+    monkeypatch.setattr(storage_client, 'get_cached_availability',
+                        lambda: {'success': False, 'error': 'No hay caché'})
+
+    respuesta = cliente.get('/api/availability/cached')
+    assert respuesta.status_code == 404
+    assert respuesta.get_json()['cached'] is False
@@ -0,0 +1,81 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import export_streams
+import historico_store
+import series_index
+
+
+COLUMNAS = export_streams.COLUMNAS_RESULTADOS
+
+
+def resultados(n):
+    fechas = [{'fecha': f'2030-06-{i % 28 + 1:02d}', 'dia_semana': 'Sábado', 'plazas_disponibles': i,
+               'plazas_totales': 50, 'porcentaje_ocupado': 12.5, 'estado': 'disponible'}
+              for i in range(n)]
+    return {'arena': {'nombre': 'Arena, "Gladiadores"', 'fechas': fechas}}
+
+
+@pytest.fixture(autouse=True)
+def bloques_pequenos(monkeypatch):
+    # Varias filas por bloque y un resto, para probar los cortes de bloque
+    monkeypatch.setattr(export_streams, 'FILAS_POR_BLOQUE', 3)
+    monkeypatch.setattr(series_index, '_PARTICIONES', {})
+    monkeypatch.setattr(series_index, '_ESTADO', {'verificado': 0.0, 'orden': []})
+
+
+def leer_csv(texto):
+    assert texto.startswith('﻿')
+    return list(csv.reader(io.StringIO(texto[1:])))
+
+
+def esperado(n):
+    return [[str(v) for v in fila] for fila in export_streams.filas_resultados(resultados(n))]
+
+
+def test_csv_ida_y_vuelta():
+    chunks = list(export_streams.codificar(export_streams.filas_resultados(resultados(7)), COLUMNAS, 'csv'))
+
+    assert len(chunks) == 3
+    filas = leer_csv(b''.join(chunks).decode('utf-8'))
+    assert filas[0] == COLUMNAS
+    assert filas[1:] == esperado(7)
+
+
+def test_csv_gz_ida_y_vuelta():
+    datos = b''.join(export_streams.codificar(export_streams.filas_resultados(resultados(7)), COLUMNAS, 'csv.gz'))
+
+    filas = leer_csv(gzip.decompress(datos).decode('utf-8'))
+    assert filas[0] == COLUMNAS
+    assert filas[1:] == esperado(7)
+
+
+def test_ndjson_ida_y_vuelta():
+    datos = b''.join(export_streams.codificar(export_streams.filas_resultados(resultados(7)), COLUMNAS, 'ndjson'))
+
+    objetos = [json.loads(linea) for linea in datos.decode('utf-8').splitlines()]
+    assert objetos == [dict(zip(COLUMNAS, fila)) for fila in export_streams.filas_resultados(resultados(7))]
+
+
+def test_sin_filas():
+    assert leer_csv(b''.join(export_streams.codificar(iter([]), COLUMNAS, 'csv')).decode('utf-8')) == [COLUMNAS]
+    assert b''.join(export_streams.codificar(iter([]), COLUMNAS, 'ndjson')) == b''
+    datos = b''.join(export_streams.codificar(iter([]), COLUMNAS, 'csv.gz'))
+    assert leer_csv(gzip.decompress(datos).decode('utf-8')) == [COLUMNAS]
+
+
+def test_filas_historico_omiten_horarios_ausentes():
+    historico_store.registrar_snapshots([
+        ('2030-05-01 10:00', {'arena': {('2030-06-01', '09:00'): {'capacidad': 40, 'capacidad_original': 50}}}),
+        ('2030-05-01 11:00', {'arena': {('2030-06-01', '10:00'): {'capacidad': 30, 'capacidad_original': 50}}}),
+    ])
+    particiones = historico_store.particiones_ordenadas(historico_store.cargar_manifest())
+
+    filas = list(export_streams.filas_historico(particiones))
+
+    assert filas == [['arena', '2030-06-01', '10:00', 50, '2030-05-01 10:00', 40],
+                     ['arena', '2030-06-01', '11:00', 50, '2030-05-01 11:00', 30]]
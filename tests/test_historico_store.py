@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+
+import pytest
+
+import diff_snapshots
+import historico_store
+import series_index
+import storage_client
+
+
+T0, T1, T2 = '2030-05-01 10:00', '2030-05-01 11:00', '2030-05-01 12:00'
+
+
+def datos(capacidades, original=50):
+    return {(fecha, hora): {'capacidad': capacidad, 'capacidad_original': original}
+            for (fecha, hora), capacidad in capacidades.items()}
+
+
+def columnas(ws):
+    """{(fecha, hora): [valores]} y headers de las columnas de snapshot"""
+    headers = historico_store._headers_snapshot(ws)
+    valores = {}
+    for row in ws.iter_rows(min_row=2, values_only=True):
+        valores[(row[0], row[1])] = list(row[historico_store.COLUMNAS_FIJAS:])
+    return headers, valores
+
+
+@pytest.fixture(autouse=True)
+def sin_cache_de_indices(monkeypatch):
+    monkeypatch.setattr(series_index, '_PARTICIONES', {})
+    monkeypatch.setattr(series_index, '_ESTADO', {'verificado': 0.0, 'orden': []})
+
+
+def test_escribir_columna_al_final_y_horarios_nuevos():
+    wb = historico_store._nuevo_workbook()
+    historico_store.escribir_columna(wb, 'arena', datos({('2030-06-01', '09:00'): 40}), T0)
+    escritos = historico_store.escribir_columna(
+        wb, 'arena', datos({('2030-06-01', '10:00'): 30}), T1)
+
+    headers, valores = columnas(wb['arena'])
+    assert escritos == 1
+    assert headers == [T0, T1]
+    assert valores[('2030-06-01', '09:00')] == [40, '-']
+    assert valores[('2030-06-01', '10:00')] == [None, 30]
+
+
+def test_escribir_columna_es_idempotente():
+    wb = historico_store._nuevo_workbook()
+    clave = ('2030-06-01', '09:00')
+    historico_store.escribir_columna(wb, 'arena', datos({clave: 40}), T0)
+    historico_store.escribir_columna(wb, 'arena', datos({clave: 0}), T1)
+    historico_store.escribir_columna(wb, 'arena', datos({clave: 0}), T1)
+    historico_store.escribir_columna(wb, 'arena', datos({clave: 40}), T0)
+
+    headers, valores = columnas(wb['arena'])
+    assert headers == [T0, T1]
+    assert valores[clave] == [40, 0]
+    # La columna reemplazada no conserva el formato de agotado
+    celda = wb['arena'].cell(row=2, column=historico_store.COLUMNAS_FIJAS + 1)
+    assert not celda.font.bold
+
+
+def test_registrar_snapshots_particiona_por_mes():
+    clave = ('2030-06-01', '09:00')
+    historico_store.registrar_snapshots([('2030-05-31 23:00', {'arena': datos({clave: 40})}),
+                                         ('2030-06-01 08:00', {'arena': datos({clave: 30})})])
+
+    particiones = historico_store.particiones_ordenadas(historico_store.cargar_manifest())
+    assert [(p['clave'], p['columnas']) for p in particiones] == [('2030-05', 1), ('2030-06', 1)]
+    assert historico_store.seleccionar_particiones(historico_store.cargar_manifest(), desde='2030-06') \
+        == particiones[1:]
+
+
+def test_escribir_columna_backfill_inserta_en_orden():
+    wb = historico_store._nuevo_workbook()
+    clave = ('2030-06-01', '09:00')
+    historico_store.escribir_columna(wb, 'arena', datos({clave: 40}), T0)
+    historico_store.escribir_columna(wb, 'arena', datos({clave: 20}), T2)
+    historico_store.escribir_columna(wb, 'arena', datos({clave: 30}), T1)
+
+    headers, valores = columnas(wb['arena'])
+    assert headers == [T0, T1, T2]
+    assert valores[clave] == [40, 30, 20]
+
+
+def test_registrar_snapshots_backfill_actualiza_particion_e_indice():
+    clave = ('2030-06-01', '09:00')
+    historico_store.registrar_snapshots([(T0, {'arena': datos({clave: 40})}),
+                                         (T2, {'arena': datos({clave: 20})})])
+    result = historico_store.registrar_snapshots([(T1, {'arena': datos({clave: 30})})])
+
+    assert result['success']
+    assert result['particiones'][0]['insertados'] == 1
+    manifest = historico_store.cargar_manifest()
+    assert [p['columnas'] for p in historico_store.particiones_ordenadas(manifest)] == [3]
+
+    serie = series_index.consultar_serie('arena', '2030-06-01', '09:00')
+    assert serie == {'puntos': [[T0, 40], [T1, 30], [T2, 20]], 'capacidad_original': 50}
+
+
+def test_backfill_reconstruye_el_indice_desde_el_workbook():
+    a, b = ('2030-06-01', '09:00'), ('2030-06-01', '10:00')
+    historico_store.registrar_snapshots([(T0, {'arena': datos({a: 40, b: 10})}),
+                                         (T2, {'arena': datos({a: 20, b: 10})})])
+    # En T1 el horario b no aparece: solo el workbook completo lo sabe
+    historico_store.registrar_snapshots([(T1, {'arena': datos({a: 30})})])
+
+    entrada = historico_store.particiones_ordenadas(historico_store.cargar_manifest())[0]
+    series_index._PARTICIONES.clear()
+    guardado = series_index.cargar_indice(entrada)
+    reconstruido = series_index.construir_desde_workbook(entrada['path'])
+
+    assert guardado.to_dict() == reconstruido.to_dict()
+    assert guardado.consultar('arena', *b) == [[T0, 10], [T1, None], [T2, 10]]
+
+
+def test_mismas_claves_desde_railway_y_desde_consultar_en_verano():
+    import app as app_module
+
+    crudos = [{'startDateTime': '2030-07-01T07:00:00Z', 'endDateTime': '2030-07-01T08:00:00Z',
+               'capacity': 20, 'originalCapacity': 50},
+              {'startDateTime': '2030-07-01T22:30:00Z', 'endDateTime': '2030-07-01T23:30:00Z',
+               'capacity': 5, 'originalCapacity': 50}]
+    timeslots = app_module.obtener_timeslots_detallados(None, 'guid', [], [('2030-07', crudos, 200, '')])
+    por_fecha = {}
+    for ts in timeslots:
+        por_fecha.setdefault(ts['fecha'], []).append(ts)
+
+    desde_consultar = historico_store.snapshot_desde_resultados({'arena': {'timeslots_por_fecha': por_fecha}})
+    desde_railway = historico_store.snapshot_desde_availability({'arena': {'timeslots': crudos}})
+
+    # CEST: UTC+2, y el último horario ya es del día siguiente en Roma
+    assert sorted(desde_railway['arena']) == [('2030-07-01', '09:00'), ('2030-07-02', '00:30')]
+    assert desde_consultar == desde_railway
+
+
+def test_resultados_sin_start_datetime_conservan_fecha_y_hora():
+    resultados = {'arena': {'timeslots_por_fecha': {'2030-01-10': [{'hora': '09:00', 'capacidad': 3}]}}}
+
+    assert historico_store.snapshot_desde_resultados(resultados) == {
+        'arena': {('2030-01-10', '09:00'): {'capacidad': 3, 'capacidad_original': 3}}}
+
+
+def test_bloqueo_de_escritura_es_exclusivo():
+    with historico_store.bloqueo_escritura():
+        with pytest.raises(historico_store.HistoricoOcupado):
+            with historico_store.bloqueo_escritura(espera=0):
+                pass
+
+    # Liberado al salir
+    with historico_store.bloqueo_escritura(espera=0):
+        pass
+
+
+def test_bloqueo_caducado_se_libera():
+    storage_client.write_bytes(historico_store.BLOQUEO_PATH,
+                               json.dumps({'token': 'muerto', 'expira': time.time() - 1}).encode('utf-8'))
+
+    with historico_store.bloqueo_escritura(espera=0):
+        assert historico_store._leer_bloqueo()['token'] != 'muerto'
+    assert historico_store._leer_bloqueo() is None
+
+
+def test_registrar_snapshots_ocupado(monkeypatch):
+    monkeypatch.setattr(historico_store, 'BLOQUEO_ESPERA', 0)
+
+    with historico_store.bloqueo_escritura():
+        with pytest.raises(historico_store.HistoricoOcupado):
+            historico_store.registrar_snapshot({'arena': datos({('2030-06-01', '09:00'): 40})}, T0)
+
+
+def test_escrituras_concurrentes_se_serializan():
+    clave = ('2030-06-01', '09:00')
+    historico_store.registrar_snapshots([(T0, {'arena': datos({clave: 40})})])
+    inicio = threading.Barrier(4)
+    errores = []
+
+    def escribir(minuto):
+        try:
+            inicio.wait()
+            historico_store.registrar_snapshots(
+                [(f'2030-05-01 10:{minuto:02d}', {'arena': datos({clave: 40 - minuto})})])
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=escribir, args=(m,)) for m in (1, 2, 3, 4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert errores == []
+    manifest = historico_store.cargar_manifest()
+    assert [p['columnas'] for p in manifest['particiones']] == [5]
+    # Cada escritura leyó el estado de la anterior: ids de evento sin repetir
+    ids = [e['id'] for e in diff_snapshots.leer_eventos('2030-05-01')]
+    assert len(ids) == len(set(ids)) and ids == sorted(ids)
+    assert diff_snapshots.secuencia_actual() == len(ids)
@@ -0,0 +1,77 @@
+import random
+from datetime import date
+
+import pytest
+
+from indice_disponibilidad import IndiceDisponibilidad
+
+
+def snapshot(semilla=3):
+    azar = random.Random(semilla)
+    datos = {}
+    for tour in ('arena', 'underground', '24h-grupos'):
+        horarios = datos.setdefault(tour, {})
+        for _ in range(300):
+            clave = (f'2030-06-{azar.randint(1, 30):02d}', f'{azar.randint(8, 17):02d}:{azar.choice(["00", "15", "30"])}')
+            horarios[clave] = {'capacidad': azar.randint(0, 40), 'capacidad_original': 40}
+    return datos
+
+
+def fuerza_bruta(datos, tours=None, desde=None, hasta=None, dias_semana=None,
+                 hora_desde=None, hora_hasta=None, min_plazas=None):
+    filas = []
+    for tour, horarios in datos.items():
+        for (fecha, hora), valores in horarios.items():
+            if tours and tour not in tours:
+                continue
+            if (desde and fecha < desde) or (hasta and fecha > hasta):
+                continue
+            if dias_semana and date.fromisoformat(fecha).weekday() not in dias_semana:
+                continue
+            if (hora_desde and hora < hora_desde) or (hora_hasta and hora > hora_hasta):
+                continue
+            if valores['capacidad'] < (min_plazas or 0):
+                continue
+            filas.append({'tour': tour, 'fecha': fecha, 'hora': hora, 'capacidad': valores['capacidad'],
+                          'capacidad_original': valores['capacidad_original']})
+    return sorted(filas, key=lambda f: (f['fecha'], f['hora'], f['tour']))
+
+
+@pytest.mark.parametrize('filtros', [
+    {},
+    {'desde': '2030-06-10', 'hasta': '2030-06-12'},
+    {'tours': ['arena', '24h-grupos'], 'desde': '2030-06-05'},
+    {'dias_semana': [5, 6], 'min_plazas': 20},
+    {'hora_desde': '09:30', 'hora_hasta': '11:15', 'hasta': '2030-06-20'},
+    {'tours': ['underground'], 'dias_semana': [0], 'hora_desde': '16:00', 'min_plazas': 5},
+    {'tours': ['inexistente']},
+    {'desde': '2030-07-01'},
+])
+def test_buscar_coincide_con_fuerza_bruta(filtros):
+    datos = snapshot()
+    esperado = fuerza_bruta(datos, **filtros)
+
+    resultado = IndiceDisponibilidad(datos).buscar(limite=None, **filtros)
+
+    assert resultado == {'total': len(esperado), 'slots': esperado}
+
+
+def test_limite_corta_slots_pero_cuenta_el_total():
+    datos = snapshot()
+    esperado = fuerza_bruta(datos, min_plazas=10)
+
+    resultado = IndiceDisponibilidad(datos).buscar(min_plazas=10, limite=5)
+
+    assert resultado['total'] == len(esperado)
+    assert resultado['slots'] == esperado[:5]
+
+
+def test_horarios_por_dia():
+    datos = {'arena': {('2030-06-01', '10:00'): {'capacidad': 3, 'capacidad_original': 40},
+                       ('2030-06-01', '09:00'): {'capacidad': 5, 'capacidad_original': 40},
+                       ('2030-06-03', '09:00'): {'capacidad': 1, 'capacidad_original': 40}},
+             'underground': {('2030-06-01', '09:00'): {'capacidad': 7, 'capacidad_original': 40}}}
+
+    dias = IndiceDisponibilidad(datos).horarios_por_dia(tours=['arena'], hasta='2030-06-02')
+
+    assert dias == {('arena', '2030-06-01'): [('09:00', 'arena', 5), ('10:00', 'arena', 3)]}
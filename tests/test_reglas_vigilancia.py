@@ -0,0 +1,61 @@
+import diff_snapshots
+import reglas_vigilancia
+
+
+def horarios(fechas, horas=('09:00', '10:00'), capacidad=50):
+    return {(fecha, hora): {'capacidad': capacidad, 'capacidad_original': 50}
+            for fecha in fechas for hora in horas}
+
+
+JUNIO = ['2030-06-01', '2030-06-02']
+JULIO = ['2030-07-01', '2030-07-02']
+T0, T1 = '2030-05-01 10:00', '2030-05-01 11:00'
+
+
+def agregar_regla(tour='*', min_plazas=10):
+    return reglas_vigilancia.agregar_regla(
+        {'tour': tour, 'desde': '2030-06-01', 'hasta': '2030-07-31', 'min_plazas': min_plazas})
+
+
+def claves(coincidencias, regla):
+    return sorted((h['tour'], h['fecha'], h['hora']) for h in coincidencias.get(regla['id'], []))
+
+
+def test_evalua_el_ultimo_snapshot():
+    regla = agregar_regla(min_plazas=20)
+    snapshot = {'arena': horarios(JUNIO)}
+    snapshot['arena'][('2030-06-01', '09:00')]['capacidad'] = 5
+
+    coincidencias = reglas_vigilancia.registrar_snapshots([(T0, snapshot)])
+
+    assert claves(coincidencias, regla) == [
+        ('arena', '2030-06-01', '10:00'), ('arena', '2030-06-02', '09:00'), ('arena', '2030-06-02', '10:00')]
+    assert reglas_vigilancia.coincidencias_actuales()['coincidencias'] == coincidencias
+
+
+def test_guardado_parcial_conserva_los_otros_tours_y_meses():
+    regla = agregar_regla()
+    completo = {'arena': horarios(JUNIO + JULIO), '24h-grupos': horarios(JUNIO)}
+    reglas_vigilancia.registrar_snapshots([(T0, completo)])
+
+    # Solo arena y junio, ahora agotado
+    parcial = {'arena': horarios(JUNIO, capacidad=0)}
+    coincidencias = reglas_vigilancia.registrar_snapshots([(T1, parcial)])
+
+    assert claves(coincidencias, regla) == sorted(
+        [('arena', fecha, hora) for fecha in JULIO for hora in ('09:00', '10:00')]
+        + [('24h-grupos', fecha, hora) for fecha in JUNIO for hora in ('09:00', '10:00')])
+
+
+def test_guardado_parcial_tras_cambiar_las_reglas_usa_el_estado_de_los_eventos():
+    agregar_regla()
+    completo = {'arena': horarios(JUNIO), '24h-grupos': horarios(JUNIO)}
+    reglas_vigilancia.registrar_snapshots([(T0, completo)])
+    diff_snapshots.registrar_snapshots([(T0, completo)])
+
+    regla = agregar_regla(tour='24h-grupos')
+    parcial = {'arena': horarios(JUNIO)}
+    coincidencias = reglas_vigilancia.registrar_snapshots([(T1, parcial)])
+
+    assert claves(coincidencias, regla) == [
+        ('24h-grupos', fecha, hora) for fecha in JUNIO for hora in ('09:00', '10:00')]
@@ -0,0 +1,46 @@
+import time
+import uuid
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+
+RESULTADO = {'resultados': {'arena': {'fechas': [{'fecha': '2030-06-01'}]}}, 'timestamp': '2030-05-01 10:00:00'}
+
+
+@pytest.fixture(autouse=True)
+def ids_consecutivos(monkeypatch):
+    """Ids deterministas: el hueco de cada resultado no depende del azar"""
+    contador = iter(range(1, 1000))
+    monkeypatch.setattr(result_cache.uuid, 'uuid4', lambda: uuid.UUID(int=next(contador) << 96))
+
+
+def test_otra_instancia_lee_el_resultado_persistido():
+    result_id = ResultCache().guardar(RESULTADO)
+
+    assert ResultCache().obtener(result_id) == RESULTADO
+
+
+def test_expulsado_de_memoria_se_recupera_de_storage():
+    cache = ResultCache(max_items=1)
+    primero = cache.guardar(RESULTADO)
+    cache.guardar({'resultados': {}})
+
+    assert len(cache) == 1
+    assert cache.obtener(primero) == RESULTADO
+
+
+def test_expirado_o_hueco_reutilizado():
+    cache = ResultCache(ttl=60, huecos=1)
+    primero = cache.guardar(RESULTADO)
+    segundo = ResultCache(huecos=1).guardar({'resultados': {}})
+
+    # El hueco ahora es del segundo: otra instancia no encuentra el primero
+    assert ResultCache(huecos=1).obtener(primero) is None
+    assert ResultCache(huecos=1).obtener(segundo) == {'resultados': {}}
+    assert ResultCache(huecos=1).obtener('no-es-un-id') is None
+
+    cache._items[primero] = (time.time() - 120, RESULTADO)
+    assert cache.obtener(primero) is None
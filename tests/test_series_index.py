@@ -0,0 +1,78 @@
+import numpy as np
+
+from series_index import SeriesIndex
+
+
+T0, T1, T2, T3 = '2030-05-01 10:00', '2030-05-01 11:00', '2030-05-02 10:00', '2030-05-03 10:00'
+CLAVE = ('2030-06-01', '09:00')
+
+
+def snapshot(capacidades, original=50):
+    return {'arena': {clave: {'capacidad': capacidad, 'capacidad_original': original}
+                      for clave, capacidad in capacidades.items()}}
+
+
+def indice_con(*snapshots):
+    indice = SeriesIndex()
+    for timestamp, capacidades in snapshots:
+        indice.agregar_snapshot(snapshot(capacidades), timestamp)
+    return indice
+
+
+def test_solo_guarda_los_cambios():
+    indice = indice_con((T0, {CLAVE: 40}), (T1, {CLAVE: 40}), (T2, {CLAVE: 30}))
+
+    assert indice.snapshots == [T0, T1, T2]
+    assert indice.consultar('arena', *CLAVE) == [[T0, 40], [T2, 30]]
+    assert indice.capacidad_original('arena', *CLAVE) == 50
+
+
+def test_horario_que_desaparece_se_marca_con_none():
+    otra = ('2030-06-01', '10:00')
+    indice = indice_con((T0, {CLAVE: 40, otra: 10}), (T1, {CLAVE: 40}))
+
+    assert indice.consultar('arena', *otra) == [[T0, 10], [T1, None]]
+    assert indice.horas('arena', '2030-06-01') == ['09:00', '10:00']
+
+
+def test_rango_con_punto_inicial_vigente():
+    indice = indice_con((T0, {CLAVE: 40}), (T1, {CLAVE: 40}), (T2, {CLAVE: 30}), (T3, {CLAVE: 20}))
+
+    # T1 no tiene punto propio: se toma la capacidad vigente (40)
+    assert indice.consultar('arena', *CLAVE, desde=T1) == [[T1, 40], [T2, 30], [T3, 20]]
+    # 'hasta' es un prefijo inclusive
+    assert indice.consultar('arena', *CLAVE, desde='2030-05-01', hasta='2030-05-02') == [[T0, 40], [T2, 30]]
+    assert indice.consultar('arena', *CLAVE, hasta='2030-05-01') == [[T0, 40]]
+    assert indice.consultar('arena', '2030-06-02', '09:00') == []
+
+
+def test_backfill_inserta_en_su_posicion():
+    indice = indice_con((T0, {CLAVE: 40}), (T2, {CLAVE: 20}), (T1, {CLAVE: 30}))
+
+    assert indice.snapshots == [T0, T1, T2]
+    assert indice.consultar('arena', *CLAVE) == [[T0, 40], [T1, 30], [T2, 20]]
+
+
+def test_serializacion_conserva_los_activos():
+    otra = ('2030-06-01', '10:00')
+    indice = indice_con((T0, {CLAVE: 40, otra: 10}), (T1, {CLAVE: 40}))
+
+    copia = SeriesIndex.from_dict(indice.to_dict())
+    assert copia.activos == {'arena': {CLAVE}}
+    copia.agregar_snapshot(snapshot({}), T2)
+    assert copia.consultar('arena', *CLAVE) == [[T0, 40], [T2, None]]
+
+
+def test_matriz_capacidades():
+    otra = ('2030-06-02', '10:00')
+    indice = indice_con((T0, {CLAVE: 40}), (T1, {CLAVE: 30, otra: 5}), (T2, {otra: 5}))
+
+    claves, originales, matriz = indice.matriz_capacidades()
+    fila = {clave: matriz[i] for i, clave in enumerate(claves)}
+
+    np.testing.assert_array_equal(fila[('arena',) + CLAVE], [40, 30, np.nan])
+    np.testing.assert_array_equal(fila[('arena',) + otra], [np.nan, 5, 5])
+    np.testing.assert_array_equal(originales, [50, 50])
+
+    claves, _, _ = indice.matriz_capacidades(desde_fecha='2030-06-02')
+    assert claves == [('arena',) + otra]
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+import app as app_module
+import trabajos_consulta
+from trabajos_consulta import ColaLlena, GestorTrabajos, COMPLETADO
+
+
+def test_consulta_identica_en_curso_se_reutiliza():
+    gestor = GestorTrabajos(max_ejecutando=1)
+    liberar = threading.Event()
+    llamadas = []
+
+    def consulta(progreso):
+        llamadas.append(1)
+        liberar.wait(5)
+        return {'ok': True}
+
+    parametros = {'tours': ['arena'], 'meses': 2}
+    primero, duplicado_1 = gestor.enviar(parametros, consulta)
+    segundo, duplicado_2 = gestor.enviar(dict(parametros), consulta)
+    otro, duplicado_3 = gestor.enviar({'tours': ['arena'], 'meses': 3}, consulta)
+    liberar.set()
+    gestor._executor.shutdown(wait=True)
+
+    assert (segundo, duplicado_1, duplicado_2) == (primero, False, True)
+    assert otro != primero and not duplicado_3
+    assert len(llamadas) == 2
+    assert gestor.obtener(primero)['estado'] == COMPLETADO
+    assert gestor.obtener(primero)['resultado'] == {'ok': True}
+
+
+def test_cola_llena_rechaza_el_trabajo():
+    gestor = GestorTrabajos(max_ejecutando=1, max_pendientes=1)
+    liberar = threading.Event()
+    arrancado = threading.Event()
+
+    def consulta(progreso):
+        arrancado.set()
+        liberar.wait(5)
+        return {}
+
+    gestor.enviar({'n': 1}, consulta)
+    assert arrancado.wait(5)
+    gestor.enviar({'n': 2}, consulta)  # queda pendiente
+
+    with pytest.raises(ColaLlena):
+        gestor.enviar({'n': 3}, consulta)
+
+    liberar.set()
+    gestor._executor.shutdown(wait=True)
+
+
+def test_sin_proceso_persistente_los_endpoints_responden_501(monkeypatch):
+    monkeypatch.setattr(trabajos_consulta, 'DISPONIBLE', False)
+    cliente = app_module.app.test_client()
+
+    assert cliente.post('/api/consultar/trabajos', json={'tours': ['arena']}).status_code == 501
+    assert cliente.get('/api/consultar/trabajos/abc').status_code == 501
+    assert cliente.get('/api/consultar/trabajos/abc/resultado').status_code == 501
@@ -0,0 +1,43 @@
+import random
+
+from api_client import AvailabilityChecker
+from report_generator import ReportGenerator
+
+
+def timeslots(n, semilla=7):
+    azar = random.Random(semilla)
+    return [{'startDateTime': f'2030-06-{azar.randint(1, 28):02d}T{azar.randint(6, 16):02d}:{azar.choice(["00", "30"])}:00Z',
+             'capacity': azar.randint(0, 25), 'originalCapacity': 25,
+             'status': azar.choice(['available', 'available', 'available', 'closed'])}
+            for _ in range(n)]
+
+
+def test_heap_top_k_coincide_con_orden_completo():
+    tours = {'arena': timeslots(400), 'underground': timeslots(300, semilla=11)}
+    umbrales = {'arena': 10, 'underground': 15}
+
+    todos = AvailabilityChecker.find_most_urgent_slots(tours, umbrales, top_k=None)
+
+    assert todos == sorted(todos, key=lambda s: (s['capacidad'], s['fecha'], s['hora'], s['tour']))
+    assert all(0 < s['capacidad'] <= umbrales[s['tour']] for s in todos)
+    for k in (1, 5, 50, len(todos), len(todos) + 10):
+        assert AvailabilityChecker.find_most_urgent_slots(tours, umbrales, top_k=k) == todos[:k]
+
+
+def test_agotados_y_cerrados_no_son_urgentes():
+    slots = [{'startDateTime': '2030-06-01T07:00:00Z', 'capacity': 0, 'status': 'available'},
+             {'startDateTime': '2030-06-01T08:00:00Z', 'capacity': 2, 'status': 'closed'},
+             {'startDateTime': '2030-06-01T09:00:00Z', 'capacity': 3, 'status': 'available'}]
+
+    urgentes = AvailabilityChecker.find_most_urgent_slots({'arena': slots}, {'arena': 10})
+
+    # 09:00 UTC son las 11:00 en Roma en verano
+    assert [(s['hora'], s['capacidad'], s['urgencia']) for s in urgentes] == [('11:00', 3, 'ALTA')]
+
+
+def test_build_report_limita_urgentes():
+    slots = timeslots(200)
+    completo = ReportGenerator.build_report(slots, threshold=10, tour='arena', top_k=None)
+    limitado = ReportGenerator.build_report(slots, threshold=10, tour='arena', top_k=3)
+
+    assert limitado['urgent_slots'] == completo['urgent_slots'][:3]
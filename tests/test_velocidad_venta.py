@@ -0,0 +1,52 @@
+import pytest
+
+import historico_store
+import velocidad_venta
+
+
+T0, T1 = '2030-05-01 10:00', '2030-05-01 12:00'
+
+
+def horarios(capacidad):
+    return {('2030-06-01', '09:00'): {'capacidad': capacidad, 'capacidad_original': 50}}
+
+
+@pytest.fixture(autouse=True)
+def sin_cache(monkeypatch):
+    monkeypatch.setattr(velocidad_venta, '_CACHE', {'modelo': None, 'cargado': 0.0})
+
+
+def resultados(capacidad):
+    return {'arena': {'timeslots_por_fecha': {'2030-06-01': [{'hora': '09:00', 'capacidad': capacidad}]}}}
+
+
+def test_sin_modelo_no_se_reconstruye_en_la_lectura(monkeypatch):
+    monkeypatch.setattr(velocidad_venta, 'reconstruir', lambda: pytest.fail('reconstruido en la lectura'))
+
+    assert velocidad_venta.obtener_modelo() is None
+    anotados = velocidad_venta.anotar_resultados(resultados(40), T1)
+    assert 'velocidad' not in anotados['arena']['timeslots_por_fecha']['2030-06-01'][0]
+
+
+def test_se_construye_al_registrar_y_anota(monkeypatch):
+    def reconstruir():
+        # El histórico ya contiene el snapshot que se registra
+        modelo = velocidad_venta.ModeloVelocidad()
+        modelo.agregar_snapshot({'arena': horarios(50)}, T0)
+        return modelo
+
+    monkeypatch.setattr(velocidad_venta, 'reconstruir', reconstruir)
+    velocidad_venta.registrar_snapshots([(T0, {'arena': horarios(50)})])
+    velocidad_venta.registrar_snapshots([(T1, {'arena': horarios(40)})])
+    monkeypatch.setattr(velocidad_venta, '_CACHE', {'modelo': None, 'cargado': 0.0})
+
+    timeslot = velocidad_venta.anotar_resultados(resultados(40), T1)['arena']['timeslots_por_fecha']['2030-06-01'][0]
+    assert timeslot['velocidad'] > 0
+
+
+def test_en_serverless_no_se_reconstruye(monkeypatch):
+    monkeypatch.setattr(historico_store, 'SERVERLESS', True)
+    monkeypatch.setattr(velocidad_venta, 'reconstruir', lambda: pytest.fail('reconstruido en serverless'))
+
+    assert velocidad_venta.registrar_snapshots([(T0, {'arena': horarios(50)})]) is None
+    assert velocidad_venta.obtener_modelo() is None
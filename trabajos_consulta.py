@@ -0,0 +1,162 @@
+"""
+Trabajos asíncronos para consultas largas de disponibilidad.
+
+Una consulta de 6 meses y 2 tours hace muchas llamadas secuenciales a la API;
+en lugar de mantener abierta la petición HTTP, POST /api/consultar/trabajos
+encola un trabajo y responde enseguida con su id. Los trabajos se ejecutan en
+un ThreadPoolExecutor acotado (MAX_EJECUTANDO hilos, MAX_PENDIENTES en cola)
+y publican su progreso (meses consultados por tour). Un trabajo idéntico (mismos
+parámetros) que ya está en cola o ejecutándose se reutiliza en vez de lanzar
+otro.
+
+Los trabajos terminados se conservan TTL_SEGUNDOS. El estado es por proceso
+y los hilos siguen después de responder, así que los trabajos solo existen
+donde hay un proceso persistente (Railway, local). En Vercel
+(historico_store.SERVERLESS) la función se congela tras el 202 y el sondeo
+puede llegar a otra instancia, por lo que DISPONIBLE es False y los
+endpoints de trabajos responden 501: el dashboard usa /api/consultar/stream
+o, sin streaming, /api/consultar.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import historico_store
+
+
+# Hilos que ejecutan consultas a la vez y trabajos admitidos en cola
+MAX_EJECUTANDO = int(os.environ.get('CONSULTA_MAX_TRABAJOS', '2'))
+MAX_PENDIENTES = int(os.environ.get('CONSULTA_MAX_PENDIENTES', '8'))
+
+# Segundos que se conserva un trabajo terminado
+TTL_SEGUNDOS = int(os.environ.get('CONSULTA_TRABAJOS_TTL', '1800'))
+
+# Sin proceso persistente no hay dónde terminar un trabajo en segundo plano
+DISPONIBLE = not historico_store.SERVERLESS
+
+PENDIENTE = 'pendiente'
+EJECUTANDO = 'ejecutando'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+EN_CURSO = (PENDIENTE, EJECUTANDO)
+
+
+class ColaLlena(Exception):
+    """No se admiten más trabajos hasta que termine alguno"""
+
+
+def clave_trabajo(parametros: dict) -> str:
+    """Huella de los parámetros de un trabajo (para deduplicar)"""
+    datos = json.dumps(parametros, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(datos.encode('utf-8')).hexdigest()
+
+
+class GestorTrabajos:
+    """Ejecutor acotado con progreso, deduplicación y expiración de trabajos"""
+
+    def __init__(self, max_ejecutando: int = MAX_EJECUTANDO, max_pendientes: int = MAX_PENDIENTES,
+                 ttl: int = TTL_SEGUNDOS):
+        self.max_pendientes = max_pendientes
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_ejecutando, thread_name_prefix='consulta')
+        self._trabajos = OrderedDict()
+        self._en_curso = {}  # clave -> trabajo_id
+        self._lock = threading.Lock()
+
+    def _purgar(self) -> None:
+        limite = time.time() - self.ttl
+        for trabajo_id in [t for t, trabajo in self._trabajos.items()
+                           if trabajo['estado'] not in EN_CURSO and trabajo['terminado'] < limite]:
+            del self._trabajos[trabajo_id]
+
+    def enviar(self, parametros: dict, funcion) -> tuple:
+        """
+        Encola un trabajo, o reutiliza uno idéntico en curso.
+
+        Args:
+            parametros: Parámetros del trabajo (definen la deduplicación)
+            funcion: Callable funcion(progreso) que retorna el resultado;
+                progreso(parte, hechos, total) actualiza el avance
+
+        Returns:
+            (trabajo_id, duplicado)
+
+        Raises:
+            ColaLlena: Si ya hay MAX_PENDIENTES trabajos esperando
+        """
+        clave = clave_trabajo(parametros)
+        with self._lock:
+            self._purgar()
+            existente = self._en_curso.get(clave)
+            if existente is not None:
+                return existente, True
+
+            pendientes = sum(1 for t in self._trabajos.values() if t['estado'] == PENDIENTE)
+            if pendientes >= self.max_pendientes:
+                raise ColaLlena(f"Hay {pendientes} consultas en cola, inténtalo en unos segundos")
+
+            trabajo_id = uuid.uuid4().hex
+            self._trabajos[trabajo_id] = {
+                'id': trabajo_id,
+                'estado': PENDIENTE,
+                'creado': time.time(),
+                'terminado': None,
+                'progreso': {},
+                'resultado': None,
+                'error': None
+            }
+            self._en_curso[clave] = trabajo_id
+
+        self._executor.submit(self._ejecutar, trabajo_id, clave, funcion)
+        return trabajo_id, False
+
+    def _ejecutar(self, trabajo_id: str, clave: str, funcion) -> None:
+        trabajo = self._trabajos[trabajo_id]
+        trabajo['estado'] = EJECUTANDO
+
+        def progreso(parte: str, hechos: int, total: int) -> None:
+            trabajo['progreso'][parte] = {'hechos': hechos, 'total': total}
+
+        try:
+            resultado, error = funcion(progreso), None
+        except Exception as e:
+            resultado, error = None, str(e)
+
+        with self._lock:
+            trabajo.update(
+                estado=ERROR if error else COMPLETADO,
+                resultado=resultado,
+                error=error,
+                terminado=time.time()
+            )
+            self._en_curso.pop(clave, None)
+
+    def obtener(self, trabajo_id: str):
+        """Trabajo por id, o None si no existe o expiró"""
+        with self._lock:
+            self._purgar()
+            return self._trabajos.get(trabajo_id)
+
+    def estado(self, trabajo_id: str):
+        """Estado y progreso de un trabajo (sin el resultado), o None"""
+        trabajo = self.obtener(trabajo_id)
+        if trabajo is None:
+            return None
+        return {
+            'id': trabajo['id'],
+            'estado': trabajo['estado'],
+            'progreso': dict(trabajo['progreso']),
+            'error': trabajo['error'],
+            'segundos': round((trabajo['terminado'] or time.time()) - trabajo['creado'], 1)
+        }
+
+
+# Instancia global del proceso
+gestor_trabajos = GestorTrabajos()
@@ -0,0 +1,356 @@
+"""
+Velocidad de venta y agotamiento estimado por horario.
+
+A partir de snapshots sucesivos del histórico se mantiene, para cada horario
+(tour, fecha, hora), una tasa de venta en plazas/hora suavizada con una media
+móvil exponencial cuyo peso depende del tiempo entre snapshots:
+
+    alpha = 1 - exp(-dt / TAU_HORAS)
+    tasa  = alpha * max(0, (cap_anterior - cap_actual) / dt) + (1 - alpha) * tasa
+
+El estado son arrays NumPy alineados por horario, de modo que aplicar un
+snapshot cuesta O(horarios). La reconstrucción desde el histórico completo
+aplica las columnas en orden sobre los mismos arrays (vectorizado por horario)
+y solo se usa la primera vez o tras un backfill fuera de orden, desde el job
+de Railway o backfill_historico.py: nunca dentro de una petición web, que
+sin modelo guardado devuelve los horarios sin proyección.
+
+El modelo se guarda en historico/velocidad.json.gz.
+"""
+
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import storage_client
+import historico_store
+
+
+MODELO_PATH = f'{historico_store.CARPETA}/velocidad.json.gz'
+
+# Constante de tiempo (horas) de la media móvil de la tasa de venta
+TAU_HORAS = float(os.environ.get('VELOCIDAD_TAU_HORAS', '24'))
+
+# Segundos que se reutiliza el modelo en memoria antes de volver a leerlo
+TTL_MODELO = int(os.environ.get('VELOCIDAD_TTL', '60'))
+
+# Tasa mínima (plazas/hora) para proyectar un agotamiento
+TASA_MINIMA = 0.01
+
+FORMATO_TS = "%Y-%m-%d %H:%M"
+
+
+def _horas(timestamp: str) -> float:
+    """
+    Convierte un timestamp 'YYYY-MM-DD HH:MM' (hora de Roma) a horas desde la
+    época, tratándolo como hora de reloj sin zona para evitar saltos de DST
+    """
+    dt = datetime.strptime(timestamp[:16], FORMATO_TS).replace(tzinfo=timezone.utc)
+    return dt.timestamp() / 3600.0
+
+
+def _timestamp(horas: float) -> str:
+    """Inverso de _horas"""
+    return datetime.fromtimestamp(horas * 3600.0, tz=timezone.utc).strftime(FORMATO_TS)
+
+
+class ModeloVelocidad:
+    """Tasa de venta suavizada por horario, en arrays alineados"""
+
+    def __init__(self):
+        # Claves (tour, fecha, hora) y su posición en los arrays
+        self.claves = []
+        self.posiciones = {}
+        self.ultimo_snapshot = ''
+        # Hora (época) y capacidad de la última observación de cada horario
+        self.ultimo_t = np.zeros(0)
+        self.ultima_cap = np.zeros(0)
+        # Tasa suavizada (plazas/hora) y número de observaciones
+        self.tasa = np.zeros(0)
+        self.observaciones = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.claves)
+
+    def _asegurar_claves(self, claves: list) -> None:
+        """Agrega horarios nuevos al final de los arrays"""
+        nuevas = [k for k in claves if k not in self.posiciones]
+        if not nuevas:
+            return
+
+        for k in nuevas:
+            self.posiciones[k] = len(self.claves)
+            self.claves.append(k)
+
+        n = len(nuevas)
+        self.ultimo_t = np.concatenate([self.ultimo_t, np.full(n, np.nan)])
+        self.ultima_cap = np.concatenate([self.ultima_cap, np.full(n, np.nan)])
+        self.tasa = np.concatenate([self.tasa, np.zeros(n)])
+        self.observaciones = np.concatenate([self.observaciones, np.zeros(n, dtype=np.int32)])
+
+    def _aplicar_columna(self, capacidades: np.ndarray, t: float) -> None:
+        """
+        Aplica una columna de capacidades (NaN = horario ausente) en el instante t.
+        Operación vectorizada O(horarios).
+        """
+        presentes = ~np.isnan(capacidades)
+        dt = t - self.ultimo_t
+        validos = presentes & ~np.isnan(self.ultima_cap) & (dt > 0)
+
+        if validos.any():
+            dt_v = dt[validos]
+            tasa_nueva = np.maximum(self.ultima_cap[validos] - capacidades[validos], 0) / dt_v
+            alpha = 1.0 - np.exp(-dt_v / TAU_HORAS)
+            # La primera tasa observada se toma tal cual
+            alpha[self.observaciones[validos] == 0] = 1.0
+            self.tasa[validos] = alpha * tasa_nueva + (1.0 - alpha) * self.tasa[validos]
+            self.observaciones[validos] += 1
+
+        self.ultima_cap[presentes] = capacidades[presentes]
+        self.ultimo_t[presentes] = t
+
+    def agregar_snapshot(self, snapshot: dict, timestamp: str) -> None:
+        """
+        Aplica un snapshot posterior al último en O(horarios).
+
+        Args:
+            snapshot: {tour_key: {(fecha, hora): {'capacidad', 'capacidad_original'}}}
+            timestamp: Timestamp del snapshot
+        """
+        claves = [(tour_key, fecha, hora) for tour_key, datos in snapshot.items() for (fecha, hora) in datos]
+        self._asegurar_claves(claves)
+
+        capacidades = np.full(len(self.claves), np.nan)
+        for tour_key, datos in snapshot.items():
+            for (fecha, hora), valores in datos.items():
+                capacidades[self.posiciones[(tour_key, fecha, hora)]] = valores.get('capacidad', 0)
+
+        self._aplicar_columna(capacidades, _horas(timestamp))
+        self.ultimo_snapshot = max(self.ultimo_snapshot, timestamp)
+
+    def podar(self, desde_fecha: str) -> None:
+        """Elimina los horarios con fecha anterior a desde_fecha"""
+        conservar = np.array([k[1] >= desde_fecha for k in self.claves], dtype=bool)
+        if conservar.all():
+            return
+
+        self.claves = [k for k, c in zip(self.claves, conservar) if c]
+        self.posiciones = {k: i for i, k in enumerate(self.claves)}
+        self.ultimo_t = self.ultimo_t[conservar]
+        self.ultima_cap = self.ultima_cap[conservar]
+        self.tasa = self.tasa[conservar]
+        self.observaciones = self.observaciones[conservar]
+
+    def estimar(self, tour_key: str, fecha: str, hora: str, capacidad=None, ahora: str = None) -> dict:
+        """
+        Velocidad de venta y agotamiento estimado de un horario.
+
+        Args:
+            tour_key, fecha, hora: Horario
+            capacidad: Capacidad actual (default: la última del histórico)
+            ahora: Timestamp desde el que proyectar (default: la última observación)
+
+        Returns:
+            dict con 'velocidad' (plazas/hora) y 'agotamiento_estimado'
+            ('YYYY-MM-DD HH:MM' o None si está agotado o no se agota antes del horario)
+        """
+        i = self.posiciones.get((tour_key, fecha, hora))
+        if i is None or not self.observaciones[i]:
+            return {'velocidad': None, 'agotamiento_estimado': None}
+
+        tasa = float(self.tasa[i])
+        if capacidad is None:
+            capacidad = self.ultima_cap[i]
+        inicio = _horas(ahora) if ahora else float(self.ultimo_t[i])
+
+        # Solo se proyecta si quedan plazas y el horario se agota antes de empezar
+        agotamiento = None
+        if capacidad is not None and capacidad > 0 and tasa >= TASA_MINIMA:
+            proyectado = inicio + capacidad / tasa
+            try:
+                if proyectado < _horas(f"{fecha} {hora}"):
+                    agotamiento = proyectado
+            except ValueError:
+                agotamiento = proyectado
+
+        return {
+            'velocidad': round(tasa, 2),
+            'agotamiento_estimado': _timestamp(agotamiento) if agotamiento is not None else None
+        }
+
+    def to_dict(self) -> dict:
+        """Serializa el modelo a un dict JSON (NaN -> None)"""
+        def lista(arr):
+            return [None if np.isnan(v) else round(float(v), 6) for v in arr]
+
+        return {
+            'version': 1,
+            'tau_horas': TAU_HORAS,
+            'ultimo_snapshot': self.ultimo_snapshot,
+            'claves': [list(k) for k in self.claves],
+            'ultimo_t': lista(self.ultimo_t),
+            'ultima_cap': lista(self.ultima_cap),
+            'tasa': lista(self.tasa),
+            'observaciones': self.observaciones.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ModeloVelocidad':
+        """Reconstruye el modelo desde su forma serializada"""
+        modelo = cls()
+        modelo.claves = [tuple(k) for k in data.get('claves', [])]
+        modelo.posiciones = {k: i for i, k in enumerate(modelo.claves)}
+        modelo.ultimo_snapshot = data.get('ultimo_snapshot', '')
+        modelo.ultimo_t = np.array(data.get('ultimo_t', []), dtype=float)
+        modelo.ultima_cap = np.array(data.get('ultima_cap', []), dtype=float)
+        modelo.tasa = np.array(data.get('tasa', []), dtype=float)
+        modelo.observaciones = np.array(data.get('observaciones', []), dtype=np.int32)
+        return modelo
+
+
+# ============== CONSTRUCCIÓN DESDE EL HISTÓRICO ==============
+
+def construir_desde_indices(indices: list, desde_fecha: str = None) -> ModeloVelocidad:
+    """
+    Construye el modelo sobre todo el histórico a partir de los índices de
+    series. Cada partición se expande a una matriz horarios x snapshots y sus
+    columnas se aplican en orden, vectorizadas por horario.
+
+    Args:
+        indices: SeriesIndex de cada partición en orden cronológico
+        desde_fecha: Ignorar horarios con fecha anterior (default: ayer)
+    """
+    desde_fecha = desde_fecha or (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    modelo = ModeloVelocidad()
+
+    for indice in indices:
+        if not indice.snapshots:
+            continue
+
+        claves, _, matriz = indice.matriz_capacidades(desde_fecha)
+        modelo._asegurar_claves(claves)
+        filas = np.array([modelo.posiciones[k] for k in claves], dtype=np.intp)
+
+        for j, ts in enumerate(indice.snapshots):
+            capacidades = np.full(len(modelo), np.nan)
+            capacidades[filas] = matriz[:, j]
+            modelo._aplicar_columna(capacidades, _horas(ts))
+
+        modelo.ultimo_snapshot = max(modelo.ultimo_snapshot, indice.snapshots[-1])
+
+    return modelo
+
+
+def reconstruir() -> ModeloVelocidad:
+    """Reconstruye el modelo desde todas las particiones del histórico"""
+    import series_index
+
+    manifest = historico_store.cargar_manifest()
+    indices = [series_index.cargar_indice(entrada) for entrada in historico_store.particiones_ordenadas(manifest)]
+    return construir_desde_indices(indices)
+
+
+# ============== PERSISTENCIA ==============
+
+_CACHE = {'modelo': None, 'cargado': 0.0}
+
+
+def guardar_modelo(modelo: ModeloVelocidad) -> dict:
+    """Guarda el modelo comprimido"""
+    data = json.dumps(modelo.to_dict(), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return storage_client.write_bytes(MODELO_PATH, gzip.compress(data), 'application/gzip')
+
+
+def _leer_modelo():
+    """Lee el modelo guardado o None si no existe"""
+    result = storage_client.read_bytes(MODELO_PATH)
+    if not result['success']:
+        return None
+    try:
+        return ModeloVelocidad.from_dict(json.loads(gzip.decompress(result['data']).decode('utf-8')))
+    except (OSError, ValueError) as e:
+        print(f"[Velocidad] Modelo corrupto, se reconstruye: {e}")
+        return None
+
+
+def obtener_modelo():
+    """
+    Retorna el modelo vigente (memoria o storage), o None si aún no se ha
+    construido: se construye al registrar snapshots, no en la lectura.
+    El storage se vuelve a leer como máximo cada TTL_MODELO segundos.
+    """
+    ahora = time.time()
+    if _CACHE['cargado'] and ahora - _CACHE['cargado'] < TTL_MODELO:
+        return _CACHE['modelo']
+
+    modelo = _leer_modelo()
+    _CACHE.update(modelo=modelo, cargado=ahora)
+    return modelo
+
+
+def registrar_snapshots(snapshots: list) -> ModeloVelocidad:
+    """
+    Actualiza el modelo con snapshots recién escritos en el histórico.
+    Se llama desde historico_store.registrar_snapshots.
+
+    Los snapshots posteriores al último aplicado cuestan O(horarios) cada uno;
+    si alguno es anterior (backfill) o no hay modelo, se reconstruye. En
+    Vercel (historico_store.SERVERLESS) no se reconstruye dentro de la
+    petición: sin modelo no se hace nada y de un backfill solo se aplican los
+    snapshots posteriores; el siguiente snapshot de Railway lo construye.
+
+    Args:
+        snapshots: Lista de (timestamp, snapshot) en orden cronológico
+    """
+    modelo = _leer_modelo()
+    reconstruir_modelo = modelo is None or (snapshots and snapshots[0][0] <= modelo.ultimo_snapshot)
+
+    if reconstruir_modelo and historico_store.SERVERLESS:
+        if modelo is None:
+            print("[Velocidad] Sin modelo: se construirá con el próximo snapshot de Railway")
+            return None
+        snapshots = [(t, s) for t, s in snapshots if t > modelo.ultimo_snapshot]
+        reconstruir_modelo = False
+
+    if reconstruir_modelo:
+        print("[Velocidad] Construyendo modelo desde el histórico...")
+        modelo = reconstruir()
+    else:
+        for timestamp, snapshot in snapshots:
+            modelo.agregar_snapshot(snapshot, timestamp)
+
+    modelo.podar((datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'))
+    guardar_modelo(modelo)
+    _CACHE.update(modelo=modelo, cargado=time.time())
+    return modelo
+
+
+def anotar_resultados(resultados: dict, ahora: str = None) -> dict:
+    """
+    Agrega 'velocidad' y 'agotamiento_estimado' a cada timeslot de los
+    resultados (formato de /api/consultar), proyectando desde la capacidad
+    actual de cada horario.
+
+    Args:
+        resultados: {tour_key: {'timeslots_por_fecha': {fecha: [timeslot]}}}
+        ahora: Timestamp de la consulta (default: ahora en hora de Roma)
+
+    Returns:
+        Los mismos resultados, modificados en el lugar (sin anotar si aún
+        no hay modelo)
+    """
+    modelo = obtener_modelo()
+    if modelo is None:
+        return resultados
+    ahora = ahora or historico_store.timestamp_actual()
+
+    for tour_key, tour_data in resultados.items():
+        for fecha, timeslots in tour_data.get('timeslots_por_fecha', {}).items():
+            for ts in timeslots:
+                ts.update(modelo.estimar(tour_key, fecha, ts.get('hora', ''), ts.get('capacidad'), ahora))
+
+    return resultados